@@ -7,6 +7,7 @@ from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import logging
 import os
+import time
 from datetime import datetime, timedelta
 
 # Load environment variables
@@ -19,7 +20,10 @@ jwt = JWTManager()
 def create_app(config_name='development'):
     """Create and configure Flask application with enterprise features"""
     
+    startup_started = time.perf_counter()
+    startup_timings = {}
     app = Flask(__name__)
+    app.extensions['startup_timings'] = startup_timings
     
     # Load configuration
     from config.settings import config
@@ -58,29 +62,17 @@ def create_app(config_name='development'):
     if not app.debug:
         logging.basicConfig(level=logging.WARNING)
     
-    # Import all models to ensure they're registered
-    try:
-        from modules.core.models import User, Role, Organization, SystemSetting, UserData
-        from modules.core.tenant_models import Tenant, UserTenant, TenantModule, TenantSettings
-        from modules.core.user_preferences_models import UserPreferences
-        from modules.core.security_models import PasswordHistory, UserSession, AccountLockout, TwoFactorAuth, SecurityEvent
-        from modules.core.audit_models import AuditLog
-        from modules.dashboard.models import UserModules, DashboardWidget, DashboardTemplate, WidgetTemplate
-        from modules.finance.models import Account, JournalEntry, JournalLine, Payment, Budget, Invoice
-        from modules.finance.cost_center_models import Department, CostCenter, Project
-        from modules.finance.currency_models import Currency, ExchangeRate, CurrencyConversion
-        from modules.finance.advanced_models import ChartOfAccounts, GeneralLedgerEntry, JournalHeader, CompanySettings, BankReconciliation, FinancialPeriod, TaxRecord, InvoiceLineItem, FixedAsset, BudgetEntry, AccountsPayable, AccountsReceivable, DepreciationSchedule, MaintenanceRecord, APPayment, ARPayment, BankTransaction, BankStatement, FinancialReport, KPI
-        from modules.finance.payment_models import PaymentMethod, BankAccount, PaymentTransaction, PartialPayment, ReconciliationSession, AccountingPeriod
-        from modules.inventory.models import Product, InventoryProduct, InventoryTransaction, StockMovement, InventoryLevel, InventoryUOM, InventoryUOMConversion, ProductCategory, Warehouse, InventoryLocation, InventoryZone, InventoryAisle, InventoryRack, InventoryLotBatch, InventorySerialNumber, InventoryValuationSnapshot, InventoryAdjustmentEntry, InventoryCostLayer, CostLayerTransaction, InventoryWarehouseActivity, InventoryStockLevel, InventoryAdvancedLocation, InventoryAdvancedWarehouse, InventoryProductVariant, InventoryPickerPerformance, DailyInventoryBalance, DailyInventoryTransactionSummary, BasicInventoryTransaction, InventoryBasicLocation, InventorySimpleWarehouse, InventoryProductCategories, InventorySuppliers, InventoryCustomers, InventoryAuditTrail, InventoryReports, DailyInventoryCycleStatus, DailyInventoryCycleAuditLogs, InventorySystemConfig
-        from modules.crm.models import Contact, Lead, Opportunity, Communication, FollowUp, Ticket, TimeEntry, BehavioralEvent, LeadIntake, KnowledgeBaseArticle, KnowledgeBaseAttachment, Pipeline
-        from modules.procurement.models import Vendor, RFQ, RFQItem, RFQInvitation, RFQResponse, RFQResponseItem, PurchaseOrder, PurchaseOrderItem, POAttachment, Contract, ContractDocument, VendorDocument, VendorCommunication
-        from modules.workflow.models import WorkflowRule, WorkflowTemplate, WorkflowExecution, WorkflowAction
-        from modules.analytics.models import PlatformMetric
-        from modules.permissions.models import Permission, RolePermission, PermissionChange
-        from modules.security.models import SecurityPolicy, SystemEvent, LoginHistory
-        from modules.tenant.models import TenantUsageStat
-    except Exception as e:
-        pass  # Silently handle import errors in production
+    # Import the models of every enabled module so their tables are registered
+    from modules.core.module_registry import ModuleRegistry
+    step_started = time.perf_counter()
+    module_registry = ModuleRegistry(
+        app,
+        enabled=app.config.get('ENABLED_MODULES'),
+        lazy=app.config.get('LAZY_BLUEPRINTS', False)
+    )
+    app.extensions['module_registry'] = module_registry
+    module_registry.load_models()
+    startup_timings['models_ms'] = round((time.perf_counter() - step_started) * 1000, 1)
     
     # Initialize enterprise services
     try:
@@ -108,33 +100,21 @@ def create_app(config_name='development'):
     except Exception as e:
         pass  # Silently handle module initialization errors in production
     
-    # Sync database schema on startup (adds missing columns automatically)
-    try:
-        with app.app_context():
-            from modules.database.schema_sync import sync_all_models
-            sync_all_models()
-    except Exception as e:
-        # Log but don't crash - schema sync is non-critical
-        import logging
-        logging.getLogger(__name__).warning(f"Database schema sync warning: {e}")
-    
-    # SECURITY: Seed permissions on startup (ensures all permissions exist)
+    # Sync database schema and seed permissions on startup; skipped when the
+    # fingerprint stored in schema_meta matches the current models/permissions
+    startup_timings['init_ms'] = round((time.perf_counter() - startup_started) * 1000, 1)
     try:
         with app.app_context():
-            from modules.core.permission_seeder import seed_all_permissions
-            result = seed_all_permissions()
-            if result['created'] > 0:
-                logging.getLogger(__name__).info(f"✅ Seeded {result['created']} new permissions on startup")
-                print(f"✅ Seeded {result['created']} new permissions on startup")
-            elif result['errors']:
-                logging.getLogger(__name__).warning(f"⚠️  Permission seeding encountered {len(result['errors'])} errors")
+            from modules.database.startup import run_startup_sync
+            startup_timings['schema'] = run_startup_sync()
     except Exception as e:
-        # Log but don't crash - permission seeding is non-critical for startup
-        import logging
-        logging.getLogger(__name__).warning(f"Permission seeding warning: {e}")
+        # Log but don't crash - schema sync and permission seeding are non-critical
+        logging.getLogger(__name__).warning(f"Startup schema sync warning: {e}")
     
     # Register blueprints
+    step_started = time.perf_counter()
     register_blueprints(app)
+    startup_timings['blueprints_ms'] = round((time.perf_counter() - step_started) * 1000, 1)
     
     # Setup error handlers
     setup_error_handlers(app)
@@ -142,6 +122,45 @@ def create_app(config_name='development'):
     # Setup request context
     setup_request_context(app)
     
+    # Request/SQL/pool metrics (served at /api/admin/metrics)
+    if app.config.get('ENABLE_METRICS', True):
+        try:
+            from modules.core.metrics import init_metrics
+            init_metrics(app, db)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not enable request metrics: {e}")
+    
+    # Background delivery of queued webhooks (modules.api.webhook_dispatcher)
+    if app.config.get('WEBHOOK_DISPATCHER_ENABLED', True) and not app.config.get('TESTING'):
+        try:
+            from modules.api.webhook_dispatcher import webhook_dispatcher
+            webhook_dispatcher.init_app(app)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not start webhook dispatcher: {e}")
+    
+    # Background handling of finance events (modules.finance.events.event_bus)
+    if app.config.get('FINANCE_EVENT_DISPATCHER_ENABLED', True):
+        try:
+            from modules.finance.events.event_bus import finance_event_bus
+            finance_event_bus.init_app(app)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not start finance event bus: {e}")
+    
+    # Background sending of queued email (services.email_outbox)
+    if app.config.get('EMAIL_SENDER_ENABLED', True):
+        try:
+            from services.email_outbox import email_outbox
+            email_outbox.init_app(app)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not start email sender: {e}")
+    
+    # Drop cached cash-flow forecasts when a commit posts to the ledger
+    try:
+        from services.cashflow_forecast import cashflow_forecaster
+        cashflow_forecaster.init_app(app)
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Could not set up cash-flow forecast invalidation: {e}")
+    
     # Setup global route protection
     try:
         from middleware.route_protection import require_authentication
@@ -169,420 +188,20 @@ def create_app(config_name='development'):
             'timestamp': datetime.utcnow().isoformat()
         })
     
+    startup_timings['total_ms'] = round((time.perf_counter() - startup_started) * 1000, 1)
+    logging.getLogger(__name__).info(f"Startup timings: {startup_timings}")
+    
     return app
 
 def register_blueprints(app):
-    """Register all application blueprints"""
-    
-    # Enhanced authentication with security features (includes login, register, verify-token, etc.)
-    try:
-        from modules.core.auth_enhanced import auth_enhanced_bp
-        app.register_blueprint(auth_enhanced_bp, url_prefix='/api/auth')
-        print("✅ Registered auth_enhanced_bp with prefix /api/auth")
-    except Exception as e:
-        print(f"⚠️  Warning: Could not register auth_enhanced_bp: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    # Note: auth.py is incomplete (references undefined auth_bp) - using auth_enhanced.py instead
-    # try:
-    #     from modules.core.auth import auth_bp
-    #     app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    # except Exception as e:
-    #     pass
-    
-    # Invite management system
-    try:
-        from modules.core.invite_management import invite_management_bp
-        app.register_blueprint(invite_management_bp, url_prefix='/api/invites')
-    except Exception as e:
-        pass
-    
-    # Comprehensive onboarding system
-    try:
-        from modules.core.onboarding_api import onboarding_bp
-        app.register_blueprint(onboarding_bp, url_prefix='/api/onboarding')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.permissions_routes import permissions_bp
-        app.register_blueprint(permissions_bp, url_prefix='/api/core/permissions')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.user_management_routes import user_management_bp
-        app.register_blueprint(user_management_bp, url_prefix='/api/admin')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.audit_routes import audit_bp
-        app.register_blueprint(audit_bp, url_prefix='/api/audit')
-    except Exception as e:
-        pass
-    
-    # Register core security routes (policies, 2fa, events) - This is the main one
-    try:
-        from modules.core.security_routes import security_bp
-        app.register_blueprint(security_bp, url_prefix='/api/security')
-        print(f"✅ Registered security_bp with prefix /api/security")
-    except Exception as e:
-        print(f"⚠️  Failed to register core security routes: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    # Also register enterprise security routes if available (different endpoints)
-    try:
-        from modules.security.routes import bp as enterprise_security_bp
-        app.register_blueprint(enterprise_security_bp)  # Already has /api/security prefix
-        print(f"✅ Registered enterprise_security_bp")
-    except Exception as e:
-        pass  # Optional
-    
-    # Tenant management
-    try:
-        from modules.tenant.tenant_routes import tenant_management_bp
-        app.register_blueprint(tenant_management_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.tenant.tenant_creation_routes import tenant_creation_bp
-        app.register_blueprint(tenant_creation_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.user_preferences_routes import user_preferences_bp
-        app.register_blueprint(user_preferences_bp)
-    except Exception as e:
-        pass
-    
-    # Enterprise features
-    try:
-        from modules.tenant.tenant_analytics_routes import tenant_analytics_bp
-        app.register_blueprint(tenant_analytics_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.tenant.subscription_routes import subscription_bp
-        app.register_blueprint(subscription_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.rate_limiting import rate_limiting_bp
-        app.register_blueprint(rate_limiting_bp)
-    except Exception as e:
-        pass
-    
-    # Core modules
-    try:
-        from modules.core.routes import core_bp
-        app.register_blueprint(core_bp, url_prefix='/api/core')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.core.visitor_routes import visitor_bp
-        app.register_blueprint(visitor_bp, url_prefix='/api')
-    except Exception as e:
-        pass
-    
-    # Finance module
-    try:
-        from modules.finance.routes import finance_bp
-        app.register_blueprint(finance_bp, url_prefix='/api/finance')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.currency_routes import currency_bp
-        app.register_blueprint(currency_bp, url_prefix='/api/finance')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.payment_routes import payment_bp
-        app.register_blueprint(payment_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.advanced_payment_routes import advanced_payment_bp
-        app.register_blueprint(advanced_payment_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.bank_reconciliation_routes import bank_reconciliation_bp
-        app.register_blueprint(bank_reconciliation_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.bank_feed_routes import bank_feed_bp
-        app.register_blueprint(bank_feed_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.analytics_routes import analytics_bp
-        app.register_blueprint(analytics_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.double_entry_routes import double_entry_bp
-        app.register_blueprint(double_entry_bp)
-        # Count routes after registration (blueprint doesn't have url_map before registration)
-        route_count = len([r for r in app.url_map.iter_rules() if r.endpoint.startswith('double_entry.')])
-        print(f"✅ Registered double_entry_bp with {route_count} routes")
-    except Exception as e:
-        print(f"❌ Error registering double_entry_bp: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    try:
-        from modules.finance.advanced_routes import advanced_finance_bp
-        app.register_blueprint(advanced_finance_bp, url_prefix='/api/finance/advanced')
-        print(f"✅ Registered advanced_finance_bp with prefix /api/finance/advanced")
-    except Exception as e:
-        print(f"❌ Error registering advanced_finance_bp: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    # Inventory-Finance integration
-    try:
-        from modules.inventory.daily_cycle_routes import inventory_daily_cycle_bp
-        app.register_blueprint(inventory_daily_cycle_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.inventory_finance_integration_routes import inventory_finance_integration_bp
-        app.register_blueprint(inventory_finance_integration_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.variance_reports_routes import variance_reports_bp
-        app.register_blueprint(variance_reports_bp)
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.finance_inventory_validation_routes import finance_inventory_validation_bp
-        app.register_blueprint(finance_inventory_validation_bp)
-    except Exception as e:
-        pass
-    
-    # Finance advanced features
-    try:
-        from modules.finance.statutory_routes import statutory_bp
-        app.register_blueprint(statutory_bp, url_prefix='/api/finance/statutory')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.tagging_routes import tagging_bp
-        app.register_blueprint(tagging_bp, url_prefix='/api/finance/tagging')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.localization_routes import localization_bp
-        app.register_blueprint(localization_bp, url_prefix='/api/finance/localization')
-    except Exception as e:
-        pass
-    
-    # CRM module
-    try:
-        from modules.crm.routes import crm_bp
-        app.register_blueprint(crm_bp, url_prefix='/api/crm')
-    except Exception as e:
-        pass
-    
-    # Inventory module
-    try:
-        from modules.inventory.routes import inventory_bp
-        app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.advanced_routes import advanced_inventory_bp
-        app.register_blueprint(advanced_inventory_bp, url_prefix='/api/inventory/advanced')
-    except Exception as e:
-        pass
-    
-    # Onboarding system
-    try:
-        from modules.onboarding.onboarding_routes import onboarding_bp
-        app.register_blueprint(onboarding_bp, url_prefix='/api/onboarding')
-    except Exception as e:
-        pass
-    
-    # Admin features
-    try:
-        from modules.core.cors_admin_routes import cors_admin_bp
-        app.register_blueprint(cors_admin_bp, url_prefix='/api/admin')
-    except Exception as e:
-        pass
-    
-    # Inventory advanced features
-    try:
-        from modules.inventory.data_integrity_routes import data_integrity_bp
-        app.register_blueprint(data_integrity_bp, url_prefix='/api/inventory/data-integrity')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.inventory_taking_routes import inventory_taking_bp
-        app.register_blueprint(inventory_taking_bp, url_prefix='/api/inventory/taking')
-    except Exception as e:
-        pass
-    
-    # Cross-module integration
-    try:
-        from modules.integration.cross_module_routes import cross_module_bp
-        app.register_blueprint(cross_module_bp, url_prefix='/api/integration')
-    except Exception as e:
-        pass
-    
-    # Automated systems
-    try:
-        from modules.finance.auto_journal_engine import auto_journal_bp
-        app.register_blueprint(auto_journal_bp, url_prefix='/api/finance/auto-journal')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.cogs_reconciliation_routes import cogs_reconciliation_bp
-        app.register_blueprint(cogs_reconciliation_bp, url_prefix='/api/inventory/cogs')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.stock_adjustment_routes import stock_adjustment_bp
-        app.register_blueprint(stock_adjustment_bp, url_prefix='/api/inventory/adjustments')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.aging_reports_routes import aging_reports_bp
-        app.register_blueprint(aging_reports_bp, url_prefix='/api/finance/aging')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.finance.multi_currency_routes import multi_currency_bp
-        app.register_blueprint(multi_currency_bp, url_prefix='/api/finance/multi-currency')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.workflow.approval_workflow_routes import approval_workflow_bp
-        app.register_blueprint(approval_workflow_bp, url_prefix='/api/workflow/approval')
-    except Exception as e:
-        pass
-    
-    # Enterprise hardening
-    try:
-        from modules.enterprise.enterprise_routes import enterprise_bp
-        app.register_blueprint(enterprise_bp, url_prefix='/api/enterprise')
-    except Exception as e:
-        pass
-    
-    # Inventory management
-    try:
-        from modules.inventory.manager_dashboard_routes import manager_dashboard_bp
-        app.register_blueprint(manager_dashboard_bp, url_prefix='/api/inventory/manager')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.analytics_routes import analytics_bp
-        app.register_blueprint(analytics_bp, url_prefix='/api/inventory/analytics')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.warehouse_routes import warehouse_bp
-        app.register_blueprint(warehouse_bp, url_prefix='/api/inventory/warehouse')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.core_routes import core_inventory_bp
-        app.register_blueprint(core_inventory_bp, url_prefix='/api/inventory/core')
-    except Exception as e:
-        pass
-    
-    try:
-        from modules.inventory.wms_routes import wms_bp
-        app.register_blueprint(wms_bp, url_prefix='/api/inventory/wms')
-    except Exception as e:
-        pass
-    
-    # Performance monitoring
-    try:
-        from modules.performance.performance_routes import performance_bp
-        app.register_blueprint(performance_bp, url_prefix='/api/performance')
-    except Exception as e:
-        pass
-    
-    # Procurement module
-    try:
-        from modules.procurement.routes import bp as procurement_bp
-        app.register_blueprint(procurement_bp)  # Already has /api/procurement prefix
-    except Exception as e:
-        print(f"Warning: Could not register procurement_bp: {e}")
-        pass
-    
-    # Dashboard module
-    try:
-        from modules.dashboard.routes import bp as dashboard_bp
-        app.register_blueprint(dashboard_bp)  # Already has /api/dashboard prefix
-    except Exception as e:
-        print(f"Warning: Could not register dashboard_bp: {e}")
-        pass
-    
-    try:
-        from modules.dashboard.module_activation_routes import module_activation_bp
-        # Register with /api/dashboard/modules to get final path /api/dashboard/modules/user
-        app.register_blueprint(module_activation_bp, url_prefix='/api/dashboard/modules')
-        print(f"✅ Registered module_activation_bp with prefix /api/dashboard/modules")
-        print(f"   Routes: /api/dashboard/modules/user, /api/dashboard/modules/available, etc.")
-    except Exception as e:
-        print(f"❌ Failed to register module_activation_bp: {e}")
-        import traceback
-        traceback.print_exc()
-        pass
-    
-    try:
-        from modules.core.user_data_routes import user_data_bp
-        app.register_blueprint(user_data_bp)  # Already has /api/user-data prefix
-    except Exception as e:
-        print(f"Warning: Could not register user_data_bp: {e}")
-        pass
-    
-    # Transaction templates
-    try:
-        from modules.finance.transaction_routes import transaction_bp
-        app.register_blueprint(transaction_bp, url_prefix='/api/finance/transactions')
-    except Exception as e:
-        pass
-    
-    # Tenant-aware finance routes
-    try:
-        from modules.finance.tenant_aware_routes import tenant_finance_bp
-        app.register_blueprint(tenant_finance_bp, url_prefix='/api/finance/tenant')
-    except Exception as e:
-        pass
+    """Register blueprints of the enabled modules (see modules.core.module_registry)"""
+    registry = app.extensions.get('module_registry')
+    if registry is None:
+        from modules.core.module_registry import ModuleRegistry
+        registry = ModuleRegistry(app, enabled=app.config.get('ENABLED_MODULES'),
+                                  lazy=app.config.get('LAZY_BLUEPRINTS', False))
+        app.extensions['module_registry'] = registry
+    registry.register_blueprints()
 
 def setup_error_handlers(app):
     """Setup error handlers for the application"""
@@ -607,6 +226,18 @@ def setup_error_handlers(app):
     def revoked_token_response(jwt_header, jwt_data):
         return jsonify({'error': 'Unauthorized', 'message': 'Token has been revoked'}), 401
 
+    @jwt.additional_claims_loader
+    def add_token_claims(identity):
+        # Issue time in milliseconds, for revoke-all (iat has whole seconds)
+        from modules.core.identity_cache import identity_cache
+        return identity_cache.token_claims()
+
+    @jwt.token_in_blocklist_loader
+    def check_token_revoked(jwt_header, jwt_data):
+        # Logged-out tokens and inactive/deleted users, served from the identity cache
+        from modules.core.identity_cache import identity_cache
+        return identity_cache.is_token_revoked(jwt_data)
+
     @jwt.needs_fresh_token_loader
     def needs_fresh_token_response(jwt_header, jwt_data):
         return jsonify({'error': 'Unauthorized', 'message': 'Fresh token required'}), 401
@@ -636,6 +267,18 @@ def setup_error_handlers(app):
     def handle_fresh_token_required(error):
         return jsonify({'error': 'Fresh token required', 'message': 'This endpoint requires a fresh token'}), 401
     
+    from modules.core.concurrency import ConcurrencyConflictError
+    from sqlalchemy.orm.exc import StaleDataError
+    
+    @app.errorhandler(ConcurrencyConflictError)
+    def handle_concurrency_conflict(error):
+        return jsonify(error.to_dict()), 409
+    
+    @app.errorhandler(StaleDataError)
+    def handle_stale_data(error):
+        db.session.rollback()
+        return jsonify(ConcurrencyConflictError().to_dict()), 409
+    
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({'error': 'Endpoint not found'}), 404
@@ -25,6 +25,8 @@ class Config:
     # Refresh tokens handle seamless re-authentication without user interruption
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour - Industry standard for ERP systems
     JWT_REFRESH_TOKEN_EXPIRES = 604800  # 7 days - Standard refresh token lifetime
+    # Seconds a user's identity/permissions are cached between explicit invalidations
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '30'))
     
     # API Configuration
     API_RATE_LIMIT = '1000 per hour'
@@ -42,6 +44,16 @@ class Config:
     CACHE_TYPE = 'redis'
     CACHE_REDIS_URL = REDIS_URL
     CACHE_DEFAULT_TIMEOUT = 300
+    # Per-process tier of services.cache_service (in front of Redis when available)
+    CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '10000'))
+    CACHE_LOCAL_MAX_BYTES = int(os.getenv('CACHE_LOCAL_MAX_BYTES', str(64 * 1024 * 1024)))
+    CACHE_LOCAL_TTL = int(os.getenv('CACHE_LOCAL_TTL', '30'))
+    
+    # Module Loading Configuration
+    # Comma-separated module names (finance,inventory,...); empty loads every module
+    ENABLED_MODULES = [m.strip() for m in os.getenv('ENABLED_MODULES', '').split(',') if m.strip()]
+    # Import optional modules' blueprints on their first request instead of at startup
+    LAZY_BLUEPRINTS = os.getenv('LAZY_BLUEPRINTS', 'false').lower() == 'true'
     
     # Multi-tenancy Configuration
     TENANT_HEADER = 'X-Tenant-ID'
@@ -59,9 +71,76 @@ class Config:
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     
+    # Transactional/bulk email (outbox in email_outbox, see services/email_outbox.py)
+    EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'smtp')  # smtp, maildir
+    EMAIL_MAILDIR_PATH = os.getenv('EMAIL_MAILDIR_PATH', 'instance/maildir')
+    EMAIL_SMTP_HOST = os.getenv('EMAIL_SMTP_HOST', 'email-smtp.eu-north-1.amazonaws.com')
+    EMAIL_SMTP_PORT = int(os.getenv('EMAIL_SMTP_PORT', '587'))
+    EMAIL_SMTP_USE_TLS = os.getenv('EMAIL_SMTP_USE_TLS', 'true').lower() == 'true'
+    EMAIL_SMTP_USER = os.getenv('SES_SMTP_USER')
+    EMAIL_SMTP_PASSWORD = os.getenv('SES_SMTP_PASS')
+    EMAIL_FROM_ADDRESS = os.getenv('SES_FROM_EMAIL', 'info@edonuerp.com')
+    EMAIL_FROM_NAME = os.getenv('SES_FROM_NAME', 'EdonuOps ERP')
+    EMAIL_SENDER_ENABLED = os.getenv('EMAIL_SENDER_ENABLED', 'true').lower() == 'true'
+    # Send inline in the calling request (no outbox); always on under TESTING
+    EMAIL_SEND_SYNC = os.getenv('EMAIL_SEND_SYNC', 'false').lower() == 'true'
+    EMAIL_SMTP_CONNECTIONS = int(os.getenv('EMAIL_SMTP_CONNECTIONS', '4'))
+    EMAIL_SMTP_MAX_MESSAGES = int(os.getenv('EMAIL_SMTP_MAX_MESSAGES', '500'))  # Reconnect after this many
+    EMAIL_SMTP_IDLE_SECONDS = float(os.getenv('EMAIL_SMTP_IDLE_SECONDS', '30'))
+    EMAIL_RATE_PER_SECOND = float(os.getenv('EMAIL_RATE_PER_SECOND', '50'))  # Keep at or below the SES quota
+    EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '100'))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+    EMAIL_BACKOFF_SECONDS = float(os.getenv('EMAIL_BACKOFF_SECONDS', '30'))
+    EMAIL_RETENTION_DAYS = int(os.getenv('EMAIL_RETENTION_DAYS', '30'))
+    
     # Monitoring Configuration
     ENABLE_METRICS = os.getenv('ENABLE_METRICS', 'true').lower() == 'true'
+    # Distinct endpoint/tenant label sets kept per metric before folding into "other"
+    METRICS_MAX_SERIES = int(os.getenv('METRICS_MAX_SERIES', '5000'))
+    # Sampling profiler for slow requests (off unless a threshold is set)
+    PROFILE_SLOW_REQUESTS_MS = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', '0'))
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+    
+    # Webhook delivery (outbox in webhook_deliveries, see modules/api/webhook_dispatcher.py)
+    WEBHOOKS_ENABLED = os.getenv('WEBHOOKS_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_DISPATCHER_ENABLED = os.getenv('WEBHOOK_DISPATCHER_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+    WEBHOOK_PER_ENDPOINT_CONCURRENCY = int(os.getenv('WEBHOOK_PER_ENDPOINT_CONCURRENCY', '2'))
+    WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', '2'))
+    WEBHOOK_BACKOFF_SECONDS = float(os.getenv('WEBHOOK_BACKOFF_SECONDS', '10'))
+    WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv('WEBHOOK_BACKOFF_MAX_SECONDS', '3600'))
     METRICS_PORT = int(os.getenv('METRICS_PORT', 9090))
+    
+    # Finance event bus (outbox in finance_event_outbox, see modules/finance/events/event_bus.py)
+    FINANCE_EVENT_DISPATCHER_ENABLED = os.getenv('FINANCE_EVENT_DISPATCHER_ENABLED', 'true').lower() == 'true'
+    # Run handlers inline in the publishing request (no outbox); always on under TESTING
+    FINANCE_EVENTS_SYNC = os.getenv('FINANCE_EVENTS_SYNC', 'false').lower() == 'true'
+    FINANCE_EVENT_WORKERS = int(os.getenv('FINANCE_EVENT_WORKERS', '4'))
+    FINANCE_EVENT_MAX_ATTEMPTS = int(os.getenv('FINANCE_EVENT_MAX_ATTEMPTS', '5'))
+    FINANCE_EVENT_POLL_INTERVAL = float(os.getenv('FINANCE_EVENT_POLL_INTERVAL', '1'))
+    FINANCE_EVENT_BACKOFF_SECONDS = float(os.getenv('FINANCE_EVENT_BACKOFF_SECONDS', '5'))
+    FINANCE_EVENT_RETENTION_DAYS = int(os.getenv('FINANCE_EVENT_RETENTION_DAYS', '7'))
+    
+    # API keys (modules/api/api_key_service.py): verified-key LRU and usage counter flushing
+    API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', '1024'))
+    API_KEY_CACHE_TTL = float(os.getenv('API_KEY_CACHE_TTL', '60'))
+    API_KEY_USAGE_FLUSH_SECONDS = float(os.getenv('API_KEY_USAGE_FLUSH_SECONDS', '10'))
+    
+    # Incremental data sync (DataSyncManager in modules/integration/integration_framework.py)
+    SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '200'))
+    SYNC_LEASE_SECONDS = int(os.getenv('SYNC_LEASE_SECONDS', '900'))
+    
+    # Cash-flow forecast (services/cashflow_forecast.py); cached per tenant until the next posting
+    CASHFLOW_CASH_ACCOUNT_PREFIXES = os.getenv('CASHFLOW_CASH_ACCOUNT_PREFIXES', '10')  # 1000-1099: cash and bank
+    CASHFLOW_HISTORY_DAYS = int(os.getenv('CASHFLOW_HISTORY_DAYS', '1095'))
+    CASHFLOW_FORECAST_CACHE_TTL = int(os.getenv('CASHFLOW_FORECAST_CACHE_TTL', '3600'))
+    
+    # Batch payroll (modules/hr/payroll_engine.py): GL account codes of the payroll journal
+    PAYROLL_EXPENSE_ACCOUNT = os.getenv('PAYROLL_EXPENSE_ACCOUNT', '6200')  # Salaries and Wages
+    PAYROLL_LIABILITY_ACCOUNT = os.getenv('PAYROLL_LIABILITY_ACCOUNT', '2100')  # Deductions without their own account
+    PAYROLL_TAX_ACCOUNT = os.getenv('PAYROLL_TAX_ACCOUNT', '2100')
+    PAYROLL_NET_PAY_ACCOUNT = os.getenv('PAYROLL_NET_PAY_ACCOUNT', '2100')  # Wages payable
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -104,10 +183,29 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', '')
     REDIS_URL = os.getenv('TEST_REDIS_URL', 'redis://localhost:6379/2')
     WTF_CSRF_ENABLED = False
+    FINANCE_EVENTS_SYNC = True
+    EMAIL_BACKEND = 'maildir'
+    EMAIL_MAILDIR_PATH = os.getenv('TEST_EMAIL_MAILDIR_PATH', 'instance/test-maildir')
+
+class BenchmarkConfig(Config):
+    # Scratch database filled by scripts/generate_synthetic_data.py (SQLite or local PostgreSQL)
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCHMARK_DATABASE_URL', os.getenv('DATABASE_URL', 'sqlite:///benchmark.db'))
+    REDIS_URL = os.getenv('BENCHMARK_REDIS_URL', 'redis://localhost:6379/3')
+    # Tokens are only minted in-process by scripts/run_benchmarks.py
+    SECRET_KEY = os.getenv('SECRET_KEY') or 'benchmark-only-secret'
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY') or 'benchmark-only-jwt-secret-key-32b'
+    JWT_ACCESS_TOKEN_EXPIRES = 86400
+    # No SSL or pool sizing: works for SQLite and a local server alike
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    LOG_LEVEL = 'WARNING'
+    WEBHOOK_DISPATCHER_ENABLED = False
+    FINANCE_EVENT_DISPATCHER_ENABLED = False
+    EMAIL_SENDER_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -5,6 +5,7 @@ Protects all routes by default, except public routes
 from flask import request, jsonify, g
 from functools import wraps
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from modules.core.identity_cache import identity_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -62,6 +63,12 @@ def require_authentication(app):
             logger.debug(f"Public route accessed: {path}")
             return None
         
+        # Routes marked @api_key_required authenticate the X-API-Key header themselves
+        if request.headers.get('X-API-Key'):
+            view = app.view_functions.get(request.endpoint)
+            if getattr(view, 'accepts_api_key', False):
+                return None
+        
         # All other routes require authentication
         try:
             # Verify JWT token
@@ -75,8 +82,9 @@ def require_authentication(app):
                     'message': 'Valid JWT token required. Please login first.'
                 }), 401
             
-            # Store user ID in request context
+            # Store user ID and cached identity (loaded by the JWT revocation check) in request context
             g.current_user_id = user_id
+            g.current_identity = identity_cache.get_identity(user_id)
             logger.debug(f"Authenticated request: {path} by user {user_id}")
             
             return None  # Continue to route handler
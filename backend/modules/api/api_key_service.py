@@ -0,0 +1,316 @@
+"""
+API Key Service
+Persistent API keys for external integrations, validated without a database
+round trip on the hot path and metered without a row per call.
+
+Key format: ``edo_<prefix>_<secret>``. Only the prefix (public, unique,
+indexed) and the SHA-256 hex digest of the whole key are stored in
+``api_keys``; the plaintext is shown once, when the key is created.
+
+Validation:
+- the digest of the presented key is looked up in a small per-process LRU of
+  recently verified keys (entries expire after ``API_KEY_CACHE_TTL`` seconds,
+  so a revocation made on another worker takes effect within that window);
+- on a miss, the row is fetched by its prefix (one indexed lookup) and the
+  digests are compared with ``hmac.compare_digest``;
+- unknown keys are remembered briefly as well, so a client retrying a bad key
+  does not hit the database on every request.
+
+Usage is counted in memory per (key, day, endpoint) and added to the
+``api_key_usage`` counters by a daemon thread every
+``API_KEY_USAGE_FLUSH_SECONDS`` (and at exit), together with
+``api_keys.usage_count`` / ``last_used``.
+
+Routes opt in to key authentication with ``@api_key_required``; everything
+else keeps requiring a JWT.
+"""
+
+import atexit
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'edo'
+API_KEY_HEADER = 'X-API-Key'
+
+def generate_api_key() -> Tuple[str, str]:
+    """New (plaintext key, lookup prefix) pair"""
+    prefix = secrets.token_hex(6)
+    return f"{KEY_PREFIX}_{prefix}_{secrets.token_urlsafe(32)}", prefix
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def parse_prefix(api_key: str) -> Optional[str]:
+    parts = (api_key or '').split('_', 2)
+    if len(parts) != 3 or parts[0] != KEY_PREFIX or not parts[1] or not parts[2]:
+        return None
+    return parts[1]
+
+def _key_info(key) -> Dict:
+    """The cached, JSON-safe view of an APIKey row"""
+    return {
+        'id': key.id,
+        'key_name': key.key_name,
+        'key_prefix': key.key_prefix,
+        'user_id': key.user_id,
+        'tenant_id': key.tenant_id,
+        'permissions': key.permissions or {},
+        'rate_limit': key.rate_limit,
+        'expires_at': key.expires_at.isoformat() if key.expires_at else None
+    }
+
+class APIKeyAuthenticator:
+    """LRU of verified key digests in front of the prefix lookup"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60, negative_ttl: float = 5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # digest -> (key info or None, expires at, key expiry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, app):
+        self.max_entries = app.config.get('API_KEY_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('API_KEY_CACHE_TTL', self.ttl)
+
+    def validate(self, api_key: str) -> Optional[Dict]:
+        """Key info for a valid, active, unexpired key, else None"""
+        prefix = parse_prefix(api_key)
+        if prefix is None:
+            return None
+        digest = hash_api_key(api_key)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                info, _, key_expires = entry
+                if info is not None and key_expires is not None and key_expires <= datetime.utcnow():
+                    return None
+                return info
+        self.misses += 1
+
+        info, key_expires = self._load(prefix, digest)
+        with self._lock:
+            self._entries[digest] = (info, now + (self.ttl if info is not None else self.negative_ttl), key_expires)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if info is not None and key_expires is not None and key_expires <= datetime.utcnow():
+            return None
+        return info
+
+    @staticmethod
+    def _load(prefix: str, digest: str):
+        from modules.api.models import APIKey
+        key = APIKey.query.filter_by(key_prefix=prefix).first()
+        if key is None or not hmac.compare_digest(key.key_hash, digest):
+            return None, None
+        if not key.is_active:
+            return None, None
+        return _key_info(key), key.expires_at
+
+    def invalidate(self, key_id: int = None):
+        """Drop a revoked/changed key (or everything) from this process's cache"""
+        with self._lock:
+            if key_id is None:
+                self._entries.clear()
+                return
+            for digest in [d for d, e in self._entries.items() if e[0] and e[0]['id'] == key_id]:
+                del self._entries[digest]
+
+class UsageRecorder:
+    """
+    In-memory per (key, day, endpoint) counters added to ``api_key_usage`` by a
+    daemon thread. A flush costs one UPDATE (or INSERT) per counter touched in
+    the interval, however many calls it covers; a failed flush keeps its
+    counters for the next one.
+    """
+
+    UPDATE_USAGE_SQL = text("""
+        UPDATE api_key_usage
+        SET call_count = call_count + :calls, error_count = error_count + :errors,
+            total_response_ms = total_response_ms + :total_ms, updated_at = :now
+        WHERE api_key_id = :api_key_id AND day = :day AND endpoint = :endpoint
+    """)
+    INSERT_USAGE_SQL = text("""
+        INSERT INTO api_key_usage
+        (api_key_id, day, endpoint, call_count, error_count, total_response_ms, updated_at)
+        VALUES (:api_key_id, :day, :endpoint, :calls, :errors, :total_ms, :now)
+    """)
+    UPDATE_KEY_SQL = text("""
+        UPDATE api_keys
+        SET usage_count = COALESCE(usage_count, 0) + :calls, last_used = :last_used
+        WHERE id = :api_key_id
+    """)
+
+    def __init__(self, flush_interval: float = 10):
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self.flushed_rows = 0
+
+    def record(self, app, api_key_id: int, endpoint: str, status_code: int, response_ms: float):
+        if self._thread is None:
+            self._start(app)
+        now = datetime.utcnow()
+        counter_key = (api_key_id, now.date(), endpoint)
+        with self._lock:
+            counts = self._counters.get(counter_key)
+            if counts is None:
+                counts = self._counters[counter_key] = [0, 0, 0.0]
+            counts[0] += 1
+            if status_code >= 400:
+                counts[1] += 1
+            counts[2] += response_ms
+            self._last_used[api_key_id] = now
+
+    def pending(self, api_key_id: int = None) -> int:
+        """Calls recorded but not flushed yet"""
+        with self._lock:
+            return sum(c[0] for k, c in self._counters.items() if api_key_id is None or k[0] == api_key_id)
+
+    def _start(self, app):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self.flush_interval = app.config.get('API_KEY_USAGE_FLUSH_SECONDS', self.flush_interval)
+            self._thread = threading.Thread(target=self._run, name='api-key-usage-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Add the counters gathered since the last flush to the database"""
+        if self._app is None:
+            return
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            last_used, self._last_used = self._last_used, {}
+        if not counters:
+            return
+
+        from app import db
+        from sqlalchemy.exc import IntegrityError
+        now = datetime.utcnow()
+        calls_per_key = {}
+        with self._flush_lock:
+            try:
+                with self._app.app_context():
+                    for (api_key_id, day, endpoint), (calls, errors, total_ms) in counters.items():
+                        params = {'api_key_id': api_key_id, 'day': day, 'endpoint': endpoint[:200],
+                                  'calls': calls, 'errors': errors, 'total_ms': total_ms, 'now': now}
+                        if db.session.execute(self.UPDATE_USAGE_SQL, params).rowcount == 0:
+                            try:
+                                with db.session.begin_nested():
+                                    db.session.execute(self.INSERT_USAGE_SQL, params)
+                            except IntegrityError:
+                                # Another worker created the row first
+                                db.session.execute(self.UPDATE_USAGE_SQL, params)
+                        calls_per_key[api_key_id] = calls_per_key.get(api_key_id, 0) + calls
+                    db.session.execute(self.UPDATE_KEY_SQL, [
+                        {'api_key_id': api_key_id, 'calls': calls, 'last_used': last_used.get(api_key_id, now)}
+                        for api_key_id, calls in calls_per_key.items()
+                    ])
+                    db.session.commit()
+                self.flushed_rows += len(counters)
+            except Exception as e:
+                logger.error(f"Error flushing usage of {len(counters)} API key counter(s): {e}")
+                try:
+                    with self._app.app_context():
+                        db.session.rollback()
+                except Exception:
+                    pass
+                self._restore(counters, last_used)
+
+    def _restore(self, counters, last_used):
+        """Merge the counters of a failed flush back so the next flush writes them"""
+        with self._lock:
+            for counter_key, (calls, errors, total_ms) in counters.items():
+                counts = self._counters.get(counter_key)
+                if counts is None:
+                    counts = self._counters[counter_key] = [0, 0, 0.0]
+                counts[0] += calls
+                counts[1] += errors
+                counts[2] += total_ms
+            for api_key_id, used in last_used.items():
+                self._last_used[api_key_id] = max(used, self._last_used.get(api_key_id, used))
+
+def create_api_key(user_id: int, tenant_id: str, key_name: str, permissions: Dict = None,
+                   rate_limit: int = 1000, expires_at: datetime = None):
+    """Persist a new key; returns (APIKey, plaintext key). The caller commits."""
+    from app import db
+    from modules.api.models import APIKey
+    api_key, prefix = generate_api_key()
+    key = APIKey(
+        key_name=key_name,
+        key_prefix=prefix,
+        key_hash=hash_api_key(api_key),
+        user_id=user_id,
+        tenant_id=tenant_id,
+        permissions=permissions or {},
+        rate_limit=rate_limit,
+        is_active=True,
+        expires_at=expires_at,
+        usage_count=0
+    )
+    db.session.add(key)
+    return key, api_key
+
+def api_key_required(f):
+    """
+    Authenticate the request with the ``X-API-Key`` header instead of a JWT.
+    Sets ``g.api_key`` (key info) and ``g.current_user_id`` to the key owner,
+    and counts the call in the key's usage.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        started = time.perf_counter()
+        info = api_key_authenticator.validate(request.headers.get(API_KEY_HEADER, ''))
+        if info is None:
+            return jsonify({'error': 'Invalid API key', 'message': f'A valid {API_KEY_HEADER} header is required'}), 401
+        g.api_key = info
+        g.current_user_id = info['user_id']
+        g.tenant_id = info['tenant_id']
+
+        status_code = 500
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+            status_code = response.status_code
+            return response
+        finally:
+            usage_recorder.record(current_app._get_current_object(), info['id'],
+                                  request.url_rule.rule if request.url_rule else request.path,
+                                  status_code, (time.perf_counter() - started) * 1000)
+    decorated_function.accepts_api_key = True
+    return decorated_function
+
+api_key_authenticator = APIKeyAuthenticator()
+usage_recorder = UsageRecorder()
@@ -3,18 +3,21 @@ from datetime import datetime
 # Use db.JSON for SQLite compatibility
 
 class APIKey(db.Model):
-    """API keys for external integrations"""
+    """API keys for external integrations (only a prefix and a SHA-256 digest are stored)"""
     __tablename__ = 'api_keys'
     
     id = db.Column(db.Integer, primary_key=True)
     key_name = db.Column(db.String(200), nullable=False)
-    key_hash = db.Column(db.String(255), unique=True, nullable=False)
+    key_prefix = db.Column(db.String(16), unique=True, index=True)  # Public lookup part of the key
+    key_hash = db.Column(db.String(255), unique=True, nullable=False)  # SHA-256 hex digest of the full key
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    tenant_id = db.Column(db.String(50), index=True)
     permissions = db.Column(db.JSON)  # Store API permissions
     rate_limit = db.Column(db.Integer, default=1000)  # Requests per hour
     is_active = db.Column(db.Boolean, default=True)
     expires_at = db.Column(db.DateTime)
-    last_used = db.Column(db.DateTime)
+    last_used = db.Column(db.DateTime)  # Updated when usage counters are flushed
+    usage_count = db.Column(db.BigInteger, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -40,6 +43,23 @@ class APICall(db.Model):
     call_metadata = db.Column(db.JSON)  # Store additional call metadata
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+class APIKeyUsage(db.Model):
+    """Per key, day and endpoint call counters (flushed in batches, not one row per call)"""
+    __tablename__ = 'api_key_usage'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    api_key_id = db.Column(db.Integer, db.ForeignKey('api_keys.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    endpoint = db.Column(db.String(200), nullable=False)
+    call_count = db.Column(db.BigInteger, default=0)
+    error_count = db.Column(db.BigInteger, default=0)
+    total_response_ms = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('api_key_id', 'day', 'endpoint', name='uq_api_key_usage_key_day_endpoint'),
+    )
+
 class APIVersion(db.Model):
     """API versioning and documentation"""
     __tablename__ = 'api_versions'
@@ -110,6 +130,47 @@ class IntegrationEvent(db.Model):
     # Relationships
     integration = db.relationship('Integration', foreign_keys=[integration_id])
 
+class SyncCursor(db.Model):
+    """High-water mark of an incremental sync (see modules/integration/integration_framework.py)"""
+    __tablename__ = 'sync_cursors'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_system = db.Column(db.String(100), nullable=False)
+    target_system = db.Column(db.String(100), nullable=False)
+    entity = db.Column(db.String(100), nullable=False)  # customers, invoices, ...
+    tenant_id = db.Column(db.String(50), nullable=False, default='default')
+    cursor = db.Column(db.String(500))  # Opaque position returned by the source; NULL = from the start
+    status = db.Column(db.String(50), default='idle')  # idle, running, failed
+    locked_until = db.Column(db.DateTime)  # Lease held by the process running the sync
+    records_synced = db.Column(db.BigInteger, default=0)
+    last_run_at = db.Column(db.DateTime)
+    last_success_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('source_system', 'target_system', 'entity', 'tenant_id', name='uq_sync_cursor'),
+    )
+
+class ExternalIdMapping(db.Model):
+    """Source record id -> id of the copy created in the target system"""
+    __tablename__ = 'external_id_mappings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_system = db.Column(db.String(100), nullable=False)
+    target_system = db.Column(db.String(100), nullable=False)
+    entity = db.Column(db.String(100), nullable=False)
+    tenant_id = db.Column(db.String(50), nullable=False, default='default')
+    source_id = db.Column(db.String(255), nullable=False)
+    target_id = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64))  # SHA-256 of the last record sent, to skip unchanged re-reads
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('source_system', 'target_system', 'entity', 'tenant_id', 'source_id',
+                            name='uq_external_id_mapping'),
+    )
+
 class MarketplaceApp(db.Model):
     """Marketplace applications"""
     __tablename__ = 'marketplace_apps'
@@ -207,8 +268,9 @@ class Webhook(db.Model):
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    tenant_id = db.Column(db.String(50), index=True)  # Events of this tenant only (NULL = all tenants)
     url = db.Column(db.String(500), nullable=False)
-    events = db.Column(db.JSON)  # Store event types to listen for
+    events = db.Column(db.JSON)  # Store event types to listen for ("*"/"all", "finance.*" wildcards)
     secret_key = db.Column(db.String(255))  # For webhook signature verification
     is_active = db.Column(db.Boolean, default=True)
     retry_count = db.Column(db.Integer, default=3)
@@ -221,21 +283,32 @@ class Webhook(db.Model):
     deliveries = db.relationship('WebhookDelivery', backref='webhook', lazy=True)
 
 class WebhookDelivery(db.Model):
-    """Webhook delivery tracking"""
+    """Webhook delivery tracking - also the outbox drained by modules.api.webhook_dispatcher"""
     __tablename__ = 'webhook_deliveries'
     
     id = db.Column(db.Integer, primary_key=True)
     webhook_id = db.Column(db.Integer, db.ForeignKey('webhooks.id'), nullable=False)
     event_type = db.Column(db.String(100), nullable=False)
+    event_id = db.Column(db.String(36))  # Shared by every delivery of one emitted event
+    tenant_id = db.Column(db.String(50))
     payload = db.Column(db.JSON)  # Store webhook payload
+    status = db.Column(db.String(20), default='pending')  # pending, in_flight, delivered, dead
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)  # Lease of the dispatcher currently sending it
     response_status = db.Column(db.Integer)
     response_body = db.Column(db.Text)
     response_headers = db.Column(db.JSON)
     delivery_time = db.Column(db.Float)  # Delivery time in seconds
     success = db.Column(db.Boolean, default=True)
     error_message = db.Column(db.Text)
-    retry_count = db.Column(db.Integer, default=0)
+    retry_count = db.Column(db.Integer, default=0)  # Failed attempts so far
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
     delivered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_webhook_deliveries_due', 'status', 'next_attempt_at'),
+        db.Index('idx_webhook_deliveries_webhook', 'webhook_id', 'created_at'),
+    )
 
 class APIDocumentation(db.Model):
     """API documentation and guides"""
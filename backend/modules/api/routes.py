@@ -1,18 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 from datetime import datetime, timedelta
 from app import db
 from modules.api.models import (
-    APIKey, APICall, APIVersion, APIEndpoint, Integration, IntegrationEvent,
+    APIKey, APIKeyUsage, APICall, APIVersion, APIEndpoint, Integration, IntegrationEvent,
     MarketplaceApp, AppReview, AppInstallation, DeveloperAccount, Webhook,
     WebhookDelivery, APIDocumentation, SandboxEnvironment, PartnerProgram
 )
+from modules.api.api_key_service import (
+    api_key_authenticator, api_key_required, usage_recorder,
+    create_api_key as create_persistent_api_key
+)
 import uuid
 
 bp = Blueprint('api', __name__, url_prefix='/api/ecosystem')
 
 # Sample data for initial state
-api_keys = []
-api_calls = []
 api_versions = []
 api_endpoints = []
 integrations = []
@@ -21,64 +23,119 @@ marketplace_apps = []
 app_reviews = []
 app_installations = []
 developer_accounts = []
-webhooks = []
-webhook_deliveries = []
 api_documentation = []
 sandbox_environments = []
 partner_programs = []
 
-# API Key endpoints
+# API Key endpoints (persistent; see modules.api.api_key_service)
+def _api_key_to_dict(key):
+    return {
+        "id": key.id,
+        "key_name": key.key_name,
+        "key_prefix": key.key_prefix,
+        "user_id": key.user_id,
+        "tenant_id": key.tenant_id,
+        "permissions": key.permissions or {},
+        "rate_limit": key.rate_limit,
+        "is_active": key.is_active,
+        "expires_at": key.expires_at.isoformat() if key.expires_at else None,
+        "last_used": key.last_used.isoformat() if key.last_used else None,
+        "usage_count": (key.usage_count or 0) + usage_recorder.pending(key.id),
+        "created_at": key.created_at.isoformat() if key.created_at else None
+    }
+
+@bp.record_once
+def _configure_api_keys(state):
+    api_key_authenticator.configure(state.app)
+
 @bp.route('/keys', methods=['GET'])
 def get_api_keys():
     """Get all API keys"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    query = APIKey.query.filter_by(tenant_id=get_current_user_tenant_id())
     user_id = request.args.get('user_id', type=int)
-    is_active = request.args.get('is_active', type=bool)
-    
-    filtered_keys = api_keys
     if user_id:
-        filtered_keys = [k for k in api_keys if k.get('user_id') == user_id]
-    if is_active is not None:
-        filtered_keys = [k for k in api_keys if k.get('is_active') == is_active]
+        query = query.filter_by(user_id=user_id)
+    if 'is_active' in request.args:
+        query = query.filter_by(is_active=request.args.get('is_active').lower() == 'true')
     
-    return jsonify(filtered_keys)
+    return jsonify([_api_key_to_dict(k) for k in query.order_by(APIKey.id).all()])
 
 @bp.route('/keys', methods=['POST'])
 def create_api_key():
     """Create a new API key"""
-    data = request.get_json()
-    
-    # Generate a unique key hash
-    key_hash = f"edonuops_{uuid.uuid4().hex[:32]}"
-    
-    new_key = {
-        "id": len(api_keys) + 1,
-        "key_name": data.get('key_name'),
-        "key_hash": key_hash,
-        "user_id": data.get('user_id'),
-        "permissions": data.get('permissions', {}),
-        "rate_limit": data.get('rate_limit', 1000),
-        "is_active": data.get('is_active', True),
-        "expires_at": data.get('expires_at'),
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    api_keys.append(new_key)
-    return jsonify(new_key), 201
-
-# API Call tracking endpoints
+    from flask_jwt_extended import get_jwt_identity
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    data = request.get_json() or {}
+    if not data.get('key_name'):
+        return jsonify({'error': 'key_name is required'}), 400
+    
+    try:
+        expires_at = datetime.fromisoformat(data['expires_at']) if data.get('expires_at') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'expires_at must be an ISO 8601 datetime'}), 400
+    
+    try:
+        key, plaintext = create_persistent_api_key(
+            user_id=int(get_jwt_identity()),
+            tenant_id=get_current_user_tenant_id(),
+            key_name=data['key_name'],
+            permissions=data.get('permissions', {}),
+            rate_limit=data.get('rate_limit', 1000),
+            expires_at=expires_at
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to create API key: {str(e)}'}), 500
+    
+    result = _api_key_to_dict(key)
+    # Only the digest is stored: the key itself is returned once, at creation
+    result['api_key'] = plaintext
+    return jsonify(result), 201
+
+@bp.route('/keys/<int:key_id>', methods=['DELETE'])
+def revoke_api_key(key_id):
+    """Revoke an API key"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    key = APIKey.query.filter_by(id=key_id, tenant_id=get_current_user_tenant_id()).first()
+    if key is None:
+        return jsonify({'error': 'API key not found'}), 404
+    
+    key.is_active = False
+    db.session.commit()
+    api_key_authenticator.invalidate(key.id)
+    return jsonify({'message': 'API key revoked', 'id': key.id})
+
+@bp.route('/keys/verify', methods=['GET'])
+@api_key_required
+def verify_api_key():
+    """Describe the API key presented in X-API-Key"""
+    return jsonify({'valid': True, 'key': g.api_key})
+
+# API usage endpoints (daily counters per key and endpoint)
 @bp.route('/calls', methods=['GET'])
 def get_api_calls():
     """Get API call history"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    query = db.session.query(APIKeyUsage).join(APIKey, APIKey.id == APIKeyUsage.api_key_id)\
+        .filter(APIKey.tenant_id == get_current_user_tenant_id())
     api_key_id = request.args.get('api_key_id', type=int)
     endpoint = request.args.get('endpoint')
-    
-    filtered_calls = api_calls
     if api_key_id:
-        filtered_calls = [c for c in api_calls if c.get('api_key_id') == api_key_id]
+        query = query.filter(APIKeyUsage.api_key_id == api_key_id)
     if endpoint:
-        filtered_calls = [c for c in api_calls if c.get('endpoint') == endpoint]
-    
-    return jsonify(filtered_calls)
+        query = query.filter(APIKeyUsage.endpoint == endpoint)
+    
+    rows = query.order_by(APIKeyUsage.day.desc(), APIKeyUsage.call_count.desc()).limit(1000).all()
+    return jsonify([{
+        "api_key_id": row.api_key_id,
+        "day": row.day.isoformat(),
+        "endpoint": row.endpoint,
+        "call_count": row.call_count,
+        "error_count": row.error_count,
+        "average_response_time": (row.total_response_ms or 0) / row.call_count if row.call_count else 0
+    } for row in rows])
 
 # API Version endpoints
 @bp.route('/versions', methods=['GET'])
@@ -342,49 +399,150 @@ def create_developer_account():
     developer_accounts.append(new_account)
     return jsonify(new_account), 201
 
-# Webhook endpoints
+# Webhook endpoints (persistent; deliveries go through modules.api.webhook_dispatcher)
+def _webhook_to_dict(webhook):
+    return {
+        "id": webhook.id,
+        "name": webhook.name,
+        "description": webhook.description,
+        "user_id": webhook.user_id,
+        "tenant_id": webhook.tenant_id,
+        "url": webhook.url,
+        "events": webhook.events or [],
+        "has_secret": bool(webhook.secret_key),
+        "is_active": webhook.is_active,
+        "retry_count": webhook.retry_count,
+        "timeout": webhook.timeout,
+        "created_at": webhook.created_at.isoformat() if webhook.created_at else None
+    }
+
+def _delivery_to_dict(delivery):
+    return {
+        "id": delivery.id,
+        "webhook_id": delivery.webhook_id,
+        "event_type": delivery.event_type,
+        "event_id": delivery.event_id,
+        "status": delivery.status,
+        "success": delivery.success,
+        "retry_count": delivery.retry_count,
+        "response_status": delivery.response_status,
+        "error_message": delivery.error_message,
+        "delivery_time": delivery.delivery_time,
+        "next_attempt_at": delivery.next_attempt_at.isoformat() if delivery.next_attempt_at else None,
+        "created_at": delivery.created_at.isoformat() if delivery.created_at else None,
+        "delivered_at": delivery.delivered_at.isoformat() if delivery.delivered_at else None
+    }
+
+def _tenant_webhook(webhook_id):
+    """Webhook ``webhook_id`` if it belongs to the caller's tenant"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    return Webhook.query.filter_by(id=webhook_id, tenant_id=get_current_user_tenant_id()).first()
+
 @bp.route('/webhooks', methods=['GET'])
 def get_webhooks():
     """Get webhooks"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    query = Webhook.query.filter_by(tenant_id=get_current_user_tenant_id())
     user_id = request.args.get('user_id', type=int)
-    is_active = request.args.get('is_active', type=bool)
-    
-    filtered_webhooks = webhooks
     if user_id:
-        filtered_webhooks = [w for w in webhooks if w.get('user_id') == user_id]
-    if is_active is not None:
-        filtered_webhooks = [w for w in webhooks if w.get('is_active') == is_active]
+        query = query.filter_by(user_id=user_id)
+    if 'is_active' in request.args:
+        query = query.filter_by(is_active=request.args.get('is_active').lower() == 'true')
     
-    return jsonify(filtered_webhooks)
+    return jsonify([_webhook_to_dict(w) for w in query.order_by(Webhook.id).all()])
 
 @bp.route('/webhooks', methods=['POST'])
 def create_webhook():
     """Create a new webhook"""
-    data = request.get_json()
-    
-    new_webhook = {
-        "id": len(webhooks) + 1,
-        "name": data.get('name'),
-        "description": data.get('description'),
-        "user_id": data.get('user_id'),
-        "url": data.get('url'),
-        "events": data.get('events', []),
-        "secret_key": data.get('secret_key'),
-        "is_active": data.get('is_active', True),
-        "retry_count": data.get('retry_count', 3),
-        "timeout": data.get('timeout', 30),
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    webhooks.append(new_webhook)
-    return jsonify(new_webhook), 201
+    from flask_jwt_extended import get_jwt_identity
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    from modules.api.webhook_dispatcher import webhook_dispatcher
+    data = request.get_json() or {}
+    if not data.get('url', '').startswith(('http://', 'https://')):
+        return jsonify({'error': 'A http(s) url is required'}), 400
+    
+    try:
+        webhook = Webhook(
+            name=data.get('name') or data['url'],
+            description=data.get('description'),
+            user_id=int(get_jwt_identity()),
+            tenant_id=get_current_user_tenant_id(),
+            url=data['url'],
+            events=data.get('events') or ['*'],
+            secret_key=data.get('secret_key') or uuid.uuid4().hex,
+            is_active=data.get('is_active', True),
+            retry_count=data.get('retry_count', 3),
+            timeout=data.get('timeout', 30)
+        )
+        db.session.add(webhook)
+        db.session.commit()
+        webhook_dispatcher.invalidate_index()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to create webhook: {str(e)}'}), 500
+    
+    result = _webhook_to_dict(webhook)
+    # The signing secret is only returned once, at creation
+    result['secret_key'] = webhook.secret_key
+    return jsonify(result), 201
+
+@bp.route('/webhooks/<int:webhook_id>', methods=['PUT'])
+def update_webhook(webhook_id):
+    """Update a webhook (url, events, secret, active flag, retries, timeout)"""
+    from modules.api.webhook_dispatcher import webhook_dispatcher
+    webhook = _tenant_webhook(webhook_id)
+    if webhook is None:
+        return jsonify({'error': 'Webhook not found'}), 404
+    
+    data = request.get_json() or {}
+    for field in ('name', 'description', 'url', 'events', 'secret_key', 'is_active', 'retry_count', 'timeout'):
+        if field in data:
+            setattr(webhook, field, data[field])
+    db.session.commit()
+    webhook_dispatcher.invalidate_index()
+    return jsonify(_webhook_to_dict(webhook))
+
+@bp.route('/webhooks/<int:webhook_id>', methods=['DELETE'])
+def delete_webhook(webhook_id):
+    """Deactivate a webhook (its delivery history is kept)"""
+    from modules.api.webhook_dispatcher import webhook_dispatcher
+    webhook = _tenant_webhook(webhook_id)
+    if webhook is None:
+        return jsonify({'error': 'Webhook not found'}), 404
+    
+    webhook.is_active = False
+    db.session.commit()
+    webhook_dispatcher.invalidate_index()
+    return jsonify({'message': 'Webhook deactivated'})
 
 # Webhook Delivery endpoints
 @bp.route('/webhooks/<int:webhook_id>/deliveries', methods=['GET'])
 def get_webhook_deliveries(webhook_id):
-    """Get deliveries for a specific webhook"""
-    deliveries = [d for d in webhook_deliveries if d.get('webhook_id') == webhook_id]
-    return jsonify(deliveries)
+    """Get deliveries for a specific webhook (newest first; ?status=dead for the dead letters)"""
+    from modules.api.webhook_dispatcher import webhook_dispatcher
+    if _tenant_webhook(webhook_id) is None:
+        return jsonify({'error': 'Webhook not found'}), 404
+    
+    query = WebhookDelivery.query.filter_by(webhook_id=webhook_id)
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    limit = min(request.args.get('limit', 100, type=int), 500)
+    deliveries = query.order_by(WebhookDelivery.id.desc()).limit(limit).all()
+    return jsonify({
+        'deliveries': [_delivery_to_dict(d) for d in deliveries],
+        'counts': webhook_dispatcher.status_counts(webhook_id)
+    })
+
+@bp.route('/webhooks/<int:webhook_id>/deliveries/<int:delivery_id>/redeliver', methods=['POST'])
+def redeliver_webhook_delivery(webhook_id, delivery_id):
+    """Re-queue a (dead-lettered) delivery"""
+    from modules.api.webhook_dispatcher import webhook_dispatcher
+    if _tenant_webhook(webhook_id) is None or WebhookDelivery.query.filter_by(
+            id=delivery_id, webhook_id=webhook_id).first() is None:
+        return jsonify({'error': 'Delivery not found'}), 404
+    if not webhook_dispatcher.redeliver(delivery_id):
+        return jsonify({'error': 'Delivery is being sent right now'}), 409
+    return jsonify({'message': 'Delivery queued'})
 
 # API Documentation endpoints
 @bp.route('/documentation', methods=['GET'])
@@ -500,17 +658,17 @@ def create_partner_program():
 def get_ecosystem_summary():
     """Get ecosystem summary analytics"""
     summary = {
-        "total_api_keys": len(api_keys),
-        "active_api_keys": len([k for k in api_keys if k.get('is_active')]),
-        "total_api_calls": len(api_calls),
+        "total_api_keys": APIKey.query.count(),
+        "active_api_keys": APIKey.query.filter_by(is_active=True).count(),
+        "total_api_calls": int(db.session.query(db.func.coalesce(db.func.sum(APIKey.usage_count), 0)).scalar()),
         "total_integrations": len(integrations),
         "active_integrations": len([i for i in integrations if i.get('is_active')]),
         "total_marketplace_apps": len(marketplace_apps),
         "published_apps": len([a for a in marketplace_apps if a.get('status') == 'published']),
         "total_developers": len(developer_accounts),
         "verified_developers": len([d for d in developer_accounts if d.get('verification_status') == 'verified']),
-        "total_webhooks": len(webhooks),
-        "active_webhooks": len([w for w in webhooks if w.get('is_active')]),
+        "total_webhooks": Webhook.query.count(),
+        "active_webhooks": Webhook.query.filter_by(is_active=True).count(),
         "total_partners": len(partner_programs),
         "active_partners": len([p for p in partner_programs if p.get('is_active')])
     }
@@ -520,15 +678,26 @@ def get_ecosystem_summary():
 @bp.route('/analytics/api-usage', methods=['GET'])
 def get_api_usage_analytics():
     """Get API usage analytics"""
+    func = db.func
+    by_endpoint = db.session.query(
+        APIKeyUsage.endpoint, func.sum(APIKeyUsage.call_count), func.sum(APIKeyUsage.error_count),
+        func.sum(APIKeyUsage.total_response_ms)
+    ).group_by(APIKeyUsage.endpoint).all()
+    total_calls = sum(int(calls or 0) for _, calls, _, _ in by_endpoint)
+    total_errors = sum(int(errors or 0) for _, _, errors, _ in by_endpoint)
+    total_ms = sum(float(ms or 0) for _, _, _, ms in by_endpoint)
+    top_keys = db.session.query(APIKeyUsage.api_key_id, func.sum(APIKeyUsage.call_count).label('calls'))\
+        .group_by(APIKeyUsage.api_key_id).order_by(func.sum(APIKeyUsage.call_count).desc()).limit(10).all()
+    
     usage = {
-        "total_calls": len(api_calls),
-        "calls_by_endpoint": {},
+        "total_calls": total_calls,
+        "calls_by_endpoint": {endpoint: int(calls or 0) for endpoint, calls, _, _ in by_endpoint},
         "calls_by_status": {
-            "success": len([c for c in api_calls if c.get('status_code', 200) < 400]),
-            "error": len([c for c in api_calls if c.get('status_code', 200) >= 400])
+            "success": total_calls - total_errors,
+            "error": total_errors
         },
-        "average_response_time": sum([c.get('response_time', 0) for c in api_calls]) / max(len(api_calls), 1),
-        "top_api_keys": []
+        "average_response_time": total_ms / max(total_calls, 1),
+        "top_api_keys": [{"api_key_id": key_id, "calls": int(calls or 0)} for key_id, calls in top_keys]
     }
     
     return jsonify(usage)
@@ -0,0 +1,388 @@
+"""
+Webhook Dispatcher
+Durable, outbox-based webhook delivery.
+
+``emit`` only adds ``WebhookDelivery`` rows (status ``pending``) to the
+caller's session, so a delivery exists exactly when the business transaction
+that produced the event commits, and emitting never waits on the network.
+Subscriptions are looked up in an in-process index keyed by
+(tenant, event type) instead of scanning every webhook. ``invalidate_index``
+bumps the ``webhook_subscriptions`` tag of ``cache_service``, which is shared
+through Redis; every process reloads its index once it sees a new version
+(and at least every ``WEBHOOK_INDEX_TTL`` seconds).
+
+A daemon thread per process claims due rows (``FOR UPDATE SKIP LOCKED`` on
+PostgreSQL, a serialized write on SQLite) under a lease and hands them to a
+bounded thread pool, at most ``WEBHOOK_PER_ENDPOINT_CONCURRENCY`` requests per
+endpoint URL at a time. Each request is signed:
+
+    X-EdonuOps-Signature: sha256=HMAC_SHA256(secret_key, "<timestamp>.<body>")
+
+Failures (network errors, 408/425/429, 5xx) are retried with exponential
+backoff and jitter up to the webhook's ``retry_count``; after that, or on any
+other 4xx, the delivery is dead-lettered (status ``dead``) and can be
+re-queued with ``redeliver``. A crashed process's leases expire and its rows
+are picked up again, so delivery is at-least-once: receivers should dedupe
+on ``X-EdonuOps-Delivery``.
+"""
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, or_, and_, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+WILDCARDS = ('*', 'all')
+RETRYABLE_STATUSES = (408, 425, 429)
+RESPONSE_BODY_LIMIT = 2000
+INDEX_TAG = 'webhook_subscriptions'
+
+def _wildcard_keys(event_type: str) -> List[str]:
+    """"finance.journal_posted" -> ["finance.journal_posted", "finance.*", "*"]"""
+    keys = [event_type]
+    parts = event_type.split('.')
+    for i in range(len(parts) - 1, 0, -1):
+        keys.append('.'.join(parts[:i]) + '.*')
+    keys.append('*')
+    return keys
+
+def sign_payload(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+class WebhookDispatcher:
+    """Outbox writer (``emit``) plus the background delivery loop"""
+
+    def __init__(self):
+        self._app = None
+        self._index = None
+        self._index_loaded_at = 0.0
+        self._index_version = None
+        self._index_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._executor = None
+        self._inflight = defaultdict(int)
+        self._inflight_lock = threading.Lock()
+        self._outstanding = 0
+        self._local = threading.local()
+        self._last_error_log = 0.0
+        self.stats = {'emitted': 0, 'delivered': 0, 'retried': 0, 'dead': 0}
+
+        # Tunables (overridden from config in init_app)
+        self.workers = 8
+        self.per_endpoint = 2
+        self.poll_interval = 2.0
+        self.backoff_base = 10.0
+        self.backoff_max = 3600.0
+        self.index_ttl = 60.0
+
+    def init_app(self, app, start: bool = True):
+        config = app.config
+        self._app = app
+        self.workers = int(config.get('WEBHOOK_WORKERS', self.workers))
+        self.per_endpoint = int(config.get('WEBHOOK_PER_ENDPOINT_CONCURRENCY', self.per_endpoint))
+        self.poll_interval = float(config.get('WEBHOOK_POLL_INTERVAL', self.poll_interval))
+        self.backoff_base = float(config.get('WEBHOOK_BACKOFF_SECONDS', self.backoff_base))
+        self.backoff_max = float(config.get('WEBHOOK_BACKOFF_MAX_SECONDS', self.backoff_max))
+        self.index_ttl = float(config.get('WEBHOOK_INDEX_TTL', self.index_ttl))
+        app.extensions['webhook_dispatcher'] = self
+        if start:
+            self.start()
+
+    # ------------------------------------------------------------------
+    # Subscriptions
+    # ------------------------------------------------------------------
+
+    def _load_index(self) -> Dict:
+        from modules.api.models import Webhook
+        index = defaultdict(list)
+        rows = Webhook.query.with_entities(Webhook.id, Webhook.tenant_id, Webhook.events).filter(
+            Webhook.is_active == True
+        ).all()
+        for webhook_id, tenant_id, events in rows:
+            for event_type in (events or ['*']):
+                key = '*' if event_type in WILDCARDS else event_type
+                index[(tenant_id, key)].append(webhook_id)
+        return dict(index)
+
+    def subscriptions(self, event_type: str, tenant_id: Optional[str] = None) -> List[int]:
+        """Ids of the active webhooks subscribed to ``event_type`` for ``tenant_id``"""
+        from services.cache_service import cache_service
+
+        # Read before loading, so a change committed during the load triggers another one
+        version = cache_service.tag_version(INDEX_TAG)
+
+        def stale():
+            return (self._index is None or version != self._index_version or
+                    time.time() - self._index_loaded_at > self.index_ttl)
+
+        index = self._index
+        if stale():
+            with self._index_lock:
+                if stale():
+                    self._index = self._load_index()
+                    self._index_version = version
+                    self._index_loaded_at = time.time()
+                index = self._index
+        matched = []
+        for key in _wildcard_keys(event_type):
+            matched.extend(index.get((tenant_id, key), ()))
+            if tenant_id is not None:
+                matched.extend(index.get((None, key), ()))
+        return sorted(set(matched))
+
+    def invalidate_index(self):
+        """Call after committing a created, changed or deleted webhook; reaches every process"""
+        from services.cache_service import cache_service
+        self._index = None
+        cache_service.invalidate_tags(INDEX_TAG)
+
+    # ------------------------------------------------------------------
+    # Outbox
+    # ------------------------------------------------------------------
+
+    def emit(self, event_type: str, data: Dict, tenant_id: Optional[str] = None, session=None) -> int:
+        """
+        Queue ``event_type`` for every matching webhook in the caller's
+        transaction (``db.session`` by default). Nothing is sent until that
+        transaction commits. Returns the number of deliveries queued.
+        """
+        from app import db
+        from modules.api.models import WebhookDelivery
+
+        webhook_ids = self.subscriptions(event_type, tenant_id)
+        if not webhook_ids:
+            return 0
+        session = session or db.session
+        now = datetime.utcnow()
+        envelope = {
+            'id': str(uuid.uuid4()),
+            'type': event_type,
+            'tenant_id': tenant_id,
+            'created_at': now.isoformat() + 'Z',
+            # Round-trip so dates/decimals become JSON and later mutation of data is not seen
+            'data': json.loads(json.dumps(data, default=str))
+        }
+        session.add_all([WebhookDelivery(
+            webhook_id=webhook_id, event_type=event_type, event_id=envelope['id'], tenant_id=tenant_id,
+            payload=envelope, status='pending', next_attempt_at=now, success=False, retry_count=0,
+            created_at=now, delivered_at=None
+        ) for webhook_id in webhook_ids])
+        session.info['webhooks_pending'] = True
+        self.stats['emitted'] += len(webhook_ids)
+        return len(webhook_ids)
+
+    def _after_commit(self, session):
+        if session.in_nested_transaction():
+            return  # a savepoint released; the deliveries are not committed yet
+        if session.info.pop('webhooks_pending', False):
+            self._wakeup.set()
+
+    def redeliver(self, delivery_id: int) -> bool:
+        """Re-queue a delivery (typically a dead-lettered one) for immediate sending"""
+        from app import db
+        from modules.api.models import WebhookDelivery
+        updated = WebhookDelivery.query.filter(
+            WebhookDelivery.id == delivery_id, WebhookDelivery.status != 'in_flight'
+        ).update({'status': 'pending', 'next_attempt_at': datetime.utcnow(), 'retry_count': 0,
+                  'error_message': None}, synchronize_session=False)
+        db.session.commit()
+        self._wakeup.set()
+        return bool(updated)
+
+    def status_counts(self, webhook_id: Optional[int] = None) -> Dict[str, int]:
+        from app import db
+        from modules.api.models import WebhookDelivery
+        query = db.session.query(WebhookDelivery.status, func.count(WebhookDelivery.id))
+        if webhook_id is not None:
+            query = query.filter(WebhookDelivery.webhook_id == webhook_id)
+        return dict(query.group_by(WebhookDelivery.status).all())
+
+    # ------------------------------------------------------------------
+    # Delivery loop
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            event.listen(Session, 'after_commit', self._after_commit)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='webhook')
+            self._thread = threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    jobs = self._claim()
+                for job in jobs:
+                    self._executor.submit(self._deliver, job)
+            except Exception as e:
+                # e.g. the table does not exist yet; keep polling, log at most once a minute
+                if time.time() - self._last_error_log > 60:
+                    self._last_error_log = time.time()
+                    logger.error(f"Webhook dispatcher error: {e}")
+
+    def _claim(self) -> List[Dict]:
+        """Lease due deliveries whose endpoint has spare concurrency"""
+        from app import db
+        from modules.api.models import Webhook, WebhookDelivery
+
+        capacity = self.workers * 2 - self._outstanding
+        if capacity <= 0:
+            return []
+        now = datetime.utcnow()
+        query = db.session.query(WebhookDelivery, Webhook).join(
+            Webhook, Webhook.id == WebhookDelivery.webhook_id
+        ).filter(or_(
+            and_(WebhookDelivery.status == 'pending', WebhookDelivery.next_attempt_at <= now),
+            and_(WebhookDelivery.status == 'in_flight', WebhookDelivery.locked_until < now)
+        )).order_by(WebhookDelivery.next_attempt_at, WebhookDelivery.id).limit(capacity * 4)
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # No row locks: take the write lock first so two processes cannot claim the same rows
+            db.session.execute(text("UPDATE webhook_deliveries SET id = id WHERE 1 = 0"))
+        else:
+            query = query.with_for_update(skip_locked=True, of=WebhookDelivery)
+
+        jobs = []
+        with self._inflight_lock:
+            for delivery, webhook in query.all():
+                if len(jobs) >= capacity:
+                    break
+                if not webhook.is_active:
+                    delivery.status, delivery.success = 'dead', False
+                    delivery.error_message = 'Webhook is inactive'
+                    continue
+                if self._inflight[webhook.url] >= self.per_endpoint:
+                    continue
+                self._inflight[webhook.url] += 1
+                delivery.status = 'in_flight'
+                delivery.locked_until = now + timedelta(seconds=(webhook.timeout or 30) + 30)
+                jobs.append({
+                    'id': delivery.id, 'url': webhook.url, 'secret': webhook.secret_key,
+                    'timeout': webhook.timeout or 30, 'event_type': delivery.event_type,
+                    'event_id': delivery.event_id, 'payload': delivery.payload,
+                    'failures': delivery.retry_count or 0, 'max_retries': webhook.retry_count or 0
+                })
+            self._outstanding += len(jobs)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._release(jobs)
+            raise
+        return jobs
+
+    def _release(self, jobs: List[Dict]):
+        with self._inflight_lock:
+            for job in jobs:
+                self._inflight[job['url']] -= 1
+                if self._inflight[job['url']] <= 0:
+                    del self._inflight[job['url']]
+            self._outstanding -= len(jobs)
+
+    def _http(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _deliver(self, job: Dict):
+        import requests
+        body = json.dumps(job['payload'], separators=(',', ':'), sort_keys=True).encode()
+        timestamp = int(time.time())
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'EdonuOps-Webhooks/1.0',
+            'X-EdonuOps-Event': job['event_type'],
+            'X-EdonuOps-Event-Id': job['event_id'] or '',
+            'X-EdonuOps-Delivery': str(job['id']),
+            'X-EdonuOps-Timestamp': str(timestamp),
+        }
+        if job['secret']:
+            headers['X-EdonuOps-Signature'] = sign_payload(job['secret'], timestamp, body)
+
+        started = time.perf_counter()
+        result = {'status': None, 'body': None, 'headers': None, 'error': None, 'retry_after': None}
+        try:
+            response = self._http().post(job['url'], data=body, headers=headers,
+                                         timeout=(min(5, job['timeout']), job['timeout']))
+            result.update(status=response.status_code, body=response.text[:RESPONSE_BODY_LIMIT],
+                          headers=dict(response.headers), retry_after=response.headers.get('Retry-After'))
+        except requests.RequestException as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['elapsed'] = time.perf_counter() - started
+
+        self._release([job])
+        try:
+            with self._app.app_context():
+                self._record(job, result)
+        except Exception as e:
+            # The lease expires and the delivery is retried
+            logger.error(f"Could not record webhook delivery {job['id']}: {e}")
+        self._wakeup.set()
+
+    def _record(self, job: Dict, result: Dict):
+        from app import db
+        from modules.api.models import WebhookDelivery
+
+        status = result['status']
+        values = {
+            'response_status': status, 'response_body': result['body'], 'response_headers': result['headers'],
+            'delivery_time': result['elapsed'], 'locked_until': None
+        }
+        if status is not None and 200 <= status < 300:
+            values.update(status='delivered', success=True, error_message=None, delivered_at=datetime.utcnow())
+            self.stats['delivered'] += 1
+        else:
+            failures = job['failures'] + 1
+            retryable = status is None or status in RETRYABLE_STATUSES or status >= 500
+            values.update(success=False, retry_count=failures,
+                          error_message=result['error'] or f"HTTP {status}")
+            if retryable and failures <= job['max_retries']:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1)) * random.uniform(0.8, 1.2)
+                if status == 429 and str(result['retry_after'] or '').isdigit():
+                    delay = max(delay, float(result['retry_after']))
+                values.update(status='pending', next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+                self.stats['retried'] += 1
+            else:
+                values['status'] = 'dead'
+                self.stats['dead'] += 1
+                logger.warning(f"Webhook delivery {job['id']} to {job['url']} dead-lettered: {values['error_message']}")
+        WebhookDelivery.query.filter(
+            WebhookDelivery.id == job['id'], WebhookDelivery.status == 'in_flight'
+        ).update(values, synchronize_session=False)
+        db.session.commit()
+
+webhook_dispatcher = WebhookDispatcher()
@@ -4,8 +4,15 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Callable
 from enum import Enum
 from dataclasses import dataclass, field
-import json
-import uuid
+from flask import has_request_context
+
+from app import db
+from modules.workflow.models import WorkflowAction, WorkflowExecution
+from modules.workflow.runtime import (
+    TaskExecutor, TriggerDispatchTable, WorkflowStore, compile_conditions,
+    current_tenant_id, current_user_id, serialize_instance, serialize_task,
+    qualified_key, workflow_id_from_key
+)
 
 logger = logging.getLogger(__name__)
 
@@ -70,12 +77,15 @@ class TaskInstance:
 class WorkflowEngine:
     """Main workflow engine for business process automation"""
     
-    def __init__(self):
+    namespace = "automation"
+    
+    def __init__(self, executor: TaskExecutor = None):
         self.workflows = {}
-        self.instances = {}
         self.task_handlers = {}
         self.trigger_handlers = {}
         self.integration_handlers = {}
+        self.dispatch = TriggerDispatchTable()
+        self.executor = executor or TaskExecutor()
         
         # Initialize default handlers
         self._initialize_default_handlers()
@@ -103,12 +113,21 @@ class WorkflowEngine:
         """Register a new workflow definition"""
         try:
             self.workflows[workflow_def.id] = workflow_def
+            self._index_workflow(workflow_def)
             logger.info(f"Workflow registered: {workflow_def.name}")
             return True
         except Exception as e:
             logger.error(f"Workflow registration failed: {e}")
             return False
     
+    def _index_workflow(self, workflow_def: WorkflowDefinition):
+        """Index the workflow under each trigger type with its compiled conditions"""
+        if workflow_def.status != WorkflowStatus.ACTIVE:
+            self.dispatch.unregister(workflow_def.id)
+            return
+        predicate = compile_conditions(workflow_def.conditions)
+        self.dispatch.register(workflow_def.id, [(t.get('type'), predicate) for t in workflow_def.triggers])
+    
     def register_task_handler(self, task_type: str, handler: Callable) -> bool:
         """Register a task handler"""
         try:
@@ -136,30 +155,38 @@ class WorkflowEngine:
             logger.error(f"Integration handler registration failed: {e}")
             return False
     
-    def start_workflow(self, workflow_id: str, data: Dict[str, Any]) -> Optional[str]:
-        """Start a new workflow instance"""
+    def start_workflow(self, workflow_id: str, data: Dict[str, Any], trigger_type: str = 'manual') -> Optional[str]:
+        """
+        Start a new workflow instance in the caller's transaction (flushed in
+        a savepoint; the caller commits, and task handlers run after that)
+        """
         try:
             if workflow_id not in self.workflows:
                 return None
             
             workflow = self.workflows[workflow_id]
-            instance_id = str(uuid.uuid4())
-            
-            instance = WorkflowInstance(
-                id=instance_id,
-                workflow_id=workflow_id,
-                status=WorkflowStatus.ACTIVE,
-                current_step=0,
-                data=data
-            )
-            
-            self.instances[instance_id] = instance
+            with db.session.begin_nested():
+                data = data or {}
+                tenant_id = current_tenant_id()
+                entity_type = data.get('document_type') or 'workflow'
+                key = qualified_key(self.namespace, workflow.id)
+                rule_id = WorkflowStore.rule_id(
+                    key, workflow.name, tenant_id, trigger_type=trigger_type,
+                    entity_type=entity_type, conditions=workflow.conditions, steps=workflow.steps
+                )
+                instance = WorkflowStore.create_instance(
+                    rule_id, key, trigger_type, entity_type, data, tenant_id,
+                    created_by=current_user_id()
+                )
+                
+                # Create first task
+                task = self._create_task_for_step(instance, 0)
             
-            # Create first task
-            self._create_task_for_step(instance, 0)
+            if task:
+                self._dispatch_task(task)
             
-            logger.info(f"Workflow started: {workflow.name} - Instance: {instance_id}")
-            return instance_id
+            logger.info(f"Workflow started: {workflow.name} - Instance: {instance.id}")
+            return str(instance.id)
             
         except Exception as e:
             logger.error(f"Workflow start failed: {e}")
@@ -169,35 +196,43 @@ class WorkflowEngine:
         """Complete a task and move to next step"""
         try:
             # Find task and instance
-            task = self._find_task(task_id)
-            if not task:
+            task = self._find_task(task_id, lock=True)
+            if not task or task.status not in (TaskStatus.PENDING.value, TaskStatus.IN_PROGRESS.value):
+                db.session.rollback()
                 return False
             
-            instance = self.instances.get(task.workflow_instance_id)
+            instance = WorkflowStore.get_instance(task.execution_id, lock=True)
             if not instance:
+                db.session.rollback()
                 return False
             
             # Update task
-            task.status = TaskStatus.COMPLETED
-            task.completed_at = datetime.utcnow()
+            task.status = TaskStatus.COMPLETED.value
+            task.executed_at = datetime.utcnow()
             task.result = result
             
             # Move to next step
-            workflow = self.workflows[instance.workflow_id]
-            next_step = instance.current_step + 1
+            workflow = self.workflows.get(workflow_id_from_key(instance.workflow_key))
+            next_step = (instance.current_step or 0) + 1
             
-            if next_step < len(workflow.steps):
+            next_task = None
+            if workflow and next_step < len(workflow.steps):
                 instance.current_step = next_step
-                self._create_task_for_step(instance, next_step)
+                next_task = self._create_task_for_step(instance, next_step)
             else:
                 # Workflow completed
-                instance.status = WorkflowStatus.COMPLETED
+                instance.execution_status = TaskStatus.COMPLETED.value
                 instance.completed_at = datetime.utcnow()
+            db.session.commit()
+            
+            if next_task:
+                self._dispatch_task(next_task)
             
             logger.info(f"Task completed: {task_id}")
             return True
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Task completion failed: {e}")
             return False
     
@@ -206,18 +241,10 @@ class WorkflowEngine:
         try:
             triggered_instances = []
             
-            for workflow_id, workflow in self.workflows.items():
-                if workflow.status != WorkflowStatus.ACTIVE:
-                    continue
-                
-                # Check if workflow should be triggered
-                for trigger in workflow.triggers:
-                    if trigger.get('type') == trigger_type:
-                        # Check conditions
-                        if self._evaluate_conditions(workflow.conditions, data):
-                            instance_id = self.start_workflow(workflow_id, data)
-                            if instance_id:
-                                triggered_instances.append(instance_id)
+            for workflow_id in self.dispatch.match(trigger_type, data):
+                instance_id = self.start_workflow(workflow_id, data, trigger_type=trigger_type)
+                if instance_id:
+                    triggered_instances.append(instance_id)
             
             return triggered_instances
             
@@ -225,85 +252,70 @@ class WorkflowEngine:
             logger.error(f"Workflow triggering failed: {e}")
             return []
     
-    def _create_task_for_step(self, instance: WorkflowInstance, step_index: int):
+    def list_instances(self, status: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Workflow instances for the current tenant, newest first"""
+        return [serialize_instance(i) for i in
+                WorkflowStore.list_instances(current_tenant_id(), status=status,
+                                              namespace=self.namespace, limit=limit)]
+    
+    def list_tasks(self, status: str = None, assigned_to: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Workflow tasks for the current tenant, newest first"""
+        return [serialize_task(t) for t in
+                WorkflowStore.list_tasks(current_tenant_id(), status=status, assigned_to=assigned_to,
+                                          namespace=self.namespace, limit=limit)]
+    
+    def _create_task_for_step(self, instance: WorkflowExecution, step_index: int) -> Optional[WorkflowAction]:
         """Create task for current workflow step"""
-        try:
-            workflow = self.workflows[instance.workflow_id]
-            step = workflow.steps[step_index]
-            
-            task = TaskInstance(
-                id=str(uuid.uuid4()),
-                workflow_instance_id=instance.id,
-                step_id=step['id'],
-                task_type=TaskType(step['type']),
-                status=TaskStatus.PENDING,
-                assigned_to=step.get('assigned_to'),
-                due_date=self._calculate_due_date(step.get('due_date_hours', 24))
-            )
-            
-            # Execute task handler
-            handler = self.task_handlers.get(step['type'])
-            if handler:
-                handler(task, instance.data)
-            
-        except Exception as e:
-            logger.error(f"Task creation failed: {e}")
+        workflow = self.workflows[workflow_id_from_key(instance.workflow_key)]
+        step = dict(workflow.steps[step_index])
+        TaskType(step['type'])  # reject unknown step types
+        step.setdefault('due_date_hours', 24)
+        return WorkflowStore.create_task(instance, step_index, step)
     
-    def _find_task(self, task_id: str) -> Optional[TaskInstance]:
-        """Find task by ID"""
-        # This would typically query the database
-        # For now, return None
-        return None
+    def _dispatch_task(self, task: WorkflowAction):
+        """Run the step's task handler on the worker pool"""
+        if task.action_type in self.task_handlers:
+            self.executor.submit(self._run_task_handler, task.id)
     
-    def _evaluate_conditions(self, conditions: List[Dict[str, Any]], data: Dict[str, Any]) -> bool:
-        """Evaluate workflow conditions"""
+    def _run_task_handler(self, task_id: int):
+        task = self._find_task(task_id)
+        if not task:
+            return
         try:
-            for condition in conditions:
-                field = condition.get('field')
-                operator = condition.get('operator')
-                value = condition.get('value')
-                
-                if field not in data:
-                    return False
-                
-                actual_value = data[field]
-                
-                if operator == 'equals' and actual_value != value:
-                    return False
-                elif operator == 'greater_than' and actual_value <= value:
-                    return False
-                elif operator == 'less_than' and actual_value >= value:
-                    return False
-                elif operator == 'contains' and value not in str(actual_value):
-                    return False
-            
-            return True
-            
+            self.task_handlers[task.action_type](task, task.execution.trigger_data or {})
         except Exception as e:
-            logger.error(f"Condition evaluation failed: {e}")
-            return False
+            logger.error(f"Task handler failed for task {task_id}: {e}")
+    
+    def _find_task(self, task_id: str, lock: bool = False) -> Optional[WorkflowAction]:
+        """Find task by ID"""
+        task = WorkflowStore.get_task(task_id, lock=lock)
+        if not task or not (task.execution.workflow_key or '').startswith(f"{self.namespace}."):
+            return None
+        if has_request_context() and task.tenant_id != current_tenant_id():
+            return None
+        return task
     
     def _calculate_due_date(self, hours: int) -> datetime:
         """Calculate task due date"""
         return datetime.utcnow() + timedelta(hours=hours)
     
     # Default task handlers
-    def _handle_approval_task(self, task: TaskInstance, data: Dict[str, Any]):
+    def _handle_approval_task(self, task: WorkflowAction, data: Dict[str, Any]):
         """Handle approval tasks"""
         logger.info(f"Approval task created: {task.id}")
         # This would typically send notifications to approvers
     
-    def _handle_notification_task(self, task: TaskInstance, data: Dict[str, Any]):
+    def _handle_notification_task(self, task: WorkflowAction, data: Dict[str, Any]):
         """Handle notification tasks"""
         logger.info(f"Notification task created: {task.id}")
         # This would typically send notifications
     
-    def _handle_integration_task(self, task: TaskInstance, data: Dict[str, Any]):
+    def _handle_integration_task(self, task: WorkflowAction, data: Dict[str, Any]):
         """Handle integration tasks"""
         logger.info(f"Integration task created: {task.id}")
         # This would typically call external systems
     
-    def _handle_automated_task(self, task: TaskInstance, data: Dict[str, Any]):
+    def _handle_automated_task(self, task: WorkflowAction, data: Dict[str, Any]):
         """Handle automated tasks"""
         logger.info(f"Automated task created: {task.id}")
         # This would typically execute automated actions
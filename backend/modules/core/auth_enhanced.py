@@ -19,7 +19,7 @@ import secrets
 import logging
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
@@ -30,6 +30,8 @@ from botocore.exceptions import ClientError
 from app import db
 from modules.core.models import User, Role
 from modules.core.tenant_context import get_current_tenant, audit_tenant_access
+from modules.core.login_throttle import login_throttle
+from modules.core.identity_cache import identity_cache
 from services.email_service import email_service
 
 # Setup logging
@@ -84,52 +86,23 @@ def generate_secure_token():
     return secrets.token_urlsafe(32)
 
 def check_rate_limit(email, ip_address, max_attempts=5, window_minutes=15):
-    """Check if user/IP has exceeded rate limit"""
-    try:
-        # Check failed attempts in the last window
-        result = db.session.execute(text("""
-            SELECT COUNT(*) as attempt_count
-            FROM login_attempts 
-            WHERE (email = :email OR ip_address = :ip_address)
-            AND success = FALSE 
-            AND attempt_time > NOW() - INTERVAL ':window_minutes minutes'
-        """), {
-            'email': email,
-            'ip_address': ip_address,
-            'window_minutes': window_minutes
-        })
-        
-        attempt_count = result.scalar()
-        return attempt_count < max_attempts, attempt_count
-        
-    except Exception as e:
-        logger.error(f"Error checking rate limit: {e}")
-        return True, 0  # Allow on error
+    """Check if user/IP has exceeded rate limit (sliding window, no DB query)"""
+    return login_throttle.check(email, ip_address, max_attempts, window_minutes * 60)
 
 def log_login_attempt(email, ip_address, success, user_id=None, failure_reason=None):
-    """Log login attempt for security monitoring"""
+    """Log login attempt for security monitoring (counted now, written in batches)"""
     try:
-        user_agent = request.headers.get('User-Agent', 'Unknown')
-        
-        db.session.execute(text("""
-            INSERT INTO login_attempts 
-            (user_id, email, ip_address, success, user_agent, failure_reason, tenant_id)
-            VALUES (:user_id, :email, :ip_address, :success, :user_agent, :failure_reason, :tenant_id)
-        """), {
+        login_throttle.record(current_app._get_current_object(), {
             'user_id': user_id,
             'email': email,
             'ip_address': ip_address,
             'success': success,
-            'user_agent': user_agent,
+            'user_agent': request.headers.get('User-Agent', 'Unknown'),
             'failure_reason': failure_reason,
             'tenant_id': get_current_tenant() or 'default_tenant'
         })
-        
-        db.session.commit()
-        
     except Exception as e:
         logger.error(f"Error logging login attempt: {e}")
-        db.session.rollback()
 
 @auth_enhanced_bp.route("/login", methods=["POST", "OPTIONS"])
 def enhanced_login():
@@ -846,6 +819,9 @@ def reset_password():
         """), {'token': token})
         
         db.session.commit()
+        
+        # Tokens issued with the old password stop working
+        identity_cache.revoke_user_tokens(user.id)
 
         return jsonify({
             "message": "Password reset successfully"
@@ -930,6 +906,29 @@ def resend_verification():
         }), 500
 
 
+@auth_enhanced_bp.route("/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    """
+    Revoke the current JWT token.
+    The token's jti is blocklisted until its own expiry, so it is rejected on
+    the very next request even though the token itself is still signed.
+    """
+    try:
+        claims = get_jwt()
+        identity_cache.revoke_token(claims.get('jti'), claims.get('exp'))
+        identity_cache.invalidate_session(claims.get('jti'))
+        logger.info(f"User {get_jwt_identity()} logged out")
+        return jsonify({
+            "message": "Logged out successfully"
+        }), 200
+    except Exception as e:
+        logger.error(f"Logout error: {e}")
+        return jsonify({
+            "message": "Logout failed"
+        }), 500
+
+
 @auth_enhanced_bp.route("/verify-token", methods=["GET"])
 @jwt_required()
 def verify_token():
@@ -947,10 +946,10 @@ def verify_token():
                 'error': 'No valid token found'
             }), 401
         
-        # Get user from database
-        user = User.query.get(user_id)
+        # Get user from the identity cache (already loaded by the JWT revocation check)
+        identity = identity_cache.get_identity(user_id)
         
-        if not user:
+        if not identity:
             logger.warning(f"Token verification failed: User {user_id} not found")
             return jsonify({
                 'valid': False,
@@ -958,21 +957,22 @@ def verify_token():
             }), 404
         
         # Check if user is active
-        if not user.is_active:
+        if not identity['is_active']:
             logger.warning(f"Token verification failed: User {user_id} is inactive")
             return jsonify({
                 'valid': False,
                 'error': 'User account is inactive'
             }), 403
         
-        # Token is valid - return user info
+        # Token is valid - return user info (profile fields from the token claims)
+        claims = get_jwt()
         return jsonify({
             'valid': True,
             'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role.role_name if user.role else 'user'
+                'id': identity['user_id'],
+                'username': claims.get('username'),
+                'email': claims.get('email'),
+                'role': identity['role_name'] or 'user'
             }
         }), 200
         
@@ -0,0 +1,104 @@
+"""
+Optimistic Concurrency Helpers
+Models opt in with an integer ``version`` column mapped as SQLAlchemy's
+``version_id_col``: every UPDATE then carries ``WHERE version = :seen`` and
+bumps it, and a lost race surfaces as StaleDataError at flush. These helpers
+turn that into a typed ConcurrencyConflictError (HTTP 409) and provide a
+bounded retry loop for commutative changes such as stock deltas.
+"""
+
+import logging
+import random
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 0.005
+
+class ConcurrencyConflictError(Exception):
+    """Record was modified by someone else since it was read"""
+    code = 'CONCURRENCY_CONFLICT'
+    status_code = 409
+
+    def __init__(self, message: str = None, model: str = None, record_id: Any = None,
+                 expected_version: int = None, current_version: int = None):
+        self.message = message or 'Record was modified by another user. Please refresh and try again.'
+        self.model = model
+        self.record_id = record_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(self.message)
+
+    def to_dict(self) -> Dict:
+        return {
+            'success': False,
+            'error': self.code,
+            'message': self.message,
+            'model': self.model,
+            'record_id': self.record_id,
+            'expected_version': self.expected_version,
+            'current_version': self.current_version
+        }
+
+def check_version(obj, expected_version) -> None:
+    """
+    Compare a client-supplied version (e.g. from If-Match or the request body)
+    with the loaded row before applying changes
+    """
+    if expected_version is None:
+        return
+    current = getattr(obj, 'version', None)
+    if current is not None and int(expected_version) != int(current):
+        raise ConcurrencyConflictError(
+            model=type(obj).__name__, record_id=getattr(obj, 'id', None),
+            expected_version=int(expected_version), current_version=int(current)
+        )
+
+def commit_versioned(session=None) -> None:
+    """Commit, translating a stale versioned UPDATE into ConcurrencyConflictError"""
+    session = session or db.session
+    try:
+        session.commit()
+    except StaleDataError as e:
+        session.rollback()
+        raise ConcurrencyConflictError(message=f'Concurrent update detected: {e}') from e
+
+def retry_on_conflict(fn: Callable = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                      backoff_seconds: float = DEFAULT_BACKOFF_SECONDS):
+    """
+    Re-run ``fn`` when it loses an optimistic-locking race.
+    ``fn`` must re-read its rows and commit itself; use it only for changes that
+    are safe to re-apply on fresh state (deltas, appends), never for user edits
+    made against a version the user saw. After ``max_attempts`` the last
+    ConcurrencyConflictError propagates. Usable as ``@retry_on_conflict`` or
+    ``@retry_on_conflict(max_attempts=3)``.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except (ConcurrencyConflictError, StaleDataError) as e:
+                    db.session.rollback()
+                    if attempt == max_attempts:
+                        if isinstance(e, StaleDataError):
+                            raise ConcurrencyConflictError(message=f'Concurrent update detected: {e}') from e
+                        raise
+                    logger.debug(f"{func.__name__}: version conflict, retry {attempt}/{max_attempts - 1}")
+                    # Jittered exponential backoff so colliding writers spread out
+                    time.sleep(backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random()))
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
+
+def current_version(model, record_id) -> Optional[int]:
+    row = db.session.query(model.version).filter(model.id == record_id).first()
+    return row[0] if row else None
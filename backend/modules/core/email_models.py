@@ -0,0 +1,48 @@
+# backend/modules/core/email_models.py
+
+from app import db
+from datetime import datetime
+
+class OutboundEmail(db.Model):
+    """
+    Email queued by a request and sent by services/email_outbox.py after commit
+    """
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=True)
+    category = db.Column(db.String(50), default='transactional')  # verification, password_reset, crm, notification, ...
+    priority = db.Column(db.Integer, default=0)  # Lower is sent first; bulk sends use a higher value
+    to_email = db.Column(db.String(255), nullable=False)
+    from_email = db.Column(db.String(255), nullable=True)  # Defaults to EMAIL_FROM_ADDRESS
+    subject = db.Column(db.String(500), nullable=False)
+    html_body = db.Column(db.Text, nullable=True)
+    text_body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Lease of the sender holding the message
+    last_error = db.Column(db.Text, nullable=True)
+    message_id = db.Column(db.String(255), nullable=True)  # Message-ID header of the sent message
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_email_outbox_due', 'status', 'priority', 'next_attempt_at'),
+        db.Index('idx_email_outbox_to', 'to_email', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tenant_id': self.tenant_id,
+            'category': self.category,
+            'to_email': self.to_email,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'message_id': self.message_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
@@ -0,0 +1,337 @@
+"""
+Identity Cache
+Short-TTL cache of what every authenticated request needs to know about its
+caller - active flag, tenant, role and granted permissions - plus token and
+session revocation state, so the JWT checks in route protection, the
+permission decorators and SecurityService do not re-read users, roles,
+sessions and policies on every request.
+
+Entries expire after ``IDENTITY_CACHE_TTL`` seconds (default 30), but every
+change that affects them invalidates explicitly, so revocation still takes
+effect on the next request:
+
+- logout                        -> ``revoke_token(jti)``
+- deactivation / deletion       -> ``invalidate_user`` + ``revoke_user_tokens``
+- role change on a user         -> ``invalidate_user``
+- role permission edits         -> ``invalidate_all``
+- security policy edits         -> ``invalidate_policies``
+- session termination           -> ``invalidate_session`` / ``revoke_user_tokens``
+
+Revoke-all compares in milliseconds: tokens carry ``iat_ms`` (from
+``token_claims``, registered as the JWT additional claims loader) because
+``iat`` has whole seconds, and a token issued in the same second as a password
+reset must survive it.
+
+State lives in Redis (shared by every worker) when it is reachable, otherwise
+in process memory (per worker; use Redis when running several workers).
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 30
+ISSUED_AT_MS_CLAIM = 'iat_ms'
+ADMIN_ROLES = ('superadmin', 'admin')
+
+class MemoryStore:
+    """Dict of key -> (expires_at, value) with a generation counter"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._next_sweep = 0.0
+
+    def get_many(self, keys: Iterable[str]) -> List:
+        now = time.time()
+        result = []
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None or item[0] <= now:
+                    result.append(None)
+                else:
+                    result.append(item[1])
+        return result
+
+    def set(self, key: str, value, ttl: float):
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                for k in [k for k, item in self._data.items() if item[0] <= now]:
+                    del self._data[k]
+                self._next_sweep = now + 60
+            self._data[key] = (now + ttl, value)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            self._data = {k: v for k, v in self._data.items() if not k.startswith('u:')}
+
+class RedisStore:
+    """Same interface over Redis; values are JSON encoded"""
+
+    GENERATION_KEY = 'gen'
+
+    def __init__(self, client, prefix: str = 'identity:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys: Iterable[str]) -> List:
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [json.loads(v) if v is not None else None for v in values]
+
+    def set(self, key: str, value, ttl: float):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}{prefix}*", count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def generation(self) -> int:
+        return int(self.client.get(self.prefix + self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        self.client.incr(self.prefix + self.GENERATION_KEY)
+
+class IdentityCache:
+    """Cached identities, revocations, sessions and security policies"""
+
+    def __init__(self, store=None, ttl: int = None):
+        self._store = store
+        self._store_lock = threading.Lock()
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = self._connect()
+        return self._store
+
+    @staticmethod
+    def _connect():
+        try:
+            import redis
+            from flask import current_app
+            client = redis.from_url(current_app.config.get('REDIS_URL', 'redis://localhost:6379/0'),
+                                    socket_connect_timeout=1, socket_timeout=1)
+            client.ping()
+            logger.info("Identity cache uses Redis")
+            return RedisStore(client)
+        except Exception as e:
+            logger.info(f"Redis not available for identity cache, using in-process cache: {e}")
+            return MemoryStore()
+
+    @property
+    def ttl(self) -> int:
+        if self._ttl is None:
+            try:
+                from flask import current_app
+                self._ttl = int(current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL_SECONDS))
+            except Exception:
+                return DEFAULT_TTL_SECONDS
+        return self._ttl
+
+    @staticmethod
+    def _token_lifetime() -> int:
+        """Longest time a revocation has to be remembered"""
+        try:
+            from flask import current_app
+            expires = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES', 3600)
+            return int(expires.total_seconds() if hasattr(expires, 'total_seconds') else expires)
+        except Exception:
+            return 3600
+
+    # ------------------------------------------------------------------
+    # Identities
+    # ------------------------------------------------------------------
+
+    def get_identity(self, user_id) -> Optional[Dict]:
+        """Cached identity for ``user_id``, or None if the user does not exist"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        store = self.store
+        if isinstance(store, MemoryStore):
+            cached, generation = store.get_many([f"u:{user_id}"])[0], store.generation()
+        else:
+            cached, generation = store.get_many([f"u:{user_id}", RedisStore.GENERATION_KEY])
+            generation = int(generation or 0)
+        if cached is not None and cached.get('generation') == generation:
+            self.hits += 1
+            return cached if cached['exists'] else None
+
+        self.misses += 1
+        identity = self._load_identity(user_id)
+        identity['generation'] = generation
+        store.set(f"u:{user_id}", identity, self.ttl)
+        return identity if identity['exists'] else None
+
+    @staticmethod
+    def _load_identity(user_id: int) -> Dict:
+        from app import db
+        from modules.core.models import User, Role
+        from modules.core.permissions import Permission, RolePermission
+
+        row = db.session.query(
+            User.is_active, User.tenant_id, User.role_id, Role.role_name
+        ).outerjoin(Role, User.role_id == Role.id).filter(User.id == user_id).first()
+        if row is None:
+            return {'user_id': user_id, 'exists': False}
+
+        is_active, tenant_id, role_id, role_name = row
+        is_admin = role_name in ADMIN_ROLES
+        permissions, modules = [], []
+        if role_id is not None and not is_admin:
+            granted = db.session.query(Permission.name, Permission.module).join(
+                RolePermission, Permission.id == RolePermission.permission_id
+            ).filter(
+                RolePermission.role_id == role_id,
+                RolePermission.granted == True
+            ).all()
+            permissions = sorted({name for name, _ in granted})
+            modules = sorted({module for _, module in granted if module})
+
+        return {
+            'user_id': user_id,
+            'exists': True,
+            'is_active': bool(is_active),
+            'tenant_id': tenant_id,
+            'role_id': role_id,
+            'role_name': role_name,
+            'is_admin': is_admin,
+            'permissions': permissions,
+            'modules': modules
+        }
+
+    def invalidate_user(self, user_id):
+        """Drop a user's cached identity (role change, deactivation, deletion)"""
+        try:
+            self.store.delete(f"u:{int(user_id)}")
+        except Exception as e:
+            logger.error(f"Error invalidating identity for user {user_id}: {e}")
+
+    def invalidate_all(self):
+        """Drop every cached identity (role permission edits)"""
+        try:
+            self.store.bump_generation()
+        except Exception as e:
+            logger.error(f"Error invalidating identities: {e}")
+
+    # ------------------------------------------------------------------
+    # Token revocation
+    # ------------------------------------------------------------------
+
+    def revoke_token(self, jti: str, expires_at: Optional[float] = None):
+        """Revoke one token (logout) until it would have expired anyway"""
+        if not jti:
+            return
+        ttl = (expires_at - time.time()) if expires_at else self._token_lifetime()
+        try:
+            self.store.set(f"j:{jti}", True, max(ttl, 1))
+        except Exception as e:
+            logger.error(f"Error revoking token: {e}")
+
+    @staticmethod
+    def token_claims() -> Dict:
+        """Extra claims for every issued token: the issue time in milliseconds"""
+        return {ISSUED_AT_MS_CLAIM: int(time.time() * 1000)}
+
+    @staticmethod
+    def _issued_before(jwt_payload: Dict, revoked_before) -> bool:
+        revoked_before = int(revoked_before)
+        if revoked_before < 10 ** 12:
+            # Written before millisecond precision: whole seconds, that second included
+            revoked_before = (revoked_before + 1) * 1000
+        issued_at = jwt_payload.get(ISSUED_AT_MS_CLAIM)
+        if issued_at is None:
+            issued_at = int(jwt_payload.get('iat') or 0) * 1000
+        return int(issued_at) < revoked_before
+
+    def revoke_user_tokens(self, user_id):
+        """Revoke every token issued to a user up to now"""
+        try:
+            self.store.set(f"r:{int(user_id)}", int(time.time() * 1000), self._token_lifetime())
+        except Exception as e:
+            logger.error(f"Error revoking tokens for user {user_id}: {e}")
+
+    def is_token_revoked(self, jwt_payload: Dict) -> bool:
+        """
+        True if the token was logged out, issued before a revoke-all, or
+        belongs to a missing or inactive user. Fails open on cache/database
+        errors like the rest of the auth checks.
+        """
+        try:
+            from flask import current_app
+            user_id = int(jwt_payload.get(current_app.config.get('JWT_IDENTITY_CLAIM', 'sub')))
+        except (TypeError, ValueError):
+            return False
+        try:
+            revoked, revoked_before = self.store.get_many([f"j:{jwt_payload.get('jti')}", f"r:{user_id}"])
+            if revoked:
+                return True
+            if revoked_before is not None and self._issued_before(jwt_payload, revoked_before):
+                return True
+            identity = self.get_identity(user_id)
+            return identity is None or not identity['is_active']
+        except Exception as e:
+            logger.error(f"Error checking token revocation: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Sessions and policies
+    # ------------------------------------------------------------------
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        return self.store.get_many([f"s:{session_id}"])[0]
+
+    def set_session(self, session_id: str, state: Dict):
+        self.store.set(f"s:{session_id}", state, self.ttl)
+
+    def invalidate_session(self, *session_ids: str):
+        try:
+            self.store.delete(*[f"s:{session_id}" for session_id in session_ids])
+        except Exception as e:
+            logger.error(f"Error invalidating cached sessions: {e}")
+
+    def get_policy(self, policy_name: str) -> Optional[Dict]:
+        return self.store.get_many([f"p:{policy_name}"])[0]
+
+    def set_policy(self, policy_name: str, configuration: Dict):
+        self.store.set(f"p:{policy_name}", configuration, self.ttl)
+
+    def invalidate_policies(self):
+        try:
+            self.store.delete_prefix('p:')
+        except Exception as e:
+            logger.error(f"Error invalidating cached policies: {e}")
+
+identity_cache = IdentityCache()
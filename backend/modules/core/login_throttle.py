@@ -0,0 +1,252 @@
+"""
+Login Throttling
+Sliding-window counters of failed logins plus a buffered writer for the
+``login_attempts`` audit table, so neither the lockout check nor the logging
+touches the database on the login hot path.
+
+Lockout rule (unchanged from the SQL version): a login is refused once the
+failed attempts in the window that match the email OR the IP reach
+``max_attempts``. Refused attempts count as failures themselves. The union is
+kept exactly by counting three keys per failure - email, IP and the
+(email, IP) pair - and taking ``email + ip - pair``.
+
+Counters live in Redis (sorted sets, shared by every worker) when it is
+reachable, otherwise in a sharded in-process map (per worker; use Redis when
+running several workers).
+"""
+
+import atexit
+import logging
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_WINDOW_SECONDS = 15 * 60
+# Timestamps kept per key; only counts below max_attempts need to be exact
+MAX_EVENTS_PER_KEY = 100
+
+def _keys(email: str, ip_address: str) -> Tuple[str, str, str]:
+    return f"e:{email}", f"i:{ip_address}", f"p:{email}|{ip_address}"
+
+class MemorySlidingWindow:
+    """Per-key timestamp deques spread over independently locked shards"""
+
+    def __init__(self, retention_seconds: int = DEFAULT_WINDOW_SECONDS, shards: int = 32):
+        self.retention = retention_seconds
+        self._shards = [({}, threading.Lock(), [0.0]) for _ in range(shards)]
+
+    def _shard(self, key: str):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _sweep(self, events: Dict, now: float, next_sweep: List[float]):
+        """Drop keys whose newest event left the window (amortized, at most every retention/4)"""
+        if now < next_sweep[0]:
+            return
+        cutoff = now - self.retention
+        for key in [k for k, q in events.items() if not q or q[-1] <= cutoff]:
+            del events[key]
+        next_sweep[0] = now + self.retention / 4
+
+    def add(self, keys: Iterable[str], now: float = None):
+        now = now or time.time()
+        for key in keys:
+            events, lock, next_sweep = self._shard(key)
+            with lock:
+                self._sweep(events, now, next_sweep)
+                q = events.get(key)
+                if q is None:
+                    q = events[key] = deque(maxlen=MAX_EVENTS_PER_KEY)
+                q.append(now)
+
+    def counts(self, keys: Iterable[str], window_seconds: int, now: float = None) -> List[int]:
+        now = now or time.time()
+        cutoff = now - min(window_seconds, self.retention)
+        result = []
+        for key in keys:
+            events, lock, _ = self._shard(key)
+            with lock:
+                q = events.get(key)
+                if not q:
+                    result.append(0)
+                    continue
+                while q and q[0] <= cutoff:
+                    q.popleft()
+                result.append(len(q))
+        return result
+
+class RedisSlidingWindow:
+    """Same interface backed by one sorted set per key (score = timestamp)"""
+
+    def __init__(self, client, retention_seconds: int = DEFAULT_WINDOW_SECONDS, prefix: str = 'login_throttle:'):
+        self.client = client
+        self.retention = retention_seconds
+        self.prefix = prefix
+
+    def add(self, keys: Iterable[str], now: float = None):
+        now = now or time.time()
+        member = f"{now:.6f}:{secrets.token_hex(4)}"
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            rkey = self.prefix + key
+            pipe.zadd(rkey, {member: now})
+            pipe.zremrangebyrank(rkey, 0, -(MAX_EVENTS_PER_KEY + 1))
+            pipe.expire(rkey, int(self.retention) + 1)
+        pipe.execute()
+
+    def counts(self, keys: Iterable[str], window_seconds: int, now: float = None) -> List[int]:
+        now = now or time.time()
+        cutoff = now - min(window_seconds, self.retention)
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.zcount(self.prefix + key, f"({cutoff}", '+inf')
+        return [int(c) for c in pipe.execute()]
+
+class LoginAttemptWriter:
+    """
+    Queue of login_attempts rows flushed by a daemon thread with executemany,
+    every ``flush_interval`` seconds or ``batch_size`` rows. The queue is bounded:
+    under a flood, rows beyond ``max_pending`` are dropped and counted rather
+    than queuing unbounded writes on the database.
+    """
+
+    INSERT_SQL = text("""
+        INSERT INTO login_attempts
+        (user_id, email, ip_address, success, user_agent, failure_reason, tenant_id)
+        VALUES (:user_id, :email, :ip_address, :success, :user_agent, :failure_reason, :tenant_id)
+    """)
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 0.5, max_pending: int = 20000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._app = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self._last_drop_warning = 0.0
+
+    def submit(self, app, record: Dict):
+        if self._thread is None:
+            self._start(app)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            now = time.time()
+            if now - self._last_drop_warning > 60:
+                self._last_drop_warning = now
+                logger.warning(f"Login attempt buffer full, {self.dropped} record(s) dropped so far")
+
+    def _start(self, app):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='login-attempt-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _drain(self) -> List[Dict]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Let a burst accumulate into one batch
+            time.sleep(self.flush_interval if self._queue.qsize() < self.batch_size else 0)
+            self._write([first] + self._drain())
+
+    def flush(self):
+        """Write everything queued so far (runs at interpreter exit)"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch: List[Dict]):
+        from app import db
+        with self._flush_lock:
+            try:
+                with self._app.app_context():
+                    db.session.execute(self.INSERT_SQL, batch)
+                    db.session.commit()
+                self.written += len(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} login attempt(s): {e}")
+                try:
+                    with self._app.app_context():
+                        db.session.rollback()
+                except Exception:
+                    pass
+
+class LoginThrottle:
+    """Failed-login window plus attempt logging"""
+
+    def __init__(self, window=None, writer: LoginAttemptWriter = None):
+        self._window = window
+        self._window_lock = threading.Lock()
+        self.writer = writer or LoginAttemptWriter()
+
+    @property
+    def window(self):
+        if self._window is None:
+            with self._window_lock:
+                if self._window is None:
+                    self._window = self._connect()
+        return self._window
+
+    @staticmethod
+    def _connect():
+        try:
+            import redis
+            from flask import current_app
+            client = redis.from_url(current_app.config.get('REDIS_URL', 'redis://localhost:6379/0'),
+                                    socket_connect_timeout=1, socket_timeout=1)
+            client.ping()
+            logger.info("Login throttling uses Redis")
+            return RedisSlidingWindow(client)
+        except Exception as e:
+            logger.info(f"Redis not available for login throttling, using in-process windows: {e}")
+            return MemorySlidingWindow()
+
+    def check(self, email: str, ip_address: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+              window_seconds: int = DEFAULT_WINDOW_SECONDS) -> Tuple[bool, int]:
+        """(allowed, failed attempts in the window matching email or IP)"""
+        try:
+            by_email, by_ip, both = self.window.counts(_keys(email, ip_address), window_seconds)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {e}")
+            return True, 0  # Allow on error
+        attempt_count = by_email + by_ip - both
+        return attempt_count < max_attempts, attempt_count
+
+    def record(self, app, record: Dict):
+        """Count a failure in the window (synchronously) and queue the audit row"""
+        if not record.get('success'):
+            try:
+                self.window.add(_keys(record.get('email'), record.get('ip_address')))
+            except Exception as e:
+                logger.error(f"Error recording failed login: {e}")
+        self.writer.submit(app, record)
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,396 @@
+"""
+Request and Database Metrics
+Flask request hooks and SQLAlchemy engine/pool events feeding an in-process
+metrics registry, rendered in the Prometheus text format by
+``/api/admin/metrics``:
+
+- request latency histogram per endpoint (URL rule), method and status
+- SQL statements, SQL time and rows returned per endpoint and tenant
+- connection pool checkout wait histogram and pool occupancy
+- hit ratios of the shared cache and the identity cache
+
+Label sets are capped (``METRICS_MAX_SERIES``); extra endpoint/tenant
+combinations are folded into ``other`` so a tenant spike cannot grow the
+registry without bound. Metrics are per worker process.
+
+``SlowRequestProfiler`` is an opt-in (``PROFILE_SLOW_REQUESTS_MS``) sampling
+profiler: a background thread samples the stacks of in-flight request
+threads every ``PROFILE_SAMPLE_INTERVAL_MS`` and keeps the collapsed stacks
+(flame-graph input) of requests that ran longer than the threshold.
+"""
+
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+OVERFLOW_LABEL = 'other'
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), max_series: int = 5000):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values: Tuple) -> Tuple:
+        if values in self._series or len(self._series) < self.max_series:
+            return values
+        return tuple(OVERFLOW_LABEL for _ in values)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class CounterMetric(_Metric):
+    kind = 'counter'
+
+    def inc(self, values: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            key = self._key(values)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in series]
+
+    def snapshot(self) -> Dict[Tuple, float]:
+        with self._lock:
+            return dict(self._series)
+
+class HistogramMetric(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS,
+                 max_series: int = 5000):
+        super().__init__(name, help_text, labels, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, values: Tuple, amount: float):
+        with self._lock:
+            key = self._key(values)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += 1
+            series[2] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        lines = self.header()
+        for key, counts, count, total in series:
+            cumulative = 0
+            labels = _labels(self.label_names, key)
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                bucket_labels = _labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple, Tuple[int, float]]:
+        with self._lock:
+            return {k: (v[1], v[2]) for k, v in self._series.items()}
+
+class SlowRequestProfiler:
+    """Samples in-flight request threads; keeps collapsed stacks of slow requests"""
+
+    def __init__(self, threshold_ms: float, interval_ms: float = 5.0, sample_rate: float = 1.0,
+                 keep: int = 50, max_depth: int = 64):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.max_depth = max_depth
+        self.profiles = deque(maxlen=keep)
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+
+    def begin(self) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+        return True
+
+    def end(self, duration: float, info: Dict):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if stacks is None or duration < self.threshold or not stacks:
+            return
+        self.profiles.append(dict(info, id=next(self._ids), duration_ms=round(duration * 1000, 1),
+                                  samples=sum(stacks.values()), stacks=stacks))
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == own:
+                        continue
+                    stacks[self._collapse(frame)] += 1
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def summaries(self) -> List[Dict]:
+        return [{k: v for k, v in p.items() if k != 'stacks'} for p in list(self.profiles)]
+
+    def folded(self, profile_id: int) -> Optional[str]:
+        """Collapsed-stack text ("frame;frame;frame count" per line) for flamegraph tools"""
+        for profile in list(self.profiles):
+            if profile['id'] == profile_id:
+                return '\n'.join(f"{stack} {count}" for stack, count in profile['stacks'].most_common()) + '\n'
+        return None
+
+class RequestMetrics:
+    """Metric definitions plus the Flask/SQLAlchemy hooks that feed them"""
+
+    def __init__(self, max_series: int = 5000):
+        self.request_latency = HistogramMetric(
+            'http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method', 'status'),
+            max_series=max_series)
+        self.db_queries = CounterMetric(
+            'db_queries_total', 'SQL statements executed', ('endpoint', 'tenant'), max_series)
+        self.db_time = CounterMetric(
+            'db_query_seconds_total', 'Time spent executing SQL', ('endpoint', 'tenant'), max_series)
+        self.db_rows = CounterMetric(
+            'db_rows_returned_total', 'Rows reported by the driver for executed statements',
+            ('endpoint', 'tenant'), max_series)
+        self.pool_wait = HistogramMetric(
+            'db_pool_checkout_wait_seconds', 'Time waiting for a pooled connection', (), POOL_WAIT_BUCKETS)
+        self.profiler = None
+        self._pools = []
+
+    # ------------------------------------------------------------------
+    # Hooks
+    # ------------------------------------------------------------------
+
+    def init_app(self, app, db):
+        from flask import g, request
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        max_series = int(app.config.get('METRICS_MAX_SERIES', 5000))
+        for metric in (self.request_latency, self.db_queries, self.db_time, self.db_rows):
+            metric.max_series = max_series
+
+        threshold = app.config.get('PROFILE_SLOW_REQUESTS_MS')
+        if threshold:
+            self.profiler = SlowRequestProfiler(
+                float(threshold),
+                interval_ms=float(app.config.get('PROFILE_SAMPLE_INTERVAL_MS', 5)),
+                sample_rate=float(app.config.get('PROFILE_SAMPLE_RATE', 1.0)))
+            self.profiler.start()
+            logger.info(f"Slow request profiler enabled (>{threshold}ms)")
+
+        @app.before_request
+        def start_request_metrics():
+            g._metrics = {'start': time.perf_counter(), 'queries': 0, 'db_time': 0.0, 'rows': 0,
+                          'profiled': self.profiler.begin() if self.profiler else False}
+
+        @app.after_request
+        def record_request_metrics(response):
+            self._finish(g, request, response.status_code)
+            return response
+
+        @app.teardown_request
+        def record_failed_request(exc):
+            # after_request does not run for unhandled exceptions
+            if getattr(g, '_metrics', None) is not None:
+                self._finish(g, request, 500)
+
+        if not getattr(Engine, '_request_metrics_hooked', False):
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            Engine._request_metrics_hooked = True
+
+        with app.app_context():
+            self._time_pool(db.engine.pool)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_started'] = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('metrics_started', time.perf_counter())
+        rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        from flask import g, has_request_context
+        state = getattr(g, '_metrics', None) if has_request_context() else None
+        if state is not None:
+            state['queries'] += 1
+            state['db_time'] += elapsed
+            state['rows'] += rows
+        else:
+            labels = ('background', 'none')
+            self.db_queries.inc(labels)
+            self.db_time.inc(labels, elapsed)
+            if rows:
+                self.db_rows.inc(labels, rows)
+
+    def _time_pool(self, pool):
+        """Time connection checkouts by wrapping the pool's internal getter"""
+        original = getattr(pool, '_do_get', None)
+        if original is None or getattr(original, '_metrics_wrapped', False):
+            return
+
+        def timed_get():
+            started = time.perf_counter()
+            try:
+                return original()
+            finally:
+                self.pool_wait.observe((), time.perf_counter() - started)
+        timed_get._metrics_wrapped = True
+        pool._do_get = timed_get
+        self._pools.append(pool)
+
+    def _finish(self, g, request, status: int):
+        state = g.pop('_metrics', None)
+        if state is None:
+            return
+        duration = time.perf_counter() - state['start']
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        identity = getattr(g, 'current_identity', None) or {}
+        tenant = str(getattr(g, 'tenant_id', None) or identity.get('tenant_id') or 'none')
+        self.request_latency.observe((endpoint, request.method, str(status)), duration)
+        if state['queries']:
+            self.db_queries.inc((endpoint, tenant), state['queries'])
+            self.db_time.inc((endpoint, tenant), state['db_time'])
+        if state['rows']:
+            self.db_rows.inc((endpoint, tenant), state['rows'])
+        if state['profiled']:
+            self.profiler.end(duration, {'endpoint': endpoint, 'method': request.method, 'path': request.path,
+                                         'status': status, 'tenant': tenant, 'queries': state['queries'],
+                                         'at': time.time()})
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+
+    def _gauges(self) -> List[str]:
+        lines = []
+        for index, pool in enumerate(self._pools):
+            for name, attr in (('db_pool_size', 'size'), ('db_pool_checked_out', 'checkedout'),
+                               ('db_pool_overflow', 'overflow')):
+                method = getattr(pool, attr, None)
+                if method is None:
+                    continue
+                try:
+                    lines.append(f'{name}{{pool="{index}"}} {method()}')
+                except Exception:
+                    pass
+
+        try:
+            from services.cache_service import cache_service
+            stats = cache_service.stats
+            hits = stats['local_hits'] + stats['redis_hits']
+            lines += [
+                f'cache_requests_total{{cache="shared",result="local_hit"}} {stats["local_hits"]}',
+                f'cache_requests_total{{cache="shared",result="redis_hit"}} {stats["redis_hits"]}',
+                f'cache_requests_total{{cache="shared",result="miss"}} {stats["misses"]}',
+                f'cache_hit_ratio{{cache="shared"}} {hits / max(hits + stats["misses"], 1):.4f}',
+            ]
+        except Exception as e:
+            logger.debug(f"Shared cache stats unavailable: {e}")
+
+        try:
+            from modules.core.identity_cache import identity_cache
+            total = identity_cache.hits + identity_cache.misses
+            lines += [
+                f'cache_requests_total{{cache="identity",result="hit"}} {identity_cache.hits}',
+                f'cache_requests_total{{cache="identity",result="miss"}} {identity_cache.misses}',
+                f'cache_hit_ratio{{cache="identity"}} {identity_cache.hits / max(total, 1):.4f}',
+            ]
+        except Exception as e:
+            logger.debug(f"Identity cache stats unavailable: {e}")
+        return lines
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in (self.request_latency, self.db_queries, self.db_time, self.db_rows, self.pool_wait):
+            lines += metric.render()
+        try:
+            from modules.finance.events.event_bus import finance_event_bus
+            lines += finance_event_bus.metric_lines()
+        except Exception as e:
+            logger.debug(f"Finance event metrics unavailable: {e}")
+        try:
+            from services.email_outbox import email_outbox
+            lines += email_outbox.metric_lines()
+        except Exception as e:
+            logger.debug(f"Email metrics unavailable: {e}")
+        typed = set()
+        for line in sorted(self._gauges(), key=lambda l: l.split('{', 1)[0]):
+            name = line.split('{', 1)[0]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    def top_endpoints(self, limit: int = 20) -> List[Dict]:
+        """Endpoints/tenants ordered by SQL time"""
+        queries = self.db_queries.snapshot()
+        rows = self.db_rows.snapshot()
+        ranked = sorted(self.db_time.snapshot().items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{
+            'endpoint': endpoint,
+            'tenant': tenant,
+            'db_seconds': round(seconds, 4),
+            'queries': int(queries.get((endpoint, tenant), 0)),
+            'rows': int(rows.get((endpoint, tenant), 0))
+        } for (endpoint, tenant), seconds in ranked]
+
+request_metrics = RequestMetrics()
+
+def init_metrics(app, db):
+    """Install the request/DB hooks (once per app)"""
+    if app.extensions.get('request_metrics') is not None:
+        return app.extensions['request_metrics']
+    request_metrics.init_app(app, db)
+    app.extensions['request_metrics'] = request_metrics
+    return request_metrics
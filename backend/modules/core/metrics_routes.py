@@ -0,0 +1,61 @@
+from flask import Blueprint, Response, current_app, jsonify
+from flask_jwt_extended import jwt_required
+import logging
+
+from modules.core.permissions import require_permission
+
+logger = logging.getLogger(__name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+def _metrics():
+    return current_app.extensions.get('request_metrics')
+
+@metrics_bp.route('', methods=['GET'])
+@jwt_required()
+@require_permission('system.audit.read')
+def get_prometheus_metrics():
+    """Request, SQL, pool and cache metrics in Prometheus text format"""
+    metrics = _metrics()
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled (ENABLE_METRICS=false)'}), 404
+    try:
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {e}")
+        return jsonify({'error': 'Failed to render metrics'}), 500
+
+@metrics_bp.route('/top-endpoints', methods=['GET'])
+@jwt_required()
+@require_permission('system.audit.read')
+def get_top_endpoints():
+    """Endpoints and tenants ordered by database time"""
+    metrics = _metrics()
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled (ENABLE_METRICS=false)'}), 404
+    return jsonify({'endpoints': metrics.top_endpoints()}), 200
+
+@metrics_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+@require_permission('system.audit.read')
+def get_slow_request_profiles():
+    """Recent slow requests captured by the sampling profiler"""
+    metrics = _metrics()
+    if metrics is None or metrics.profiler is None:
+        return jsonify({'error': 'Profiler is disabled (set PROFILE_SLOW_REQUESTS_MS)'}), 404
+    return jsonify({
+        'threshold_ms': metrics.profiler.threshold * 1000,
+        'profiles': metrics.profiler.summaries()
+    }), 200
+
+@metrics_bp.route('/profiles/<int:profile_id>', methods=['GET'])
+@jwt_required()
+@require_permission('system.audit.read')
+def get_slow_request_stacks(profile_id):
+    """Collapsed stacks of one slow request (input for flamegraph.pl / speedscope)"""
+    metrics = _metrics()
+    if metrics is None or metrics.profiler is None:
+        return jsonify({'error': 'Profiler is disabled (set PROFILE_SLOW_REQUESTS_MS)'}), 404
+    folded = metrics.profiler.folded(profile_id)
+    if folded is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(folded, mimetype='text/plain')
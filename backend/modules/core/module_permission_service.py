@@ -15,6 +15,7 @@ SECURITY CONTROLS:
 
 from app import db
 from modules.core.permissions import Permission, RolePermission, PermissionManager
+from modules.core.identity_cache import identity_cache
 from modules.core.models import User, Role
 from modules.core.module_permission_mappings import get_module_permissions, validate_module_id
 from modules.core.permission_seeder import verify_permissions_exist
@@ -181,6 +182,7 @@ def grant_module_permissions(user_id, module_id, granted_by_user_id=None):
         # Commit all changes
         if granted:
             db.session.commit()
+            identity_cache.invalidate_all()
             logger.info(f"✅ Successfully granted {len(granted)} permissions for module '{module_id}' to role '{role.role_name}'")
             print(f"✅ Successfully granted {len(granted)} permissions for module '{module_id}' to role '{role.role_name}'")
             
@@ -353,6 +355,7 @@ def revoke_module_permissions(user_id, module_id, revoked_by_user_id=None):
         # Commit all changes
         if revoked:
             db.session.commit()
+            identity_cache.invalidate_all()
             logger.info(f"✅ Successfully revoked {len(revoked)} permissions for module '{module_id}' from role '{role.role_name}'")
             print(f"✅ Successfully revoked {len(revoked)} permissions for module '{module_id}' from role '{role.role_name}'")
             
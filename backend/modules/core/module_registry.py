@@ -0,0 +1,268 @@
+"""
+Module Registry
+Declarative list of the models and blueprints each business module brings.
+``create_app`` builds a registry from two settings:
+
+- ``ENABLED_MODULES``: modules to load (empty = all); their ``requires`` are
+  pulled in automatically, and the core/security/tenant/dashboard groups are
+  always on. Nothing from a disabled module is imported.
+- ``LAZY_BLUEPRINTS``: when true, optional modules are not imported at
+  startup. Their blueprints are imported and registered when the first
+  request arrives, before Flask dispatches it (Flask closes setup after its
+  first request, so every deferred module is loaded at that point).
+
+Each import is timed and its RSS delta recorded; the report is served by
+``/api/admin/modules/report``. Shared dependencies are charged to whichever
+module imported them first.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ModuleSpec = namedtuple('ModuleSpec', 'name prefixes models requires always_enabled')
+BlueprintSpec = namedtuple('BlueprintSpec', 'module import_path attr url_prefix')
+
+MODULES = OrderedDict((spec.name, spec) for spec in [
+    ModuleSpec('core', (), (
+        'modules.core.models', 'modules.core.tenant_models', 'modules.core.user_preferences_models',
+        'modules.core.security_models', 'modules.core.audit_models', 'modules.core.email_models',
+        'modules.api.models',
+    ), (), True),
+    # modules.security.models redefines the core permission tables, so it is only
+    # imported by the enterprise security routes that need it
+    ModuleSpec('security', (), (), (), True),
+    ModuleSpec('tenant', (), (), (), True),
+    ModuleSpec('dashboard', (), ('modules.dashboard.models',), (), True),
+    ModuleSpec('finance', ('/api/finance',), (
+        'modules.finance.models', 'modules.finance.cost_center_models', 'modules.finance.currency_models',
+        'modules.finance.advanced_models', 'modules.finance.payment_models', 'modules.finance.event_models',
+    ), (), False),
+    ModuleSpec('inventory', ('/api/inventory',), ('modules.inventory.models',), ('finance',), False),
+    ModuleSpec('crm', ('/api/crm',), ('modules.crm.models',), (), False),
+    ModuleSpec('procurement', ('/api/procurement',), ('modules.procurement.models',), ('finance', 'inventory'), False),
+    ModuleSpec('workflow', ('/api/workflow',), ('modules.workflow.models', 'modules.workflows.models'), (), False),
+    ModuleSpec('integration', ('/api/integration',), (), ('finance', 'inventory', 'workflow'), False),
+    ModuleSpec('hr', ('/api/hr',), ('modules.hr.models',), ('finance',), False),
+    ModuleSpec('enterprise', ('/api/enterprise',), (), (), False),
+    ModuleSpec('performance', ('/api/performance',), (), (), False),
+])
+
+# Registration order is preserved (it decides precedence between overlapping rules)
+BLUEPRINTS = [
+    BlueprintSpec('core', 'modules.core.auth_enhanced', 'auth_enhanced_bp', '/api/auth'),
+    BlueprintSpec('core', 'modules.core.invite_management', 'invite_management_bp', '/api/invites'),
+    BlueprintSpec('core', 'modules.core.onboarding_api', 'onboarding_bp', '/api/onboarding'),
+    BlueprintSpec('core', 'modules.core.permissions_routes', 'permissions_bp', '/api/core/permissions'),
+    BlueprintSpec('core', 'modules.core.user_management_routes', 'user_management_bp', '/api/admin'),
+    BlueprintSpec('core', 'modules.core.audit_routes', 'audit_bp', '/api/audit'),
+    BlueprintSpec('core', 'modules.core.module_registry_routes', 'module_registry_bp', '/api/admin/modules'),
+    BlueprintSpec('core', 'modules.core.metrics_routes', 'metrics_bp', '/api/admin/metrics'),
+    BlueprintSpec('core', 'modules.api.routes', 'bp', None),  # Already has /api/ecosystem prefix
+    BlueprintSpec('security', 'modules.core.security_routes', 'security_bp', '/api/security'),
+    BlueprintSpec('security', 'modules.security.routes', 'bp', None),  # Already has /api/security prefix
+    BlueprintSpec('tenant', 'modules.tenant.tenant_routes', 'tenant_management_bp', None),
+    BlueprintSpec('tenant', 'modules.tenant.tenant_creation_routes', 'tenant_creation_bp', None),
+    BlueprintSpec('core', 'modules.core.user_preferences_routes', 'user_preferences_bp', None),
+    BlueprintSpec('tenant', 'modules.tenant.tenant_analytics_routes', 'tenant_analytics_bp', None),
+    BlueprintSpec('tenant', 'modules.tenant.subscription_routes', 'subscription_bp', None),
+    BlueprintSpec('core', 'modules.core.rate_limiting', 'rate_limiting_bp', None),
+    BlueprintSpec('core', 'modules.core.routes', 'core_bp', '/api/core'),
+    BlueprintSpec('core', 'modules.core.visitor_routes', 'visitor_bp', '/api'),
+    BlueprintSpec('finance', 'modules.finance.routes', 'finance_bp', '/api/finance'),
+    BlueprintSpec('finance', 'modules.finance.currency_routes', 'currency_bp', '/api/finance'),
+    BlueprintSpec('finance', 'modules.finance.payment_routes', 'payment_bp', None),
+    BlueprintSpec('finance', 'modules.finance.advanced_payment_routes', 'advanced_payment_bp', None),
+    BlueprintSpec('finance', 'modules.finance.bank_reconciliation_routes', 'bank_reconciliation_bp', None),
+    BlueprintSpec('finance', 'modules.finance.bank_feed_routes', 'bank_feed_bp', None),
+    BlueprintSpec('finance', 'modules.finance.analytics_routes', 'analytics_bp', None),
+    BlueprintSpec('finance', 'modules.finance.double_entry_routes', 'double_entry_bp', None),
+    BlueprintSpec('finance', 'modules.finance.advanced_routes', 'advanced_finance_bp', '/api/finance/advanced'),
+    BlueprintSpec('inventory', 'modules.inventory.daily_cycle_routes', 'inventory_daily_cycle_bp', None),
+    BlueprintSpec('inventory', 'modules.inventory.inventory_finance_integration_routes', 'inventory_finance_integration_bp', None),
+    BlueprintSpec('inventory', 'modules.inventory.variance_reports_routes', 'variance_reports_bp', None),
+    BlueprintSpec('inventory', 'modules.inventory.finance_inventory_validation_routes', 'finance_inventory_validation_bp', None),
+    BlueprintSpec('finance', 'modules.finance.statutory_routes', 'statutory_bp', '/api/finance/statutory'),
+    BlueprintSpec('finance', 'modules.finance.tagging_routes', 'tagging_bp', '/api/finance/tagging'),
+    BlueprintSpec('finance', 'modules.finance.localization_routes', 'localization_bp', '/api/finance/localization'),
+    BlueprintSpec('crm', 'modules.crm.routes', 'crm_bp', '/api/crm'),
+    BlueprintSpec('inventory', 'modules.inventory.routes', 'inventory_bp', '/api/inventory'),
+    BlueprintSpec('inventory', 'modules.inventory.advanced_routes', 'advanced_inventory_bp', '/api/inventory/advanced'),
+    BlueprintSpec('core', 'modules.onboarding.onboarding_routes', 'onboarding_bp', '/api/onboarding'),
+    BlueprintSpec('core', 'modules.core.cors_admin_routes', 'cors_admin_bp', '/api/admin'),
+    BlueprintSpec('inventory', 'modules.inventory.data_integrity_routes', 'data_integrity_bp', '/api/inventory/data-integrity'),
+    BlueprintSpec('inventory', 'modules.inventory.inventory_taking_routes', 'inventory_taking_bp', '/api/inventory/taking'),
+    BlueprintSpec('integration', 'modules.integration.cross_module_routes', 'cross_module_bp', '/api/integration'),
+    BlueprintSpec('finance', 'modules.finance.auto_journal_engine', 'auto_journal_bp', '/api/finance/auto-journal'),
+    BlueprintSpec('inventory', 'modules.inventory.cogs_reconciliation_routes', 'cogs_reconciliation_bp', '/api/inventory/cogs'),
+    BlueprintSpec('inventory', 'modules.inventory.stock_adjustment_routes', 'stock_adjustment_bp', '/api/inventory/adjustments'),
+    BlueprintSpec('finance', 'modules.finance.aging_reports_routes', 'aging_reports_bp', '/api/finance/aging'),
+    BlueprintSpec('finance', 'modules.finance.multi_currency_routes', 'multi_currency_bp', '/api/finance/multi-currency'),
+    BlueprintSpec('workflow', 'modules.workflow.approval_workflow_routes', 'approval_workflow_bp', '/api/workflow/approval'),
+    BlueprintSpec('enterprise', 'modules.enterprise.enterprise_routes', 'enterprise_bp', '/api/enterprise'),
+    BlueprintSpec('inventory', 'modules.inventory.manager_dashboard_routes', 'manager_dashboard_bp', '/api/inventory/manager'),
+    BlueprintSpec('inventory', 'modules.inventory.analytics_routes', 'analytics_bp', '/api/inventory/analytics'),
+    BlueprintSpec('inventory', 'modules.inventory.warehouse_routes', 'warehouse_bp', '/api/inventory/warehouse'),
+    BlueprintSpec('inventory', 'modules.inventory.core_routes', 'core_inventory_bp', '/api/inventory/core'),
+    BlueprintSpec('inventory', 'modules.inventory.wms_routes', 'wms_bp', '/api/inventory/wms'),
+    BlueprintSpec('hr', 'modules.hr.routes', 'bp', None),  # Already has /api/hr prefix
+    BlueprintSpec('performance', 'modules.performance.performance_routes', 'performance_bp', '/api/performance'),
+    BlueprintSpec('procurement', 'modules.procurement.routes', 'bp', None),  # Already has /api/procurement prefix
+    BlueprintSpec('dashboard', 'modules.dashboard.routes', 'bp', None),  # Already has /api/dashboard prefix
+    BlueprintSpec('dashboard', 'modules.dashboard.module_activation_routes', 'module_activation_bp', '/api/dashboard/modules'),
+    BlueprintSpec('core', 'modules.core.user_data_routes', 'user_data_bp', None),  # Already has /api/user-data prefix
+    BlueprintSpec('finance', 'modules.finance.transaction_routes', 'transaction_bp', '/api/finance/transactions'),
+    BlueprintSpec('finance', 'modules.finance.tenant_aware_routes', 'tenant_finance_bp', '/api/finance/tenant'),
+]
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux /proc, falling back to peak RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+def _timed_import(import_path: str):
+    """Import a module; returns (module or None, record)"""
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    record = {'import_path': import_path}
+    try:
+        module = importlib.import_module(import_path)
+        record['status'] = 'loaded'
+    except Exception as e:
+        module = None
+        record['status'] = 'failed'
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['import_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    record['rss_delta_kb'] = max(_rss_bytes() - rss_before, 0) // 1024
+    return module, record
+
+def resolve_enabled_modules(enabled: Optional[Iterable[str]]) -> List[str]:
+    """Enabled list plus everything it requires and the always-on groups, in registry order"""
+    if not enabled:
+        return list(MODULES)
+    wanted = set()
+    pending = [name for name in enabled if name in MODULES]
+    unknown = [name for name in enabled if name not in MODULES]
+    if unknown:
+        logger.warning(f"Unknown modules in ENABLED_MODULES ignored: {', '.join(unknown)}")
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(MODULES[name].requires)
+    return [name for name, spec in MODULES.items() if spec.always_enabled or name in wanted]
+
+class ModuleRegistry:
+    """Loads models and blueprints for the enabled modules, eagerly or on first request"""
+
+    def __init__(self, app, enabled: Optional[Iterable[str]] = None, lazy: bool = False):
+        self.app = app
+        self.enabled = resolve_enabled_modules(enabled)
+        self.lazy = lazy
+        self.models = []
+        self.blueprints = []
+        self.pending = OrderedDict()  # module -> [BlueprintSpec], waiting for first request
+        self._lock = threading.Lock()
+
+    def load_models(self):
+        """Import model modules of every enabled module so their tables are registered"""
+        for name in self.enabled:
+            for import_path in MODULES[name].models:
+                _, record = _timed_import(import_path)
+                record['module'] = name
+                self.models.append(record)
+                if record['status'] == 'failed':
+                    logger.debug(f"Model import {import_path} failed: {record['error']}")
+
+    def register_blueprints(self):
+        """Register eager blueprints now; queue lazy modules' blueprints by URL prefix"""
+        for spec in BLUEPRINTS:
+            if spec.module not in self.enabled:
+                continue
+            module_spec = MODULES[spec.module]
+            if self.lazy and not module_spec.always_enabled and module_spec.prefixes:
+                self.pending.setdefault(spec.module, []).append(spec)
+                continue
+            self._register(spec)
+
+        if self.pending:
+            self.app.wsgi_app = LazyBlueprintMiddleware(self.app.wsgi_app, self)
+            logger.info(f"Deferred blueprints for modules: {', '.join(self.pending)}")
+
+    def _register(self, spec: BlueprintSpec):
+        module, record = _timed_import(spec.import_path)
+        record.update({'module': spec.module, 'blueprint': spec.attr, 'url_prefix': spec.url_prefix})
+        if module is not None:
+            try:
+                blueprint = getattr(module, spec.attr)
+                if spec.url_prefix:
+                    self.app.register_blueprint(blueprint, url_prefix=spec.url_prefix)
+                else:
+                    self.app.register_blueprint(blueprint)
+            except Exception as e:
+                record['status'] = 'failed'
+                record['error'] = f"{type(e).__name__}: {e}"
+        if record['status'] == 'failed':
+            logger.warning(f"⚠️  Could not register {spec.attr} from {spec.import_path}: {record['error']}")
+        self.blueprints.append(record)
+
+    def load_pending(self):
+        """Register every deferred module's blueprints (no-op once loaded)"""
+        with self._lock:
+            while self.pending:
+                name, specs = next(iter(self.pending.items()))
+                started = time.perf_counter()
+                for spec in specs:
+                    self._register(spec)
+                del self.pending[name]
+                logger.info(f"Lazily loaded module '{name}' in {round((time.perf_counter() - started) * 1000, 1)}ms")
+
+    def report(self) -> Dict:
+        modules = OrderedDict()
+        for record in self.models + self.blueprints:
+            totals = modules.setdefault(record['module'], {
+                'status': 'loaded', 'import_ms': 0.0, 'rss_delta_kb': 0, 'failed': 0
+            })
+            totals['import_ms'] = round(totals['import_ms'] + record['import_ms'], 2)
+            totals['rss_delta_kb'] += record['rss_delta_kb']
+            totals['failed'] += record['status'] == 'failed'
+        for name in self.pending:
+            modules.setdefault(name, {'import_ms': 0.0, 'rss_delta_kb': 0, 'failed': 0})['status'] = 'pending'
+        for name in MODULES:
+            if name not in self.enabled:
+                modules[name] = {'status': 'disabled'}
+
+        return {
+            'enabled_modules': self.enabled,
+            'lazy_blueprints': self.lazy,
+            'rss_kb': _rss_bytes() // 1024,
+            'modules': modules,
+            'models': self.models,
+            'blueprints': self.blueprints
+        }
+
+class LazyBlueprintMiddleware:
+    """WSGI wrapper that registers the deferred modules before the first request is dispatched"""
+
+    def __init__(self, wsgi_app, registry: ModuleRegistry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        if self.registry.pending:
+            # Concurrent first requests wait here until registration is done
+            self.registry.load_pending()
+        return self.wsgi_app(environ, start_response)
@@ -0,0 +1,24 @@
+from flask import Blueprint, current_app, jsonify
+from flask_jwt_extended import jwt_required
+import logging
+
+from modules.core.permissions import require_permission
+
+logger = logging.getLogger(__name__)
+module_registry_bp = Blueprint('module_registry', __name__)
+
+@module_registry_bp.route('/report', methods=['GET'])
+@jwt_required()
+@require_permission('system.audit.read')
+def get_module_report():
+    """Per-module import time and memory, plus startup timings"""
+    try:
+        registry = current_app.extensions.get('module_registry')
+        if registry is None:
+            return jsonify({'error': 'Module registry not initialized'}), 503
+        report = registry.report()
+        report['startup_timings'] = current_app.extensions.get('startup_timings', {})
+        return jsonify(report), 200
+    except Exception as e:
+        logger.error(f"Error building module report: {e}")
+        return jsonify({'error': 'Failed to build module report'}), 500
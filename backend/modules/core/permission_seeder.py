@@ -16,6 +16,7 @@ from app import db
 from modules.core.permissions import Permission
 from modules.core.module_permission_mappings import PERMISSION_DEFINITIONS
 from modules.core.tenant_models import Tenant
+from sqlalchemy.exc import IntegrityError
 import logging
 from datetime import datetime
 
@@ -64,7 +65,6 @@ def seed_all_permissions():
     errors = []
     
     logger.info("🔐 Starting permission seeding process...")
-    print("🔐 Starting permission seeding process...")
     
     # Ensure system tenant exists for global permissions
     try:
@@ -74,48 +74,41 @@ def seed_all_permissions():
         system_tenant_id = None  # Fallback to NULL if system tenant creation fails
     
     try:
-        for permission_name, permission_def in PERMISSION_DEFINITIONS.items():
+        # One read of the existing names, then a set difference; a concurrent
+        # worker can win the race on the unique name, so retry once on conflict
+        for attempt in range(2):
+            existing_names = {row[0] for row in db.session.query(Permission.name)}
+            missing = [name for name in PERMISSION_DEFINITIONS if name not in existing_names]
+            existing_count = len(PERMISSION_DEFINITIONS) - len(missing)
+            if not missing:
+                break
+            
             try:
-                # Check if permission already exists
-                existing_permission = Permission.query.filter_by(name=permission_name).first()
-                
-                if existing_permission:
-                    existing_count += 1
-                    logger.debug(f"   ⏭️  Permission '{permission_name}' already exists - skipping")
-                else:
-                    # Create new permission with system tenant (global permissions)
-                    new_permission = Permission(
-                        name=permission_name,
-                        module=permission_def['module'],
-                        action=permission_def['action'],
-                        resource=permission_def.get('resource'),
-                        description=permission_def.get('description', ''),
-                        tenant_id=system_tenant_id  # Use system tenant for global permissions
-                    )
-                    db.session.add(new_permission)
-                    created_count += 1
-                    logger.info(f"   ✅ Created permission: {permission_name}")
-                    print(f"   ✅ Created permission: {permission_name}")
-                    
-            except Exception as e:
-                error_msg = f"Error creating permission '{permission_name}': {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                errors.append(error_msg)
+                db.session.bulk_insert_mappings(Permission, [{
+                    'name': permission_name,
+                    'module': PERMISSION_DEFINITIONS[permission_name]['module'],
+                    'action': PERMISSION_DEFINITIONS[permission_name]['action'],
+                    'resource': PERMISSION_DEFINITIONS[permission_name].get('resource'),
+                    'description': PERMISSION_DEFINITIONS[permission_name].get('description', ''),
+                    'tenant_id': system_tenant_id  # Use system tenant for global permissions
+                } for permission_name in missing])
+                db.session.commit()
+                created_count = len(missing)
+                break
+            except IntegrityError as e:
                 db.session.rollback()
-                continue
+                if attempt == 1:
+                    error_msg = f"Error creating permissions: {str(e)}"
+                    logger.error(error_msg)
+                    errors.append(error_msg)
         
-        # Commit all new permissions
         if created_count > 0:
-            db.session.commit()
-            logger.info(f"✅ Successfully created {created_count} permissions")
-            print(f"✅ Successfully created {created_count} permissions")
+            logger.info(f"✅ Successfully created {created_count} permissions: {', '.join(missing)}")
         else:
             logger.info("ℹ️  No new permissions to create")
-            print("ℹ️  No new permissions to create")
         
         if existing_count > 0:
             logger.info(f"ℹ️  {existing_count} permissions already existed")
-            print(f"ℹ️  {existing_count} permissions already existed")
         
         return {
             'created': created_count,
@@ -128,7 +121,6 @@ def seed_all_permissions():
         db.session.rollback()
         error_msg = f"Critical error during permission seeding: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        print(f"❌ {error_msg}")
         raise
 
 def verify_permissions_exist(permission_names):
@@ -147,15 +139,10 @@ def verify_permissions_exist(permission_names):
             'existing': list  # Permissions that exist
         }
     """
-    missing = []
-    existing = []
-    
-    for perm_name in permission_names:
-        perm = Permission.query.filter_by(name=perm_name).first()
-        if perm:
-            existing.append(perm_name)
-        else:
-            missing.append(perm_name)
+    permission_names = list(permission_names)
+    found = {row[0] for row in db.session.query(Permission.name).filter(Permission.name.in_(permission_names))}
+    existing = [perm_name for perm_name in permission_names if perm_name in found]
+    missing = [perm_name for perm_name in permission_names if perm_name not in found]
     
     return {
         'all_exist': len(missing) == 0,
@@ -2,6 +2,7 @@
 
 from app import db
 from modules.core.models import User, Role
+from modules.core.identity_cache import identity_cache
 from functools import wraps
 from flask import request, jsonify, g
 from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
@@ -61,27 +62,16 @@ class PermissionManager:
     def user_has_permission(user_id, permission_name):
         """Check if a user has a specific permission"""
         try:
-            user = User.query.get(user_id)
-            if not user or not user.role:
+            identity = identity_cache.get_identity(user_id)
+            if not identity or not identity['role_name']:
                 return False
             
             # Superadmin and Admin roles have all permissions
-            if user.role.role_name in ['superadmin', 'admin']:
+            if identity['is_admin']:
                 return True
             
             # Check if user's role has the specific permission
-            permission = Permission.query.filter_by(name=permission_name).first()
-            if not permission:
-                logger.warning(f"Permission '{permission_name}' not found")
-                return False
-            
-            role_permission = RolePermission.query.filter_by(
-                role_id=user.role.id,
-                permission_id=permission.id,
-                granted=True
-            ).first()
-            
-            return role_permission is not None
+            return permission_name in identity['permissions']
             
         except Exception as e:
             logger.error(f"Error checking permission: {e}")
@@ -91,24 +81,16 @@ class PermissionManager:
     def user_has_module_access(user_id, module_name):
         """Check if user has any access to a module"""
         try:
-            user = User.query.get(user_id)
-            if not user or not user.role:
+            identity = identity_cache.get_identity(user_id)
+            if not identity or not identity['role_name']:
                 return False
             
             # Superadmin and Admin roles have all access
-            if user.role.role_name in ['superadmin', 'admin']:
+            if identity['is_admin']:
                 return True
             
             # Check if user has any permission in the module
-            permissions = db.session.query(Permission).join(
-                RolePermission, Permission.id == RolePermission.permission_id
-            ).filter(
-                RolePermission.role_id == user.role.id,
-                RolePermission.granted == True,
-                Permission.module == module_name
-            ).first()
-            
-            return permissions is not None
+            return module_name in identity['modules']
             
         except Exception as e:
             logger.error(f"Error checking module access: {e}")
@@ -118,19 +100,19 @@ class PermissionManager:
     def get_user_permissions(user_id):
         """Get all permissions for a user"""
         try:
-            user = User.query.get(user_id)
-            if not user or not user.role:
+            identity = identity_cache.get_identity(user_id)
+            if not identity or not identity['role_name']:
                 return []
             
             # Superadmin and Admin get all permissions
-            if user.role.role_name in ['superadmin', 'admin']:
+            if identity['is_admin']:
                 return Permission.query.all()
             
             # Get user's role permissions
             permissions = db.session.query(Permission).join(
                 RolePermission, Permission.id == RolePermission.permission_id
             ).filter(
-                RolePermission.role_id == user.role.id,
+                RolePermission.role_id == identity['role_id'],
                 RolePermission.granted == True
             ).all()
             
@@ -197,8 +179,8 @@ def require_permission(permission_name):
                     }), 400
                 
                 # Handle superadmin/admin case - check if user has superadmin or admin role
-                user = User.query.get(current_user_id)
-                if user and user.role and user.role.role_name in ['superadmin', 'admin']:
+                identity = identity_cache.get_identity(current_user_id)
+                if identity and identity['is_admin']:
                     # Superadmin and Admin roles have all permissions
                     g.current_user_id = current_user_id
                     g.required_permission = permission_name
@@ -268,8 +250,8 @@ def require_module_access(module_name):
                     }), 400
                 
                 # Handle superadmin/admin case - check if user has superadmin or admin role
-                user = User.query.get(current_user_id)
-                if user and user.role and user.role.role_name in ['superadmin', 'admin']:
+                identity = identity_cache.get_identity(current_user_id)
+                if identity and identity['is_admin']:
                     # Superadmin and Admin roles have all access
                     g.current_user_id = current_user_id
                     g.required_module = module_name
@@ -309,8 +291,8 @@ def require_any_permission(*permission_names):
                 current_user_id = get_jwt_identity()
                 
                 # Handle superadmin/admin case - check if user has superadmin or admin role
-                user = User.query.get(current_user_id)
-                if user and user.role and user.role.role_name in ['superadmin', 'admin']:
+                identity = identity_cache.get_identity(current_user_id)
+                if identity and identity['is_admin']:
                     # Superadmin and Admin roles have all permissions
                     return f(*args, **kwargs)
                 
@@ -5,6 +5,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from modules.core.models import User, Role
 from modules.core.permissions import Permission, RolePermission, PermissionManager, require_permission
+from modules.core.identity_cache import identity_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -250,6 +251,8 @@ def update_role_permissions(role_id):
                 db.session.add(role_permission)
         
         db.session.commit()
+        # Every user holding this role picks up the new permissions on their next request
+        identity_cache.invalidate_all()
         
         return jsonify({
             'message': f'Updated permissions for role {role.role_name}',
@@ -451,6 +454,7 @@ def update_role(role_id):
         
         db.session.commit()
         print(f"✓ Database committed successfully")
+        identity_cache.invalidate_all()
         
         # Get updated permissions
         permissions = db.session.query(Permission).join(
@@ -7,6 +7,7 @@ import logging
 from app import db
 from modules.core.security_models import SecurityPolicy, PasswordHistory, UserSession, AccountLockout, TwoFactorAuth, SecurityEvent
 from modules.core.permissions import require_permission, PermissionManager
+from modules.core.identity_cache import identity_cache
 
 logger = logging.getLogger(__name__)
 
@@ -137,6 +138,7 @@ def update_security_policy():
             policy.updated_at = datetime.utcnow()
         
         db.session.commit()
+        identity_cache.invalidate_policies()
         
         return jsonify({
             'success': True,
@@ -262,6 +264,8 @@ def terminate_all_sessions():
             for session in sessions:
                 db.session.delete(session)
             db.session.commit()
+            identity_cache.invalidate_session(*[session.session_id for session in sessions])
+            identity_cache.revoke_user_tokens(user_id)
             success = True
         else:
             success = security_service.invalidate_all_user_sessions(user_id)
@@ -6,6 +6,7 @@ Provides utilities for extracting tenant context and enforcing tenant isolation
 from flask import request, g
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from modules.core.models import User
+from modules.core.identity_cache import identity_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,13 +44,13 @@ def get_current_user_tenant_id():
         return None
     
     try:
-        user = User.query.get(user_id)
-        if not user:
+        identity = identity_cache.get_identity(user_id)
+        if not identity:
             logger.warning(f"User {user_id} not found")
             return None
         
-        # Get tenant_id from user
-        tenant_id = getattr(user, 'tenant_id', None)
+        # Get tenant_id from the user's cached identity
+        tenant_id = identity['tenant_id']
         if tenant_id:
             logger.debug(f"User {user_id} belongs to tenant {tenant_id}")
             return tenant_id
@@ -6,6 +6,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 from modules.core.models import User, Role, Organization
 from modules.core.permissions import require_permission, PermissionManager
+from modules.core.identity_cache import identity_cache
 from modules.core.tenant_helpers import get_current_user_tenant_id, get_current_user_id
 from modules.core.tenant_query_helper import tenant_query
 from datetime import datetime
@@ -51,12 +52,12 @@ def get_all_users():
             return jsonify({'error': 'Authentication required', 'message': 'User ID not found in JWT token'}), 401
         
         # Get user and check if admin
-        user = User.query.get(current_user_id)
-        if not user:
+        identity = identity_cache.get_identity(current_user_id)
+        if not identity:
             return jsonify({'error': 'User not found'}), 404
         
         # Superadmin/Admin bypass - can view users without explicit permission
-        is_admin = user.role and user.role.role_name in ['superadmin', 'admin']
+        is_admin = identity['is_admin']
         
         # Non-admin users need system.users.read permission
         if not is_admin:
@@ -368,6 +369,11 @@ def update_user(user_id):
         
         db.session.commit()
         
+        # Role, activation and password changes apply on the user's next request
+        identity_cache.invalidate_user(user_id)
+        if data.get('password') or data.get('is_active') is False:
+            identity_cache.revoke_user_tokens(user_id)
+        
         # Log user update to audit trail
         try:
             from services.audit_logger_service import audit_logger
@@ -445,6 +451,8 @@ def delete_user(user_id):
         
         db.session.delete(user)
         db.session.commit()
+        identity_cache.invalidate_user(user_id)
+        identity_cache.revoke_user_tokens(user_id)
         
         # Log user deletion to audit trail
         try:
@@ -496,6 +504,7 @@ def activate_user(user_id):
         if hasattr(user, 'is_active'):
             user.is_active = True
             db.session.commit()
+            identity_cache.invalidate_user(user_id)
         
         return jsonify({
             'message': 'User activated successfully',
@@ -537,6 +546,8 @@ def deactivate_user(user_id):
         if hasattr(user, 'is_active'):
             user.is_active = False
             db.session.commit()
+            identity_cache.invalidate_user(user_id)
+            identity_cache.revoke_user_tokens(user_id)
         
         return jsonify({
             'message': 'User deactivated successfully',
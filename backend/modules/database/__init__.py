@@ -2,8 +2,8 @@
 Database utilities and schema synchronization
 """
 
-from .schema_sync import sync_all_models, sync_model_columns
+from .schema_sync import SchemaSyncError, sync_all_models, sync_model_columns
 
-__all__ = ['sync_all_models', 'sync_model_columns']
+__all__ = ['SchemaSyncError', 'sync_all_models', 'sync_model_columns']
 
 
@@ -0,0 +1,14 @@
+"""
+Database bookkeeping models
+"""
+
+from app import db
+from datetime import datetime
+
+class SchemaMeta(db.Model):
+    """Key/value markers for startup work (e.g. the last applied schema fingerprint)"""
+    __tablename__ = 'schema_meta'
+
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.String(128), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
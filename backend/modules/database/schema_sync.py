@@ -6,18 +6,29 @@ Adds missing columns without affecting existing data
 
 from sqlalchemy import text, inspect
 from app import db
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-def sync_model_columns(model_class):
+class SchemaSyncError(Exception):
+    """Raised after a sync pass in which some columns could not be added"""
+
+    def __init__(self, failed, added=0):
+        super().__init__(f"{failed} column(s) could not be synced ({added} added)")
+        self.failed = failed
+        self.added = added
+
+def sync_model_columns(model_class, inspector=None):
     """
     Sync a single model's columns with the database
     Adds missing columns without affecting existing data
+    Returns the number of columns added; raises SchemaSyncError if any failed
     """
+    table_name = model_class.__tablename__
     try:
-        table_name = model_class.__tablename__
-        inspector = inspect(db.engine)
+        inspector = inspector or inspect(db.engine)
         
         # Get existing columns from database
         existing_columns = {col['name']: col for col in inspector.get_columns(table_name)}
@@ -37,7 +48,9 @@ def sync_model_columns(model_class):
             if col_name not in existing_columns:
                 missing_columns.append((col_name, col_info))
         
-        # Add missing columns
+        # Add missing columns, each behind a savepoint so one failure does not abort the rest
+        added = 0
+        failed = []
         if missing_columns:
             for col_name, col_info in missing_columns:
                 try:
@@ -64,10 +77,10 @@ def sync_model_columns(model_class):
                         sql_type = 'FLOAT'
                     elif 'BOOLEAN' in col_type.upper() or 'BOOL' in col_type.upper():
                         sql_type = 'BOOLEAN'
-                    elif 'DATE' in col_type.upper():
-                        sql_type = 'DATE'
                     elif 'DATETIME' in col_type.upper() or 'TIMESTAMP' in col_type.upper():
                         sql_type = 'TIMESTAMP'
+                    elif 'DATE' in col_type.upper():
+                        sql_type = 'DATE'
                     elif 'JSONB' in col_type.upper():
                         sql_type = 'JSONB'
                     else:
@@ -93,62 +106,133 @@ def sync_model_columns(model_class):
                         ADD COLUMN IF NOT EXISTS {col_name} {sql_type}{nullable_clause}{default_clause}
                     """
                     
-                    db.session.execute(text(alter_sql))
+                    with db.session.begin_nested():
+                        db.session.execute(text(alter_sql))
+                    added += 1
                     logger.info(f"✅ Added missing column '{col_name}' to table '{table_name}'")
                     
                 except Exception as e:
+                    failed.append(col_name)
                     logger.warning(f"⚠️  Could not add column '{col_name}' to '{table_name}': {e}")
                     # Continue with other columns even if one fails
         
         if missing_columns:
             db.session.commit()
-            logger.info(f"✅ Synced {len(missing_columns)} missing column(s) for table '{table_name}'")
-            return len(missing_columns)
+            logger.info(f"✅ Synced {added} of {len(missing_columns)} missing column(s) for table '{table_name}'")
+        if failed:
+            raise SchemaSyncError(len(failed), added)
         
-        return 0
+        return added
         
+    except SchemaSyncError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error syncing columns for {table_name}: {e}")
         db.session.rollback()
-        return 0
+        raise SchemaSyncError(1) from e
+
+def _module_enabled(name):
+    """Skip models of modules disabled via ENABLED_MODULES (no registry = everything enabled)"""
+    try:
+        from flask import current_app
+        registry = current_app.extensions.get('module_registry')
+    except RuntimeError:
+        registry = None
+    return registry is None or name in registry.enabled
+
+def get_models_to_sync():
+    """Models whose columns are kept in sync with the database on startup"""
+    # Import models dynamically to avoid circular imports
+    models_to_sync = []
+    
+    if _module_enabled('finance'):
+        try:
+            from modules.finance.models import Account
+            from modules.finance.advanced_models import JournalHeader
+            models_to_sync.extend([Account, JournalHeader])
+        except ImportError as e:
+            logger.debug(f"Could not import finance models: {e}")
+
+    if _module_enabled('workflow'):
+        try:
+            from modules.workflow.models import WorkflowRule, WorkflowExecution, WorkflowAction
+            models_to_sync.extend([WorkflowRule, WorkflowExecution, WorkflowAction])
+        except ImportError as e:
+            logger.debug(f"Could not import workflow models: {e}")
 
-def sync_all_models():
+    if _module_enabled('inventory'):
+        try:
+            from modules.inventory.advanced_models import StockLevel
+            models_to_sync.append(StockLevel)
+        except ImportError as e:
+            logger.debug(f"Could not import inventory models: {e}")
+
+    if _module_enabled('procurement'):
+        try:
+            from modules.procurement.models import PurchaseOrder
+            models_to_sync.append(PurchaseOrder)
+        except ImportError as e:
+            logger.debug(f"Could not import procurement models: {e}")
+    
+    return models_to_sync
+
+def models_fingerprint(models=None) -> str:
+    """
+    Stable hash of the synced models' column definitions
+    Changes whenever a column is added, retyped or has its default changed
+    """
+    tables = []
+    for model in sorted(models if models is not None else get_models_to_sync(), key=lambda m: m.__tablename__):
+        columns = []
+        for column in model.__table__.columns:
+            default = getattr(column.default, 'arg', None) if column.default is not None else None
+            columns.append([column.name, repr(column.type), column.nullable,
+                            default if isinstance(default, (int, float, str, bool)) else None])
+        tables.append([model.__tablename__, sorted(columns)])
+    return hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()
+
+def sync_all_models(models=None):
     """
     Sync all registered models with the database
     This should be called on application startup
     Automatically adds missing columns without affecting existing data
+    Returns the number of columns added; raises SchemaSyncError carrying the
+    failure count once every model has been tried
     """
     try:
-        # Import models dynamically to avoid circular imports
-        models_to_sync = []
-        
-        try:
-            from modules.finance.models import Account
-            models_to_sync.append(Account)
-        except ImportError as e:
-            logger.debug(f"Could not import Account model: {e}")
+        models_to_sync = models if models is not None else get_models_to_sync()
         
         if not models_to_sync:
             logger.debug("No models to sync")
             return 0
         
+        # One inspector for the whole pass: reflection results are cached per inspector
+        inspector = inspect(db.engine)
+        existing_tables = set(inspector.get_table_names())
+        
         total_synced = 0
+        total_failed = 0
         for model in models_to_sync:
             try:
                 # Check if table exists before syncing
-                inspector = inspect(db.engine)
                 table_name = model.__tablename__
                 
-                if not inspector.has_table(table_name):
+                if table_name not in existing_tables:
                     logger.debug(f"Table '{table_name}' does not exist, skipping sync (will be created by db.create_all())")
                     continue
                 
-                synced = sync_model_columns(model)
+                synced = sync_model_columns(model, inspector)
                 total_synced += synced
+            except SchemaSyncError as e:
+                total_synced += e.added
+                total_failed += e.failed
+                logger.warning(f"⚠️  Could not fully sync model {model.__name__}: {e}")
             except Exception as e:
+                total_failed += 1
                 logger.warning(f"⚠️  Could not sync model {model.__name__}: {e}")
-                continue
         
+        if total_failed:
+            raise SchemaSyncError(total_failed, total_synced)
         if total_synced > 0:
             logger.info(f"✅ Database schema sync complete: {total_synced} column(s) added")
         else:
@@ -156,9 +240,10 @@ def sync_all_models():
         
         return total_synced
         
+    except SchemaSyncError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error during database schema sync: {e}")
         import traceback
         logger.debug(traceback.format_exc())
-        return 0
-
+        raise SchemaSyncError(1) from e
@@ -0,0 +1,109 @@
+"""
+Startup Schema Work
+Column sync and permission seeding only need to run when the synced models or
+PERMISSION_DEFINITIONS change. Both are hashed into one fingerprint that is
+stored in ``schema_meta``; a worker booting against a database that already
+carries the current fingerprint skips the reflection and seeding entirely.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Dict
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_KEY = 'startup_fingerprint'
+
+def startup_fingerprint() -> str:
+    from modules.database.schema_sync import models_fingerprint
+    from modules.core.module_permission_mappings import PERMISSION_DEFINITIONS
+    payload = json.dumps({
+        'models': models_fingerprint(),
+        'permissions': PERMISSION_DEFINITIONS
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _stored_fingerprint():
+    from modules.database.models import SchemaMeta
+    SchemaMeta.__table__.create(db.engine, checkfirst=True)
+    row = db.session.get(SchemaMeta, FINGERPRINT_KEY)
+    return row.value if row else None
+
+def _store_fingerprint(fingerprint: str):
+    from modules.database.models import SchemaMeta
+    try:
+        db.session.merge(SchemaMeta(key=FINGERPRINT_KEY, value=fingerprint))
+        db.session.commit()
+    except Exception as e:
+        # Another worker stored it first
+        db.session.rollback()
+        logger.debug(f"Could not store startup fingerprint: {e}")
+
+def run_startup_sync(force: bool = False) -> Dict:
+    """
+    Schema sync + permission seeding, skipped when the stored fingerprint matches.
+    Must run inside an app context. Returns per-step timings in milliseconds.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    fingerprint = startup_fingerprint()
+    try:
+        stored = _stored_fingerprint()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not read startup fingerprint: {e}")
+        stored = None
+    timings['fingerprint_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    if stored == fingerprint and not force:
+        timings['skipped'] = True
+        logger.info(f"Startup schema sync skipped (fingerprint {fingerprint[:12]} unchanged) in {timings['fingerprint_ms']}ms")
+        return timings
+
+    timings['skipped'] = False
+    clean = True
+
+    step = time.perf_counter()
+    from modules.database.schema_sync import SchemaSyncError
+    try:
+        from modules.database.schema_sync import sync_all_models
+        timings['columns_added'] = sync_all_models()
+    except SchemaSyncError as e:
+        clean = False
+        timings['columns_added'] = e.added
+        timings['columns_failed'] = e.failed
+        logger.warning(f"⚠️  Database schema sync: {e}")
+    except Exception as e:
+        clean = False
+        logger.warning(f"Database schema sync warning: {e}")
+    timings['schema_sync_ms'] = round((time.perf_counter() - step) * 1000, 1)
+
+    step = time.perf_counter()
+    try:
+        from modules.core.permission_seeder import seed_all_permissions
+        result = seed_all_permissions()
+        timings['permissions_created'] = result['created']
+        if result['errors']:
+            clean = False
+            logger.warning(f"⚠️  Permission seeding encountered {len(result['errors'])} errors")
+    except Exception as e:
+        clean = False
+        logger.warning(f"Permission seeding warning: {e}")
+    timings['permission_seed_ms'] = round((time.perf_counter() - step) * 1000, 1)
+
+    # Only a fully successful pass is recorded, so failures are retried next boot
+    if clean:
+        _store_fingerprint(fingerprint)
+
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        f"Startup schema sync: fingerprint {timings['fingerprint_ms']}ms, "
+        f"schema {timings['schema_sync_ms']}ms, permissions {timings['permission_seed_ms']}ms, "
+        f"total {timings['total_ms']}ms"
+    )
+    return timings
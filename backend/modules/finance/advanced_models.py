@@ -121,6 +121,10 @@ class JournalHeader(db.Model):
     reversed_at = db.Column(db.DateTime)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Optimistic locking: bumped on every UPDATE, stale writers get StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
+    
     # Relationships
     lines = db.relationship('GeneralLedgerEntry', backref='journal_header', lazy='dynamic')
     
@@ -185,6 +189,11 @@ class AccountsPayable(db.Model):
     payments = db.relationship('APPayment', backref='invoice', lazy='dynamic')
     # Payment relationships will be added after payment models are defined
 
+    # Covers the aging GROUP BY so it is answered from the index alone
+    __table_args__ = (
+        db.Index('idx_ap_aging', 'tenant_id', 'vendor_id', 'status', 'due_date', 'outstanding_amount', 'invoice_date', 'vendor_name'),
+    )
+
 # Accounts Receivable - Enhanced
 class AccountsReceivable(db.Model):
     __tablename__ = 'advanced_accounts_receivable'
@@ -226,6 +235,36 @@ class AccountsReceivable(db.Model):
     payments = db.relationship('ARPayment', backref='invoice', lazy='dynamic')
     # Payment relationships will be added after payment models are defined
 
+    # Covers the aging GROUP BY so it is answered from the index alone
+    __table_args__ = (
+        db.Index('idx_ar_aging', 'tenant_id', 'customer_id', 'status', 'due_date', 'outstanding_amount', 'invoice_date', 'customer_name'),
+    )
+
+# AR/AP aging history - one row per tenant, ledger and day (written nightly by aging_reports)
+class AgingSnapshot(db.Model):
+    __tablename__ = 'aging_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=False)
+    ledger = db.Column(db.String(2), nullable=False)  # ar, ap
+    snapshot_date = db.Column(db.Date, nullable=False)
+    current_amount = db.Column(db.Float, default=0.0)
+    days_30_amount = db.Column(db.Float, default=0.0)
+    days_60_amount = db.Column(db.Float, default=0.0)
+    days_90_amount = db.Column(db.Float, default=0.0)
+    days_120_amount = db.Column(db.Float, default=0.0)
+    over_120_amount = db.Column(db.Float, default=0.0)
+    total_outstanding = db.Column(db.Float, default=0.0)
+    overdue_amount = db.Column(db.Float, default=0.0)
+    open_items = db.Column(db.Integer, default=0)
+    period_invoiced = db.Column(db.Float, default=0.0)  # Invoiced in the trailing DSO/DPO window
+    days_outstanding = db.Column(db.Float)  # DSO for ar, DPO for ap
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'ledger', 'snapshot_date', name='uq_aging_snapshot'),
+    )
+
 # Fixed Assets - Enhanced
 class FixedAsset(db.Model):
     __tablename__ = 'advanced_fixed_assets'
@@ -1,7 +1,21 @@
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from decimal import Decimal
-import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, func
+from app import db
+
+BUCKETS = ('current', '30_days', '60_days', '90_days', '120_days', 'over_120_days')
+# Days past due at which each bucket but the last ends
+BUCKET_DAYS = (0, 30, 60, 90, 120)
+# Snapshot column per bucket
+SNAPSHOT_COLUMNS = {
+    'current': 'current_amount',
+    '30_days': 'days_30_amount',
+    '60_days': 'days_60_amount',
+    '90_days': 'days_90_amount',
+    '120_days': 'days_120_amount',
+    'over_120_days': 'over_120_amount'
+}
+CLOSED_STATUSES = ('paid', 'void')
 
 class AgingReports:
     """Comprehensive Aging Reports for Accounts Receivable and Accounts Payable"""
@@ -16,7 +30,8 @@ class AgingReports:
             'over_120_days': 121
         }
     
-    def generate_ar_aging_report(self, as_of_date: datetime = None, customer_id: str = None) -> Dict:
+    def generate_ar_aging_report(self, as_of_date: datetime = None, customer_id: str = None,
+                                 tenant_id: str = None) -> Dict:
         """
         Generate comprehensive Accounts Receivable aging report
         """
@@ -24,18 +39,17 @@ class AgingReports:
             if not as_of_date:
                 as_of_date = datetime.now()
             
-            # Get AR transactions
-            ar_transactions = self._get_ar_transactions(customer_id)
+            from .advanced_models import AccountsReceivable
             
-            # Calculate aging buckets
-            aging_data = self._calculate_aging_buckets(ar_transactions, as_of_date)
+            # Bucket totals and the customer breakdown come from one grouped query
+            aging_data, customer_breakdown = self._aging_by_party(
+                AccountsReceivable, AccountsReceivable.customer_id, AccountsReceivable.customer_name,
+                tenant_id, as_of_date, customer_id, 'customer'
+            )
             
             # Generate summary
             summary = self._generate_ar_summary(aging_data)
             
-            # Generate customer breakdown
-            customer_breakdown = self._generate_customer_breakdown(ar_transactions, as_of_date)
-            
             report = {
                 'report_id': f"AR-AGING-{as_of_date.strftime('%Y%m%d')}",
                 'report_type': 'accounts_receivable_aging',
@@ -60,7 +74,8 @@ class AgingReports:
                 'error': f'Error generating AR aging report: {str(e)}'
             }
     
-    def generate_ap_aging_report(self, as_of_date: datetime = None, supplier_id: str = None) -> Dict:
+    def generate_ap_aging_report(self, as_of_date: datetime = None, supplier_id: str = None,
+                                 tenant_id: str = None) -> Dict:
         """
         Generate comprehensive Accounts Payable aging report
         """
@@ -68,18 +83,17 @@ class AgingReports:
             if not as_of_date:
                 as_of_date = datetime.now()
             
-            # Get AP transactions
-            ap_transactions = self._get_ap_transactions(supplier_id)
+            from .advanced_models import AccountsPayable
             
-            # Calculate aging buckets
-            aging_data = self._calculate_aging_buckets(ap_transactions, as_of_date)
+            # Bucket totals and the supplier breakdown come from one grouped query
+            aging_data, supplier_breakdown = self._aging_by_party(
+                AccountsPayable, AccountsPayable.vendor_id, AccountsPayable.vendor_name,
+                tenant_id, as_of_date, supplier_id, 'supplier'
+            )
             
             # Generate summary
             summary = self._generate_ap_summary(aging_data)
             
-            # Generate supplier breakdown
-            supplier_breakdown = self._generate_supplier_breakdown(ap_transactions, as_of_date)
-            
             report = {
                 'report_id': f"AP-AGING-{as_of_date.strftime('%Y%m%d')}",
                 'report_type': 'accounts_payable_aging',
@@ -104,176 +118,175 @@ class AgingReports:
                 'error': f'Error generating AP aging report: {str(e)}'
             }
     
-    def _get_ar_transactions(self, customer_id: str = None) -> List[Dict]:
+    @staticmethod
+    def _due_date(model):
         """
-        Get Accounts Receivable transactions (mock data)
+        Due date used for aging. Items recorded without one (legacy rows) are
+        treated as due on their invoice date instead of NULL falling through
+        every comparison into over_120_days.
         """
-        # Mock data - replace with actual database query
-        ar_transactions = [
-            {
-                'invoice_id': 'INV-001',
-                'customer_id': 'CUST001',
-                'customer_name': 'ABC Company',
-                'invoice_date': datetime.now() - timedelta(days=5),
-                'due_date': datetime.now() + timedelta(days=25),
-                'invoice_amount': 15000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 15000.00,
-                'status': 'open'
-            },
-            {
-                'invoice_id': 'INV-002',
-                'customer_id': 'CUST002',
-                'customer_name': 'XYZ Corporation',
-                'invoice_date': datetime.now() - timedelta(days=35),
-                'due_date': datetime.now() - timedelta(days=5),
-                'invoice_amount': 25000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 25000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'INV-003',
-                'customer_id': 'CUST003',
-                'customer_name': 'DEF Industries',
-                'invoice_date': datetime.now() - timedelta(days=65),
-                'due_date': datetime.now() - timedelta(days=35),
-                'invoice_amount': 18000.00,
-                'paid_amount': 5000.00,
-                'outstanding_amount': 13000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'INV-004',
-                'customer_id': 'CUST001',
-                'customer_name': 'ABC Company',
-                'invoice_date': datetime.now() - timedelta(days=95),
-                'due_date': datetime.now() - timedelta(days=65),
-                'invoice_amount': 12000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 12000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'INV-005',
-                'customer_id': 'CUST004',
-                'customer_name': 'GHI Solutions',
-                'invoice_date': datetime.now() - timedelta(days=125),
-                'due_date': datetime.now() - timedelta(days=95),
-                'invoice_amount': 8000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 8000.00,
-                'status': 'overdue'
-            }
-        ]
-        
-        if customer_id:
-            ar_transactions = [t for t in ar_transactions if t['customer_id'] == customer_id]
-        
-        return ar_transactions
+        return func.coalesce(model.due_date, model.invoice_date)
     
-    def _get_ap_transactions(self, supplier_id: str = None) -> List[Dict]:
+    @staticmethod
+    def _bucket_conditions(due_date_column, as_of: date) -> List:
         """
-        Get Accounts Payable transactions (mock data)
+        (bucket, condition) pairs on the due date. Comparing due_date with
+        as_of minus N days keeps this portable and lets an index on due_date
+        be used. Days past due <= 0 is current, <= 30 is 30_days, and so on.
         """
-        # Mock data - replace with actual database query
-        ap_transactions = [
-            {
-                'invoice_id': 'AP-INV-001',
-                'supplier_id': 'SUPP001',
-                'supplier_name': 'Supplier A',
-                'invoice_date': datetime.now() - timedelta(days=10),
-                'due_date': datetime.now() + timedelta(days=20),
-                'invoice_amount': 20000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 20000.00,
-                'status': 'open'
-            },
-            {
-                'invoice_id': 'AP-INV-002',
-                'supplier_id': 'SUPP002',
-                'supplier_name': 'Supplier B',
-                'invoice_date': datetime.now() - timedelta(days=40),
-                'due_date': datetime.now() - timedelta(days=10),
-                'invoice_amount': 15000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 15000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'AP-INV-003',
-                'supplier_id': 'SUPP003',
-                'supplier_name': 'Supplier C',
-                'invoice_date': datetime.now() - timedelta(days=70),
-                'due_date': datetime.now() - timedelta(days=40),
-                'invoice_amount': 12000.00,
-                'paid_amount': 3000.00,
-                'outstanding_amount': 9000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'AP-INV-004',
-                'supplier_id': 'SUPP001',
-                'supplier_name': 'Supplier A',
-                'invoice_date': datetime.now() - timedelta(days=100),
-                'due_date': datetime.now() - timedelta(days=70),
-                'invoice_amount': 18000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 18000.00,
-                'status': 'overdue'
-            },
-            {
-                'invoice_id': 'AP-INV-005',
-                'supplier_id': 'SUPP004',
-                'supplier_name': 'Supplier D',
-                'invoice_date': datetime.now() - timedelta(days=130),
-                'due_date': datetime.now() - timedelta(days=100),
-                'invoice_amount': 10000.00,
-                'paid_amount': 0.00,
-                'outstanding_amount': 10000.00,
-                'status': 'overdue'
-            }
+        def days_before(days):
+            return as_of - timedelta(days=days)
+        return [
+            ('current', due_date_column >= as_of),
+            ('30_days', and_(due_date_column < as_of, due_date_column >= days_before(30))),
+            ('60_days', and_(due_date_column < days_before(30), due_date_column >= days_before(60))),
+            ('90_days', and_(due_date_column < days_before(60), due_date_column >= days_before(90))),
+            ('120_days', and_(due_date_column < days_before(90), due_date_column >= days_before(120))),
+            ('over_120_days', due_date_column < days_before(120)),
         ]
-        
-        if supplier_id:
-            ap_transactions = [t for t in ap_transactions if t['supplier_id'] == supplier_id]
-        
-        return ap_transactions
     
-    def _calculate_aging_buckets(self, transactions: List[Dict], as_of_date: datetime) -> Dict:
+    def _aging_by_party(self, model, party_column, name_column, tenant_id: str, as_of_date: datetime,
+                        party_id: str, party: str) -> Tuple[Dict, List[Dict]]:
         """
-        Calculate aging buckets for transactions
+        Aging buckets and per customer/supplier breakdown of the open items,
+        from a single GROUP BY on (party, bucket). The bucket is one CASE over
+        the due date, so each row is classified once instead of once per bucket.
         """
-        aging_buckets = {
-            'current': {'amount': 0, 'count': 0, 'transactions': []},
-            '30_days': {'amount': 0, 'count': 0, 'transactions': []},
-            '60_days': {'amount': 0, 'count': 0, 'transactions': []},
-            '90_days': {'amount': 0, 'count': 0, 'transactions': []},
-            '120_days': {'amount': 0, 'count': 0, 'transactions': []},
-            'over_120_days': {'amount': 0, 'count': 0, 'transactions': []}
-        }
-        
-        for transaction in transactions:
-            days_overdue = (as_of_date - transaction['due_date']).days
-            
-            if days_overdue <= 0:
-                bucket = 'current'
-            elif days_overdue <= 30:
-                bucket = '30_days'
-            elif days_overdue <= 60:
-                bucket = '60_days'
-            elif days_overdue <= 90:
-                bucket = '90_days'
-            elif days_overdue <= 120:
-                bucket = '120_days'
-            else:
-                bucket = 'over_120_days'
-            
-            aging_buckets[bucket]['amount'] += transaction['outstanding_amount']
-            aging_buckets[bucket]['count'] += 1
-            aging_buckets[bucket]['transactions'].append(transaction)
+        as_of = as_of_date.date() if isinstance(as_of_date, datetime) else as_of_date
+        due_date = self._due_date(model)
+        bucket = case(
+            *[(due_date >= as_of - timedelta(days=days), index) for index, days in enumerate(BUCKET_DAYS)],
+            else_=len(BUCKET_DAYS)
+        ).label('bucket')
+        
+        query = db.session.query(
+            party_column, bucket, func.max(name_column), func.count(model.id),
+            func.sum(model.outstanding_amount), func.min(model.invoice_date)
+        ).filter(
+            model.tenant_id == tenant_id,
+            model.status.notin_(CLOSED_STATUSES),
+            model.outstanding_amount > 0
+        )
+        if party_id:
+            query = query.filter(party_column == party_id)
+        rows = query.group_by(party_column, bucket).all()
+        
+        aging_data = {name: {'amount': 0.0, 'count': 0} for name in BUCKETS}
+        parties = {}
+        for party_key, index, party_name, count, amount, oldest in rows:
+            name = BUCKETS[index]
+            amount, count = float(amount or 0), int(count or 0)
+            aging_data[name]['amount'] += amount
+            aging_data[name]['count'] += count
+            entry = parties.get(party_key)
+            if entry is None:
+                entry = parties[party_key] = {
+                    f'{party}_id': party_key,
+                    f'{party}_name': party_name,
+                    'total_outstanding': 0.0,
+                    'invoice_count': 0,
+                    'oldest_invoice_date': oldest,
+                    'overdue_amount': 0.0,
+                    'overdue_invoices': 0,
+                    'aging_buckets': {b: 0.0 for b in BUCKETS}
+                }
+            entry['total_outstanding'] += amount
+            entry['invoice_count'] += count
+            entry['aging_buckets'][name] = round(amount, 2)
+            if oldest is not None and (entry['oldest_invoice_date'] is None or oldest < entry['oldest_invoice_date']):
+                entry['oldest_invoice_date'] = oldest
+            if name != 'current':
+                entry['overdue_amount'] += amount
+                entry['overdue_invoices'] += count
+        
+        for values in aging_data.values():
+            values['amount'] = round(values['amount'], 2)
+        breakdown = list(parties.values())
+        for entry in breakdown:
+            entry['total_outstanding'] = round(entry['total_outstanding'], 2)
+            entry['overdue_amount'] = round(entry['overdue_amount'], 2)
+        breakdown.sort(key=lambda item: item['total_outstanding'], reverse=True)
+        return aging_data, breakdown
+    
+    # ------------------------------------------------------------------
+    # Snapshots (aging history for trend and DSO/DPO charts)
+    # ------------------------------------------------------------------
+    
+    def take_snapshots(self, as_of_date: date = None, window_days: int = 90) -> Dict:
+        """
+        Record today's AR and AP aging of every tenant in aging_snapshots: one
+        grouped query per ledger, re-running for the same day replaces its rows.
+        DSO/DPO = outstanding / invoiced in the last ``window_days`` * window_days.
+        """
+        from .advanced_models import AccountsPayable, AccountsReceivable, AgingSnapshot
         
-        return aging_buckets
+        as_of = as_of_date or date.today()
+        window_start = as_of - timedelta(days=window_days)
+        written = {}
+        try:
+            for ledger, model in (('ar', AccountsReceivable), ('ap', AccountsPayable)):
+                is_open = and_(model.status != 'paid', model.outstanding_amount > 0)
+                amount = model.outstanding_amount
+                columns = [
+                    model.tenant_id,
+                    func.sum(case((is_open, 1), else_=0)),
+                    func.sum(case((is_open, amount), else_=0)),
+                    func.sum(case((model.invoice_date > window_start, model.total_amount), else_=0))
+                ]
+                for _, condition in self._bucket_conditions(self._due_date(model), as_of):
+                    columns.append(func.sum(case((and_(is_open, condition), amount), else_=0)))
+                rows = db.session.query(*columns).filter(model.status != 'void').group_by(model.tenant_id).all()
+                
+                AgingSnapshot.query.filter_by(ledger=ledger, snapshot_date=as_of).delete(synchronize_session=False)
+                snapshots = []
+                for row in rows:
+                    tenant_id, open_items, total, invoiced = row[:4]
+                    total, invoiced = float(total or 0), float(invoiced or 0)
+                    values = {SNAPSHOT_COLUMNS[bucket]: round(float(row[4 + index] or 0), 2)
+                              for index, bucket in enumerate(BUCKETS)}
+                    snapshots.append(dict(
+                        values,
+                        tenant_id=tenant_id, ledger=ledger, snapshot_date=as_of,
+                        open_items=int(open_items or 0), total_outstanding=round(total, 2),
+                        overdue_amount=round(total - values['current_amount'], 2),
+                        period_invoiced=round(invoiced, 2),
+                        days_outstanding=round(total / invoiced * window_days, 1) if invoiced else None,
+                        created_at=datetime.utcnow()
+                    ))
+                if snapshots:
+                    db.session.bulk_insert_mappings(AgingSnapshot, snapshots)
+                written[ledger] = len(snapshots)
+            db.session.commit()
+            return {'success': True, 'snapshot_date': as_of.isoformat(), 'tenants': written}
+        except Exception as e:
+            db.session.rollback()
+            return {'success': False, 'error': f'Error taking aging snapshots: {str(e)}'}
+    
+    def get_aging_trend(self, tenant_id: str, ledger: str = 'ar', days: int = 90) -> Dict:
+        """Daily aging history of a tenant from aging_snapshots (no ledger scan)"""
+        from .advanced_models import AgingSnapshot
+        try:
+            since = date.today() - timedelta(days=days)
+            snapshots = AgingSnapshot.query.filter(
+                AgingSnapshot.tenant_id == tenant_id,
+                AgingSnapshot.ledger == ledger,
+                AgingSnapshot.snapshot_date >= since
+            ).order_by(AgingSnapshot.snapshot_date).all()
+            return {
+                'success': True,
+                'ledger': ledger,
+                'metric': 'dso' if ledger == 'ar' else 'dpo',
+                'trend': [{
+                    'date': s.snapshot_date.isoformat(),
+                    'aging_buckets': {bucket: getattr(s, column) for bucket, column in SNAPSHOT_COLUMNS.items()},
+                    'total_outstanding': s.total_outstanding,
+                    'overdue_amount': s.overdue_amount,
+                    'open_items': s.open_items,
+                    'days_outstanding': s.days_outstanding
+                } for s in snapshots]
+            }
+        except Exception as e:
+            return {'success': False, 'error': f'Error loading aging trend: {str(e)}'}
     
     def _generate_ar_summary(self, aging_data: Dict) -> Dict:
         """
@@ -315,68 +328,6 @@ class AgingReports:
             'current_invoices': aging_data['current']['count']
         }
     
-    def _generate_customer_breakdown(self, transactions: List[Dict], as_of_date: datetime) -> List[Dict]:
-        """
-        Generate customer breakdown for AR
-        """
-        customer_data = {}
-        
-        for transaction in transactions:
-            customer_id = transaction['customer_id']
-            if customer_id not in customer_data:
-                customer_data[customer_id] = {
-                    'customer_id': customer_id,
-                    'customer_name': transaction['customer_name'],
-                    'total_outstanding': 0,
-                    'invoice_count': 0,
-                    'oldest_invoice_date': transaction['invoice_date'],
-                    'overdue_amount': 0,
-                    'overdue_invoices': 0
-                }
-            
-            customer_data[customer_id]['total_outstanding'] += transaction['outstanding_amount']
-            customer_data[customer_id]['invoice_count'] += 1
-            
-            if transaction['invoice_date'] < customer_data[customer_id]['oldest_invoice_date']:
-                customer_data[customer_id]['oldest_invoice_date'] = transaction['invoice_date']
-            
-            if transaction['status'] == 'overdue':
-                customer_data[customer_id]['overdue_amount'] += transaction['outstanding_amount']
-                customer_data[customer_id]['overdue_invoices'] += 1
-        
-        return list(customer_data.values())
-    
-    def _generate_supplier_breakdown(self, transactions: List[Dict], as_of_date: datetime) -> List[Dict]:
-        """
-        Generate supplier breakdown for AP
-        """
-        supplier_data = {}
-        
-        for transaction in transactions:
-            supplier_id = transaction['supplier_id']
-            if supplier_id not in supplier_data:
-                supplier_data[supplier_id] = {
-                    'supplier_id': supplier_id,
-                    'supplier_name': transaction['supplier_name'],
-                    'total_outstanding': 0,
-                    'invoice_count': 0,
-                    'oldest_invoice_date': transaction['invoice_date'],
-                    'overdue_amount': 0,
-                    'overdue_invoices': 0
-                }
-            
-            supplier_data[supplier_id]['total_outstanding'] += transaction['outstanding_amount']
-            supplier_data[supplier_id]['invoice_count'] += 1
-            
-            if transaction['invoice_date'] < supplier_data[supplier_id]['oldest_invoice_date']:
-                supplier_data[supplier_id]['oldest_invoice_date'] = transaction['invoice_date']
-            
-            if transaction['status'] == 'overdue':
-                supplier_data[supplier_id]['overdue_amount'] += transaction['outstanding_amount']
-                supplier_data[supplier_id]['overdue_invoices'] += 1
-        
-        return list(supplier_data.values())
-    
     def _analyze_ar_risk(self, aging_data: Dict) -> Dict:
         """
         Analyze AR risk based on aging
@@ -9,35 +9,29 @@ import hashlib
 import logging
 from datetime import datetime, timedelta
 from typing import Any, Optional, Dict, List
-from flask import current_app
+from flask import g
 from functools import wraps
-import redis
-from sqlalchemy import text
+from services.cache_service import cache_service
 
 logger = logging.getLogger(__name__)
 
 class ReconciliationCache:
-    """Intelligent caching service for reconciliation data"""
+    """Reconciliation data cached through the shared two-tier cache, tagged per bank account"""
+    
+    TAG = 'reconciliation'
     
     def __init__(self):
-        self.redis_client = None
+        self.cache = cache_service
+        # Reconciliation caching stays opt-in (flag name kept for existing deployments)
         self.cache_enabled = os.getenv('REDIS_CACHE_ENABLED', 'false').lower() == 'true'
         self.default_ttl = int(os.getenv('CACHE_DEFAULT_TTL', '3600'))  # 1 hour
-        
-        if self.cache_enabled:
-            try:
-                self.redis_client = redis.Redis(
-                    host=os.getenv('REDIS_HOST', 'localhost'),
-                    port=int(os.getenv('REDIS_PORT', '6379')),
-                    db=int(os.getenv('REDIS_DB', '0')),
-                    decode_responses=True
-                )
-                # Test connection
-                self.redis_client.ping()
-                logger.info("Redis cache connection established")
-            except Exception as e:
-                logger.warning(f"Redis cache not available: {str(e)}")
-                self.cache_enabled = False
+    
+    @staticmethod
+    def _tenant_id() -> Optional[str]:
+        try:
+            return getattr(g, 'tenant_id', None)
+        except RuntimeError:
+            return None
     
     def get_cache_key(self, prefix: str, **kwargs) -> str:
         """Generate cache key from parameters"""
@@ -52,55 +46,32 @@ class ReconciliationCache:
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        if not self.cache_enabled or not self.redis_client:
-            return None
-        
-        try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-            return None
-        except Exception as e:
-            logger.error(f"Error getting cache value: {str(e)}")
+        if not self.cache_enabled:
             return None
+        return self.cache.get(key, tenant_id=self._tenant_id())
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    def set(self, key: str, value: Any, ttl: Optional[int] = None,
+            bank_account_id: Optional[int] = None) -> bool:
         """Set value in cache"""
-        if not self.cache_enabled or not self.redis_client:
+        if not self.cache_enabled:
             return False
         
-        try:
-            ttl = ttl or self.default_ttl
-            serialized_value = json.dumps(value, default=str)
-            return self.redis_client.setex(key, ttl, serialized_value)
-        except Exception as e:
-            logger.error(f"Error setting cache value: {str(e)}")
-            return False
+        tags = [self.TAG]
+        if bank_account_id:
+            tags.append(f"bank_account:{bank_account_id}")
+        return self.cache.set(key, value, ttl or self.default_ttl, tenant_id=self._tenant_id(), tags=tags)
     
     def delete(self, key: str) -> bool:
         """Delete value from cache"""
-        if not self.cache_enabled or not self.redis_client:
-            return False
-        
-        try:
-            return self.redis_client.delete(key) > 0
-        except Exception as e:
-            logger.error(f"Error deleting cache value: {str(e)}")
+        if not self.cache_enabled:
             return False
+        return self.cache.delete(key, tenant_id=self._tenant_id())
     
     def invalidate_pattern(self, pattern: str) -> int:
         """Invalidate cache keys matching pattern"""
-        if not self.cache_enabled or not self.redis_client:
-            return 0
-        
-        try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
-            return 0
-        except Exception as e:
-            logger.error(f"Error invalidating cache pattern: {str(e)}")
+        if not self.cache_enabled:
             return 0
+        return self.cache.delete_pattern(pattern)
     
     def get_reconciliation_sessions(self, bank_account_id: Optional[int] = None, 
                                   status: Optional[str] = None, 
@@ -125,7 +96,7 @@ class ReconciliationCache:
             status=status,
             limit=len(sessions)
         )
-        return self.set(cache_key, sessions, ttl)
+        return self.set(cache_key, sessions, ttl, bank_account_id=bank_account_id)
     
     def get_bank_transactions(self, bank_account_id: int, 
                             start_date: Optional[str] = None,
@@ -151,7 +122,7 @@ class ReconciliationCache:
             start_date=start_date,
             end_date=end_date
         )
-        return self.set(cache_key, transactions, ttl)
+        return self.set(cache_key, transactions, ttl, bank_account_id=bank_account_id)
     
     def get_gl_entries(self, bank_account_id: int, 
                       reconciled: Optional[bool] = None) -> Optional[List[Dict]]:
@@ -173,44 +144,20 @@ class ReconciliationCache:
             bank_account_id=bank_account_id,
             reconciled=reconciled
         )
-        return self.set(cache_key, entries, ttl)
+        return self.set(cache_key, entries, ttl, bank_account_id=bank_account_id)
     
     def invalidate_reconciliation_cache(self, bank_account_id: Optional[int] = None):
-        """Invalidate reconciliation-related cache"""
-        patterns = [
-            'reconciliation_sessions:*',
-            'bank_transactions:*',
-            'gl_entries:*'
-        ]
-        
-        if bank_account_id:
-            patterns = [f"*:bank_account_id={bank_account_id}*"]
-        
-        total_invalidated = 0
-        for pattern in patterns:
-            total_invalidated += self.invalidate_pattern(pattern)
-        
-        logger.info(f"Invalidated {total_invalidated} cache entries")
-        return total_invalidated
+        """Invalidate reconciliation-related cache (one bank account, or all of it)"""
+        tag = f"bank_account:{bank_account_id}" if bank_account_id else self.TAG
+        self.cache.invalidate_tags(tag, tenant_id=self._tenant_id())
+        logger.info(f"Invalidated reconciliation cache ({tag})")
+        return 1
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        if not self.cache_enabled or not self.redis_client:
+        if not self.cache_enabled:
             return {'enabled': False}
-        
-        try:
-            info = self.redis_client.info()
-            return {
-                'enabled': True,
-                'connected_clients': info.get('connected_clients', 0),
-                'used_memory': info.get('used_memory_human', '0B'),
-                'total_commands_processed': info.get('total_commands_processed', 0),
-                'keyspace_hits': info.get('keyspace_hits', 0),
-                'keyspace_misses': info.get('keyspace_misses', 0)
-            }
-        except Exception as e:
-            logger.error(f"Error getting cache stats: {str(e)}")
-            return {'enabled': True, 'error': str(e)}
+        return {'enabled': True, **self.cache.get_stats()}
 
 # Global cache instance
 reconciliation_cache = ReconciliationCache()
@@ -228,18 +175,15 @@ def cache_result(ttl: int = 3600, key_prefix: str = 'default'):
                 kwargs=kwargs
             )
             
-            # Try to get from cache
-            cached_result = reconciliation_cache.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"Cache hit for {func.__name__}")
-                return cached_result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            reconciliation_cache.set(cache_key, result, ttl)
-            logger.debug(f"Cached result for {func.__name__}")
+            if not reconciliation_cache.cache_enabled:
+                return func(*args, **kwargs)
             
-            return result
+            # Concurrent misses share one call
+            return reconciliation_cache.cache.get_or_set(
+                cache_key, lambda: func(*args, **kwargs), ttl,
+                tenant_id=reconciliation_cache._tenant_id(),
+                tags=[ReconciliationCache.TAG]
+            )
         return wrapper
     return decorator
 
@@ -254,15 +198,3 @@ def invalidate_cache_on_change(func):
         
         return result
     return wrapper
-
-
-
-
-
-
-
-
-
-
-
-
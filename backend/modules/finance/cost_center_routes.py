@@ -304,6 +304,37 @@ def get_cost_center_summary():
     else:
         return jsonify({"error": result['error']}), 500
 
+@cost_center_bp.route('/budget-variance', methods=['GET'])
+def get_budget_variance():
+    """Budget vs actual per account and cost center for a period window"""
+    from modules.core.tenant_helpers import get_current_user_tenant_id
+    from services.budget_service import BudgetService
+
+    tenant_id = get_current_user_tenant_id()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 403
+    
+    period = request.args.get('period') or datetime.utcnow().strftime('%Y-%m')
+    scenarios = [s for s in request.args.get('scenario', 'base').split(',') if s]
+    
+    try:
+        result = BudgetService.compare_to_budget(
+            period,
+            cost_center=request.args.get('cost_center'),
+            scenarios=scenarios,
+            window=request.args.get('window', 'period'),
+            months=request.args.get('months', 12, type=int),
+            by_period=request.args.get('by_period', 'false').lower() == 'true',
+            threshold_pct=request.args.get('threshold_pct', 10.0, type=float),
+            threshold_amount=request.args.get('threshold_amount', 0.0, type=float),
+            tenant_id=tenant_id,
+            flagged_only=request.args.get('flagged_only', 'false').lower() == 'true'
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(result), 200
+
 @cost_center_bp.route('/departments/summary', methods=['GET'])
 def get_department_summary():
     """Get department summary with expenses"""
@@ -0,0 +1,36 @@
+"""
+Finance Event Outbox Model
+==========================
+
+Finance events (journal posted, period closed, ...) are written to this table
+in the transaction that produces them and dispatched to their handlers by
+modules/finance/events/event_bus.py after commit.
+"""
+
+from datetime import datetime
+from app import db
+
+class FinanceEventOutbox(db.Model):
+    """
+    One published finance event and its dispatch state
+    """
+    __tablename__ = 'finance_event_outbox'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)  # Dispatch order
+    event_id = db.Column(db.String(36), unique=True, nullable=False)
+    tenant_id = db.Column(db.String(50))  # Events of one tenant are handled in id order
+    event_type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    handlers_done = db.Column(db.JSON)  # Handlers that already succeeded; only the others are retried
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)  # Lease of the worker processing the event
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_finance_event_outbox_open', 'status', 'id'),
+        db.Index('idx_finance_event_outbox_tenant', 'tenant_id', 'id'),
+    )
@@ -0,0 +1,394 @@
+"""
+Finance Event Bus
+Transactional outbox plus background dispatch for finance events.
+
+``publish`` adds one ``finance_event_outbox`` row to the caller's session, so
+an event exists exactly when the posting transaction commits, and publishing
+costs the same however many handlers are subscribed. After the commit a
+dispatcher thread is woken; it claims due events and hands them to a pool of
+``FINANCE_EVENT_WORKERS`` threads.
+
+Ordering: events of one tenant are handled one at a time, in publish order.
+A tenant's events are only claimed when every earlier event of that tenant is
+finished (``done`` or ``failed``), so an event waiting for a retry holds back
+the tenant's later events; other tenants are unaffected. Claiming runs under
+a single lock across processes (advisory lock on PostgreSQL, the write lock
+on SQLite) so this holds with several workers.
+
+Retries are per handler: a handler that succeeds is recorded in
+``handlers_done`` in the same commit as its own writes and is not run again.
+An event with failing handlers is retried with exponential backoff up to
+``FINANCE_EVENT_MAX_ATTEMPTS`` and then marked ``failed``. A crashed worker's
+leases expire and its events are picked up again (at-least-once).
+
+Synchronous mode (``FINANCE_EVENTS_SYNC``, on by default under TESTING) runs
+the handlers inline in ``publish`` instead, without an outbox row.
+"""
+
+import atexit
+import importlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session
+
+from modules.core.metrics import CounterMetric, HistogramMetric
+
+logger = logging.getLogger(__name__)
+
+# Modules whose import registers the handlers the workers must run
+HANDLER_MODULES = ('modules.finance.events.finance_events',)
+# Arbitrary key of the PostgreSQL advisory lock serializing claims
+CLAIM_LOCK_KEY = 7213409
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+def handler_name(handler: Callable) -> str:
+    return f"{handler.__module__}.{getattr(handler, '__qualname__', handler.__name__)}"
+
+class FinanceEventBus:
+    """Handler registry, outbox writer (``publish``) and the dispatch loop"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List] = {}
+        self._app = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._executor = None
+        self._busy_tenants = set()
+        self._busy_lock = threading.Lock()
+        self._last_error_log = 0.0
+        self._last_purge = 0.0
+        self.synchronous = False
+
+        # Tunables (overridden from config in init_app)
+        self.workers = 4
+        self.max_attempts = 5
+        self.poll_interval = 1.0
+        self.backoff_base = 5.0
+        self.backoff_max = 3600.0
+        self.lease_seconds = 300
+        self.batch_per_tenant = 50
+        self.retention_days = 7
+
+        self.events_total = CounterMetric('finance_events_total', 'Finance events by type and outcome',
+                                          ('event_type', 'result'))
+        self.handler_failures = CounterMetric('finance_event_handler_failures_total',
+                                              'Finance event handler failures', ('handler',))
+        self.handler_duration = HistogramMetric('finance_event_handler_seconds', 'Finance event handler run time',
+                                                ('handler',), buckets=HANDLER_BUCKETS)
+        self.dispatch_lag = HistogramMetric('finance_event_lag_seconds', 'Time from publish to handled',
+                                            ('event_type',), buckets=LAG_BUCKETS)
+
+    def init_app(self, app, start: bool = True):
+        config = app.config
+        self._app = app
+        self.synchronous = bool(config.get('FINANCE_EVENTS_SYNC') or config.get('TESTING'))
+        self.workers = int(config.get('FINANCE_EVENT_WORKERS', self.workers))
+        self.max_attempts = int(config.get('FINANCE_EVENT_MAX_ATTEMPTS', self.max_attempts))
+        self.poll_interval = float(config.get('FINANCE_EVENT_POLL_INTERVAL', self.poll_interval))
+        self.backoff_base = float(config.get('FINANCE_EVENT_BACKOFF_SECONDS', self.backoff_base))
+        self.retention_days = int(config.get('FINANCE_EVENT_RETENTION_DAYS', self.retention_days))
+        app.extensions['finance_event_bus'] = self
+        if start and not self.synchronous:
+            self.start()
+
+    # ------------------------------------------------------------------
+    # Handlers
+    # ------------------------------------------------------------------
+
+    def register(self, event_type: str, handler: Callable, name: str = None):
+        """Subscribe ``handler(data)`` to ``event_type``; ``name`` identifies it across retries"""
+        name = name or handler_name(handler)
+        handlers = self._handlers.setdefault(event_type, [])
+        if all(existing != name for existing, _ in handlers):
+            handlers.append((name, handler))
+
+    def handlers(self, event_type: str) -> List:
+        return list(self._handlers.get(event_type, ()))
+
+    def _run_handler(self, name: str, handler: Callable, data: Dict) -> Optional[str]:
+        """Run one handler; returns the error message if it failed"""
+        started = time.perf_counter()
+        try:
+            handler(dict(data))
+            return None
+        except Exception as e:
+            self.handler_failures.inc((name,))
+            logger.error(f"Finance event handler {name} failed for {data.get('event_type')}: {e}")
+            return f"{name}: {type(e).__name__}: {e}"
+        finally:
+            self.handler_duration.observe((name,), time.perf_counter() - started)
+
+    # ------------------------------------------------------------------
+    # Outbox
+    # ------------------------------------------------------------------
+
+    def publish(self, event_type: str, data: Dict, tenant_id: Optional[str] = None, session=None) -> str:
+        """
+        Record ``event_type`` in the caller's transaction (``db.session`` by
+        default); handlers run after it commits. Returns the event id.
+        """
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+
+        event_id = str(uuid.uuid4())
+        # Round-trip so dates/decimals become JSON and later mutation of data is not seen
+        payload = json.loads(json.dumps(data, default=str))
+        if self.synchronous:
+            payload.update(event_type=event_type, event_id=event_id, tenant_id=tenant_id)
+            failed = [self._run_handler(name, handler, payload) for name, handler in self.handlers(event_type)]
+            self.events_total.inc((event_type, 'failed' if any(failed) else 'done'))
+            return event_id
+
+        session = session or db.session
+        now = datetime.utcnow()
+        session.add(FinanceEventOutbox(
+            event_id=event_id, tenant_id=tenant_id, event_type=event_type, payload=payload,
+            status='pending', attempts=0, handlers_done=[], next_attempt_at=now, created_at=now
+        ))
+        session.info['finance_events_pending'] = True
+        self.events_total.inc((event_type, 'published'))
+        return event_id
+
+    def _after_commit(self, session):
+        if session.in_nested_transaction():
+            return  # a savepoint released; the events are not committed yet
+        if session.info.pop('finance_events_pending', False):
+            self._wakeup.set()
+
+    def _after_rollback(self, session):
+        if session.in_nested_transaction():
+            return
+        session.info.pop('finance_events_pending', None)
+
+    def status_counts(self) -> Dict[str, int]:
+        from app import db
+        from sqlalchemy import func
+        from modules.finance.event_models import FinanceEventOutbox
+        return dict(db.session.query(FinanceEventOutbox.status, func.count(FinanceEventOutbox.id))
+                    .group_by(FinanceEventOutbox.status).all())
+
+    def retry_failed(self, event_id: str) -> bool:
+        """Re-queue a failed event (its successful handlers are still skipped)"""
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+        updated = FinanceEventOutbox.query.filter_by(event_id=event_id, status='failed').update(
+            {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        self._wakeup.set()
+        return bool(updated)
+
+    def metric_lines(self) -> List[str]:
+        lines = []
+        for metric in (self.events_total, self.handler_failures, self.handler_duration, self.dispatch_lag):
+            lines += metric.render()
+        return lines
+
+    # ------------------------------------------------------------------
+    # Dispatch loop
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            for module in HANDLER_MODULES:
+                importlib.import_module(module)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='finance-event')
+            self._thread = threading.Thread(target=self._run, name='finance-event-dispatcher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    claimed = self._claim()
+                    if time.time() - self._last_purge > 3600:
+                        self._purge()
+                for tenant_id, event_ids in claimed.items():
+                    self._executor.submit(self._process_tenant, tenant_id, event_ids)
+            except Exception as e:
+                # e.g. the table does not exist yet; keep polling, log at most once a minute
+                if time.time() - self._last_error_log > 60:
+                    self._last_error_log = time.time()
+                    logger.error(f"Finance event dispatcher error: {e}")
+
+    def _claim(self) -> Dict[Optional[str], List[int]]:
+        """Lease the next due events of each tenant that has nothing in progress"""
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+
+        with self._busy_lock:
+            capacity = self.workers - len(self._busy_tenants)
+        if capacity <= 0:
+            return {}
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # Take the write lock first so two processes cannot claim at once
+            db.session.execute(text("UPDATE finance_event_outbox SET id = id WHERE 1 = 0"))
+        elif not db.session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY}).scalar():
+            db.session.rollback()
+            return {}
+
+        now = datetime.utcnow()
+        columns = (FinanceEventOutbox.id, FinanceEventOutbox.tenant_id, FinanceEventOutbox.status,
+                   FinanceEventOutbox.next_attempt_at, FinanceEventOutbox.locked_until)
+        is_open = FinanceEventOutbox.status.in_(('pending', 'processing'))
+
+        def claimable(status, next_attempt_at, locked_until):
+            in_progress = status == 'processing' and locked_until is not None and locked_until > now
+            waiting = status == 'pending' and next_attempt_at is not None and next_attempt_at > now
+            return not (in_progress or waiting)
+
+        # The oldest open event of every tenant, so one tenant's backlog cannot hide the others
+        heads = db.session.query(func.min(FinanceEventOutbox.id).label('id')).filter(is_open).group_by(
+            FinanceEventOutbox.tenant_id).subquery()
+        head_rows = db.session.query(*columns).join(heads, FinanceEventOutbox.id == heads.c.id).order_by(
+            FinanceEventOutbox.id).all()
+
+        claimed = OrderedDict()
+        with self._busy_lock:
+            for _, tenant_id, status, next_attempt_at, locked_until in head_rows:
+                if len(claimed) >= capacity:
+                    break
+                # A tenant whose head is in progress or waiting for a retry holds back its later events
+                if tenant_id not in self._busy_tenants and claimable(status, next_attempt_at, locked_until):
+                    claimed[tenant_id] = []
+            self._busy_tenants.update(claimed)
+
+        try:
+            for tenant_id, event_ids in claimed.items():
+                same_tenant = (FinanceEventOutbox.tenant_id == tenant_id if tenant_id is not None
+                               else FinanceEventOutbox.tenant_id.is_(None))
+                rows = db.session.query(*columns).filter(same_tenant, is_open).order_by(
+                    FinanceEventOutbox.id).limit(self.batch_per_tenant).all()
+                for event_id, _, status, next_attempt_at, locked_until in rows:
+                    if not claimable(status, next_attempt_at, locked_until):
+                        break
+                    event_ids.append(event_id)
+
+            ids = [event_id for event_ids in claimed.values() for event_id in event_ids]
+            if ids:
+                FinanceEventOutbox.query.filter(FinanceEventOutbox.id.in_(ids)).update(
+                    {'status': 'processing', 'locked_until': now + timedelta(seconds=self.lease_seconds)},
+                    synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._busy_lock:
+                self._busy_tenants.difference_update(claimed)
+            raise
+        return claimed
+
+    def _process_tenant(self, tenant_id: Optional[str], event_ids: List[int]):
+        """Handle one tenant's claimed events in order, stopping at the first that must be retried"""
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+        try:
+            with self._app.app_context():
+                for position, event_id in enumerate(event_ids):
+                    try:
+                        finished = self._process(event_id)
+                    except Exception as e:
+                        logger.error(f"Could not process finance event {event_id}: {e}")
+                        db.session.rollback()
+                        finished = False
+                    if not finished:
+                        # Hand the rest back so they are not handled ahead of the retry
+                        rest = event_ids[position + 1:]
+                        if rest:
+                            FinanceEventOutbox.query.filter(
+                                FinanceEventOutbox.id.in_(rest), FinanceEventOutbox.status == 'processing'
+                            ).update({'status': 'pending', 'locked_until': None}, synchronize_session=False)
+                            db.session.commit()
+                        break
+        except Exception as e:
+            # The leases expire and the events are picked up again
+            logger.error(f"Finance event worker error for tenant {tenant_id}: {e}")
+        finally:
+            with self._busy_lock:
+                self._busy_tenants.discard(tenant_id)
+            self._wakeup.set()
+
+    def _process(self, event_id: int) -> bool:
+        """Run the pending handlers of one event; False if it is to be retried"""
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+
+        row = db.session.get(FinanceEventOutbox, event_id)
+        if row is None or row.status != 'processing':
+            return True
+        event_type, attempts, created_at = row.event_type, row.attempts or 0, row.created_at
+        done = list(row.handlers_done or [])
+        data = dict(row.payload or {}, event_type=event_type, event_id=row.event_id, tenant_id=row.tenant_id)
+
+        errors = []
+        for name, handler in self.handlers(event_type):
+            if name in done:
+                continue
+            error = self._run_handler(name, handler, data)
+            if error is None:
+                done.append(name)
+                # The handler's own writes and its completion are committed together
+                FinanceEventOutbox.query.filter_by(id=event_id).update(
+                    {'handlers_done': list(done)}, synchronize_session=False)
+                db.session.commit()
+            else:
+                db.session.rollback()
+                errors.append(error)
+
+        now = datetime.utcnow()
+        values = {'locked_until': None, 'handlers_done': done}
+        if not errors:
+            values.update(status='done', processed_at=now, last_error=None)
+            self.events_total.inc((event_type, 'done'))
+            self.dispatch_lag.observe((event_type,), (now - created_at).total_seconds() if created_at else 0)
+        elif attempts + 1 >= self.max_attempts:
+            values.update(status='failed', attempts=attempts + 1, last_error='\n'.join(errors)[:4000], processed_at=now)
+            self.events_total.inc((event_type, 'failed'))
+            logger.warning(f"Finance event {event_id} ({event_type}) failed after {attempts + 1} attempt(s)")
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** attempts) * random.uniform(0.8, 1.2)
+            values.update(status='pending', attempts=attempts + 1, last_error='\n'.join(errors)[:4000],
+                          next_attempt_at=now + timedelta(seconds=delay))
+            self.events_total.inc((event_type, 'retried'))
+        FinanceEventOutbox.query.filter_by(id=event_id).update(values, synchronize_session=False)
+        db.session.commit()
+        return values['status'] != 'pending'
+
+    def _purge(self):
+        """Delete handled events older than the retention period"""
+        from app import db
+        from modules.finance.event_models import FinanceEventOutbox
+        self._last_purge = time.time()
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        FinanceEventOutbox.query.filter(
+            FinanceEventOutbox.status == 'done', FinanceEventOutbox.processed_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+finance_event_bus = FinanceEventBus()
@@ -5,6 +5,7 @@ from enum import Enum
 import logging
 from ..advanced_models import JournalHeader
 from app.audit_logger import AuditLogger
+from .event_bus import finance_event_bus, handler_name
 
 logger = logging.getLogger(__name__)
 
@@ -14,19 +15,19 @@ class FinanceEventType(Enum):
     PERIOD_CLOSED = "period_closed"
     BUDGET_ALERT = "budget_alert"
 
-_event_handlers = {}
-
 def register_handler(event_type: FinanceEventType, handler: Callable):
-    """Register callback for specific event type"""
-    _event_handlers.setdefault(event_type, []).append(handler)
+    """Register callback for specific event type (called with data["event_type"] as a FinanceEventType)"""
+    def call(data: Dict):
+        handler(dict(data, event_type=FinanceEventType(data["event_type"])))
+    finance_event_bus.register(event_type.value, call, name=handler_name(handler))
 
 def trigger_event(event_type: FinanceEventType, data: Dict):
-    """Notify all registered handlers of an event"""
-    for handler in _event_handlers.get(event_type, []):
-        try:
-            handler(data)
-        except Exception as e:
-            logger.error(f"EventHandler failed for {event_type}: {str(e)}")
+    """
+    Publish an event. It is recorded in the current transaction and handled
+    by background workers after commit (see events/event_bus.py), in order
+    per tenant; handlers do not run inside the posting request.
+    """
+    return finance_event_bus.publish(event_type.value, data, tenant_id=data.get("tenant_id"))
 
 # Built-in event handlers
 def _log_finance_event(data: Dict):
@@ -40,10 +41,14 @@ def _log_finance_event(data: Dict):
     )
 
 def _notify_webhooks(data: Dict):
-    """Send event data to registered webhooks"""
+    """
+    Queue the event for subscribed webhooks in the handler's transaction; the
+    webhook dispatcher sends it after commit (no network I/O here)
+    """
     if current_app.config.get("WEBHOOKS_ENABLED"):
-        # Implementation would use requests.post to external URLs
-        pass
+        from modules.api.webhook_dispatcher import webhook_dispatcher
+        payload = {k: v for k, v in data.items() if k not in ("event_type", "event_id")}
+        webhook_dispatcher.emit(f"finance.{data['event_type'].value}", payload, tenant_id=data.get("tenant_id"))
 
 def _update_dashboard_cache(data: Dict):
     """Refresh cached dashboard data"""
@@ -51,13 +56,17 @@ def _update_dashboard_cache(data: Dict):
         FinanceEventType.JOURNAL_POSTED,
         FinanceEventType.PERIOD_CLOSED
     ):
-        current_app.cache.delete("financial_dashboard")
+        from services.cache_service import cache_service
+        cache_service.delete("financial_dashboard", tenant_id=data.get("tenant_id"))
+        cache_service.invalidate_tags("financial_dashboard", "cashflow_forecast", tenant_id=data.get("tenant_id"))
 
 # Register core handlers
 register_handler(FinanceEventType.JOURNAL_POSTED, _log_finance_event)
 register_handler(FinanceEventType.ACCOUNT_RECONCILED, _log_finance_event)
 register_handler(FinanceEventType.PERIOD_CLOSED, _log_finance_event)
 register_handler(FinanceEventType.JOURNAL_POSTED, _update_dashboard_cache)
+for _event_type in FinanceEventType:
+    register_handler(_event_type, _notify_webhooks)
 
 # Model event hooks
 def on_journal_posted(journal_id: str, user_id: str):
@@ -66,6 +75,7 @@ def on_journal_posted(journal_id: str, user_id: str):
         "entity_type": "journal_entry",
         "entity_id": journal_id,
         "user_id": user_id,
+        "tenant_id": getattr(entry, "tenant_id", None),
         "metadata": {
             "period": entry.period,
             "amount": sum(l.debit_amount for l in entry.lines)
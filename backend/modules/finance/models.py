@@ -52,7 +52,11 @@ class JournalEntry(db.Model):
     is_backdated = db.Column(db.Boolean, default=False)
     period_locked = db.Column(db.Boolean, default=False)
     backdate_reason = db.Column(db.String(200))
-    
+
+    # Corrections: a reversing entry points at the entry it reverses, which points at its replacement
+    reversal_of_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=True)
+    replaced_by_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=True)
+
     tenant_id = db.Column(db.String(50), nullable=False, index=True)  # Company/tenant identifier - company-wide transactions
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # User who created (audit trail)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -135,7 +139,9 @@ class Budget(db.Model):
     actual_amount = db.Column(db.Float, default=0.0)
     forecast_amount = db.Column(db.Float, default=0.0)
     scenario = db.Column(db.String(20), default='base')  # base, optimistic, pessimistic, custom
+    cost_center_id = db.Column(db.Integer, db.ForeignKey('cost_centers.id'), nullable=True)  # NULL = whole account
     notes = db.Column(db.Text)
+    tenant_id = db.Column(db.String(50), nullable=True, index=True)  # Company/tenant identifier
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # User isolation
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -160,6 +166,8 @@ class BudgetScenario(db.Model):
 # Indexes
 db.Index('ix_journal_lines_account_id', JournalLine.account_id)
 db.Index('ix_journal_lines_journal_entry_id', JournalLine.journal_entry_id)
+db.Index('ix_journal_entries_tenant_status_period', JournalEntry.tenant_id, JournalEntry.status, JournalEntry.period)  # Budget-vs-actual windows
+db.Index('ix_budgets_tenant_scenario_period', Budget.tenant_id, Budget.scenario, Budget.period)
 db.Index('ix_accounts_tenant_code', Account.tenant_id, Account.code)  # Composite index for tenant_id + code lookups
 db.Index('ix_accounts_tenant_id', Account.tenant_id)  # Index for tenant isolation queries
 db.Index('ix_invoices_invoice_number', Invoice.invoice_number)
\ No newline at end of file
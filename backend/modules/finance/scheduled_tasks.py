@@ -172,8 +172,26 @@ def generate_reconciliation_reports():
         logger.error(f"Error generating reconciliation reports: {str(e)}")
         return {}
 
+def run_aging_snapshot():
+    """Record the nightly AR/AP aging snapshot of every tenant"""
+    try:
+        logger.info("Taking AR/AP aging snapshots")
+        
+        with current_app.app_context():
+            from .aging_reports import aging_reports
+            
+            result = aging_reports.take_snapshots()
+            
+            logger.info(f"Aging snapshots taken: {result}")
+            return result
+            
+    except Exception as e:
+        logger.error(f"Error taking aging snapshots: {str(e)}")
+        return {}
+
 # Task registry for external schedulers
 TASKS = {
+    'aging_snapshot': run_aging_snapshot,
     'daily_reconciliation': run_daily_reconciliation,
     'weekly_reconciliation': run_weekly_reconciliation,
     'monthly_reconciliation': run_monthly_reconciliation,
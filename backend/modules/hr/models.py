@@ -0,0 +1,196 @@
+# backend/modules/hr/models.py
+
+from app import db
+from datetime import datetime
+
+class Employee(db.Model):
+    """
+    Employee master data used by the payroll run (modules/hr/payroll_engine.py)
+    """
+    __tablename__ = 'hr_employees'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=False)  # Company/tenant identifier
+    employee_number = db.Column(db.String(50), nullable=False)
+    first_name = db.Column(db.String(100), nullable=False)
+    last_name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(255), nullable=True)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
+    cost_center_id = db.Column(db.Integer, db.ForeignKey('cost_centers.id'), nullable=True)  # Salary expense is posted here
+    base_salary = db.Column(db.Float, nullable=False, default=0.0)  # Gross base pay per monthly period
+    tax_code = db.Column(db.String(20), default='standard')  # Selects the PayrollTaxBracket table
+    status = db.Column(db.String(20), default='active')  # active, on_leave, terminated
+    hire_date = db.Column(db.Date, nullable=True)
+    termination_date = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'employee_number', name='uq_hr_employee_tenant_number'),
+        db.Index('idx_hr_employees_payroll', 'tenant_id', 'status', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'employee_number': self.employee_number,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'email': self.email,
+            'department_id': self.department_id,
+            'cost_center_id': self.cost_center_id,
+            'base_salary': self.base_salary,
+            'tax_code': self.tax_code,
+            'status': self.status,
+            'hire_date': self.hire_date.isoformat() if self.hire_date else None,
+            'termination_date': self.termination_date.isoformat() if self.termination_date else None
+        }
+
+class PayComponent(db.Model):
+    """
+    An earning or deduction type (bonus, allowance, pension, union dues, ...)
+    """
+    __tablename__ = 'hr_pay_components'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=False)
+    code = db.Column(db.String(30), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # earning, deduction
+    calculation = db.Column(db.String(20), default='fixed')  # fixed, percent_of_base, percent_of_gross
+    pre_tax = db.Column(db.Boolean, default=False)  # Deductions only: taken before income tax
+    default_amount = db.Column(db.Float, default=0.0)  # Amount, or percentage for percent_* calculations
+    cap = db.Column(db.Float, nullable=True)  # Maximum per employee per period
+    account_code = db.Column(db.String(20), nullable=True)  # GL account; defaults to the payroll expense/liability account
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'code', name='uq_hr_pay_component_tenant_code'),
+    )
+
+class EmployeePayComponent(db.Model):
+    """
+    A pay component assigned to an employee for a range of periods
+    """
+    __tablename__ = 'hr_employee_pay_components'
+
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('hr_employees.id'), nullable=False)
+    component_id = db.Column(db.Integer, db.ForeignKey('hr_pay_components.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=True)  # Overrides PayComponent.default_amount
+    start_period = db.Column(db.String(7), nullable=True)  # YYYY-MM; NULL = no start
+    end_period = db.Column(db.String(7), nullable=True)  # YYYY-MM; NULL = open-ended
+
+    __table_args__ = (
+        db.Index('idx_hr_employee_pay_components_employee', 'employee_id', 'component_id'),
+    )
+
+class PayrollTaxBracket(db.Model):
+    """
+    One band of a progressive income tax table, in monthly amounts. The table in
+    force for a period is the one with the latest effective_from on or before it.
+    """
+    __tablename__ = 'hr_payroll_tax_brackets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=False)
+    tax_code = db.Column(db.String(20), default='standard')
+    effective_from = db.Column(db.Date, nullable=False)
+    lower_bound = db.Column(db.Float, nullable=False, default=0.0)  # Taxable pay above this is taxed at rate
+    rate = db.Column(db.Float, nullable=False)  # Percentage
+
+    __table_args__ = (
+        db.Index('idx_hr_payroll_tax_brackets_lookup', 'tenant_id', 'tax_code', 'effective_from'),
+    )
+
+class PayrollRun(db.Model):
+    """
+    The payroll of one tenant for one period; re-running the period replaces
+    its payslips and reverses its journal entry in favour of a new one
+    """
+    __tablename__ = 'hr_payroll_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(50), nullable=False)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    status = db.Column(db.String(20), default='calculated')  # calculated, posted
+    input_hash = db.Column(db.String(64), nullable=True)  # Fingerprint of the inputs the run was computed from
+    employee_count = db.Column(db.Integer, default=0)
+    gross_pay = db.Column(db.Float, default=0.0)
+    pre_tax_deductions = db.Column(db.Float, default=0.0)
+    income_tax = db.Column(db.Float, default=0.0)
+    post_tax_deductions = db.Column(db.Float, default=0.0)
+    net_pay = db.Column(db.Float, default=0.0)
+    journal_entry_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=True)
+    run_count = db.Column(db.Integer, default=1)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    calculated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'period', name='uq_hr_payroll_run_tenant_period'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'period': self.period,
+            'status': self.status,
+            'employee_count': self.employee_count,
+            'gross_pay': self.gross_pay,
+            'pre_tax_deductions': self.pre_tax_deductions,
+            'income_tax': self.income_tax,
+            'post_tax_deductions': self.post_tax_deductions,
+            'net_pay': self.net_pay,
+            'journal_entry_id': self.journal_entry_id,
+            'run_count': self.run_count,
+            'calculated_at': self.calculated_at.isoformat() if self.calculated_at else None
+        }
+
+class Payslip(db.Model):
+    """
+    One employee's pay for a payroll run; written in bulk by the payroll engine
+    """
+    __tablename__ = 'hr_payslips'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    payroll_run_id = db.Column(db.Integer, db.ForeignKey('hr_payroll_runs.id'), nullable=False)
+    tenant_id = db.Column(db.String(50), nullable=False)
+    period = db.Column(db.String(7), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('hr_employees.id'), nullable=False)
+    cost_center_id = db.Column(db.Integer, nullable=True)
+    worked_days = db.Column(db.Integer, default=0)
+    base_pay = db.Column(db.Float, default=0.0)  # base_salary prorated to worked_days
+    earnings = db.Column(db.Float, default=0.0)
+    gross_pay = db.Column(db.Float, default=0.0)
+    pre_tax_deductions = db.Column(db.Float, default=0.0)
+    taxable_pay = db.Column(db.Float, default=0.0)
+    income_tax = db.Column(db.Float, default=0.0)
+    post_tax_deductions = db.Column(db.Float, default=0.0)
+    net_pay = db.Column(db.Float, default=0.0)
+    components = db.Column(db.JSON, nullable=True)  # {component code: amount}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('payroll_run_id', 'employee_id', name='uq_hr_payslip_run_employee'),
+        db.Index('idx_hr_payslips_employee', 'tenant_id', 'employee_id', 'period'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'payroll_run_id': self.payroll_run_id,
+            'period': self.period,
+            'employee_id': self.employee_id,
+            'worked_days': self.worked_days,
+            'base_pay': self.base_pay,
+            'earnings': self.earnings,
+            'gross_pay': self.gross_pay,
+            'pre_tax_deductions': self.pre_tax_deductions,
+            'taxable_pay': self.taxable_pay,
+            'income_tax': self.income_tax,
+            'post_tax_deductions': self.post_tax_deductions,
+            'net_pay': self.net_pay,
+            'components': self.components or {}
+        }
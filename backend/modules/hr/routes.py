@@ -0,0 +1,71 @@
+from flask import Blueprint, request, jsonify
+import logging
+from app import db
+from modules.core.permissions import require_permission
+from modules.core.tenant_helpers import get_current_user_id, get_current_user_tenant_id
+from modules.hr.models import PayrollRun, Payslip
+from modules.hr.payroll_engine import payroll_engine
+
+bp = Blueprint('hr', __name__, url_prefix='/api/hr')
+logger = logging.getLogger(__name__)
+
+# Payroll endpoints
+@bp.route('/payroll/runs', methods=['POST'])
+@require_permission('hr.payroll.create')
+def run_payroll():
+    """Run (or re-run) the payroll of a period and post its journal entry"""
+    tenant_id = get_current_user_tenant_id()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 403
+
+    data = request.get_json() or {}
+    period = data.get('period')
+    if not period:
+        return jsonify({"error": "period (YYYY-MM) is required"}), 400
+
+    try:
+        result = payroll_engine.run_payroll(tenant_id, period, user_id=get_current_user_id(),
+                                            post=data.get('post', True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Payroll run {period} failed: {e}")
+        return jsonify({"error": "Payroll run failed"}), 500
+
+    return jsonify(result), 200 if result.get('unchanged') else 201
+
+@bp.route('/payroll/runs', methods=['GET'])
+@require_permission('hr.payroll.read')
+def get_payroll_runs():
+    """List the payroll runs of the tenant, latest period first"""
+    tenant_id = get_current_user_tenant_id()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 403
+
+    runs = PayrollRun.query.filter_by(tenant_id=tenant_id).order_by(PayrollRun.period.desc()).all()
+    return jsonify([run.to_dict() for run in runs]), 200
+
+@bp.route('/payroll/runs/<period>', methods=['GET'])
+@require_permission('hr.payroll.read')
+def get_payroll_run(period):
+    """A payroll run with a page of its payslips"""
+    tenant_id = get_current_user_tenant_id()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 403
+
+    run = PayrollRun.query.filter_by(tenant_id=tenant_id, period=period).first()
+    if run is None:
+        return jsonify({"error": f"No payroll run for {period}"}), 404
+
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 100, type=int), 1000)
+    payslips = Payslip.query.filter_by(payroll_run_id=run.id).order_by(Payslip.employee_id).paginate(
+        page=page, per_page=per_page, error_out=False)
+
+    return jsonify({
+        "run": run.to_dict(),
+        "payslips": [payslip.to_dict() for payslip in payslips.items],
+        "page": page,
+        "per_page": per_page,
+        "total": payslips.total
+    }), 200
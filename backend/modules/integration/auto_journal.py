@@ -3,6 +3,7 @@ from typing import Dict, List, Optional
 from decimal import Decimal
 import json
 import logging
+import uuid
 
 # Import database models
 try:
@@ -28,15 +29,21 @@ class AutoJournalEngine:
         self.transaction_counter = 0
         self.cost_method_cache = {}  # Cache for product cost methods
     
-    def _persist_to_database(self, journal_entry: Dict, event_type: str = None) -> bool:
+    def _persist_to_database(self, journal_entry: Dict, event_type: str = None, commit: bool = True) -> bool:
         """
         Persist journal entry to the actual GeneralLedgerEntry database table
         Includes validation using the enhanced validation engine
+        
+        With ``commit=False`` the entry is written in a savepoint of the caller's
+        transaction and commits (or not) with it; a failure only rolls back the
+        savepoint.
         """
         if not DB_AVAILABLE:
             logger.warning("Database models not available, journal entry stored in memory only")
             return False
         
+        savepoint = None if commit else db.session.begin_nested()
+        tenant_id = journal_entry.get('tenant_id')
         try:
             # Enhanced validation
             if VALIDATION_AVAILABLE:
@@ -60,7 +67,8 @@ class AutoJournalEngine:
                 total_credit=sum(line.get('credit', 0) for line in journal_entry.get('lines', [])),
                 status='posted',
                 posting_status='posted',
-                created_by='AUTO-JOURNAL-ENGINE'
+                posted_by='AUTO-JOURNAL-ENGINE',
+                tenant_id=tenant_id
             )
             
             db.session.add(journal_header)
@@ -73,7 +81,10 @@ class AutoJournalEngine:
                 
                 # Check if account exists in cache
                 if account_name not in account_cache:
-                    account = ChartOfAccounts.query.filter_by(account_name=account_name).first()
+                    accounts = ChartOfAccounts.query.filter_by(account_name=account_name)
+                    if tenant_id:
+                        accounts = accounts.filter_by(tenant_id=tenant_id)
+                    account = accounts.first()
                     if not account:
                         # Create account if it doesn't exist
                         account_type = self._determine_account_type(account_name)
@@ -82,7 +93,8 @@ class AutoJournalEngine:
                             account_code=self._generate_account_code(account_name),
                             account_type=account_type,
                             is_active=True,
-                            description=f"Auto-created for {account_name}"
+                            description=f"Auto-created for {account_name}",
+                            tenant_id=tenant_id
                         )
                         db.session.add(account)
                         db.session.flush()  # Get the ID
@@ -90,24 +102,33 @@ class AutoJournalEngine:
                 
                 # Create GL entry
                 gl_entry = GeneralLedgerEntry(
+                    journal_header_id=journal_header.id,
                     account_id=account_cache[account_name].id,
                     entry_date=journal_entry['date'] if isinstance(journal_entry['date'], datetime) else datetime.now(),
                     description=line['description'],
                     debit_amount=float(line['debit']),
                     credit_amount=float(line['credit']),
                     reference=journal_entry['reference'],
-                    transaction_type=journal_entry.get('metadata', {}).get('transaction_type', 'auto_journal'),
+                    journal_type=journal_entry.get('metadata', {}).get('transaction_type', 'auto_journal'),
+                    fiscal_period=journal_header.fiscal_period,
+                    source_module=journal_header.source_module,
                     status='posted',
-                    created_by='auto_journal_engine'
+                    tenant_id=tenant_id
                 )
                 db.session.add(gl_entry)
             
-            db.session.commit()
+            if savepoint is None:
+                db.session.commit()
+            else:
+                savepoint.commit()
             logger.info(f"Journal entry {journal_entry['id']} persisted to database successfully")
             return True
             
         except Exception as e:
-            db.session.rollback()
+            if savepoint is None:
+                db.session.rollback()
+            else:
+                savepoint.rollback()
             logger.error(f"Failed to persist journal entry {journal_entry['id']} to database: {str(e)}")
             return False
     
@@ -194,21 +215,28 @@ class AutoJournalEngine:
             'valuation_date': datetime.now()
         }
     
-    def on_inventory_receipt(self, receipt_data: Dict) -> Dict:
+    def on_inventory_receipt(self, receipt_data: Dict, commit: bool = True) -> Dict:
         """
         Automatically post journal entry when inventory is received (GR/IR Logic)
         Step 1: Goods Receipt
         Debit: Inventory Asset
         Credit: GR/IR Clearing Account
         
-        Note: This creates a temporary liability until the vendor invoice is received
+        Note: This creates a temporary liability until the vendor invoice is received.
+        With ``commit=False`` the entry joins the caller's transaction.
         """
         try:
-            self.transaction_counter += 1
-            je_id = f"GR-{datetime.now().strftime('%Y%m%d')}-{self.transaction_counter:03d}"
+            # The journal number is unique in the GL: derive it from the receipt
+            # row, never from this process's counter (restarts, other workers)
+            if receipt_data.get('receipt_id'):
+                je_id = f"GR-{receipt_data['receipt_id']}"
+            else:
+                je_id = f"GR-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:12].upper()}"
             
-            # Calculate total value
-            total_value = receipt_data.get('quantity', 0) * receipt_data.get('unit_cost', 0)
+            # Calculate total value (multi-line receipts pass their landed total)
+            total_value = receipt_data.get('total_value')
+            if total_value is None:
+                total_value = receipt_data.get('quantity', 0) * receipt_data.get('unit_cost', 0)
             
             # Create journal entry using GR/IR clearing account
             journal_entry = {
@@ -218,6 +246,7 @@ class AutoJournalEngine:
                 'description': f"Goods Receipt - {receipt_data.get('item_name', '')} (PO: {receipt_data.get('po_reference', '')})",
                 'status': 'posted',
                 'source_module': 'Inventory',
+                'tenant_id': receipt_data.get('tenant_id'),
                 'lines': [
                     {
                         'account': 'Inventory',
@@ -245,7 +274,7 @@ class AutoJournalEngine:
             self.journal_entries.append(journal_entry)
             
             # Persist to database
-            db_success = self._persist_to_database(journal_entry)
+            db_success = self._persist_to_database(journal_entry, commit=commit)
             
             return {
                 'success': True,
@@ -7,16 +7,19 @@ API endpoints for cross-module integration
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 import json
+import logging
 
 # Import all the new modules
 from modules.integration.auto_journal import auto_journal_engine
 from modules.integration.cogs_reconciliation import cogs_reconciliation
 from modules.inventory.adjustments import stock_adjustment
 from modules.finance.aging_reports import aging_reports
+from modules.core.tenant_helpers import get_current_user_tenant_id
 from modules.finance.multi_currency import multi_currency
 from modules.workflows.approval_engine import approval_workflow
 
 cross_module_bp = Blueprint('cross_module', __name__)
+logger = logging.getLogger(__name__)
 
 # ============================================================================
 # INVENTORY VALUATION ENDPOINTS (DISABLED - MODULE NOT AVAILABLE)
@@ -341,7 +344,8 @@ def generate_ar_aging_report():
         if as_of_date:
             as_of_date = datetime.fromisoformat(as_of_date.replace('Z', '+00:00'))
         
-        result = aging_reports.generate_ar_aging_report(as_of_date, customer_id)
+        result = aging_reports.generate_ar_aging_report(as_of_date, customer_id,
+                                                        tenant_id=get_current_user_tenant_id())
         
         return jsonify(result)
     except Exception as e:
@@ -361,7 +365,8 @@ def generate_ap_aging_report():
         if as_of_date:
             as_of_date = datetime.fromisoformat(as_of_date.replace('Z', '+00:00'))
         
-        result = aging_reports.generate_ap_aging_report(as_of_date, supplier_id)
+        result = aging_reports.generate_ap_aging_report(as_of_date, supplier_id,
+                                                        tenant_id=get_current_user_tenant_id())
         
         return jsonify(result)
     except Exception as e:
@@ -370,6 +375,56 @@ def generate_ap_aging_report():
             'error': str(e)
         }), 400
 
+@cross_module_bp.route('/finance/aging/trend', methods=['GET'])
+def get_aging_trend():
+    """Daily AR (DSO) or AP (DPO) aging history from the nightly snapshots"""
+    try:
+        ledger = request.args.get('ledger', 'ar')
+        if ledger not in ('ar', 'ap'):
+            return jsonify({'success': False, 'error': 'ledger must be ar or ap'}), 400
+        days = request.args.get('days', 90, type=int)
+        
+        result = aging_reports.get_aging_trend(get_current_user_tenant_id(), ledger, days)
+        
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@cross_module_bp.route('/finance/cashflow/forecast', methods=['GET'])
+def get_cashflow_forecast():
+    """13-week and 12-month cash forecast for each scenario (cached until the next posting)"""
+    try:
+        from services.cashflow_forecast import SCENARIOS, cashflow_forecaster
+        
+        names = [s for s in request.args.get('scenarios', ','.join(SCENARIOS)).split(',') if s]
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown scenario: {', '.join(unknown)}"}), 400
+        as_of = request.args.get('as_of')
+        
+        result = cashflow_forecaster.forecast(
+            get_current_user_tenant_id(),
+            as_of=datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else None,
+            scenarios={name: SCENARIOS[name] for name in names},
+            use_cache=request.args.get('refresh', 'false').lower() != 'true'
+        )
+        
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid as_of date. Use YYYY-MM-DD: {str(e)}'
+        }), 400
+    except Exception as e:
+        logger.error(f"Error forecasting cash flow: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ============================================================================
 # MULTI-CURRENCY ENDPOINTS
 # ============================================================================
@@ -527,6 +582,33 @@ def escalate_workflow(workflow_id):
             'error': str(e)
         }), 400
 
+@cross_module_bp.route('/workflows/bulk-action', methods=['POST'])
+def bulk_workflow_action():
+    """Approve or reject many workflows in one transaction"""
+    try:
+        data = request.get_json() or {}
+        action = data.get('action', 'approve')
+        user = data.get('user') or data.get('approver') or data.get('rejector')
+        notes = data.get('notes') or data.get('reason', '')
+        
+        if not user:
+            return jsonify({
+                'success': False,
+                'error': 'user is required'
+            }), 400
+        
+        result = approval_workflow.bulk_action(
+            data.get('workflow_ids', []), user, action, notes,
+            all_or_nothing=bool(data.get('all_or_nothing', False))
+        )
+        
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 @cross_module_bp.route('/workflows', methods=['GET'])
 def get_workflows():
     """Get workflows with optional filtering"""
@@ -2,12 +2,13 @@ import requests
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, Tuple
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from flask import current_app
 import hashlib
 import hmac
+import threading
 import time
 import base64
 
@@ -28,6 +29,26 @@ class IntegrationConfig:
     webhook_url: str = ""
     webhook_secret: str = ""
 
+@dataclass
+class SyncPage:
+    """One page of changed records from ``IntegrationProvider.list_changes``"""
+    records: List[Dict]
+    cursor: Optional[str]  # Position after this page, stored as the sync's high-water mark
+    has_more: bool = False
+
+@dataclass
+class SyncItem:
+    """A record to write to the target; ``target_id`` is set when it was synced before"""
+    source_id: str
+    record: Dict
+    target_id: Optional[str] = None
+
+@dataclass
+class BatchResult:
+    """Outcome of ``IntegrationProvider.upsert_batch``"""
+    target_ids: Dict[str, str] = field(default_factory=dict)  # source id -> target id
+    errors: Dict[str, str] = field(default_factory=dict)  # source id -> error
+
 class IntegrationProvider(ABC):
     """Abstract base class for integration providers"""
     
@@ -83,6 +104,35 @@ class IntegrationProvider(ABC):
         except requests.exceptions.RequestException as e:
             logger.error(f"Integration request failed: {e}")
             return None
+    
+    def list_changes(self, entity: str, cursor: Optional[str], limit: int) -> SyncPage:
+        """
+        Records of ``entity`` changed after ``cursor`` (None = from the start),
+        oldest first, at most ``limit`` of them. Providers that can act as a
+        sync source implement this.
+        """
+        raise NotImplementedError(f"{self.config.name} cannot be used as a sync source for {entity}")
+    
+    def upsert_batch(self, entity: str, items: List[SyncItem]) -> BatchResult:
+        """
+        Create or update ``items`` in this system. The default calls
+        ``create_<singular entity>`` per new record and skips records that
+        already have a target id; providers with a bulk API override this.
+        """
+        create = getattr(self, f"create_{entity.rstrip('s')}", None)
+        if create is None:
+            raise NotImplementedError(f"{self.config.name} cannot be used as a sync target for {entity}")
+        result = BatchResult()
+        for item in items:
+            if item.target_id:
+                result.target_ids[item.source_id] = item.target_id
+                continue
+            response = create(item.record)
+            if response is None:
+                result.errors[item.source_id] = 'create failed'
+            else:
+                result.target_ids[item.source_id] = str(response.get('id') or response.get('Id') or item.source_id)
+        return result
 
 class StripeIntegration(IntegrationProvider):
     """Stripe payment integration"""
@@ -212,6 +262,65 @@ class QuickBooksIntegration(IntegrationProvider):
         """Create customer in QuickBooks"""
         return self.make_request("POST", "/v3/company/me/customer", customer_data)
     
+    ENTITY_NAMES = {'customers': 'Customer', 'invoices': 'Invoice'}
+    BATCH_LIMIT = 30  # Operations per QuickBooks batch request
+    
+    def list_changes(self, entity: str, cursor: Optional[str], limit: int) -> SyncPage:
+        """
+        Changed records via the Change Data Capture API. The cursor is
+        "<LastUpdatedTime>|<Id>" of the last record synced: changedSince is
+        inclusive and many records can share one timestamp, so the records up
+        to and including that one are skipped (a bare timestamp, as stored by
+        older runs, skips nothing).
+        """
+        name = self.ENTITY_NAMES[entity]
+        since, _, last_id = (cursor or '').partition('|')
+        since = since or (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        response = self.make_request("GET", "/v3/company/me/cdc", params={"entities": name, "changedSince": since})
+        if response is None:
+            raise RuntimeError(f"QuickBooks change query for {name} failed")
+        records = []
+        for query_response in response.get('CDCResponse', [{}])[0].get('QueryResponse', []):
+            records.extend(query_response.get(name, []))
+        
+        def position(record):
+            return (record.get('MetaData', {}).get('LastUpdatedTime') or since, str(record.get('Id')))
+        
+        records.sort(key=position)
+        if cursor:
+            records = [r for r in records if position(r) > (since, last_id)]
+        page = records[:limit]
+        if not page:
+            return SyncPage([], cursor, False)
+        for record in page:
+            record.setdefault('id', record.get('Id'))
+        return SyncPage(page, '|'.join(position(page[-1])), len(records) > limit)
+    
+    def upsert_batch(self, entity: str, items: List[SyncItem]) -> BatchResult:
+        """Create/update through the batch endpoint, 30 operations per request"""
+        name = self.ENTITY_NAMES[entity]
+        result = BatchResult()
+        for start in range(0, len(items), self.BATCH_LIMIT):
+            chunk = items[start:start + self.BATCH_LIMIT]
+            operations = []
+            for item in chunk:
+                body = dict(item.record)
+                if item.target_id:
+                    body.update({"Id": item.target_id, "sparse": True})
+                operations.append({"bId": item.source_id, "operation": "update" if item.target_id else "create",
+                                   name: body})
+            response = self.make_request("POST", "/v3/company/me/batch", {"BatchItemRequest": operations})
+            if response is None:
+                for item in chunk:
+                    result.errors[item.source_id] = 'batch request failed'
+                continue
+            for entry in response.get('BatchItemResponse', []):
+                if entry.get('Fault'):
+                    result.errors[entry['bId']] = json.dumps(entry['Fault'])[:500]
+                else:
+                    result.target_ids[entry['bId']] = str(entry.get(name, {}).get('Id'))
+        return result
+    
     def sync_transactions(self, start_date: str, end_date: str) -> Optional[List[Dict]]:
         """Sync transactions from QuickBooks"""
         params = {
@@ -352,74 +461,249 @@ class IntegrationManager:
 
 # Data synchronization
 class DataSyncManager:
-    """Manager for data synchronization between systems"""
+    """
+    Incremental, resumable sync of one entity from a source to a target system.
+    
+    Each (source, target, entity, tenant) pair has a row in ``sync_cursors``
+    holding the source's high-water mark. A run reads the source page by page
+    from that cursor, skips records whose content is unchanged since they were
+    last sent (``external_id_mappings.content_hash``), writes the rest to the
+    target in one batch, records the source id -> target id mapping (so a
+    record is updated rather than created again) and commits the new cursor.
+    A run that stops part-way resumes from the last committed page. A page
+    with failed records is not committed past: the run stops there and the
+    next one retries the page (records that did succeed are skipped by hash).
+    """
     
     def __init__(self, integration_manager: IntegrationManager):
         self.integration_manager = integration_manager
         self.sync_jobs: Dict[str, Dict] = {}
+        self._jobs_lock = threading.Lock()
+        self._scheduler = None
     
-    def sync_customers(self, source_system: str, target_system: str) -> bool:
+    def sync_customers(self, source_system: str, target_system: str, tenant_id: str = 'default') -> bool:
         """Sync customers between systems"""
-        try:
-            source = self.integration_manager.get_integration(source_system)
-            target = self.integration_manager.get_integration(target_system)
-            
-            if not source or not target:
-                return False
-            
-            # Get customers from source
-            customers = source.get_customers()
-            if not customers:
-                return False
-            
-            # Sync to target
-            for customer in customers:
-                target.create_customer(customer)
-            
-            return True
-        except Exception as e:
-            logger.error(f"Customer sync failed: {e}")
-            return False
+        return self.sync(source_system, target_system, 'customers', tenant_id)['success']
     
-    def sync_invoices(self, source_system: str, target_system: str) -> bool:
+    def sync_invoices(self, source_system: str, target_system: str, tenant_id: str = 'default') -> bool:
         """Sync invoices between systems"""
+        return self.sync(source_system, target_system, 'invoices', tenant_id)['success']
+    
+    def sync(self, source_system: str, target_system: str, entity: str, tenant_id: str = 'default',
+             batch_size: int = None, max_batches: int = None) -> Dict:
+        """Sync the records changed since the last run; returns run statistics"""
+        stats = {'success': False, 'entity': entity, 'read': 0, 'written': 0, 'unchanged': 0,
+                 'failed': 0, 'batches': 0, 'cursor': None}
+        source = self.integration_manager.get_integration(source_system)
+        target = self.integration_manager.get_integration(target_system)
+        if not source or not target:
+            stats['error'] = 'Unknown source or target system'
+            return stats
+        
+        from app import db
+        batch_size = batch_size or self._config('SYNC_BATCH_SIZE', 200)
+        cursor_row = self._acquire(source_system, target_system, entity, tenant_id)
+        if cursor_row is None:
+            stats['error'] = 'Sync already running'
+            return stats
+        stats['cursor'] = cursor_row.cursor
+        
         try:
-            source = self.integration_manager.get_integration(source_system)
-            target = self.integration_manager.get_integration(target_system)
+            while max_batches is None or stats['batches'] < max_batches:
+                page = source.list_changes(entity, cursor_row.cursor, batch_size)
+                stats['read'] += len(page.records)
+                failed = self._write_batch(source_system, target_system, entity, tenant_id,
+                                           target, page.records, stats)
+                stats['batches'] += 1
+                if failed:
+                    # Keep the cursor before this page so the failures are retried
+                    cursor_row.last_error = '; '.join(f"{k}: {v}" for k, v in list(failed.items())[:5])
+                    cursor_row.status = 'failed'
+                    break
+                # Checkpoint: mappings and cursor are committed together
+                cursor_row.cursor = page.cursor
+                cursor_row.records_synced = (cursor_row.records_synced or 0) + len(page.records)
+                cursor_row.locked_until = datetime.utcnow() + timedelta(seconds=self._config('SYNC_LEASE_SECONDS', 900))
+                db.session.commit()
+                stats['cursor'] = page.cursor
+                if not page.has_more or not page.records:
+                    break
             
-            if not source or not target:
-                return False
-            
-            # Get invoices from source
-            invoices = source.get_invoices()
-            if not invoices:
-                return False
-            
-            # Sync to target
-            for invoice in invoices:
-                target.create_invoice(invoice)
-            
-            return True
+            if cursor_row.status != 'failed':
+                cursor_row.status = 'idle'
+                cursor_row.last_error = None
+                cursor_row.last_success_at = datetime.utcnow()
+                stats['success'] = True
         except Exception as e:
-            logger.error(f"Invoice sync failed: {e}")
+            logger.error(f"{entity} sync {source_system} -> {target_system} failed: {e}")
+            db.session.rollback()
+            cursor_row.status = 'failed'
+            cursor_row.last_error = str(e)[:2000]
+            stats['error'] = str(e)
+        
+        cursor_row.locked_until = None
+        cursor_row.last_run_at = datetime.utcnow()
+        db.session.commit()
+        return stats
+    
+    def _write_batch(self, source_system: str, target_system: str, entity: str, tenant_id: str,
+                     target: IntegrationProvider, records: List[Dict], stats: Dict) -> Dict[str, str]:
+        """Send the changed records of one page; returns the failures"""
+        from app import db
+        from modules.api.models import ExternalIdMapping
+        if not records:
+            return {}
+        
+        # Latest version of each record in the page
+        latest = {}
+        for record in records:
+            latest[str(record['id'])] = record
+        mappings = {
+            m.source_id: m for m in ExternalIdMapping.query.filter(
+                ExternalIdMapping.source_system == source_system,
+                ExternalIdMapping.target_system == target_system,
+                ExternalIdMapping.entity == entity,
+                ExternalIdMapping.tenant_id == tenant_id,
+                ExternalIdMapping.source_id.in_(list(latest))
+            )
+        }
+        
+        items, hashes = [], {}
+        for source_id, record in latest.items():
+            hashes[source_id] = self._content_hash(record)
+            mapping = mappings.get(source_id)
+            if mapping is not None and mapping.content_hash == hashes[source_id]:
+                stats['unchanged'] += 1
+                continue
+            items.append(SyncItem(source_id, record, mapping.target_id if mapping else None))
+        if not items:
+            return {}
+        
+        result = target.upsert_batch(entity, items)
+        now = datetime.utcnow()
+        for source_id, target_id in result.target_ids.items():
+            mapping = mappings.get(source_id)
+            if mapping is None:
+                db.session.add(ExternalIdMapping(
+                    source_system=source_system, target_system=target_system, entity=entity,
+                    tenant_id=tenant_id, source_id=source_id, target_id=target_id,
+                    content_hash=hashes[source_id], synced_at=now
+                ))
+            else:
+                mapping.target_id = target_id
+                mapping.content_hash = hashes[source_id]
+                mapping.synced_at = now
+        stats['written'] += len(result.target_ids)
+        stats['failed'] += len(result.errors)
+        if result.errors:
+            # Keep what succeeded; the page itself is retried next run
+            db.session.commit()
+        return result.errors
+    
+    @staticmethod
+    def _content_hash(record: Dict) -> str:
+        return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def _acquire(self, source_system: str, target_system: str, entity: str, tenant_id: str):
+        """The cursor row, leased to this run; None if another run holds it"""
+        from app import db
+        from modules.api.models import SyncCursor
+        from sqlalchemy import or_
+        from sqlalchemy.exc import IntegrityError
+        
+        key = dict(source_system=source_system, target_system=target_system, entity=entity, tenant_id=tenant_id)
+        if SyncCursor.query.filter_by(**key).first() is None:
+            try:
+                db.session.add(SyncCursor(status='idle', records_synced=0, **key))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+        
+        now = datetime.utcnow()
+        claimed = SyncCursor.query.filter_by(**key).filter(
+            or_(SyncCursor.locked_until.is_(None), SyncCursor.locked_until < now)
+        ).update({'locked_until': now + timedelta(seconds=self._config('SYNC_LEASE_SECONDS', 900)),
+                  'status': 'running'}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None
+        return SyncCursor.query.filter_by(**key).first()
+    
+    def get_cursor(self, source_system: str, target_system: str, entity: str, tenant_id: str = 'default'):
+        from modules.api.models import SyncCursor
+        return SyncCursor.query.filter_by(source_system=source_system, target_system=target_system,
+                                          entity=entity, tenant_id=tenant_id).first()
+    
+    def reset_cursor(self, source_system: str, target_system: str, entity: str, tenant_id: str = 'default') -> bool:
+        """Make the next run start from the beginning (mappings are kept, so nothing is duplicated)"""
+        from app import db
+        cursor_row = self.get_cursor(source_system, target_system, entity, tenant_id)
+        if cursor_row is None:
             return False
+        cursor_row.cursor = None
+        db.session.commit()
+        return True
+    
+    @staticmethod
+    def _config(key: str, default):
+        try:
+            return current_app.config.get(key, default)
+        except RuntimeError:
+            return default
     
     def schedule_sync(self, job_name: str, sync_function: Callable, 
                      schedule: str = "daily") -> bool:
-        """Schedule a sync job"""
+        """Schedule a sync job (run by ``run_due_jobs`` / the scheduler thread)"""
         try:
-            self.sync_jobs[job_name] = {
-                "function": sync_function,
-                "schedule": schedule,
-                "last_run": None,
-                "next_run": self._calculate_next_run(schedule)
-            }
+            with self._jobs_lock:
+                self.sync_jobs[job_name] = {
+                    "function": sync_function,
+                    "schedule": schedule,
+                    "last_run": None,
+                    "last_result": None,
+                    "next_run": self._calculate_next_run(schedule)
+                }
             logger.info(f"Scheduled sync job: {job_name}")
             return True
         except Exception as e:
             logger.error(f"Failed to schedule sync job: {e}")
             return False
     
+    def run_due_jobs(self) -> Dict[str, Any]:
+        """Run the scheduled jobs whose next_run has passed"""
+        now = datetime.utcnow()
+        with self._jobs_lock:
+            due = [(name, job) for name, job in self.sync_jobs.items() if job['next_run'] <= now]
+            for _, job in due:
+                job['next_run'] = self._calculate_next_run(job['schedule'])
+        results = {}
+        for name, job in due:
+            try:
+                results[name] = job['function']()
+            except Exception as e:
+                logger.error(f"Sync job {name} failed: {e}")
+                results[name] = {'success': False, 'error': str(e)}
+            job['last_run'] = datetime.utcnow()
+            job['last_result'] = results[name]
+        return results
+    
+    def start_scheduler(self, app, interval: float = 60) -> None:
+        """Check for due jobs every ``interval`` seconds in a daemon thread"""
+        if self._scheduler is not None:
+            return
+        
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        self.run_due_jobs()
+                except Exception as e:
+                    logger.error(f"Sync scheduler error: {e}")
+        
+        self._scheduler = threading.Thread(target=run, name='data-sync-scheduler', daemon=True)
+        self._scheduler.start()
+    
     def _calculate_next_run(self, schedule: str) -> datetime:
         """Calculate next run time for scheduled job"""
         now = datetime.utcnow()
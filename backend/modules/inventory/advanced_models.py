@@ -353,6 +353,10 @@ class StockLevel(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # Multi-tenancy support
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Optimistic locking: bumped on every UPDATE, stale writers get StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
+    
     # Relationships
     product = db.relationship('InventoryProduct', backref='stock_levels')
     variant = db.relationship('ProductVariant', backref='stock_levels')
@@ -427,6 +431,11 @@ class InventoryTransaction(db.Model):
     # Tier 3 relationships
     from_advanced_location = db.relationship('AdvancedLocation', foreign_keys=[from_advanced_location_id], backref='outgoing_transactions')
     to_advanced_location = db.relationship('AdvancedLocation', foreign_keys=[to_advanced_location_id], backref='incoming_transactions')
+    
+    # Daily cycle close scans one day's range; keep it sargable
+    __table_args__ = (
+        db.Index('idx_inv_txn_date_product', 'transaction_date', 'product_id'),
+    )
 
 # ============================================================================
 # TRACKING MODELS - UNIVERSAL ACROSS ALL TIERS
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Dict, List
 import json
+import secrets
 import time
 import threading
 
@@ -8,8 +9,6 @@ class APIEcosystem:
     """API-First Ecosystem with Webhooks and Developer Tools"""
     
     def __init__(self):
-        self.webhooks = []
-        self.api_keys = {}
         self.rate_limits = {}
         self.api_analytics = {
             'total_requests': 0,
@@ -19,37 +18,48 @@ class APIEcosystem:
         self.lock = threading.Lock()
     
     def register_webhook(self, webhook_data: Dict) -> Dict:
-        """Register a new webhook subscription"""
+        """Register a new webhook subscription (stored in the webhooks table)"""
         try:
-            webhook = {
-                'id': f"webhook_{len(self.webhooks) + 1}",
-                'url': webhook_data['url'],
-                'events': webhook_data.get('events', ['all']),
-                'is_active': True,
-                'created_at': datetime.utcnow().isoformat()
-            }
+            from app import db
+            from flask_jwt_extended import get_jwt_identity
+            from modules.api.models import Webhook
+            from modules.api.webhook_dispatcher import webhook_dispatcher
             
-            with self.lock:
-                self.webhooks.append(webhook)
+            webhook = Webhook(
+                name=webhook_data.get('name') or webhook_data['url'],
+                user_id=webhook_data.get('user_id') or int(get_jwt_identity()),
+                tenant_id=webhook_data.get('tenant_id'),
+                url=webhook_data['url'],
+                events=webhook_data.get('events', ['all']),
+                secret_key=webhook_data.get('secret_key') or secrets.token_hex(16),
+                is_active=True
+            )
+            db.session.add(webhook)
+            db.session.commit()
+            webhook_dispatcher.invalidate_index()
             
             return {
                 'success': True,
-                'webhook_id': webhook['id'],
+                'webhook_id': webhook.id,
+                'secret_key': webhook.secret_key,
                 'message': 'Webhook registered successfully'
             }
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def trigger_webhook_event(self, event_type: str, event_data: Dict) -> Dict:
-        """Trigger webhook events for subscribed endpoints"""
+    def trigger_webhook_event(self, event_type: str, event_data: Dict, tenant_id: str = None) -> Dict:
+        """
+        Queue webhook deliveries for subscribed endpoints. The deliveries are
+        committed here and sent in the background by the webhook dispatcher.
+        """
         try:
-            triggered_count = 0
+            from app import db
+            from modules.api.webhook_dispatcher import webhook_dispatcher
             
-            with self.lock:
-                for webhook in self.webhooks:
-                    if webhook['is_active'] and ('all' in webhook['events'] or event_type in webhook['events']):
-                        triggered_count += 1
+            triggered_count = webhook_dispatcher.emit(event_type, event_data, tenant_id=tenant_id)
+            if triggered_count:
+                db.session.commit()
             
             return {
                 'success': True,
@@ -60,26 +70,25 @@ class APIEcosystem:
             return {'success': False, 'error': str(e)}
     
     def create_api_key(self, key_data: Dict) -> Dict:
-        """Create new API key for external integrations"""
+        """Create new API key for external integrations (stored hashed in the api_keys table)"""
         try:
-            import secrets
-            api_key = f"edonu_{secrets.token_urlsafe(16)}"
-            
-            key_info = {
-                'id': f"key_{len(self.api_keys) + 1}",
-                'name': key_data['name'],
-                'key': api_key,
-                'is_active': True,
-                'created_at': datetime.utcnow().isoformat()
-            }
+            from app import db
+            from flask_jwt_extended import get_jwt_identity
+            from modules.api.api_key_service import create_api_key
             
-            with self.lock:
-                self.api_keys[api_key] = key_info
+            key, api_key = create_api_key(
+                user_id=key_data.get('user_id') or int(get_jwt_identity()),
+                tenant_id=key_data.get('tenant_id'),
+                key_name=key_data['name'],
+                permissions=key_data.get('permissions'),
+                rate_limit=key_data.get('rate_limit', 1000)
+            )
+            db.session.commit()
             
             return {
                 'success': True,
                 'api_key': api_key,
-                'key_id': key_info['id']
+                'key_id': key.id
             }
             
         except Exception as e:
@@ -88,13 +97,13 @@ class APIEcosystem:
     def validate_api_key(self, api_key: str) -> Dict:
         """Validate API key and check rate limits"""
         try:
-            with self.lock:
-                key_data = self.api_keys.get(api_key)
-                
-                if not key_data or not key_data['is_active']:
-                    return {'valid': False, 'error': 'Invalid API key'}
-                
-                return {'valid': True, 'key_data': key_data}
+            from modules.api.api_key_service import api_key_authenticator
+            
+            key_data = api_key_authenticator.validate(api_key)
+            if key_data is None:
+                return {'valid': False, 'error': 'Invalid API key'}
+            
+            return {'valid': True, 'key_data': key_data}
                 
         except Exception as e:
             return {'valid': False, 'error': str(e)}
@@ -128,14 +137,30 @@ class APIEcosystem:
                     'total_requests': analytics['total_requests'],
                     'average_response_time_ms': avg_response_time * 1000,
                     'requests_by_endpoint': analytics['requests_by_endpoint'],
-                    'active_webhooks': len([w for w in self.webhooks if w['is_active']]),
-                    'active_api_keys': len([k for k in self.api_keys.values() if k['is_active']])
+                    'active_webhooks': self._active_webhook_count(),
+                    'active_api_keys': self._active_api_key_count()
                 }
             }
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def _active_api_key_count() -> int:
+        try:
+            from modules.api.models import APIKey
+            return APIKey.query.filter_by(is_active=True).count()
+        except Exception:
+            return 0
+    
+    @staticmethod
+    def _active_webhook_count() -> int:
+        try:
+            from modules.api.models import Webhook
+            return Webhook.query.filter_by(is_active=True).count()
+        except Exception:
+            return 0
+    
     def get_api_documentation(self) -> Dict:
         """Generate API documentation"""
         try:
@@ -2,95 +2,199 @@ from datetime import datetime
 from typing import Dict, List, Optional
 import threading
 import time
-from contextlib import contextmanager
+
+from app import db
+from modules.core.concurrency import (
+    ConcurrencyConflictError, check_version, commit_versioned, current_version, retry_on_conflict
+)
+
+def _versioned_models() -> Dict:
+    """Tables that carry an optimistic-locking ``version`` column"""
+    from modules.inventory.advanced_models import StockLevel
+    from modules.procurement.models import PurchaseOrder
+    from modules.finance.advanced_models import JournalHeader
+    return {model.__tablename__: model for model in (StockLevel, PurchaseOrder, JournalHeader)}
+
+# Columns update_with_optimistic_lock may write per table; keys, tenant, audit
+# columns, workflow state and totals derived from lines are left to their own code
+UPDATABLE_FIELDS = {
+    'inventory_stock_levels': frozenset({
+        'quantity_on_hand', 'quantity_allocated', 'quantity_available', 'quantity_in_transit',
+        'unit_cost', 'total_value', 'cost_currency', 'base_currency_unit_cost', 'base_currency_total_value'
+    }),
+    'purchase_orders': frozenset({
+        'order_date', 'expected_delivery', 'status', 'total_amount', 'tax_amount', 'notes'
+    }),
+    'advanced_journal_headers': frozenset({
+        'reference_id', 'posting_date', 'document_date', 'fiscal_period', 'description',
+        'currency', 'exchange_rate'
+    }),
+}
 
 class ConcurrencyManager:
     """Enterprise-grade concurrency management for inventory operations"""
-    
+
     def __init__(self):
         self.lock_manager = threading.Lock()
         self.active_locks = {}
         self.transaction_timeout = 30
-    
+        self.conflicts = 0
+        self.retries = 0
+        self.adjustments = 0
+
+    def _model_for(self, table_name: str):
+        model = _versioned_models().get(table_name)
+        if model is None:
+            raise ValueError(f"Table '{table_name}' does not support optimistic locking")
+        return model
+
     def get_optimistic_lock_version(self, table_name: str, record_id: int) -> int:
         """Get current version number for optimistic locking"""
         try:
-            # Mock implementation - replace with actual database query
-            return int(time.time()) % 1000
+            version = current_version(self._model_for(table_name), record_id)
+            return version if version is not None else 0
         except Exception as e:
             print(f"Error getting version number: {e}")
             return 0
-    
-    def update_with_optimistic_lock(self, table_name: str, record_id: int, 
+
+    def update_with_optimistic_lock(self, table_name: str, record_id: int,
                                   data: Dict, expected_version: int) -> Dict:
         """Update record with optimistic locking to prevent race conditions"""
         try:
-            # Simulate version check
-            current_version = self.get_optimistic_lock_version(table_name, record_id)
-            
-            if current_version != expected_version:
+            model = self._model_for(table_name)
+            record = db.session.get(model, record_id)
+            if record is None:
+                return {
+                    'success': False,
+                    'error': 'NOT_FOUND',
+                    'message': f'{model.__name__} {record_id} not found'
+                }
+
+            # Reject edits made against a version the caller no longer holds;
+            # the UPDATE itself also carries WHERE version = :seen
+            data = data or {}
+            rejected = sorted(set(data) - UPDATABLE_FIELDS[table_name])
+            if rejected:
                 return {
                     'success': False,
-                    'error': 'CONCURRENCY_CONFLICT',
-                    'message': 'Record was modified by another user. Please refresh and try again.',
-                    'current_version': current_version
+                    'error': 'INVALID_FIELDS',
+                    'message': f"{model.__name__} fields cannot be updated here: {', '.join(rejected)}"
                 }
-            
-            # Simulate successful update
+
+            check_version(record, expected_version)
+            for field, value in data.items():
+                setattr(record, field, value)
+            commit_versioned()
+
             return {
                 'success': True,
                 'message': 'Record updated successfully',
-                'new_version': expected_version + 1
+                'new_version': record.version
             }
-            
+
+        except ConcurrencyConflictError as e:
+            db.session.rollback()
+            self._count('conflicts')
+            result = e.to_dict()
+            if result['current_version'] is None:
+                result['current_version'] = self.get_optimistic_lock_version(table_name, record_id)
+            return result
         except Exception as e:
+            db.session.rollback()
             return {
                 'success': False,
                 'error': 'UPDATE_FAILED',
                 'message': f'Error updating record: {str(e)}'
             }
-    
+
     def process_stock_adjustment_with_locking(self, adjustment_data: Dict) -> Dict:
         """Process stock adjustment with full concurrency protection"""
         item_id = adjustment_data.get('item_id')
         warehouse_id = adjustment_data.get('warehouse_id')
-        quantity = adjustment_data.get('quantity', 0)
-        
+        quantity = float(adjustment_data.get('quantity', 0) or 0)
+
+        if not item_id or not warehouse_id:
+            return {
+                'success': False,
+                'error': 'INVALID_ADJUSTMENT',
+                'message': 'item_id and warehouse_id are required'
+            }
+
         lock_key = f"stock_{item_id}_{warehouse_id}"
-        
+        attempts = []
+
+        # A stock delta is commutative, so a writer that loses the version race
+        # simply re-reads the row and re-applies the same delta
+        @retry_on_conflict
+        def apply_delta():
+            from modules.inventory.advanced_models import StockLevel
+            attempts.append(1)
+            level = StockLevel.query.filter_by(
+                product_id=item_id, simple_warehouse_id=warehouse_id,
+                basic_location_id=None, advanced_location_id=None, lot_batch_id=None
+            ).first()
+            if level is None:
+                level = StockLevel(product_id=item_id, simple_warehouse_id=warehouse_id,
+                                   user_id=adjustment_data.get('user_id'))
+                db.session.add(level)
+
+            on_hand = (level.quantity_on_hand or 0.0) + quantity
+            if on_hand < 0 and not adjustment_data.get('allow_negative', False):
+                raise ValueError(f'Insufficient stock: {level.quantity_on_hand or 0.0} on hand')
+            level.quantity_on_hand = on_hand
+            level.quantity_available = on_hand - (level.quantity_allocated or 0.0)
+            level.total_value = on_hand * (level.unit_cost or 0.0)
+            commit_versioned()
+            return level
+
         with self.lock_manager:
-            if lock_key in self.active_locks:
-                return {
-                    'success': False,
-                    'error': 'LOCK_ACQUISITION_FAILED',
-                    'message': 'Item is currently being processed by another operation'
-                }
-            
-            self.active_locks[lock_key] = datetime.utcnow()
-        
+            self.active_locks[lock_key] = self.active_locks.get(lock_key, 0) + 1
+
         try:
-            # Simulate stock adjustment processing
-            time.sleep(0.1)  # Simulate processing time
-            
+            level = apply_delta()
+            self._count('adjustments')
+
             return {
                 'success': True,
                 'message': 'Stock adjustment processed successfully',
-                'transaction_id': f"ADJ-{int(time.time())}",
-                'new_quantity': 100 + quantity  # Mock new quantity
+                'transaction_id': f"ADJ-{int(time.time() * 1000)}",
+                'new_quantity': level.quantity_on_hand,
+                'version': level.version,
+                'attempts': len(attempts)
+            }
+
+        except ConcurrencyConflictError as e:
+            self._count('conflicts')
+            return e.to_dict()
+        except ValueError as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'error': 'INSUFFICIENT_STOCK',
+                'message': str(e)
             }
-            
         finally:
-            # Release lock
             with self.lock_manager:
-                if lock_key in self.active_locks:
-                    del self.active_locks[lock_key]
-    
+                self.retries += max(len(attempts) - 1, 0)
+                remaining = self.active_locks.get(lock_key, 1) - 1
+                if remaining > 0:
+                    self.active_locks[lock_key] = remaining
+                else:
+                    self.active_locks.pop(lock_key, None)
+
+    def _count(self, counter: str):
+        with self.lock_manager:
+            setattr(self, counter, getattr(self, counter) + 1)
+
     def get_concurrency_metrics(self) -> Dict:
         """Get concurrency performance metrics"""
         with self.lock_manager:
             return {
                 'active_locks': len(self.active_locks),
                 'lock_details': list(self.active_locks.keys()),
+                'adjustments': self.adjustments,
+                'conflicts': self.conflicts,
+                'retries': self.retries,
                 'timestamp': datetime.utcnow().isoformat()
             }
 
@@ -7,10 +7,17 @@ Purpose: Precise cost tracking with layer-based costing methods
 from app import db
 from datetime import datetime, date
 from typing import Dict, List, Optional
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, text, literal_column
 from sqlalchemy.dialects.postgresql import JSON
 import json
 
+# Layers fetched (and locked) per round trip while consuming an issue
+LAYER_BATCH_SIZE = 25
+
+# Layers without a receipt date (rows from before the column was enforced) sort
+# as the oldest, so the keyset never compares against NULL
+UNDATED_RECEIPT = date(1900, 1, 1)
+
 class InventoryCostLayer(db.Model):
     """
     Cost layers for precise FIFO/LIFO/Average cost tracking
@@ -67,13 +74,16 @@ class InventoryCostLayer(db.Model):
         db.Index('idx_cost_layers_product_date', 'product_id', 'receipt_date'),
         db.Index('idx_cost_layers_fifo', 'product_id', 'simple_warehouse_id', 'layer_sequence'),
         db.Index('idx_cost_layers_lifo', 'product_id', 'simple_warehouse_id', 'receipt_date', 'layer_sequence'),
+        # Open layers only: issues never scan a product's depleted history
+        db.Index('idx_cost_layers_open', 'product_id', 'simple_warehouse_id',
+                 text(f"coalesce(receipt_date, '{UNDATED_RECEIPT.isoformat()}')"), 'layer_sequence', 'id',
+                 postgresql_where=text('is_depleted = false'), sqlite_where=text('is_depleted = 0')),
     )
     
     @classmethod
-    def get_available_layers(cls, product_id: int, warehouse_id: int = None, 
-                           cost_method: str = 'FIFO', limit_quantity: float = None):
+    def _open_layers_query(cls, product_id: int, warehouse_id: int = None, cost_method: str = 'FIFO'):
         """
-        Get available cost layers for a product using specified method
+        Open layers for a product in cost-method order; returns (query, ordering columns, descending)
         """
         query = cls.query.filter(
             cls.product_id == product_id,
@@ -84,22 +94,74 @@ class InventoryCostLayer(db.Model):
         if warehouse_id:
             query = query.filter(cls.simple_warehouse_id == warehouse_id)
         
-        # Order by cost method
-        if cost_method.upper() == 'FIFO':
-            query = query.order_by(cls.receipt_date.asc(), cls.layer_sequence.asc())
-        elif cost_method.upper() == 'LIFO':
-            query = query.order_by(cls.receipt_date.desc(), cls.layer_sequence.desc())
-        else:  # Average or other methods
-            query = query.order_by(cls.receipt_date.asc(), cls.layer_sequence.asc())
-        
-        layers = query.all()
+        # Order by cost method (Average and other methods use FIFO order)
+        descending = (cost_method or 'FIFO').upper() == 'LIFO'
+        columns = (cls._receipt_order(), cls.layer_sequence, cls.id)
+        query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+        return query, columns, descending
+    
+    @classmethod
+    def _receipt_order(cls):
+        """receipt_date as sorted by the open-layer index (NULL as UNDATED_RECEIPT)"""
+        return func.coalesce(cls.receipt_date, literal_column(f"'{UNDATED_RECEIPT.isoformat()}'"), type_=db.Date)
+    
+    @classmethod
+    def _after(cls, columns, descending: bool, last_layer):
+        """Keyset predicate: layers strictly after ``last_layer`` in the query order"""
+        values = [last_layer.receipt_date or UNDATED_RECEIPT, last_layer.layer_sequence, last_layer.id]
+        clauses = []
+        for i, column in enumerate(columns):
+            beyond = column < values[i] if descending else column > values[i]
+            clauses.append(and_(*[columns[k] == values[k] for k in range(i)], beyond))
+        return or_(*clauses)
+    
+    @classmethod
+    def iter_available_layers(cls, product_id: int, warehouse_id: int = None, cost_method: str = 'FIFO',
+                              lock: bool = False, batch_size: int = LAYER_BATCH_SIZE):
+        """
+        Stream open layers in cost-method order, ``batch_size`` rows per query.
+        With ``lock`` each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+        concurrent issues take disjoint layers; on SQLite (no row locks) the
+        transaction is upgraded to a write transaction first, serializing issuers.
+        """
+        query, columns, descending = cls._open_layers_query(product_id, warehouse_id, cost_method)
+        if lock:
+            if db.session.get_bind().dialect.name == 'sqlite':
+                cls._begin_serialized_write()
+            else:
+                query = query.with_for_update(skip_locked=True)
         
-        # If limit_quantity specified, only return layers needed
+        last_layer = None
+        while True:
+            page = query if last_layer is None else query.filter(cls._after(columns, descending, last_layer))
+            layers = page.limit(batch_size).all()
+            for layer in layers:
+                yield layer
+            if len(layers) < batch_size:
+                return
+            last_layer = layers[-1]
+    
+    @classmethod
+    def _begin_serialized_write(cls):
+        """
+        SQLite fallback for row locks: a no-op write takes the database RESERVED lock
+        up front, so a second issuer blocks until this transaction ends instead of
+        reading the same layers.
+        """
+        db.session.execute(text(f"UPDATE {cls.__tablename__} SET id = id WHERE 1 = 0"))
+    
+    @classmethod
+    def get_available_layers(cls, product_id: int, warehouse_id: int = None, 
+                           cost_method: str = 'FIFO', limit_quantity: float = None):
+        """
+        Get available cost layers for a product using specified method
+        """
+        # If limit_quantity specified, only read the layers needed
         if limit_quantity:
             selected_layers = []
             remaining_needed = limit_quantity
             
-            for layer in layers:
+            for layer in cls.iter_available_layers(product_id, warehouse_id, cost_method):
                 if remaining_needed <= 0:
                     break
                     
@@ -108,7 +170,52 @@ class InventoryCostLayer(db.Model):
             
             return selected_layers
         
-        return layers
+        query, _, _ = cls._open_layers_query(product_id, warehouse_id, cost_method)
+        return query.all()
+    
+    @classmethod
+    def consume_layers(cls, product_id: int, quantity: float, warehouse_id: int = None,
+                       cost_method: str = 'FIFO', batch_size: int = LAYER_BATCH_SIZE) -> List[Dict]:
+        """
+        Lock and deplete layers in cost-method order until ``quantity`` is covered.
+        Only the rows actually depleted are read and locked; layers held by a
+        concurrent issue are skipped. Returns the deplete_layer() results (each
+        with the layer's sequence and receipt date, None for legacy undated
+        layers); the caller commits.
+        """
+        depletions = []
+        remaining_to_issue = quantity
+        if remaining_to_issue <= 0:
+            return depletions
+        
+        for layer in cls.iter_available_layers(product_id, warehouse_id, cost_method,
+                                               lock=True, batch_size=batch_size):
+            result = layer.deplete_layer(remaining_to_issue)
+            result['layer_sequence'] = layer.layer_sequence
+            result['receipt_date'] = layer.receipt_date
+            depletions.append(result)
+            
+            remaining_to_issue -= result['depleted_quantity']
+            if remaining_to_issue <= 0.001:
+                break
+        
+        return depletions
+    
+    @classmethod
+    def open_totals(cls, product_id: int, warehouse_id: int = None):
+        """(remaining quantity, remaining cost) across open layers, computed in SQL"""
+        query = db.session.query(
+            func.coalesce(func.sum(cls.remaining_quantity), 0.0),
+            func.coalesce(func.sum(cls.remaining_cost), 0.0)
+        ).filter(
+            cls.product_id == product_id,
+            cls.remaining_quantity > 0,
+            cls.is_depleted == False
+        )
+        if warehouse_id:
+            query = query.filter(cls.simple_warehouse_id == warehouse_id)
+        quantity, cost = query.one()
+        return float(quantity or 0.0), float(cost or 0.0)
     
     def deplete_layer(self, quantity_to_deplete: float) -> Dict:
         """
@@ -47,7 +47,9 @@ def process_stock_adjustment_with_locking():
         response_time = time.time() - start_time
         api_ecosystem.track_api_request('/api/enterprise/concurrency/stock-adjustment', response_time)
         
-        return jsonify(result), 200 if result['success'] else 400
+        if result['success']:
+            return jsonify(result), 200
+        return jsonify(result), 409 if result.get('error') == 'CONCURRENCY_CONFLICT' else 400
         
     except Exception as e:
         return jsonify({
@@ -14,195 +14,399 @@ import uuid
 bp = Blueprint('manufacturing', __name__, url_prefix='/api/manufacturing')
 
 # Sample data for initial state
-boms = []
-bom_items = []
-production_orders = []
-work_centers = []
-production_operations = []
-mrp_records = []
 supply_chain_nodes = []
 supply_chain_links = []
 quality_controls = []
 maintenance_schedules = []
 equipment = []
 
+def _tenant_context():
+    """(user_id, tenant_id) for the authenticated user"""
+    from modules.core.tenant_helpers import require_tenant_context
+    return require_tenant_context()
+
+def _parse_datetime(value):
+    """ISO datetime from request data, or None; raises ValueError when malformed"""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    return datetime.fromisoformat(value)
+
+def _parse_id(value):
+    """Positive integer id from request data, or None"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+def _work_center_error(data, tenant_id):
+    """Error message when data names a work center the tenant does not have"""
+    if data.get('work_center_id') is None:
+        return None
+    work_center_id = _parse_id(data.get('work_center_id'))
+    if work_center_id is None or not WorkCenter.query.filter_by(id=work_center_id, tenant_id=tenant_id).first():
+        return "Work center not found"
+    return None
+
+def _production_order_refs_error(data, tenant_id):
+    """Error message when data names a BOM or product the tenant does not have"""
+    bom_id = _parse_id(data.get('bom_id'))
+    if bom_id is None or not BillOfMaterials.query.filter_by(id=bom_id, tenant_id=tenant_id).first():
+        return "Bill of materials not found"
+    product_id = _parse_id(data.get('product_id'))
+    if product_id is None or not Product.query.filter_by(id=product_id, tenant_id=tenant_id).first():
+        return "Product not found"
+    return None
+
+def _serialize_bom(bom):
+    return {
+        "id": bom.id,
+        "name": bom.name,
+        "description": bom.description,
+        "product_id": bom.product_id,
+        "version": bom.version,
+        "is_active": bom.is_active,
+        "created_at": bom.created_at.isoformat() if bom.created_at else None
+    }
+
+def _serialize_bom_item(item):
+    return {
+        "id": item.id,
+        "bom_id": item.bom_id,
+        "component_id": item.component_id,
+        "quantity": item.quantity,
+        "unit_of_measure": item.unit_of_measure,
+        "scrap_factor": item.scrap_factor,
+        "lead_time": item.lead_time,
+        "cost": item.cost,
+        "sequence": item.sequence
+    }
+
+def _serialize_production_order(order):
+    return {
+        "id": order.id,
+        "order_number": order.order_number,
+        "bom_id": order.bom_id,
+        "product_id": order.product_id,
+        "quantity": order.quantity,
+        "completed_quantity": order.completed_quantity,
+        "status": order.status,
+        "priority": order.priority,
+        "planned_start_date": order.planned_start_date.isoformat() if order.planned_start_date else None,
+        "planned_end_date": order.planned_end_date.isoformat() if order.planned_end_date else None,
+        "work_center_id": order.work_center_id,
+        "cost": order.cost,
+        "notes": order.notes,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "updated_at": order.updated_at.isoformat() if order.updated_at else None
+    }
+
+def _serialize_work_center(work_center):
+    return {
+        "id": work_center.id,
+        "name": work_center.name,
+        "description": work_center.description,
+        "capacity": work_center.capacity,
+        "efficiency": work_center.efficiency,
+        "cost_per_hour": work_center.cost_per_hour,
+        "is_active": work_center.is_active,
+        "location": work_center.location,
+        "created_at": work_center.created_at.isoformat() if work_center.created_at else None
+    }
+
+def _serialize_mrp_record(record):
+    return {
+        "id": record.id,
+        "product_id": record.product_id,
+        "period_start": record.period_start.isoformat(),
+        "period_end": record.period_end.isoformat(),
+        "gross_requirements": record.gross_requirements,
+        "scheduled_receipts": record.scheduled_receipts,
+        "projected_on_hand": record.projected_on_hand,
+        "net_requirements": record.net_requirements,
+        "planned_order_receipts": record.planned_order_receipts,
+        "planned_order_releases": record.planned_order_releases,
+        "safety_stock": record.safety_stock,
+        "lead_time": record.lead_time,
+        "lot_size": record.lot_size
+    }
+
 # Bill of Materials endpoints
 @bp.route('/boms', methods=['GET'])
 def get_boms():
     """Get all Bill of Materials"""
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
     product_id = request.args.get('product_id', type=int)
     
-    filtered_boms = boms
+    query = BillOfMaterials.query.filter_by(tenant_id=tenant_id)
     if product_id:
-        filtered_boms = [bom for bom in boms if bom.get('product_id') == product_id]
+        query = query.filter_by(product_id=product_id)
     
-    return jsonify(filtered_boms)
+    return jsonify([_serialize_bom(bom) for bom in query.order_by(BillOfMaterials.id).all()])
 
 @bp.route('/boms', methods=['POST'])
 def create_bom():
     """Create a new Bill of Materials"""
-    data = request.get_json()
-    
-    new_bom = {
-        "id": len(boms) + 1,
-        "name": data.get('name'),
-        "description": data.get('description'),
-        "product_id": data.get('product_id'),
-        "version": data.get('version', '1.0'),
-        "is_active": data.get('is_active', True),
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    boms.append(new_bom)
-    return jsonify(new_bom), 201
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    data = request.get_json() or {}
+    if not data.get('name') or not data.get('product_id'):
+        return jsonify({"error": "name and product_id are required"}), 400
+    
+    new_bom = BillOfMaterials(
+        name=data.get('name'),
+        description=data.get('description'),
+        product_id=data.get('product_id'),
+        version=data.get('version', '1.0'),
+        is_active=data.get('is_active', True),
+        tenant_id=tenant_id,
+        created_by=user_id
+    )
+    db.session.add(new_bom)
+    db.session.commit()
+    return jsonify(_serialize_bom(new_bom)), 201
 
 @bp.route('/boms/<int:bom_id>/items', methods=['GET'])
 def get_bom_items(bom_id):
     """Get items for a specific BOM"""
-    items = [item for item in bom_items if item.get('bom_id') == bom_id]
-    return jsonify(items)
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    items = BOMItem.query.filter_by(bom_id=bom_id, tenant_id=tenant_id).order_by(
+        BOMItem.sequence, BOMItem.id
+    ).all()
+    return jsonify([_serialize_bom_item(item) for item in items])
 
 @bp.route('/boms/<int:bom_id>/items', methods=['POST'])
 def add_bom_item(bom_id):
     """Add an item to a BOM"""
-    data = request.get_json()
-    
-    new_item = {
-        "id": len(bom_items) + 1,
-        "bom_id": bom_id,
-        "component_id": data.get('component_id'),
-        "quantity": data.get('quantity'),
-        "unit_of_measure": data.get('unit_of_measure', 'pcs'),
-        "scrap_factor": data.get('scrap_factor', 0.0),
-        "lead_time": data.get('lead_time', 0),
-        "cost": data.get('cost', 0.0),
-        "sequence": data.get('sequence', 0)
-    }
-    
-    bom_items.append(new_item)
-    return jsonify(new_item), 201
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    bom = BillOfMaterials.query.filter_by(id=bom_id, tenant_id=tenant_id).first()
+    if not bom:
+        return jsonify({"error": "Bill of materials not found"}), 404
+    
+    data = request.get_json() or {}
+    component_id = _parse_id(data.get('component_id'))
+    if component_id is None or data.get('quantity') is None:
+        return jsonify({"error": "component_id (a product id) and quantity are required"}), 400
+    if component_id == bom.product_id:
+        return jsonify({"error": "A product cannot be a component of itself"}), 400
+    
+    new_item = BOMItem(
+        bom_id=bom_id,
+        component_id=component_id,
+        quantity=data.get('quantity'),
+        unit_of_measure=data.get('unit_of_measure', 'pcs'),
+        scrap_factor=data.get('scrap_factor', 0.0),
+        lead_time=data.get('lead_time', 0),
+        cost=data.get('cost', 0.0),
+        sequence=data.get('sequence', 0),
+        tenant_id=tenant_id,
+        created_by=user_id
+    )
+    db.session.add(new_item)
+    db.session.commit()
+    return jsonify(_serialize_bom_item(new_item)), 201
 
 # Production Orders endpoints
 @bp.route('/production-orders', methods=['GET'])
 def get_production_orders():
     """Get all production orders"""
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
     status = request.args.get('status')
     work_center_id = request.args.get('work_center_id', type=int)
     
-    filtered_orders = production_orders
+    query = ProductionOrder.query.filter_by(tenant_id=tenant_id)
     if status:
-        filtered_orders = [order for order in filtered_orders if order.get('status') == status]
+        query = query.filter_by(status=status)
     if work_center_id:
-        filtered_orders = [order for order in filtered_orders if order.get('work_center_id') == work_center_id]
+        query = query.filter_by(work_center_id=work_center_id)
     
-    return jsonify(filtered_orders)
+    return jsonify([_serialize_production_order(o) for o in query.order_by(ProductionOrder.id).all()])
 
 @bp.route('/production-orders', methods=['POST'])
 def create_production_order():
     """Create a new production order"""
-    data = request.get_json()
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    data = request.get_json() or {}
+    if not data.get('bom_id') or not data.get('product_id') or data.get('quantity') is None:
+        return jsonify({"error": "bom_id, product_id and quantity are required"}), 400
+    refs_error = _production_order_refs_error(data, tenant_id) or _work_center_error(data, tenant_id)
+    if refs_error:
+        return jsonify({"error": refs_error}), 400
+    try:
+        planned_start_date = _parse_datetime(data.get('planned_start_date'))
+        planned_end_date = _parse_datetime(data.get('planned_end_date'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Generate order number
-    order_number = f"PO-{datetime.utcnow().strftime('%Y%m%d')}-{len(production_orders) + 1:03d}"
-    
-    new_order = {
-        "id": len(production_orders) + 1,
-        "order_number": order_number,
-        "bom_id": data.get('bom_id'),
-        "product_id": data.get('product_id'),
-        "quantity": data.get('quantity'),
-        "completed_quantity": data.get('completed_quantity', 0.0),
-        "status": data.get('status', 'planned'),
-        "priority": data.get('priority', 5),
-        "planned_start_date": data.get('planned_start_date'),
-        "planned_end_date": data.get('planned_end_date'),
-        "work_center_id": data.get('work_center_id'),
-        "cost": data.get('cost', 0.0),
-        "notes": data.get('notes'),
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    production_orders.append(new_order)
-    return jsonify(new_order), 201
+    order_number = f"MO-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    
+    new_order = ProductionOrder(
+        order_number=order_number,
+        bom_id=_parse_id(data.get('bom_id')),
+        product_id=_parse_id(data.get('product_id')),
+        quantity=data.get('quantity'),
+        completed_quantity=data.get('completed_quantity', 0.0),
+        status=data.get('status', 'planned'),
+        priority=data.get('priority', 5),
+        planned_start_date=planned_start_date,
+        planned_end_date=planned_end_date,
+        work_center_id=data.get('work_center_id'),
+        cost=data.get('cost', 0.0),
+        notes=data.get('notes'),
+        tenant_id=tenant_id,
+        created_by=user_id
+    )
+    db.session.add(new_order)
+    db.session.commit()
+    return jsonify(_serialize_production_order(new_order)), 201
 
 @bp.route('/production-orders/<int:order_id>', methods=['PUT'])
 def update_production_order(order_id):
     """Update a production order"""
-    data = request.get_json()
-    order = next((o for o in production_orders if o['id'] == order_id), None)
-    
-    if order:
-        order.update(data)
-        order['updated_at'] = datetime.utcnow().isoformat()
-        return jsonify(order)
-    
-    return jsonify({"error": "Production order not found"}), 404
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    order = ProductionOrder.query.filter_by(id=order_id, tenant_id=tenant_id).first()
+    if not order:
+        return jsonify({"error": "Production order not found"}), 404
+    
+    data = request.get_json() or {}
+    work_center_error = _work_center_error(data, tenant_id)
+    if work_center_error:
+        return jsonify({"error": work_center_error}), 400
+    try:
+        dates = {field: _parse_datetime(data[field])
+                 for field in ('planned_start_date', 'planned_end_date', 'actual_start_date', 'actual_end_date')
+                 if field in data}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for field in ('quantity', 'completed_quantity', 'status', 'priority',
+                  'work_center_id', 'cost', 'notes'):
+        if field in data:
+            setattr(order, field, data[field])
+    for field, value in dates.items():
+        setattr(order, field, value)
+    
+    db.session.commit()
+    return jsonify(_serialize_production_order(order))
 
 # Work Centers endpoints
 @bp.route('/work-centers', methods=['GET'])
 def get_work_centers():
     """Get all work centers"""
-    return jsonify(work_centers)
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    work_centers = WorkCenter.query.filter_by(tenant_id=tenant_id).order_by(WorkCenter.id).all()
+    return jsonify([_serialize_work_center(wc) for wc in work_centers])
 
 @bp.route('/work-centers', methods=['POST'])
 def create_work_center():
     """Create a new work center"""
-    data = request.get_json()
-    
-    new_work_center = {
-        "id": len(work_centers) + 1,
-        "name": data.get('name'),
-        "description": data.get('description'),
-        "capacity": data.get('capacity', 0.0),
-        "efficiency": data.get('efficiency', 100.0),
-        "cost_per_hour": data.get('cost_per_hour', 0.0),
-        "is_active": data.get('is_active', True),
-        "location": data.get('location'),
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    work_centers.append(new_work_center)
-    return jsonify(new_work_center), 201
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    data = request.get_json() or {}
+    if not data.get('name'):
+        return jsonify({"error": "name is required"}), 400
+    
+    new_work_center = WorkCenter(
+        name=data.get('name'),
+        description=data.get('description'),
+        capacity=data.get('capacity', 0.0),
+        efficiency=data.get('efficiency', 100.0),
+        cost_per_hour=data.get('cost_per_hour', 0.0),
+        is_active=data.get('is_active', True),
+        location=data.get('location'),
+        tenant_id=tenant_id,
+        created_by=user_id
+    )
+    db.session.add(new_work_center)
+    db.session.commit()
+    return jsonify(_serialize_work_center(new_work_center)), 201
 
 # Material Requirements Planning endpoints
 @bp.route('/mrp', methods=['GET'])
 def get_mrp():
-    """Get Material Requirements Planning data"""
+    """Get Material Requirements Planning data from the last MRP run"""
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
     product_id = request.args.get('product_id', type=int)
     
-    filtered_mrp = mrp_records
+    query = MaterialRequirementsPlan.query.filter_by(tenant_id=tenant_id)
     if product_id:
-        filtered_mrp = [mrp for mrp in mrp_records if mrp.get('product_id') == product_id]
+        query = query.filter_by(product_id=product_id)
     
-    return jsonify(filtered_mrp)
+    records = query.order_by(MaterialRequirementsPlan.product_id, MaterialRequirementsPlan.period_start).all()
+    return jsonify([_serialize_mrp_record(r) for r in records])
 
 @bp.route('/mrp/calculate', methods=['POST'])
 def calculate_mrp():
-    """Calculate MRP for products"""
-    data = request.get_json()
-    product_ids = data.get('product_ids', [])
-    
-    # Mock MRP calculation
-    mrp_results = []
-    for product_id in product_ids:
-        mrp_result = {
-            "product_id": product_id,
-            "period_start": datetime.now().date().isoformat(),
-            "period_end": (datetime.now() + timedelta(days=30)).date().isoformat(),
-            "gross_requirements": 100.0,
-            "scheduled_receipts": 50.0,
-            "projected_on_hand": 25.0,
-            "net_requirements": 25.0,
-            "planned_order_receipts": 30.0,
-            "planned_order_releases": 30.0,
-            "safety_stock": 10.0,
-            "lead_time": 7,
-            "lot_size": 50.0
-        }
-        mrp_results.append(mrp_result)
-        mrp_records.append(mrp_result)
+    """
+    Run regenerative MRP for the tenant.
+    
+    Body (all optional): demand [{product_id, quantity, due_date}], start_date,
+    period_days, horizon_periods, lot_sizing ('lot_for_lot' or
+    'fixed_order_quantity'), lot_sizes {product_id: qty}, lead_times
+    {product_id: days}, default_lead_time_days, product_ids (limits the
+    records returned; the run always plans every item).
+    """
+    from modules.manufacturing.mrp_engine import MRPEngine, BOMCycleError
+    
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    data = request.get_json() or {}
+    try:
+        start_date = data.get('start_date')
+        engine = MRPEngine(
+            tenant_id=tenant_id,
+            start_date=datetime.fromisoformat(start_date).date() if start_date else None,
+            period_days=int(data.get('period_days', 7)),
+            horizon_periods=int(data.get('horizon_periods', 12)),
+            lot_sizing=data.get('lot_sizing', 'lot_for_lot'),
+            lot_sizes=data.get('lot_sizes'),
+            lead_times=data.get('lead_times'),
+            default_lead_time_days=int(data.get('default_lead_time_days', 0)),
+            user_id=user_id
+        )
+        summary = engine.run(demand=data.get('demand', []))
+    except BOMCycleError as e:
+        return jsonify({"error": str(e)}), 422
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify(mrp_results)
+    product_ids = data.get('product_ids', [])
+    return jsonify({
+        "summary": summary,
+        "records": engine.records_for(product_ids) if product_ids else []
+    })
 
 # Supply Chain endpoints
 @bp.route('/supply-chain/nodes', methods=['GET'])
@@ -383,12 +587,28 @@ def create_maintenance_schedule():
 @bp.route('/analytics/production-summary', methods=['GET'])
 def get_production_summary():
     """Get production summary analytics"""
+    user_id, tenant_id = _tenant_context()
+    if not tenant_id:
+        return jsonify({"error": "Tenant context required"}), 400
+    
+    order_counts = dict(
+        db.session.query(ProductionOrder.status, db.func.count(ProductionOrder.id))
+        .filter(ProductionOrder.tenant_id == tenant_id)
+        .group_by(ProductionOrder.status).all()
+    )
+    
+    work_center_counts = dict(
+        db.session.query(WorkCenter.is_active, db.func.count(WorkCenter.id))
+        .filter(WorkCenter.tenant_id == tenant_id)
+        .group_by(WorkCenter.is_active).all()
+    )
+    
     summary = {
-        "total_orders": len(production_orders),
-        "orders_in_progress": len([o for o in production_orders if o.get('status') == 'in_progress']),
-        "orders_completed": len([o for o in production_orders if o.get('status') == 'completed']),
-        "total_work_centers": len(work_centers),
-        "active_work_centers": len([wc for wc in work_centers if wc.get('is_active')]),
+        "total_orders": sum(order_counts.values()),
+        "orders_in_progress": order_counts.get('in_progress', 0),
+        "orders_completed": order_counts.get('completed', 0),
+        "total_work_centers": sum(work_center_counts.values()),
+        "active_work_centers": work_center_counts.get(True, 0),
         "total_equipment": len(equipment),
         "operational_equipment": len([eq for eq in equipment if eq.get('status') == 'operational']),
         "pending_maintenance": len([sched for sched in maintenance_schedules if sched.get('status') == 'scheduled']),
@@ -418,66 +638,7 @@ def get_supply_chain_map():
 # Initialize sample data
 def init_sample_data():
     """Initialize sample manufacturing data"""
-    global boms, bom_items, production_orders, work_centers, equipment, supply_chain_nodes
-    
-    # Sample work centers
-    work_centers.extend([
-        {
-            "id": 1,
-            "name": "Assembly Line A",
-            "description": "Main assembly line for electronics",
-            "capacity": 8.0,
-            "efficiency": 95.0,
-            "cost_per_hour": 150.0,
-            "is_active": True,
-            "location": "Building 1, Floor 2",
-            "created_at": datetime.utcnow().isoformat()
-        },
-        {
-            "id": 2,
-            "name": "Packaging Station",
-            "description": "Product packaging and labeling",
-            "capacity": 6.0,
-            "efficiency": 90.0,
-            "cost_per_hour": 80.0,
-            "is_active": True,
-            "location": "Building 1, Floor 1",
-            "created_at": datetime.utcnow().isoformat()
-        }
-    ])
-    
-    # Sample BOMs
-    boms.extend([
-        {
-            "id": 1,
-            "name": "Laptop Assembly BOM",
-            "description": "Bill of materials for laptop assembly",
-            "product_id": 1,
-            "version": "1.0",
-            "is_active": True,
-            "created_at": datetime.utcnow().isoformat()
-        }
-    ])
-    
-    # Sample production orders
-    production_orders.extend([
-        {
-            "id": 1,
-            "order_number": "PO-20240814-001",
-            "bom_id": 1,
-            "product_id": 1,
-            "quantity": 100,
-            "completed_quantity": 0,
-            "status": "planned",
-            "priority": 5,
-            "planned_start_date": (datetime.now() + timedelta(days=1)).isoformat(),
-            "planned_end_date": (datetime.now() + timedelta(days=3)).isoformat(),
-            "work_center_id": 1,
-            "cost": 0.0,
-            "notes": "Initial production run",
-            "created_at": datetime.utcnow().isoformat()
-        }
-    ])
+    global equipment, supply_chain_nodes
     
     # Sample equipment
     equipment.extend([
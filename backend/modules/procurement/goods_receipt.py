@@ -0,0 +1,335 @@
+# backend/modules/procurement/goods_receipt.py
+"""
+Goods Receipt Service
+Posts a purchase-order receipt as one unit of work: every line is validated
+(including against the quantity still open on the PO) before anything is
+written, then the receipt record, inventory transactions, cost layers and one
+GR/IR journal for the whole receipt go out in a single transaction. A journal
+that cannot be written fails the whole receipt: stock is never received
+without its GR/IR entry.
+
+Callers pass an idempotency key (scanner/device generated); a retried request
+with the same key replays the stored response instead of receiving twice.
+The key is claimed by the receipt row's unique constraint inside the same
+transaction, so two concurrent retries cannot both post.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from modules.procurement.models import GoodsReceipt
+
+logger = logging.getLogger(__name__)
+
+# Unique constraint on (tenant_id, idempotency_key); its violation means a replay
+IDEMPOTENCY_CONSTRAINT = 'uq_goods_receipt_idempotency'
+# Float slack when comparing received quantities with the open PO quantity
+QUANTITY_EPSILON = 1e-9
+
+class JournalPostingError(Exception):
+    """The receipt's GR/IR journal could not be written"""
+
+def _tenant_id() -> str:
+    from modules.core.tenant_context import get_current_tenant
+    try:
+        return get_current_tenant() or 'default'
+    except RuntimeError:
+        return 'default'
+
+class GoodsReceiptService:
+    """Atomic, idempotent receiving against a purchase order"""
+
+    def __init__(self, journal_engine=None):
+        self.journal_engine = journal_engine
+
+    def receive(self, po: Dict, lines: List[Dict], warehouse_id: int, landed_costs_total: float = 0.0,
+                idempotency_key: Optional[str] = None, received_by: Optional[str] = None) -> Dict:
+        """
+        Receive ``lines`` ([{item_id, quantity}]) against ``po`` (dict with ``items``).
+        Returns {'success', 'status_code', ...}; on success ``response`` is the
+        payload for the caller and ``replayed`` tells whether it was stored earlier.
+        """
+        tenant_id = _tenant_id()
+        po_id = po['id']
+
+        if idempotency_key:
+            replay = self._replay(tenant_id, idempotency_key, po_id)
+            if replay is not None:
+                return replay
+
+        # Validate every line before writing anything
+        items_by_id = {item['id']: item for item in po.get('items') or []}
+        errors = []
+        valid = []
+        for index, line in enumerate(lines or []):
+            item = items_by_id.get(line.get('item_id'))
+            if item is None:
+                errors.append({'type': 'line_not_found', 'line': index, 'item_id': line.get('item_id')})
+                continue
+            try:
+                qty = float(line.get('quantity') or 0)
+            except (TypeError, ValueError):
+                qty = 0.0
+            if qty <= 0:
+                errors.append({'type': 'invalid_quantity', 'line': index, 'item_id': item['id']})
+                continue
+            if not item.get('product_id'):
+                errors.append({'type': 'missing_product', 'line': index, 'item_id': item['id']})
+                continue
+            valid.append((item, qty))
+
+        if not valid and not errors:
+            errors.append({'type': 'no_lines'})
+        if not errors:
+            errors.extend(self._over_receipts(valid))
+        if not errors:
+            errors.extend(self._missing_products({int(item['product_id']) for item, _ in valid}))
+        if errors:
+            return {'success': False, 'status_code': 400, 'error': 'Receipt validation failed', 'errors': errors}
+
+        receipts, movements = self._cost_lines(po, valid, float(landed_costs_total or 0.0))
+        total_qty = sum(r['received_qty'] for r in receipts)
+        total_cost = sum(m['total_cost'] for m in movements)
+
+        # PO status after this receipt, computed without touching the PO yet
+        received = {item_id: float(item.get('received_quantity') or 0) for item_id, item in items_by_id.items()}
+        for r in receipts:
+            received[r['item_id']] += r['received_qty']
+        po_status = po.get('status')
+        if all(received[item_id] >= (item.get('quantity') or 0) for item_id, item in items_by_id.items()):
+            po_status = 'received'
+
+        response = {
+            'message': 'Received',
+            'receipts': receipts,
+            'po_status': po_status,
+            'idempotency_key': idempotency_key
+        }
+
+        try:
+            receipt = GoodsReceipt(
+                po_id=po_id,
+                idempotency_key=idempotency_key or f"PO{po_id}-{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}",
+                warehouse_id=warehouse_id,
+                line_count=len(receipts),
+                total_quantity=total_qty,
+                total_cost_base=round(total_cost, 2),
+                received_by=str(received_by) if received_by is not None else None,
+                tenant_id=tenant_id
+            )
+            db.session.add(receipt)
+            db.session.flush()  # claims the idempotency key
+
+            self._write_inventory(tenant_id, po, receipt, warehouse_id, movements)
+            self._post_journal(tenant_id, po, receipt, receipts, warehouse_id, total_qty, total_cost, response)
+
+            response['receipt_id'] = receipt.id
+            receipt.response_json = json.dumps(response)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if not self._is_idempotency_conflict(e):
+                logger.error(f"Goods receipt for PO {po_id} violates a constraint: {e.orig}")
+                return {'success': False, 'status_code': 400,
+                        'error': 'Receipt references data that does not exist or is not allowed'}
+            if idempotency_key:
+                replay = self._replay(tenant_id, idempotency_key, po_id)
+                if replay is not None:
+                    return replay
+            return {'success': False, 'status_code': 409, 'error': 'Receipt is already being processed'}
+        except JournalPostingError as e:
+            db.session.rollback()
+            logger.error(f"Goods receipt for PO {po_id} rolled back, GR/IR journal failed: {e}")
+            return {'success': False, 'status_code': 500,
+                    'error': 'GR/IR journal could not be posted; nothing was received'}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Goods receipt for PO {po_id} failed: {e}")
+            return {'success': False, 'status_code': 500, 'error': f'Receipt failed: {str(e)}'}
+
+        # Committed: reflect it on the PO lines
+        for r in receipts:
+            items_by_id[r['item_id']]['received_quantity'] = received[r['item_id']]
+        if po_status != po.get('status'):
+            po['status'] = po_status
+            po['updated_at'] = datetime.utcnow().isoformat()
+
+        return {'success': True, 'status_code': 200, 'response': response, 'replayed': False}
+
+    def _replay(self, tenant_id: str, idempotency_key: str, po_id: int) -> Optional[Dict]:
+        existing = GoodsReceipt.query.filter_by(tenant_id=tenant_id, idempotency_key=idempotency_key).first()
+        if existing is None:
+            return None
+        if existing.po_id != po_id:
+            return {'success': False, 'status_code': 409,
+                    'error': f'Idempotency key already used for purchase order {existing.po_id}'}
+        response = json.loads(existing.response_json or '{}')
+        response['replayed'] = True
+        return {'success': True, 'status_code': 200, 'response': response, 'replayed': True}
+
+    @staticmethod
+    def _is_idempotency_conflict(error: IntegrityError) -> bool:
+        """Whether ``error`` is the idempotency key's unique violation (and not e.g. a foreign key)"""
+        constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+        if constraint:
+            return constraint == IDEMPOTENCY_CONSTRAINT
+        # SQLite names the columns instead of the constraint
+        message = str(error.orig)
+        return IDEMPOTENCY_CONSTRAINT in message or 'goods_receipts.idempotency_key' in message
+
+    @staticmethod
+    def _over_receipts(valid) -> List[Dict]:
+        """Lines that would receive more than is still open on their PO line"""
+        requested = {}
+        for item, qty in valid:
+            requested[item['id']] = requested.get(item['id'], 0.0) + qty
+        errors = []
+        for item, _ in valid:
+            if item['id'] not in requested:
+                continue
+            ordered = float(item.get('quantity') or 0)
+            already = float(item.get('received_quantity') or 0)
+            qty = requested.pop(item['id'])
+            if qty > ordered - already + QUANTITY_EPSILON:
+                errors.append({'type': 'over_receipt', 'item_id': item['id'], 'ordered': ordered,
+                               'already_received': already, 'requested': qty,
+                               'remaining': max(ordered - already, 0.0)})
+        return errors
+
+    def _missing_products(self, product_ids) -> List[Dict]:
+        from modules.inventory.models import Product
+        found = {row[0] for row in db.session.query(Product.id).filter(Product.id.in_(product_ids))}
+        return [{'type': 'unknown_product', 'product_id': pid} for pid in sorted(product_ids - found)]
+
+    def _cost_lines(self, po: Dict, valid, landed_total: float):
+        """FX-locked unit cost plus value-proportional landed-cost allocation per line"""
+        base_sum = sum(qty * float(item.get('unit_price_foreign') or 0) for item, qty in valid)
+        receipts = []
+        movements = []
+        for item, qty in valid:
+            line_fx = float(item.get('fx_rate') or po.get('fx_rate') or 1.0)
+            unit_foreign = float(item.get('unit_price_foreign') or 0)
+            allocated = 0.0
+            if landed_total > 0 and base_sum > 0:
+                allocated = landed_total * (qty * unit_foreign) / base_sum
+            unit_base = unit_foreign * line_fx
+            total_base = qty * unit_base + allocated
+
+            receipts.append({
+                'item_id': item['id'],
+                'received_qty': qty,
+                'unit_cost_base': round(unit_base, 4),
+                'fx_rate': line_fx,
+                'allocated_landed_costs': round(allocated, 2),
+                'total_cost_base': round(total_base, 2)
+            })
+            movements.append({
+                'product_id': int(item['product_id']),
+                'quantity': qty,
+                'unit_cost': unit_base,
+                'total_cost': total_base,
+                'fx_rate': line_fx
+            })
+        return receipts, movements
+
+    def _write_inventory(self, tenant_id: str, po: Dict, receipt: GoodsReceipt, warehouse_id: int,
+                         movements: List[Dict]):
+        from modules.inventory.models import BasicInventoryTransaction
+        from modules.inventory.advanced_models import InventoryProduct
+        from modules.inventory.cost_layer_models import InventoryCostLayer
+
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(BasicInventoryTransaction, [{
+            'product_id': m['product_id'],
+            'transaction_type': 'IN',
+            'quantity': m['quantity'],
+            'unit_cost': m['unit_cost'],
+            'total_cost': m['total_cost'],
+            'reference_type': 'PO',
+            'reference_id': po['id'],
+            'warehouse_id': warehouse_id,
+            'notes': f'Goods receipt {receipt.id}',
+            'tenant_id': tenant_id,
+            'created_at': now
+        } for m in movements])
+
+        # Cost layers for products tracked by the costing engine; sequences
+        # continue from each product's last layer in this warehouse
+        product_ids = {m['product_id'] for m in movements}
+        costed = {row[0] for row in db.session.query(InventoryProduct.id).filter(InventoryProduct.id.in_(product_ids))}
+        if not costed:
+            return
+        sequences = dict(db.session.query(
+            InventoryCostLayer.product_id, func.max(InventoryCostLayer.layer_sequence)
+        ).filter(
+            InventoryCostLayer.product_id.in_(costed),
+            InventoryCostLayer.simple_warehouse_id == warehouse_id
+        ).group_by(InventoryCostLayer.product_id).all())
+
+        layers = []
+        today = date.today()
+        for m in movements:
+            if m['product_id'] not in costed:
+                continue
+            sequence = (sequences.get(m['product_id']) or 0) + 1
+            sequences[m['product_id']] = sequence
+            unit_cost = m['total_cost'] / m['quantity']
+            layers.append({
+                'product_id': m['product_id'],
+                'simple_warehouse_id': warehouse_id,
+                'layer_sequence': sequence,
+                'receipt_date': today,
+                'receipt_reference': po.get('po_number') or f"PO-{po['id']}",
+                'unit_cost': unit_cost,
+                'original_quantity': m['quantity'],
+                'remaining_quantity': m['quantity'],
+                'total_cost': m['total_cost'],
+                'remaining_cost': m['total_cost'],
+                'currency': po.get('currency') or 'USD',
+                'exchange_rate': m['fx_rate'],
+                'base_currency_unit_cost': unit_cost,
+                'base_currency_total_cost': m['total_cost'],
+                'is_depleted': False,
+                'source_transaction_id': receipt.id,
+                'source_document_type': 'PO',
+                'created_at': now,
+                'updated_at': now
+            })
+        db.session.bulk_insert_mappings(InventoryCostLayer, layers)
+
+    def _post_journal(self, tenant_id: str, po: Dict, receipt: GoodsReceipt, receipts: List[Dict],
+                      warehouse_id: int, total_qty: float, total_cost: float, response: Dict):
+        """
+        One GR/IR journal for the whole receipt (Dr Inventory / Cr GR/IR Clearing),
+        written in the receipt's transaction; the caller commits. Raises
+        JournalPostingError if it cannot be written.
+        """
+        if self.journal_engine is None:
+            raise JournalPostingError('no journal engine configured')
+        try:
+            result = self.journal_engine.on_inventory_receipt({
+                'tenant_id': tenant_id,
+                'receipt_id': receipt.id,
+                'po_id': po['id'],
+                'po_reference': po.get('po_number') or f"PO-{po['id']}",
+                'item_name': f"{len(receipts)} line(s)",
+                'quantity': total_qty,
+                'total_value': round(total_cost, 2),
+                'warehouse_id': warehouse_id,
+                'currency': po.get('currency'),
+                'fx_rate': po.get('fx_rate'),
+                'receipts': receipts
+            }, commit=False)
+        except Exception as e:
+            raise JournalPostingError(str(e)) from e
+
+        if not (result and result.get('success') and result.get('persisted_to_db')):
+            raise JournalPostingError((result or {}).get('error') or 'journal entry was not persisted')
+        receipt.journal_entry_id = result.get('journal_entry_id')
+        response['journal_entry_id'] = receipt.journal_entry_id
@@ -52,6 +52,10 @@ class PurchaseOrder(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Optimistic locking: bumped on every UPDATE, stale writers get StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
+    
     # Relationships
     vendor = db.relationship('Vendor', backref='purchase_orders')
     items = db.relationship('PurchaseOrderItem', backref='purchase_order', cascade='all, delete-orphan')
@@ -81,6 +85,26 @@ class POAttachment(db.Model):
     uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class GoodsReceipt(db.Model):
+    """One posted PO receipt; the idempotency key makes scanner retries replay instead of re-receiving"""
+    __tablename__ = 'goods_receipts'
+    id = db.Column(db.Integer, primary_key=True)
+    po_id = db.Column(db.Integer, nullable=False, index=True)
+    idempotency_key = db.Column(db.String(100), nullable=False)
+    warehouse_id = db.Column(db.Integer)
+    line_count = db.Column(db.Integer, default=0)
+    total_quantity = db.Column(db.Float, default=0.0)
+    total_cost_base = db.Column(db.Float, default=0.0)
+    journal_entry_id = db.Column(db.String(50))
+    response_json = db.Column(db.Text)  # JSON string of the response returned to the caller
+    received_by = db.Column(db.String(100))
+    tenant_id = db.Column(db.String(50), nullable=False, index=True)  # Company/tenant identifier - company-wide
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'idempotency_key', name='uq_goods_receipt_idempotency'),
+    )
+
 
 class VendorDocument(db.Model):
     __tablename__ = 'vendor_documents'
@@ -0,0 +1,347 @@
+# backend/modules/procurement/rfq_scoring.py
+"""
+RFQ Scoring Engine
+Scores RFQ responses against the weighted criteria in ``RFQ.criteria_json``.
+
+All responses (with vendor KPIs) and all response line items for a batch of
+RFQs are loaded in two queries; every criterion is min-max normalized within
+its RFQ with numpy group reductions, so scoring cost is linear in the number
+of responses and lines regardless of how many RFQs are in the batch.
+
+criteria_json: [{"name": "price", "weight": 60}, {"name": "quality", "weight": 40}]
+Weights may sum to 1 or 100 (they are renormalized). An optional
+``"direction": "min" | "max"`` overrides the criterion's default.
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app import db
+from modules.procurement.models import RFQ, RFQItem, RFQResponseHeader, RFQResponseItem, Vendor
+
+logger = logging.getLogger(__name__)
+
+# criterion -> (response column, default direction); 'min' means lower is better
+CRITERIA = {
+    'price': ('total_price', 'min'),
+    'delivery': ('delivery_days', 'min'),
+    'validity': ('validity_days', 'max'),
+    'quality': ('quality_score', 'max'),
+    'on_time_delivery': ('on_time_delivery_rate', 'max'),
+    'price_variance': ('price_variance_pct', 'min'),
+    'preferred': ('is_preferred', 'max'),
+    'risk': ('risk_score', 'max'),
+}
+
+CRITERION_ALIASES = {
+    'cost': 'price',
+    'total_price': 'price',
+    'lead_time': 'delivery',
+    'delivery_days': 'delivery',
+    'on_time': 'on_time_delivery',
+    'otd': 'on_time_delivery',
+    'preferred_vendor': 'preferred',
+}
+
+# Criteria that have a per-line value for split-award optimization
+LINE_CRITERIA = ('price', 'delivery')
+
+DEFAULT_CRITERIA = [{'name': 'price', 'weight': 0.5}, {'name': 'delivery', 'weight': 0.5}]
+
+RISK_LEVEL_SCORES = {'low': 1.0, 'medium': 0.5, 'high': 0.0}
+
+def parse_criteria(criteria_json: Optional[str]) -> Dict:
+    """
+    Resolve criteria_json into normalized weights.
+    Returns {'criteria': [{name, weight, direction}], 'ignored': [names]}
+    """
+    try:
+        raw = json.loads(criteria_json) if criteria_json else []
+    except (TypeError, ValueError):
+        raw = []
+    if not isinstance(raw, list) or not raw:
+        raw = DEFAULT_CRITERIA
+
+    merged, ignored = {}, []
+    for entry in raw:
+        if not isinstance(entry, dict):
+            continue
+        name = str(entry.get('name', '')).strip().lower()
+        name = CRITERION_ALIASES.get(name, name)
+        try:
+            weight = float(entry.get('weight', 0) or 0)
+        except (TypeError, ValueError):
+            weight = 0.0
+        if name not in CRITERIA:
+            ignored.append(entry.get('name'))
+            continue
+        if weight <= 0:
+            continue
+        direction = entry.get('direction') if entry.get('direction') in ('min', 'max') else CRITERIA[name][1]
+        if name in merged:
+            merged[name]['weight'] += weight
+        else:
+            merged[name] = {'name': name, 'weight': weight, 'direction': direction}
+
+    total = sum(c['weight'] for c in merged.values())
+    if total <= 0:
+        if raw is DEFAULT_CRITERIA:
+            return {'criteria': [], 'ignored': ignored}
+        fallback = parse_criteria(None)
+        fallback['ignored'] = ignored
+        return fallback
+    criteria = [dict(c, weight=c['weight'] / total) for c in merged.values()]
+    return {'criteria': criteria, 'ignored': ignored}
+
+def _group_normalize(values: np.ndarray, groups: np.ndarray, n_groups: int, direction: str) -> np.ndarray:
+    """
+    Min-max normalize ``values`` to [0, 1] within each group (1 = best).
+    Missing values (NaN) score 0; a group where every value is equal scores 1.
+    """
+    present = ~np.isnan(values)
+    group_min = np.full(n_groups, np.inf)
+    group_max = np.full(n_groups, -np.inf)
+    np.minimum.at(group_min, groups[present], values[present])
+    np.maximum.at(group_max, groups[present], values[present])
+
+    lo, hi = group_min[groups], group_max[groups]
+    span = hi - lo
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = np.where(span > 0, (values - lo) / span, 1.0)
+    if direction == 'min':
+        scaled = np.where(span > 0, 1.0 - scaled, 1.0)
+    return np.where(present, scaled, 0.0)
+
+class RFQScoringEngine:
+    """Batch, vectorized RFQ response scoring with split-award optimization"""
+
+    def score(self, rfq_ids: Iterable[int], persist: bool = True) -> Dict[int, Dict]:
+        """
+        Score every response of the given RFQs.
+        Returns {rfq_id: {'criteria', 'ignored_criteria', 'ranking', 'split_award'}}
+        """
+        rfq_ids = sorted({int(r) for r in rfq_ids})
+        if not rfq_ids:
+            return {}
+
+        rfqs = {r.id: r for r in RFQ.query.filter(RFQ.id.in_(rfq_ids)).all()}
+        rfq_ids = [r for r in rfq_ids if r in rfqs]
+        results = {rid: {'rfq_id': rid, 'criteria': [], 'ignored_criteria': [], 'ranking': [],
+                         'split_award': None} for rid in rfq_ids}
+        if not rfq_ids:
+            return results
+
+        responses = self._load_responses(rfq_ids)
+        if not responses['id'].size:
+            for rid in rfq_ids:
+                parsed = parse_criteria(rfqs[rid].criteria_json)
+                results[rid].update(criteria=parsed['criteria'], ignored_criteria=parsed['ignored'])
+            return results
+
+        group_of_rfq = {rid: i for i, rid in enumerate(rfq_ids)}
+        groups = np.array([group_of_rfq[r] for r in responses['rfq_id']], dtype=np.int64)
+        n_groups = len(rfq_ids)
+
+        # Weight matrix (RFQ x criterion): each RFQ carries its own criteria
+        names = list(CRITERIA)
+        weights = np.zeros((n_groups, len(names)))
+        directions = {}
+        for rid, g in group_of_rfq.items():
+            parsed = parse_criteria(rfqs[rid].criteria_json)
+            results[rid].update(criteria=parsed['criteria'], ignored_criteria=parsed['ignored'])
+            for c in parsed['criteria']:
+                weights[g, names.index(c['name'])] = c['weight']
+                directions[(g, c['name'])] = c['direction']
+
+        # Criterion scores (response x criterion), normalized per RFQ
+        scores = np.zeros((len(groups), len(names)))
+        for j, name in enumerate(names):
+            if not weights[:, j].any():
+                continue
+            column = responses[CRITERIA[name][0]]
+            default_dir = CRITERIA[name][1]
+            scores[:, j] = _group_normalize(column, groups, n_groups, default_dir)
+            flipped = np.array([directions.get((g, name), default_dir) != default_dir for g in range(n_groups)])
+            if flipped.any():
+                other_dir = 'max' if default_dir == 'min' else 'min'
+                scores[:, j] = np.where(flipped[groups],
+                                        _group_normalize(column, groups, n_groups, other_dir), scores[:, j])
+
+        contributions = scores * weights[groups]
+        totals = contributions.sum(axis=1) * 100.0
+
+        # Rank within each RFQ: sort by (group, -score, price, id)
+        order = np.lexsort((responses['id'], np.nan_to_num(responses['total_price'], nan=np.inf), -totals, groups))
+        ranks = np.empty(len(order), dtype=np.int64)
+        group_sorted = groups[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(group_sorted)) + 1]
+        position = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        ranks[order] = position + 1
+        leader = {}
+        for i in order[starts]:
+            leader[groups[i]] = i
+
+        group_sizes = np.bincount(groups, minlength=n_groups)
+        updates = []
+        for i in order:
+            g = groups[i]
+            active = [j for j in range(len(names)) if weights[g, j] > 0]
+            criterion_scores = {names[j]: round(float(scores[i, j]), 4) for j in active}
+            entry = {
+                'response_id': int(responses['id'][i]),
+                'vendor_id': int(responses['vendor_id'][i]),
+                'rank': int(ranks[i]),
+                'total_score': round(float(totals[i]), 2),
+                'criterion_scores': criterion_scores,
+                'contributions': {names[j]: round(float(contributions[i, j] * 100), 2) for j in active},
+                'explanation': self._explain(i, leader[g], ranks[i], active, names, contributions,
+                                             totals, int(group_sizes[g]))
+            }
+            results[rfq_ids[g]]['ranking'].append(entry)
+            updates.append({
+                'id': entry['response_id'],
+                'total_score': entry['total_score'],
+                'score_json': json.dumps(criterion_scores)
+            })
+
+        self._split_award(rfq_ids, group_of_rfq, weights, names, responses, scores, results)
+
+        if persist and updates:
+            db.session.bulk_update_mappings(RFQResponseHeader, updates)
+            db.session.commit()
+        return results
+
+    def _load_responses(self, rfq_ids: List[int]) -> Dict[str, np.ndarray]:
+        rows = db.session.query(
+            RFQResponseHeader.id, RFQResponseHeader.rfq_id, RFQResponseHeader.vendor_id,
+            RFQResponseHeader.total_price, RFQResponseHeader.delivery_days, RFQResponseHeader.validity_days,
+            Vendor.quality_score, Vendor.on_time_delivery_rate, Vendor.price_variance_pct,
+            Vendor.is_preferred, Vendor.risk_level
+        ).outerjoin(Vendor, Vendor.id == RFQResponseHeader.vendor_id) \
+         .filter(RFQResponseHeader.rfq_id.in_(rfq_ids)).all()
+
+        def column(index, transform=None):
+            values = [r[index] for r in rows]
+            if transform:
+                values = [transform(v) for v in values]
+            return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+        return {
+            'id': np.array([r[0] for r in rows], dtype=np.int64),
+            'rfq_id': np.array([r[1] for r in rows], dtype=np.int64),
+            'vendor_id': np.array([r[2] or 0 for r in rows], dtype=np.int64),
+            'total_price': column(3),
+            'delivery_days': column(4),
+            'validity_days': column(5),
+            'quality_score': column(6),
+            'on_time_delivery_rate': column(7),
+            'price_variance_pct': column(8, lambda v: abs(v) if v is not None else None),
+            'is_preferred': column(9, lambda v: None if v is None else (1.0 if v else 0.0)),
+            'risk_score': column(10, lambda v: RISK_LEVEL_SCORES.get(str(v).lower()) if v else None),
+        }
+
+    @staticmethod
+    def _explain(i, leader, rank, active, names, contributions, totals, count) -> str:
+        if rank == 1:
+            if not active:
+                return f'Ranked 1 of {count}'
+            best = max(active, key=lambda j: contributions[i, j])
+            return f'Ranked 1 of {count}; strongest on {names[best]}'
+        gap = (totals[leader] - totals[i])
+        deficits = {names[j]: (contributions[leader, j] - contributions[i, j]) * 100 for j in active}
+        behind = sorted((k for k, v in deficits.items() if v > 0.005), key=lambda k: -deficits[k])
+        text = f'Ranked {rank} of {count}, {gap:.2f} points behind the leader'
+        if behind:
+            text += '; mainly on ' + ', '.join(f'{k} (-{deficits[k]:.2f})' for k in behind[:2])
+        return text
+
+    def _split_award(self, rfq_ids, group_of_rfq, weights, names, responses, header_scores, results):
+        """
+        Line-level optimization: each RFQ item goes to the response with the best
+        line score (line price/delivery normalized across the item's quotes, plus
+        the vendor's header score on the remaining criteria).
+        """
+        rows = db.session.query(
+            RFQResponseItem.response_id, RFQResponseItem.rfq_item_id, RFQResponseItem.price,
+            RFQResponseItem.delivery_days, RFQItem.quantity, RFQItem.rfq_id
+        ).join(RFQItem, RFQItem.id == RFQResponseItem.rfq_item_id) \
+         .filter(RFQItem.rfq_id.in_(rfq_ids)).all()
+        if not rows:
+            return
+
+        response_index = {int(rid): i for i, rid in enumerate(responses['id'])}
+        rows = [r for r in rows if r[0] in response_index]
+        if not rows:
+            return
+        resp_idx = np.array([response_index[r[0]] for r in rows], dtype=np.int64)
+        item_ids = np.array([r[1] for r in rows], dtype=np.int64)
+        price = np.array([np.nan if r[2] is None else float(r[2]) for r in rows])
+        header_delivery = responses['delivery_days'][resp_idx]
+        delivery = np.array([np.nan if r[3] is None else float(r[3]) for r in rows])
+        delivery = np.where(np.isnan(delivery), header_delivery, delivery)
+        quantity = np.array([float(r[4] or 1.0) for r in rows])
+        groups = np.array([group_of_rfq[r[5]] for r in rows], dtype=np.int64)
+
+        unique_items, item_group = np.unique(item_ids, return_inverse=True)
+        line_values = {'price': price, 'delivery': delivery}
+        score = np.zeros(len(rows))
+        for name in LINE_CRITERIA:
+            j = names.index(name)
+            w = weights[groups, j]
+            if not w.any():
+                continue
+            score += w * _group_normalize(line_values[name], item_group, len(unique_items), CRITERIA[name][1])
+        for j, name in enumerate(names):
+            if name in LINE_CRITERIA:
+                continue
+            score += weights[groups, j] * header_scores[resp_idx, j]
+        # Lines without a price can't be awarded
+        score = np.where(np.isnan(price), -np.inf, score)
+
+        # Best line per item: sort by (item, -score, price) and take each item's first row
+        order = np.lexsort((np.nan_to_num(price, nan=np.inf), -score, item_group))
+        first = order[np.r_[0, np.flatnonzero(np.diff(item_group[order])) + 1]]
+        first = first[np.isfinite(score[first])]
+
+        extended = np.nan_to_num(price) * quantity
+        for g, rid in enumerate(rfq_ids):
+            picks = first[groups[first] == g]
+            if not picks.size:
+                continue
+            lines = [{
+                'rfq_item_id': int(item_ids[k]),
+                'response_id': int(responses['id'][resp_idx[k]]),
+                'vendor_id': int(responses['vendor_id'][resp_idx[k]]),
+                'unit_price': float(price[k]),
+                'quantity': float(quantity[k]),
+                'extended_price': round(float(extended[k]), 2),
+                'line_score': round(float(score[k]) * 100, 2)
+            } for k in picks]
+            split_total = round(float(extended[picks].sum()), 2)
+
+            # Cheapest single vendor that quoted every awarded item, for comparison
+            in_group = groups == g
+            n_items = picks.size
+            per_response_total = np.bincount(resp_idx[in_group], weights=extended[in_group],
+                                             minlength=len(responses['id']))
+            per_response_lines = np.bincount(resp_idx[in_group & ~np.isnan(price)],
+                                             minlength=len(responses['id']))
+            complete = np.flatnonzero(per_response_lines >= n_items)
+            single = None
+            if complete.size:
+                best = complete[np.argmin(per_response_total[complete])]
+                single = {
+                    'response_id': int(responses['id'][best]),
+                    'vendor_id': int(responses['vendor_id'][best]),
+                    'total': round(float(per_response_total[best]), 2)
+                }
+            results[rid]['split_award'] = {
+                'lines': lines,
+                'total': split_total,
+                'vendors': sorted({line['vendor_id'] for line in lines}),
+                'best_single_vendor': single,
+                'savings_vs_single_vendor': round(single['total'] - split_total, 2) if single else None
+            }
@@ -21,6 +21,8 @@ from modules.procurement.models import (
     Contract,
     ContractDocument,
 )
+from modules.procurement.rfq_scoring import RFQScoringEngine
+from modules.procurement.goods_receipt import GoodsReceiptService
 from modules.finance.models import Account
 from app.audit_logger import AuditLogger, AuditAction
 import os
@@ -761,7 +763,6 @@ def upload_po_attachment(po_id):
 def receive_purchase_order(po_id: int):
     if request.method == 'OPTIONS':
         return ('', 200)
-    from modules.inventory.models import BasicInventoryTransaction
     data = request.get_json() or {}
     po = next((p for p in purchase_orders if p['id'] == po_id), None)
     if not po:
@@ -769,98 +770,32 @@ def receive_purchase_order(po_id: int):
     if po.get('status') == 'rejected':
         return jsonify({'error': 'Cannot receive a rejected PO'}), 400
 
-    lines = data.get('items') or []
-    warehouse_id = int(data.get('warehouse_id') or 1)
-    landed_total = float(data.get('landed_costs_total') or 0.0)
-    # Compute proportional allocation base
-    base_sum = 0.0
-    for l in lines:
-        item = next((it for it in po['items'] if it['id'] == l.get('item_id')), None)
-        if not item:
-            continue
-        qty = float(l.get('quantity') or 0)
-        base_sum += qty * float(item.get('unit_price_foreign') or 0)
-
-    receipts = []
-    gaps = []
-    for l in lines:
-        item = next((it for it in po['items'] if it['id'] == l.get('item_id')), None)
-        if not item:
-            gaps.append({'type': 'line_not_found', 'item_id': l.get('item_id')})
-            continue
-        qty = float(l.get('quantity') or 0)
-        if qty <= 0:
-            continue
-        if not item.get('product_id'):
-            gaps.append({'type': 'missing_product', 'item_id': item['id']})
-            continue
-        # FX locked from item/PO
-        line_fx = float(item.get('fx_rate') or po.get('fx_rate') or 1.0)
-        unit_foreign = float(item.get('unit_price_foreign') or 0)
-        # Landed allocation per unit
-        allocated = 0.0
-        if landed_total > 0 and base_sum > 0:
-            share = (qty * unit_foreign) / base_sum
-            allocated = landed_total * share
-        unit_base = unit_foreign * line_fx
-        total_base = qty * unit_base + allocated
-
-        # Persist inventory transaction (SQLite via SQLAlchemy model)
+    # Scanners resend on timeouts; the key makes the retry replay the first result
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    result = GoodsReceiptService(journal_engine=_auto_journal_engine).receive(
+        po,
+        data.get('items') or [],
+        warehouse_id=int(data.get('warehouse_id') or 1),
+        landed_costs_total=float(data.get('landed_costs_total') or 0.0),
+        idempotency_key=idempotency_key,
+        received_by=data.get('received_by')
+    )
+    if not result['success']:
+        return jsonify({'error': result['error'], 'errors': result.get('errors', [])}), result['status_code']
+
+    response = result['response']
+    if not result['replayed']:
         try:
-            txn = BasicInventoryTransaction(
-                product_id=int(item.get('product_id') or 0),
-                transaction_type='IN',
-                quantity=qty,
-                unit_cost=unit_base,
-                total_cost=total_base,
-                reference_type='PO',
-                reference_id=po_id,
-                warehouse_id=warehouse_id
+            AuditLogger.log(
+                user_id=(data.get('received_by') or 'system'),
+                action=AuditAction.UPDATE,
+                entity_type='purchase_order_receive',
+                entity_id=str(po_id),
+                new_values={'receipts': response['receipts'], 'po_status': response['po_status']}
             )
-            db.session.add(txn)
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            # Fallback: continue without failing entire receipt
-        item['received_quantity'] = float(item.get('received_quantity') or 0) + qty
-        receipts.append({
-            'item_id': item['id'],
-            'received_qty': qty,
-            'unit_cost_base': round(unit_base, 4),
-            'fx_rate': line_fx,
-            'allocated_landed_costs': round(allocated, 2),
-            'total_cost_base': round(total_base, 2)
-        })
-
-    # Auto-close if fully received
-    if all((it.get('received_quantity') or 0) >= (it.get('quantity') or 0) for it in po['items']):
-        po['status'] = 'received'
-        po['updated_at'] = datetime.utcnow().isoformat()
-
-    # Attempt auto-journal in finance (optional)
-    try:
-        if _auto_journal_engine is not None:
-            _auto_journal_engine.on_inventory_receipt({
-                'po_id': po_id,
-                'currency': po.get('currency'),
-                'fx_rate': po.get('fx_rate'),
-                'receipts': receipts
-            })
-    except Exception:
-        # Ignore finance errors but report sync intent
-        gaps.append({'type': 'finance_sync_pending'})
-
-    try:
-        AuditLogger.log(
-            user_id=(data.get('received_by') or 'system'),
-            action=AuditAction.UPDATE,
-            entity_type='purchase_order_receive',
-            entity_id=str(po_id),
-            new_values={'receipts': receipts, 'po_status': po['status']}
-        )
-    except Exception:
-        pass
-    return jsonify({'message': 'Received', 'receipts': receipts, 'po_status': po['status'], 'gaps': gaps}), 200
+        except Exception:
+            pass
+    return jsonify(response), 200
 
 
 # Reporting summary endpoint
@@ -1205,41 +1140,39 @@ def submit_rfq_response(rfq_id: int):
 @require_permission('procurement.rfqs.update')
 
 def score_rfq_responses(rfq_id: int):
-    data = request.get_json() or {}
     rfq = RFQ.query.get(rfq_id)
     if not rfq:
         return jsonify({'error': 'RFQ not found'}), 404
     # criteria_json expected: [{name, weight}] weights sum to 1 or 100
-    import json
     try:
-        criteria = json.loads(rfq.criteria_json or '[]')
-    except Exception:
-        criteria = []
-    responses = RFQResponseHeader.query.filter_by(rfq_id=rfq_id).all()
-    for resp in responses:
-        scores = {}
-        # Example scoring: inverse of total price, lower delivery days better
-        weight_price = next((c['weight'] for c in criteria if c.get('name') == 'price'), 0.5)
-        weight_delivery = next((c['weight'] for c in criteria if c.get('name') == 'delivery'), 0.5)
-        # Normalize across responses
-    
-    totals = [r.total_price or 0 for r in responses] or [1]
-    min_total, max_total = min(totals), max(totals)
-    deliveries = [r.delivery_days or 0 for r in responses] or [0]
-    min_deliv, max_deliv = min(deliveries), max(deliveries)
-    def normalize_inverse(value, min_v, max_v):
-        if max_v == min_v:
-            return 1.0
-        return 1 - ((value - min_v) / (max_v - min_v))
-    import json as _json
-    for resp in responses:
-        price_score = normalize_inverse(resp.total_price or 0, min_total, max_total)
-        delivery_score = normalize_inverse(resp.delivery_days or 0, min_deliv, max_deliv)
-        total_score = (weight_price * price_score) + (weight_delivery * delivery_score)
-        resp.total_score = round(total_score * 100, 2)
-        resp.score_json = _json.dumps({'price': round(price_score, 4), 'delivery': round(delivery_score, 4)})
-    db.session.commit()
-    return jsonify({'responses': [_serialize_response(r) for r in responses]})
+        result = RFQScoringEngine().score([rfq_id])[rfq_id]
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"RFQ scoring failed for {rfq_id}: {e}")
+        return jsonify({'error': 'Failed to score RFQ responses'}), 500
+    responses = RFQResponseHeader.query.filter_by(rfq_id=rfq_id).order_by(RFQResponseHeader.total_score.desc()).all()
+    return jsonify(dict(result, responses=[_serialize_response(r) for r in responses]))
+
+
+@bp.route('/rfqs/score', methods=['POST'])
+@require_permission('procurement.rfqs.update')
+
+def score_rfqs_batch():
+    """Score the responses of many RFQs in one pass"""
+    data = request.get_json() or {}
+    try:
+        rfq_ids = [int(r) for r in (data.get('rfq_ids') or [])]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'rfq_ids must be a list of integers'}), 400
+    if not rfq_ids:
+        return jsonify({'error': 'rfq_ids is required'}), 400
+    try:
+        results = RFQScoringEngine().score(rfq_ids)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Batch RFQ scoring failed: {e}")
+        return jsonify({'error': 'Failed to score RFQ responses'}), 500
+    return jsonify({'rfqs': [results[r] for r in sorted(results)], 'count': len(results)})
 
 
 @bp.route('/rfqs/<int:rfq_id>/award', methods=['POST'])
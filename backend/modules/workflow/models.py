@@ -5,6 +5,7 @@ from sqlalchemy.dialects.postgresql import JSON
 class WorkflowRule(db.Model):
     __tablename__ = 'workflow_rules'
     id = db.Column(db.Integer, primary_key=True)
+    workflow_key = db.Column(db.String(100), index=True)  # Code-defined workflow id backing this rule (runtime)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     trigger_type = db.Column(db.String(50), nullable=False)  # create, update, delete, status_change
@@ -22,6 +23,8 @@ class WorkflowExecution(db.Model):
     __tablename__ = 'workflow_executions'
     id = db.Column(db.Integer, primary_key=True)
     rule_id = db.Column(db.Integer, db.ForeignKey('workflow_rules.id'), nullable=False)
+    workflow_key = db.Column(db.String(100), index=True)  # Code-defined workflow id (runtime instances)
+    current_step = db.Column(db.Integer, default=0)  # Index of the active step in the workflow definition
     trigger_type = db.Column(db.String(50), nullable=False)
     entity_type = db.Column(db.String(50), nullable=False)
     entity_id = db.Column(db.Integer, nullable=False)
@@ -43,6 +46,10 @@ class WorkflowAction(db.Model):
     execution_id = db.Column(db.Integer, db.ForeignKey('workflow_executions.id'), nullable=False)
     action_type = db.Column(db.String(50), nullable=False)  # assign, notify, create, update, etc.
     action_data = db.Column(JSON)  # Data for the action
+    step_id = db.Column(db.String(100))  # Step id in the workflow definition
+    step_index = db.Column(db.Integer)
+    assigned_to = db.Column(db.String(100), index=True)
+    due_date = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     result = db.Column(JSON)  # Result of the action
     error_message = db.Column(db.Text)
@@ -54,6 +61,11 @@ class WorkflowAction(db.Model):
     # Relationships
     execution = db.relationship('WorkflowExecution', backref='actions')
 
+    __table_args__ = (
+        db.Index('idx_workflow_actions_execution_step', 'execution_id', 'step_id'),
+        db.Index('idx_workflow_actions_tenant_status', 'tenant_id', 'status'),
+    )
+
 class WorkflowTemplate(db.Model):
     __tablename__ = 'workflow_templates'
     id = db.Column(db.Integer, primary_key=True)
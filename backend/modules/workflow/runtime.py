@@ -0,0 +1,411 @@
+"""
+Workflow Runtime
+Shared, durable runtime used by the workflow and automation engines.
+
+- Definitions stay in code (identical in every worker); instance and task
+  state lives in ``workflow_executions`` / ``workflow_actions`` so it survives
+  restarts and is visible to every gunicorn worker.
+- Triggers are indexed by type in a dispatch table and their conditions are
+  compiled to closures once, at registration time, so an event only touches
+  the workflows listening for it.
+- Starting a workflow joins the caller's transaction: rows are flushed, the
+  caller commits (or rolls back) them with its own work.
+- Task handlers run on a bounded thread pool (each job in its own app
+  context, submitted once the caller's transaction commits); set
+  WORKFLOW_WORKERS=0 or app.config['WORKFLOW_SYNC_EXECUTION'] to run them
+  inline, e.g. in tests.
+"""
+
+import logging
+import operator
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from modules.workflow.models import WorkflowRule, WorkflowExecution, WorkflowAction
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONDITION COMPILATION
+# ============================================================================
+
+def _contains(actual, expected):
+    return str(expected) in str(actual)
+
+def _is_in(actual, expected):
+    return actual in (expected or ())
+
+CONDITION_OPERATORS = {
+    'equals': operator.eq,
+    'not_equals': operator.ne,
+    'greater_than': operator.gt,
+    'greater_or_equal': operator.ge,
+    'less_than': operator.lt,
+    'less_or_equal': operator.le,
+    'contains': _contains,
+    'in': _is_in,
+}
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+def _always(data: Dict[str, Any]) -> bool:
+    return True
+
+def compile_conditions(conditions: Optional[List[Dict[str, Any]]]) -> Predicate:
+    """
+    Compile ``[{field, operator, value}]`` into a single predicate.
+    Every condition must hold; a missing field or an incomparable value fails
+    the match. Unknown operators are ignored, as before.
+    """
+    checks = tuple(
+        (c.get('field'), CONDITION_OPERATORS[c.get('operator')], c.get('value'))
+        for c in (conditions or [])
+        if c.get('operator') in CONDITION_OPERATORS
+    )
+    if not checks:
+        return _always
+
+    def predicate(data: Dict[str, Any]) -> bool:
+        for field, compare, value in checks:
+            if field not in data:
+                return False
+            try:
+                if not compare(data[field], value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    return predicate
+
+def all_of(*predicates: Predicate) -> Predicate:
+    """Combine predicates, dropping the no-op ones"""
+    active = tuple(p for p in predicates if p is not _always)
+    if not active:
+        return _always
+    if len(active) == 1:
+        return active[0]
+    return lambda data: all(p(data) for p in active)
+
+# ============================================================================
+# TRIGGER DISPATCH
+# ============================================================================
+
+class TriggerDispatchTable:
+    """Trigger type -> [(workflow_id, predicate)] index"""
+
+    def __init__(self):
+        self._by_type: Dict[str, Tuple[Tuple[str, Predicate], ...]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, workflow_id: str, entries: Iterable[Tuple[str, Predicate]]):
+        """Replace all dispatch entries for a workflow"""
+        with self._lock:
+            by_type = {
+                trigger_type: tuple(e for e in items if e[0] != workflow_id)
+                for trigger_type, items in self._by_type.items()
+            }
+            for trigger_type, predicate in entries:
+                by_type[trigger_type] = by_type.get(trigger_type, ()) + ((workflow_id, predicate),)
+            # Swap in a new mapping so readers never need the lock
+            self._by_type = {k: v for k, v in by_type.items() if v}
+
+    def unregister(self, workflow_id: str):
+        self.register(workflow_id, ())
+
+    def trigger_types(self) -> List[str]:
+        return list(self._by_type)
+
+    def match(self, trigger_type: str, data: Dict[str, Any]) -> List[str]:
+        """Workflow ids whose trigger of this type accepts the event (in registration order)"""
+        matched = []
+        for workflow_id, predicate in self._by_type.get(trigger_type, ()):
+            if workflow_id in matched:
+                continue
+            try:
+                if predicate(data):
+                    matched.append(workflow_id)
+            except Exception as e:
+                logger.error(f"Trigger evaluation failed for {workflow_id}: {e}")
+        return matched
+
+# ============================================================================
+# PERSISTENCE
+# ============================================================================
+
+def current_tenant_id() -> str:
+    if has_request_context():
+        return getattr(g, 'tenant_id', None) or getattr(g, 'current_tenant', None) or 'default'
+    return 'default'
+
+def current_user_id() -> Optional[int]:
+    if has_request_context():
+        try:
+            return int(getattr(g, 'current_user_id', None))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+class WorkflowStore:
+    """Workflow instances as WorkflowExecution rows, tasks as WorkflowAction rows"""
+
+    # (tenant_id, workflow_key) -> workflow_rules.id of committed rules; rules are never deleted
+    _rule_ids: Dict[Tuple[str, str], int] = {}
+    _rule_lock = threading.Lock()
+
+    @classmethod
+    def rule_id(cls, workflow_key: str, name: str, tenant_id: str, trigger_type: str = 'manual',
+                entity_type: str = 'workflow', conditions=None, steps=None) -> int:
+        """
+        Get or create the tenant's WorkflowRule row backing a code-defined
+        workflow, in the caller's transaction. The id is cached once that
+        transaction commits, so it can never point at a rolled-back row.
+        """
+        cache_key = (tenant_id, workflow_key)
+        rule_id = cls._rule_ids.get(cache_key)
+        if rule_id is not None:
+            return rule_id
+
+        with cls._rule_lock:
+            rule = WorkflowRule.query.filter_by(tenant_id=tenant_id, workflow_key=workflow_key).first()
+            if not rule:
+                # A savepoint: a failed insert must not poison the caller's transaction
+                with db.session.begin_nested():
+                    rule = WorkflowRule(
+                        workflow_key=workflow_key,
+                        name=name,
+                        trigger_type=trigger_type,
+                        entity_type=entity_type,
+                        conditions=conditions or [],
+                        actions=steps or [],
+                        tenant_id=tenant_id
+                    )
+                    db.session.add(rule)
+            db.session().info.setdefault('workflow_rule_ids', {})[cache_key] = rule.id
+            return rule.id
+
+    @staticmethod
+    def create_instance(rule_id: int, workflow_key: str, trigger_type: str, entity_type: str,
+                        data: Dict[str, Any], tenant_id: str, created_by: int = None) -> WorkflowExecution:
+        execution = WorkflowExecution(
+            rule_id=rule_id,
+            workflow_key=workflow_key,
+            trigger_type=trigger_type,
+            entity_type=entity_type,
+            entity_id=_entity_id(data),
+            trigger_data=data,
+            execution_status='running',
+            current_step=0,
+            tenant_id=tenant_id,
+            created_by=created_by
+        )
+        db.session.add(execution)
+        db.session.flush()
+        return execution
+
+    @staticmethod
+    def create_task(execution: WorkflowExecution, step_index: int, step: Dict[str, Any]) -> WorkflowAction:
+        due_hours = step.get('due_date_hours')
+        task = WorkflowAction(
+            execution_id=execution.id,
+            action_type=step.get('type', 'manual'),
+            action_data=step,
+            step_id=step.get('id'),
+            step_index=step_index,
+            assigned_to=step.get('assigned_to'),
+            due_date=datetime.utcnow() + timedelta(hours=due_hours) if due_hours else None,
+            status='pending',
+            tenant_id=execution.tenant_id,
+            created_by=execution.created_by
+        )
+        db.session.add(task)
+        db.session.flush()
+        return task
+
+    @staticmethod
+    def get_instance(instance_id, lock: bool = False) -> Optional[WorkflowExecution]:
+        try:
+            query = WorkflowExecution.query.filter_by(id=int(instance_id))
+        except (TypeError, ValueError):
+            return None
+        return (query.with_for_update() if lock else query).first()
+
+    @staticmethod
+    def get_task(task_id, lock: bool = False) -> Optional[WorkflowAction]:
+        try:
+            query = WorkflowAction.query.filter_by(id=int(task_id))
+        except (TypeError, ValueError):
+            return None
+        return (query.with_for_update() if lock else query).first()
+
+    @staticmethod
+    def get_open_task(instance_id, step_id: str, lock: bool = False) -> Optional[WorkflowAction]:
+        try:
+            query = WorkflowAction.query.filter_by(execution_id=int(instance_id), step_id=step_id)
+        except (TypeError, ValueError):
+            return None
+        query = query.filter(WorkflowAction.status.in_(('pending', 'in_progress')))
+        return (query.with_for_update() if lock else query).first()
+
+    @staticmethod
+    def list_instances(tenant_id: str = None, status: str = None, namespace: str = None,
+                       limit: int = 100) -> List[WorkflowExecution]:
+        query = WorkflowExecution.query
+        if tenant_id:
+            query = query.filter_by(tenant_id=tenant_id)
+        if status:
+            query = query.filter_by(execution_status=status)
+        if namespace:
+            query = query.filter(WorkflowExecution.workflow_key.like(f"{namespace}.%"))
+        return query.order_by(WorkflowExecution.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def list_tasks(tenant_id: str = None, status: str = None, assigned_to: str = None,
+                   namespace: str = None, limit: int = 100) -> List[WorkflowAction]:
+        query = WorkflowAction.query
+        if namespace:
+            query = query.join(WorkflowExecution, WorkflowAction.execution_id == WorkflowExecution.id) \
+                .filter(WorkflowExecution.workflow_key.like(f"{namespace}.%"))
+        if tenant_id:
+            query = query.filter(WorkflowAction.tenant_id == tenant_id)
+        if status:
+            query = query.filter(WorkflowAction.status == status)
+        if assigned_to:
+            query = query.filter(WorkflowAction.assigned_to == assigned_to)
+        return query.order_by(WorkflowAction.id.desc()).limit(limit).all()
+
+def _entity_id(data: Dict[str, Any]) -> int:
+    for key in ('entity_id', 'document_id', 'id'):
+        try:
+            return int(data[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 0
+
+def qualified_key(namespace: str, workflow_id: str) -> str:
+    """Engine-qualified key, so engines sharing the tables never pick up each other's instances"""
+    return f"{namespace}.{workflow_id}"
+
+def workflow_id_from_key(key: Optional[str]) -> Optional[str]:
+    return key.split('.', 1)[-1] if key else key
+
+def serialize_instance(execution: WorkflowExecution) -> Dict[str, Any]:
+    return {
+        'id': execution.id,
+        'workflow_id': workflow_id_from_key(execution.workflow_key),
+        'status': execution.execution_status,
+        'current_step': execution.current_step,
+        'entity_type': execution.entity_type,
+        'entity_id': execution.entity_id,
+        'started_at': execution.started_at.isoformat() if execution.started_at else None,
+        'completed_at': execution.completed_at.isoformat() if execution.completed_at else None,
+        'error_message': execution.error_message
+    }
+
+def serialize_task(task: WorkflowAction) -> Dict[str, Any]:
+    step = task.action_data or {}
+    return {
+        'id': task.id,
+        'name': step.get('name', task.step_id),
+        'step_id': task.step_id,
+        'status': task.status,
+        'assigned_to': task.assigned_to,
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+        'workflow_instance_id': task.execution_id,
+        'task_type': task.action_type,
+        'result': task.result,
+        'executed_at': task.executed_at.isoformat() if task.executed_at else None
+    }
+
+# ============================================================================
+# TASK EXECUTION
+# ============================================================================
+
+class TaskExecutor:
+    """Bounded worker pool for task handlers; inline when configured synchronous"""
+
+    def __init__(self, max_workers: int = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('WORKFLOW_WORKERS', '4'))
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def is_synchronous(self) -> bool:
+        if self.max_workers <= 0:
+            return True
+        return has_app_context() and bool(current_app.config.get('WORKFLOW_SYNC_EXECUTION'))
+
+    def submit(self, fn: Callable, *args):
+        """
+        Run ``fn(*args)`` after the caller's transaction commits. While
+        db.session holds uncommitted writes the job is parked on the session
+        and handed to the pool from after_commit (dropped on rollback);
+        otherwise it starts at once. Synchronous mode runs it inline.
+        """
+        if self.is_synchronous():
+            fn(*args)
+            return None
+
+        app = current_app._get_current_object()
+        session = db.session()
+        if session.info.get('workflow_writes') or session.new or session.dirty or session.deleted:
+            session.info.setdefault('workflow_jobs', []).append((self, app, fn, args))
+            return None
+        return self._get_pool().submit(self._run_in_app_context, app, fn, args)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='workflow-task')
+        return self._pool
+
+    @staticmethod
+    def _run_in_app_context(app, fn: Callable, args: tuple):
+        with app.app_context():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Workflow task job failed: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+def _after_flush(session, flush_context):
+    session.info['workflow_writes'] = True
+
+# Savepoints fire after_commit/after_rollback too; only the outer transaction counts
+
+def _after_commit(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('workflow_writes', None)
+    WorkflowStore._rule_ids.update(session.info.pop('workflow_rule_ids', {}))
+    for executor, app, fn, args in session.info.pop('workflow_jobs', ()):
+        executor._get_pool().submit(executor._run_in_app_context, app, fn, args)
+
+def _after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('workflow_writes', None)
+    session.info.pop('workflow_rule_ids', None)
+    session.info.pop('workflow_jobs', None)
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
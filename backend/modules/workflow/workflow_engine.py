@@ -2,14 +2,17 @@ from enum import Enum
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Callable
 from dataclasses import dataclass, field
-import json
+import functools
 import logging
-from flask import current_app, g
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON
-from sqlalchemy.ext.declarative import declarative_base
+from app import db
+from modules.workflow.models import WorkflowAction, WorkflowExecution
+from modules.workflow.runtime import (
+    TaskExecutor, TriggerDispatchTable, WorkflowStore, all_of, compile_conditions,
+    current_tenant_id, current_user_id, serialize_instance, serialize_task,
+    qualified_key, workflow_id_from_key
+)
 
 logger = logging.getLogger(__name__)
-Base = declarative_base()
 
 class WorkflowStatus(Enum):
     DRAFT = "draft"
@@ -74,14 +77,21 @@ class TaskInstance:
     result: Dict[str, Any] = field(default_factory=dict)
     comments: List[Dict[str, Any]] = field(default_factory=list)
 
+# Task types whose handler does the work itself; the workflow advances as soon as it succeeds.
+# Approval/manual tasks wait for complete_task().
+AUTO_ADVANCE_TASK_TYPES = {"automated", "notification", "integration"}
+
 class WorkflowEngine:
     """Enterprise workflow engine for business process automation"""
     
-    def __init__(self):
+    namespace = "workflow"
+    
+    def __init__(self, executor: TaskExecutor = None):
         self.workflows: Dict[str, WorkflowDefinition] = {}
-        self.instances: Dict[str, WorkflowInstance] = {}
         self.task_handlers: Dict[str, Callable] = {}
         self.trigger_handlers: Dict[str, Callable] = {}
+        self.dispatch = TriggerDispatchTable()
+        self.executor = executor or TaskExecutor()
         self._register_default_handlers()
     
     def _register_default_handlers(self):
@@ -101,12 +111,31 @@ class WorkflowEngine:
         """Register a new workflow definition"""
         try:
             self.workflows[workflow.id] = workflow
+            self._index_workflow(workflow)
             logger.info(f"Registered workflow: {workflow.name}")
             return True
         except Exception as e:
             logger.error(f"Failed to register workflow: {e}")
             return False
     
+    def _index_workflow(self, workflow: WorkflowDefinition):
+        """(Re)build the dispatch entries for a workflow's triggers"""
+        if workflow.status != WorkflowStatus.ACTIVE:
+            self.dispatch.unregister(workflow.id)
+            return
+        
+        entries = []
+        for trigger in workflow.triggers:
+            trigger_type = trigger.get('type')
+            handler = self.trigger_handlers.get(trigger_type)
+            if handler is None:
+                continue
+            entries.append((trigger_type, all_of(
+                functools.partial(handler, trigger),
+                compile_conditions(trigger.get('conditions'))
+            )))
+        self.dispatch.register(workflow.id, entries)
+    
     def register_task_handler(self, task_type: str, handler: Callable):
         """Register a task handler"""
         self.task_handlers[task_type] = handler
@@ -115,11 +144,18 @@ class WorkflowEngine:
     def register_trigger_handler(self, trigger_type: str, handler: Callable):
         """Register a trigger handler"""
         self.trigger_handlers[trigger_type] = handler
+        for workflow in self.workflows.values():
+            if any(t.get('type') == trigger_type for t in workflow.triggers):
+                self._index_workflow(workflow)
         logger.info(f"Registered trigger handler for: {trigger_type}")
     
     def start_workflow(self, workflow_id: str, variables: Dict[str, Any] = None, 
-                      created_by: str = None) -> Optional[str]:
-        """Start a new workflow instance"""
+                      created_by: str = None, trigger_type: str = 'manual') -> Optional[str]:
+        """
+        Start a new workflow instance in the caller's transaction (flushed in
+        a savepoint; the caller commits). Returns None if it cannot start,
+        leaving the caller's other work untouched.
+        """
         if workflow_id not in self.workflows:
             logger.error(f"Workflow not found: {workflow_id}")
             return None
@@ -130,130 +166,155 @@ class WorkflowEngine:
             return None
         
         try:
-            instance_id = f"{workflow_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-            instance = WorkflowInstance(
-                id=instance_id,
-                workflow_id=workflow_id,
-                status=TaskStatus.PENDING,
-                current_task=workflow.tasks[0]['id'] if workflow.tasks else None,
-                variables=variables or {},
-                created_by=created_by or getattr(g, 'current_user_id', 'system'),
-                tenant_id=getattr(g, 'current_tenant', 'default')
-            )
-            
-            self.instances[instance_id] = instance
-            
-            # Start first task
-            if workflow.tasks:
-                self._start_task(instance_id, workflow.tasks[0]['id'])
+            with db.session.begin_nested():
+                variables = variables or {}
+                tenant_id = current_tenant_id()
+                entity_type = variables.get('document_type') or 'workflow'
+                key = qualified_key(self.namespace, workflow.id)
+                rule_id = WorkflowStore.rule_id(
+                    key, workflow.name, tenant_id,
+                    trigger_type=trigger_type, entity_type=entity_type, steps=workflow.tasks
+                )
+                instance = WorkflowStore.create_instance(
+                    rule_id, key, trigger_type, entity_type, variables, tenant_id,
+                    created_by=_user_id(created_by)
+                )
+                
+                # Start first task
+                task = None
+                if workflow.tasks:
+                    task = WorkflowStore.create_task(instance, 0, workflow.tasks[0])
+                else:
+                    instance.execution_status = TaskStatus.COMPLETED.value
+                    instance.completed_at = datetime.utcnow()
+                
+                if task:
+                    self._dispatch_task(task, commit=False)
             
-            logger.info(f"Started workflow instance: {instance_id}")
-            return instance_id
+            logger.info(f"Started workflow instance: {instance.id}")
+            return str(instance.id)
             
         except Exception as e:
             logger.error(f"Failed to start workflow: {e}")
             return None
     
-    def _start_task(self, instance_id: str, task_id: str) -> bool:
-        """Start a specific task in a workflow instance"""
-        if instance_id not in self.instances:
-            return False
+    def _dispatch_task(self, task: WorkflowAction, commit: bool = True):
+        """
+        Hand a freshly created task to its handler; with ``commit=False``
+        (inside the caller's transaction) handlers run inline only flush
+        """
+        task_type = task.action_type
+        if task_type not in self.task_handlers:
+            # Manual task - wait for user action
+            return
         
-        instance = self.instances[instance_id]
-        workflow = self.workflows[instance.workflow_id]
-        
-        # Find task definition
-        task_def = next((t for t in workflow.tasks if t['id'] == task_id), None)
-        if not task_def:
-            return False
+        if task_type not in AUTO_ADVANCE_TASK_TYPES:
+            self._run_task(task.id, advance=False, commit=commit)
+        elif self.executor.is_synchronous():
+            self._run_task(task.id, commit=commit)
+        else:
+            self.executor.submit(self._run_task, task.id)
+    
+    def _run_task(self, task_id: int, advance: bool = True, commit: bool = True):
+        """Execute a task's handler; completes the task and advances the instance when ``advance``"""
+        task = WorkflowStore.get_task(task_id, lock=True)
+        if not task or task.status != TaskStatus.PENDING.value:
+            if commit:
+                db.session.rollback()
+            return
         
+        instance = task.execution
         try:
-            # Create task instance
-            task_instance = TaskInstance(
-                id=f"{instance_id}_{task_id}",
-                workflow_instance_id=instance_id,
-                task_id=task_id,
-                status=TaskStatus.IN_PROGRESS,
-                started_at=datetime.utcnow()
-            )
-            
-            # Handle task based on type
-            task_type = task_def.get('type', 'manual')
-            if task_type in self.task_handlers:
-                result = self.task_handlers[task_type](task_instance, instance, task_def)
-                if result:
-                    task_instance.status = TaskStatus.COMPLETED
-                    task_instance.result = result
-                else:
-                    task_instance.status = TaskStatus.FAILED
-            else:
-                # Manual task - wait for user action
-                task_instance.status = TaskStatus.PENDING
-            
-            # Store task instance
-            instance.current_task = task_id
-            
-            logger.info(f"Started task: {task_id} in instance: {instance_id}")
-            return True
-            
+            result = self.task_handlers[task.action_type](task, instance, task.action_data or {})
+            error = None
         except Exception as e:
-            logger.error(f"Failed to start task: {e}")
-            return False
+            result, error = None, str(e)
+        
+        next_task = None
+        if not advance:
+            # Waiting on a user; keep the handler output (e.g. approvers) on the task
+            task.result = result
+        elif result:
+            next_task = self._advance(task, result)
+        else:
+            task.status = TaskStatus.FAILED.value
+            task.error_message = error
+            task.executed_at = datetime.utcnow()
+            instance.execution_status = TaskStatus.FAILED.value
+            instance.error_message = error or f"Task {task.step_id} returned no result"
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+        
+        if next_task:
+            self._dispatch_task(next_task, commit=commit)
+        logger.info(f"Ran task: {task.step_id} in instance: {task.execution_id}")
+    
+    def _advance(self, task: WorkflowAction, result: Dict[str, Any]) -> Optional[WorkflowAction]:
+        """Complete ``task`` and create the next one (None when the workflow is finished)"""
+        instance = WorkflowStore.get_instance(task.execution_id, lock=True)
+        workflow = self.workflows.get(workflow_id_from_key(instance.workflow_key))
+        
+        task.status = TaskStatus.COMPLETED.value
+        task.result = result or {}
+        task.executed_at = datetime.utcnow()
+        
+        next_index = (task.step_index or 0) + 1
+        if workflow and next_index < len(workflow.tasks):
+            instance.current_step = next_index
+            return WorkflowStore.create_task(instance, next_index, workflow.tasks[next_index])
+        
+        # Workflow completed
+        instance.execution_status = TaskStatus.COMPLETED.value
+        instance.completed_at = datetime.utcnow()
+        return None
     
     def complete_task(self, instance_id: str, task_id: str, result: Dict[str, Any] = None) -> bool:
         """Complete a task and move to next"""
-        if instance_id not in self.instances:
+        try:
+            task = WorkflowStore.get_open_task(instance_id, task_id, lock=True)
+            if not task or task.tenant_id != current_tenant_id():
+                db.session.rollback()
+                return False
+            
+            next_task = self._advance(task, result)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to complete task: {e}")
             return False
         
-        instance = self.instances[instance_id]
-        workflow = self.workflows[instance.workflow_id]
-        
-        # Update task status
-        task_instance = TaskInstance(
-            id=f"{instance_id}_{task_id}",
-            workflow_instance_id=instance_id,
-            task_id=task_id,
-            status=TaskStatus.COMPLETED,
-            completed_at=datetime.utcnow(),
-            result=result or {}
-        )
-        
-        # Find next task
-        current_task_index = next((i for i, t in enumerate(workflow.tasks) if t['id'] == task_id), -1)
-        if current_task_index >= 0 and current_task_index + 1 < len(workflow.tasks):
-            next_task = workflow.tasks[current_task_index + 1]
-            self._start_task(instance_id, next_task['id'])
-        else:
-            # Workflow completed
-            instance.status = TaskStatus.COMPLETED
-            instance.completed_at = datetime.utcnow()
+        if next_task:
+            self._dispatch_task(next_task)
         
         logger.info(f"Completed task: {task_id} in instance: {instance_id}")
         return True
     
+    def get_instance(self, instance_id: str) -> Optional[Dict[str, Any]]:
+        """Instance with its tasks, for the current tenant"""
+        instance = WorkflowStore.get_instance(instance_id)
+        if not instance or instance.tenant_id != current_tenant_id() \
+                or not (instance.workflow_key or '').startswith(f"{self.namespace}."):
+            return None
+        data = serialize_instance(instance)
+        data['tasks'] = [serialize_task(t) for t in sorted(instance.actions, key=lambda t: t.id)]
+        return data
+    
     def trigger_workflow(self, trigger_type: str, data: Dict[str, Any]) -> List[str]:
         """Trigger workflows based on events"""
         triggered_instances = []
         
-        for workflow_id, workflow in self.workflows.items():
-            if workflow.status != WorkflowStatus.ACTIVE:
-                continue
-            
-            # Check if workflow should be triggered
-            for trigger in workflow.triggers:
-                if trigger.get('type') == trigger_type:
-                    if trigger_type in self.trigger_handlers:
-                        should_trigger = self.trigger_handlers[trigger_type](trigger, data)
-                        if should_trigger:
-                            instance_id = self.start_workflow(workflow_id, data)
-                            if instance_id:
-                                triggered_instances.append(instance_id)
+        for workflow_id in self.dispatch.match(trigger_type, data):
+            instance_id = self.start_workflow(workflow_id, data, trigger_type=trigger_type)
+            if instance_id:
+                triggered_instances.append(instance_id)
         
         return triggered_instances
     
     # Default task handlers
-    def _handle_approval_task(self, task_instance: TaskInstance, 
-                            workflow_instance: WorkflowInstance, 
+    def _handle_approval_task(self, task_instance: WorkflowAction, 
+                            workflow_instance: WorkflowExecution, 
                             task_def: Dict[str, Any]) -> Dict[str, Any]:
         """Handle approval tasks"""
         # In a real implementation, this would create approval requests
@@ -263,8 +324,8 @@ class WorkflowEngine:
             "message": task_def.get("message", "Approval required")
         }
     
-    def _handle_notification_task(self, task_instance: TaskInstance,
-                                workflow_instance: WorkflowInstance,
+    def _handle_notification_task(self, task_instance: WorkflowAction,
+                                workflow_instance: WorkflowExecution,
                                 task_def: Dict[str, Any]) -> Dict[str, Any]:
         """Handle notification tasks"""
         # In a real implementation, this would send notifications
@@ -274,8 +335,8 @@ class WorkflowEngine:
             "message": task_def.get("message", "Notification sent")
         }
     
-    def _handle_integration_task(self, task_instance: TaskInstance,
-                               workflow_instance: WorkflowInstance,
+    def _handle_integration_task(self, task_instance: WorkflowAction,
+                               workflow_instance: WorkflowExecution,
                                task_def: Dict[str, Any]) -> Dict[str, Any]:
         """Handle integration tasks"""
         # In a real implementation, this would call external APIs
@@ -285,8 +346,8 @@ class WorkflowEngine:
             "result": "Integration successful"
         }
     
-    def _handle_automated_task(self, task_instance: TaskInstance,
-                             workflow_instance: WorkflowInstance,
+    def _handle_automated_task(self, task_instance: WorkflowAction,
+                             workflow_instance: WorkflowExecution,
                              task_def: Dict[str, Any]) -> Dict[str, Any]:
         """Handle automated tasks"""
         # In a real implementation, this would execute business logic
@@ -311,6 +372,12 @@ class WorkflowEngine:
         """Handle user action triggers"""
         return data.get("action") == trigger.get("action")
 
+def _user_id(created_by) -> Optional[int]:
+    try:
+        return int(created_by)
+    except (TypeError, ValueError):
+        return current_user_id()
+
 # Predefined workflows
 def create_invoice_approval_workflow() -> WorkflowDefinition:
     """Create invoice approval workflow"""
@@ -1,15 +1,34 @@
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from decimal import Decimal
-import json
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy import or_
+
+from app import db
+from modules.workflow.runtime import current_tenant_id
+from modules.workflows.models import ApprovalRequest, ApprovalHistory
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one bulk approve/reject call (one transaction)
+MAX_BULK_ITEMS = 1000
+
+# Mock user roles - replace with actual user role system
+USER_APPROVAL_ROLES = {
+    'manager': frozenset(['manager', 'finance_manager', 'director', 'controller']),
+    'finance_manager': frozenset(['finance_manager', 'director', 'controller']),
+    'director': frozenset(['director']),
+    'controller': frozenset(['controller']),
+    'supervisor': frozenset(['supervisor', 'inventory_manager']),
+    'inventory_manager': frozenset(['inventory_manager']),
+    'accountant': frozenset(['accountant', 'controller']),
+    'finance': frozenset(['finance', 'controller'])
+}
 
 class ApprovalWorkflow:
     """Comprehensive Approval Workflow Engine for Critical Transactions"""
     
     def __init__(self):
-        self.workflows = []
-        self.approval_history = []
-        
         # Workflow templates
         self.workflow_templates = {
             'purchase_order': {
@@ -167,49 +186,50 @@ class ApprovalWorkflow:
             amount = workflow_data['amount']
             required_stages = self._determine_required_stages(template, amount)
             
-            # Create workflow
-            workflow_id = f"WF-{workflow_type.upper()}-{datetime.now().strftime('%Y%m%d')}-{len(self.workflows) + 1:03d}"
-            
-            workflow = {
-                'id': workflow_id,
-                'type': workflow_type,
-                'name': template['name'],
-                'description': template['description'],
-                'reference_id': workflow_data['reference_id'],
-                'reference_type': workflow_data.get('reference_type', workflow_type),
-                'amount': amount,
-                'currency': workflow_data.get('currency', 'USD'),
-                'initiator': workflow_data['initiator'],
-                'initiated_date': datetime.now(),
-                'status': 'pending',
-                'current_stage': 1,
-                'total_stages': len(required_stages),
-                'stages': required_stages,
-                'approval_history': [],
-                'metadata': workflow_data.get('metadata', {}),
-                'timeout_date': self._calculate_timeout_date(required_stages[0]['timeout_hours']),
-                'escalated': False,
-                'escalated_to': None,
-                'escalated_date': None
-            }
-            
-            self.workflows.append(workflow)
+            now = datetime.now()
+            workflow = ApprovalRequest(
+                workflow_type=workflow_type,
+                name=template['name'],
+                description=template['description'],
+                reference_id=str(workflow_data['reference_id']),
+                reference_type=workflow_data.get('reference_type', workflow_type),
+                amount=amount,
+                currency=workflow_data.get('currency', 'USD'),
+                initiator=workflow_data['initiator'],
+                initiated_date=now,
+                status='pending',
+                current_stage=1,
+                total_stages=len(required_stages),
+                stages=required_stages,
+                current_role=required_stages[0]['role'],
+                timeout_date=self._calculate_timeout_date(required_stages[0]['timeout_hours']),
+                escalated=False,
+                extra_data=workflow_data.get('metadata', {}),
+                tenant_id=current_tenant_id()
+            )
+            db.session.add(workflow)
+            db.session.flush()
+            
+            # Sequence comes from the primary key so concurrent creators never collide
+            workflow.workflow_id = f"WF-{workflow_type.upper()}-{now.strftime('%Y%m%d')}-{workflow.id:03d}"
             
             # Create initial approval history entry
-            self._create_approval_history_entry(workflow_id, 'initiated', workflow_data['initiator'], {
+            db.session.add(self._history_entry(workflow, 'initiated', workflow_data['initiator'], now, data={
                 'amount': amount,
-                'currency': workflow.get('currency', 'USD'),
+                'currency': workflow.currency,
                 'notes': workflow_data.get('notes', '')
-            })
+            }))
+            db.session.commit()
             
             return {
                 'success': True,
-                'workflow_id': workflow_id,
-                'workflow': workflow,
+                'workflow_id': workflow.workflow_id,
+                'workflow': self._serialize(workflow),
                 'message': f'Approval workflow created successfully. Awaiting {required_stages[0]["name"]}'
             }
             
         except Exception as e:
+            db.session.rollback()
             return {
                 'success': False,
                 'error': f'Error creating workflow: {str(e)}'
@@ -220,84 +240,24 @@ class ApprovalWorkflow:
         Approve a workflow at current stage
         """
         try:
-            workflow = self._get_workflow_by_id(workflow_id)
+            workflow = self._get_workflow_by_id(workflow_id, lock=True)
             if not workflow:
                 return {
                     'success': False,
                     'error': 'Workflow not found'
                 }
             
-            if workflow['status'] != 'pending':
-                return {
-                    'success': False,
-                    'error': f'Workflow is not pending (current status: {workflow["status"]})'
-                }
+            result, history = self._apply_approval(workflow, approver, self._approver_roles(approver), notes, datetime.now())
+            if not result['success']:
+                db.session.rollback()
+                return result
             
-            current_stage = workflow['current_stage']
-            stage_info = workflow['stages'][current_stage - 1]
-            
-            # Check if approver has permission for this stage
-            if not self._can_approve_stage(approver, stage_info):
-                return {
-                    'success': False,
-                    'error': f'User {approver} does not have permission to approve this stage'
-                }
-            
-            # Check if workflow has timed out
-            if datetime.now() > workflow['timeout_date']:
-                return {
-                    'success': False,
-                    'error': 'Workflow has timed out and needs to be escalated'
-                }
-            
-            # Record approval
-            approval_entry = {
-                'stage': current_stage,
-                'stage_name': stage_info['name'],
-                'approver': approver,
-                'action': 'approved',
-                'date': datetime.now(),
-                'notes': notes
-            }
-            
-            workflow['approval_history'].append(approval_entry)
-            
-            # Check if this is the final stage
-            if current_stage >= workflow['total_stages']:
-                # Workflow completed
-                workflow['status'] = 'approved'
-                workflow['completed_date'] = datetime.now()
-                
-                # Create final approval history entry
-                self._create_approval_history_entry(workflow_id, 'completed', approver, {
-                    'final_approver': approver,
-                    'notes': notes
-                })
-                
-                # Execute the approved action
-                self._execute_approved_action(workflow)
-                
-                return {
-                    'success': True,
-                    'workflow_id': workflow_id,
-                    'status': 'approved',
-                    'message': 'Workflow approved and completed successfully'
-                }
-            else:
-                # Move to next stage
-                workflow['current_stage'] = current_stage + 1
-                next_stage = workflow['stages'][current_stage]
-                workflow['timeout_date'] = self._calculate_timeout_date(next_stage['timeout_hours'])
-                
-                return {
-                    'success': True,
-                    'workflow_id': workflow_id,
-                    'status': 'pending',
-                    'next_stage': next_stage['name'],
-                    'message': f'Stage {current_stage} approved. Awaiting {next_stage["name"]}'
-                }
+            db.session.add_all(history)
+            db.session.commit()
+            return result
             
         except Exception as e:
+            db.session.rollback()
             return {
                 'success': False,
                 'error': f'Error approving workflow: {str(e)}'
@@ -308,61 +268,104 @@ class ApprovalWorkflow:
         Reject a workflow
         """
         try:
-            workflow = self._get_workflow_by_id(workflow_id)
+            workflow = self._get_workflow_by_id(workflow_id, lock=True)
             if not workflow:
                 return {
                     'success': False,
                     'error': 'Workflow not found'
                 }
             
-            if workflow['status'] != 'pending':
-                return {
-                    'success': False,
-                    'error': f'Workflow is not pending (current status: {workflow["status"]})'
-                }
+            result, history = self._apply_rejection(workflow, rejector, self._approver_roles(rejector), reason, datetime.now())
+            if not result['success']:
+                db.session.rollback()
+                return result
             
-            current_stage = workflow['current_stage']
-            stage_info = workflow['stages'][current_stage - 1]
+            db.session.add_all(history)
+            db.session.commit()
+            return result
             
-            # Check if rejector has permission for this stage
-            if not self._can_approve_stage(rejector, stage_info):
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'error': f'Error rejecting workflow: {str(e)}'
+            }
+    
+    def bulk_action(self, workflow_ids: List[str], user: str, action: str, notes: str = '',
+                    all_or_nothing: bool = False) -> Dict:
+        """
+        Approve or reject many workflows in one transaction.
+        Every item is validated exactly as the single-item call would; items that fail
+        are reported and skipped (or abort the whole batch when ``all_or_nothing``).
+        """
+        if action not in ('approve', 'reject'):
+            return {
+                'success': False,
+                'error': f'Invalid bulk action: {action}'
+            }
+        
+        workflow_ids = list(dict.fromkeys(workflow_ids or []))
+        if not workflow_ids:
+            return {
+                'success': False,
+                'error': 'No workflow ids supplied'
+            }
+        if len(workflow_ids) > MAX_BULK_ITEMS:
+            return {
+                'success': False,
+                'error': f'Too many workflows in one request (max {MAX_BULK_ITEMS})'
+            }
+        
+        try:
+            rows = ApprovalRequest.query.filter(
+                ApprovalRequest.tenant_id == current_tenant_id(),
+                ApprovalRequest.workflow_id.in_(workflow_ids)
+            ).order_by(ApprovalRequest.id).with_for_update().all()
+            by_id = {w.workflow_id: w for w in rows}
+            
+            roles = self._approver_roles(user)
+            now = datetime.now()
+            apply = self._apply_approval if action == 'approve' else self._apply_rejection
+            
+            results, errors, history = [], [], []
+            for workflow_id in workflow_ids:
+                workflow = by_id.get(workflow_id)
+                if not workflow:
+                    errors.append({'workflow_id': workflow_id, 'error': 'Workflow not found'})
+                    continue
+                result, entries = apply(workflow, user, roles, notes, now)
+                if result['success']:
+                    results.append(result)
+                    history.extend(entries)
+                else:
+                    errors.append({'workflow_id': workflow_id, 'error': result['error']})
+            
+            if errors and all_or_nothing:
+                db.session.rollback()
                 return {
                     'success': False,
-                    'error': f'User {rejector} does not have permission to reject this stage'
+                    'processed': 0,
+                    'errors': errors,
+                    'error': f'{len(errors)} workflow(s) failed validation; nothing was changed'
                 }
             
-            # Record rejection
-            rejection_entry = {
-                'stage': current_stage,
-                'stage_name': stage_info['name'],
-                'rejector': rejector,
-                'action': 'rejected',
-                'date': datetime.now(),
-                'reason': reason
-            }
-            
-            workflow['approval_history'].append(rejection_entry)
-            workflow['status'] = 'rejected'
-            workflow['rejected_date'] = datetime.now()
-            workflow['rejection_reason'] = reason
-            
-            # Create rejection history entry
-            self._create_approval_history_entry(workflow_id, 'rejected', rejector, {
-                'reason': reason,
-                'stage': current_stage
-            })
+            if history:
+                db.session.bulk_insert_mappings(ApprovalHistory, [self._history_mapping(h) for h in history])
+            db.session.commit()
             
             return {
                 'success': True,
-                'workflow_id': workflow_id,
-                'status': 'rejected',
-                'message': 'Workflow rejected successfully'
+                'processed': len(results),
+                'failed': len(errors),
+                'results': results,
+                'errors': errors
             }
             
         except Exception as e:
+            db.session.rollback()
             return {
                 'success': False,
-                'error': f'Error rejecting workflow: {str(e)}'
+                'error': f'Error processing bulk {action}: {str(e)}'
             }
     
     def escalate_workflow(self, workflow_id: str, escalator: str, escalated_to: str, reason: str) -> Dict:
@@ -370,21 +373,21 @@ class ApprovalWorkflow:
         Escalate a workflow to a higher authority
         """
         try:
-            workflow = self._get_workflow_by_id(workflow_id)
+            workflow = self._get_workflow_by_id(workflow_id, lock=True)
             if not workflow:
                 return {
                     'success': False,
                     'error': 'Workflow not found'
                 }
             
-            if workflow['status'] != 'pending':
+            if workflow.status != 'pending':
                 return {
                     'success': False,
-                    'error': f'Workflow is not pending (current status: {workflow["status"]})'
+                    'error': f'Workflow is not pending (current status: {workflow.status})'
                 }
             
-            current_stage = workflow['current_stage']
-            stage_info = workflow['stages'][current_stage - 1]
+            current_stage = workflow.current_stage
+            stage_info = workflow.stages[current_stage - 1]
             
             # Check if escalation is allowed for this stage
             if not stage_info.get('can_escalate', False):
@@ -393,28 +396,20 @@ class ApprovalWorkflow:
                     'error': 'Escalation is not allowed for this stage'
                 }
             
-            # Record escalation
-            escalation_entry = {
-                'stage': current_stage,
-                'stage_name': stage_info['name'],
-                'escalator': escalator,
-                'action': 'escalated',
-                'date': datetime.now(),
-                'escalated_to': escalated_to,
-                'reason': reason
-            }
-            
-            workflow['approval_history'].append(escalation_entry)
-            workflow['escalated'] = True
-            workflow['escalated_to'] = escalated_to
-            workflow['escalated_date'] = datetime.now()
+            now = datetime.now()
+            workflow.escalated = True
+            workflow.escalated_to = escalated_to
+            workflow.escalated_date = now
+            # The escalation target gets the stage's full time to act
+            workflow.timeout_date = self._calculate_timeout_date(stage_info['timeout_hours'])
             
-            # Create escalation history entry
-            self._create_approval_history_entry(workflow_id, 'escalated', escalator, {
+            # Record escalation
+            db.session.add(self._history_entry(workflow, 'escalated', escalator, now, notes=reason, stage_info=stage_info, data={
                 'escalated_to': escalated_to,
                 'reason': reason,
                 'stage': current_stage
-            })
+            }))
+            db.session.commit()
             
             return {
                 'success': True,
@@ -425,66 +420,166 @@ class ApprovalWorkflow:
             }
             
         except Exception as e:
+            db.session.rollback()
             return {
                 'success': False,
                 'error': f'Error escalating workflow: {str(e)}'
             }
     
-    def get_workflows(self, filters: Dict = None) -> List[Dict]:
+    def get_workflows(self, filters: Dict = None, limit: int = 500) -> List[Dict]:
         """
         Get workflows with optional filtering
         """
-        workflows = self.workflows
+        query = ApprovalRequest.query.filter_by(tenant_id=current_tenant_id())
         
         if filters:
             if 'status' in filters:
-                workflows = [w for w in workflows if w['status'] == filters['status']]
+                query = query.filter(ApprovalRequest.status == filters['status'])
             
             if 'type' in filters:
-                workflows = [w for w in workflows if w['type'] == filters['type']]
+                query = query.filter(ApprovalRequest.workflow_type == filters['type'])
             
             if 'initiator' in filters:
-                workflows = [w for w in workflows if w['initiator'] == filters['initiator']]
+                query = query.filter(ApprovalRequest.initiator == filters['initiator'])
             
             if 'date_from' in filters:
-                workflows = [w for w in workflows if w['initiated_date'] >= filters['date_from']]
+                query = query.filter(ApprovalRequest.initiated_date >= filters['date_from'])
             
             if 'date_to' in filters:
-                workflows = [w for w in workflows if w['initiated_date'] <= filters['date_to']]
+                query = query.filter(ApprovalRequest.initiated_date <= filters['date_to'])
         
-        return sorted(workflows, key=lambda x: x['initiated_date'], reverse=True)
+        workflows = query.order_by(ApprovalRequest.initiated_date.desc()).limit(limit).all()
+        return [self._serialize(w, include_history=False) for w in workflows]
     
-    def get_pending_approvals(self, user: str) -> List[Dict]:
+    def get_pending_approvals(self, user: str, limit: int = 500) -> List[Dict]:
         """
         Get pending approvals for a specific user
         """
-        pending_workflows = []
+        # Resolve the user's roles once; the inbox is then one indexed lookup
+        # on (tenant_id, status, current_role) plus escalations addressed to the user
+        roles = self._approver_roles(user)
+        inbox_keys = [ApprovalRequest.escalated_to == user]
+        if roles:
+            inbox_keys.append(ApprovalRequest.current_role.in_(roles))
         
-        for workflow in self.workflows:
-            if workflow['status'] == 'pending':
-                current_stage = workflow['current_stage']
-                stage_info = workflow['stages'][current_stage - 1]
-                
-                # Check if user can approve this stage
-                if self._can_approve_stage(user, stage_info):
-                    pending_workflows.append(workflow)
+        pending_workflows = ApprovalRequest.query.filter(
+            ApprovalRequest.tenant_id == current_tenant_id(),
+            ApprovalRequest.status == 'pending',
+            or_(*inbox_keys)
+        ).order_by(ApprovalRequest.timeout_date).limit(limit).all()
         
-        return pending_workflows
+        return [self._serialize(w, include_history=False) for w in pending_workflows]
     
     def get_workflow_by_id(self, workflow_id: str) -> Optional[Dict]:
         """
         Get specific workflow by ID
         """
-        return self._get_workflow_by_id(workflow_id)
+        workflow = self._get_workflow_by_id(workflow_id)
+        return self._serialize(workflow) if workflow else None
     
-    def _get_workflow_by_id(self, workflow_id: str) -> Optional[Dict]:
+    def _get_workflow_by_id(self, workflow_id: str, lock: bool = False) -> Optional[ApprovalRequest]:
         """
         Internal method to find workflow by ID
         """
-        for workflow in self.workflows:
-            if workflow['id'] == workflow_id:
-                return workflow
-        return None
+        query = ApprovalRequest.query.filter_by(tenant_id=current_tenant_id(), workflow_id=workflow_id)
+        return (query.with_for_update() if lock else query).first()
+    
+    def _apply_approval(self, workflow: ApprovalRequest, approver: str, roles: Set[str],
+                        notes: str, now: datetime) -> Tuple[Dict, List[ApprovalHistory]]:
+        """
+        Validate and apply one approval in the current session (no commit)
+        """
+        if workflow.status != 'pending':
+            return self._failure(f'Workflow is not pending (current status: {workflow.status})'), []
+        
+        current_stage = workflow.current_stage
+        stage_info = workflow.stages[current_stage - 1]
+        
+        # Check if approver has permission for this stage
+        if not self._can_act_on(workflow, approver, roles):
+            return self._failure(f'User {approver} does not have permission to approve this stage'), []
+        
+        # Check if workflow has timed out
+        if workflow.timeout_date and now > workflow.timeout_date:
+            return self._failure('Workflow has timed out and needs to be escalated'), []
+        
+        # Record approval
+        history = [self._history_entry(workflow, 'approved', approver, now, notes=notes, stage_info=stage_info)]
+        
+        # Check if this is the final stage
+        if current_stage >= workflow.total_stages:
+            # Workflow completed
+            workflow.status = 'approved'
+            workflow.completed_date = now
+            workflow.current_role = None
+            
+            history.append(self._history_entry(workflow, 'completed', approver, now, data={
+                'final_approver': approver,
+                'notes': notes
+            }))
+            
+            # Execute the approved action
+            self._execute_approved_action(workflow)
+            
+            return {
+                'success': True,
+                'workflow_id': workflow.workflow_id,
+                'status': 'approved',
+                'message': 'Workflow approved and completed successfully'
+            }, history
+        
+        # Move to next stage
+        next_stage = workflow.stages[current_stage]
+        workflow.current_stage = current_stage + 1
+        workflow.current_role = next_stage['role']
+        workflow.timeout_date = self._calculate_timeout_date(next_stage['timeout_hours'])
+        # An escalation targets a single stage
+        workflow.escalated_to = None
+        
+        return {
+            'success': True,
+            'workflow_id': workflow.workflow_id,
+            'status': 'pending',
+            'next_stage': next_stage['name'],
+            'message': f'Stage {current_stage} approved. Awaiting {next_stage["name"]}'
+        }, history
+    
+    def _apply_rejection(self, workflow: ApprovalRequest, rejector: str, roles: Set[str],
+                         reason: str, now: datetime) -> Tuple[Dict, List[ApprovalHistory]]:
+        """
+        Validate and apply one rejection in the current session (no commit)
+        """
+        if workflow.status != 'pending':
+            return self._failure(f'Workflow is not pending (current status: {workflow.status})'), []
+        
+        current_stage = workflow.current_stage
+        stage_info = workflow.stages[current_stage - 1]
+        
+        # Check if rejector has permission for this stage
+        if not self._can_act_on(workflow, rejector, roles):
+            return self._failure(f'User {rejector} does not have permission to reject this stage'), []
+        
+        workflow.status = 'rejected'
+        workflow.rejected_date = now
+        workflow.rejection_reason = reason
+        workflow.current_role = None
+        
+        history = [self._history_entry(workflow, 'rejected', rejector, now, notes=reason, stage_info=stage_info,
+                                       data={'reason': reason, 'stage': current_stage})]
+        
+        return {
+            'success': True,
+            'workflow_id': workflow.workflow_id,
+            'status': 'rejected',
+            'message': 'Workflow rejected successfully'
+        }, history
+    
+    @staticmethod
+    def _failure(error: str) -> Dict:
+        return {
+            'success': False,
+            'error': error
+        }
     
     def _determine_required_stages(self, template: Dict, amount: float) -> List[Dict]:
         """
@@ -506,64 +601,112 @@ class ApprovalWorkflow:
         """
         return datetime.now() + timedelta(hours=timeout_hours)
     
-    def _can_approve_stage(self, user: str, stage_info: Dict) -> bool:
-        """
-        Check if user can approve a specific stage
-        """
-        # Mock user roles - replace with actual user role system
-        user_roles = {
-            'manager': ['manager', 'finance_manager', 'director', 'controller'],
-            'finance_manager': ['finance_manager', 'director', 'controller'],
-            'director': ['director'],
-            'controller': ['controller'],
-            'supervisor': ['supervisor', 'inventory_manager'],
-            'inventory_manager': ['inventory_manager'],
-            'accountant': ['accountant', 'controller'],
-            'finance': ['finance', 'controller']
-        }
-        
-        required_role = stage_info['role']
-        user_role_list = user_roles.get(user, [])
-        
-        return required_role in user_role_list
+    def _approver_roles(self, user: str) -> Set[str]:
+        """
+        Roles a user may approve for
+        """
+        return USER_APPROVAL_ROLES.get(user, frozenset())
     
-    def _create_approval_history_entry(self, workflow_id: str, action: str, user: str, data: Dict) -> None:
+    def _can_act_on(self, workflow: ApprovalRequest, user: str, roles: Set[str]) -> bool:
+        """
+        Role check against the current stage, or the user the stage was escalated to
+        """
+        return workflow.current_role in roles or (workflow.escalated_to is not None and workflow.escalated_to == user)
+    
+    def _history_entry(self, workflow: ApprovalRequest, action: str, user: str, timestamp: datetime,
+                       notes: str = None, stage_info: Dict = None, data: Dict = None) -> ApprovalHistory:
         """
         Create approval history entry
         """
-        history_entry = {
-            'id': f"HIST-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
-            'workflow_id': workflow_id,
-            'action': action,
-            'user': user,
-            'timestamp': datetime.now(),
-            'data': data
+        return ApprovalHistory(
+            request_id=workflow.id,
+            workflow_id=workflow.workflow_id,
+            stage=stage_info['stage'] if stage_info else workflow.current_stage,
+            stage_name=stage_info['name'] if stage_info else None,
+            action=action,
+            user=user,
+            notes=notes,
+            data=data or {},
+            timestamp=timestamp,
+            tenant_id=workflow.tenant_id
+        )
+    
+    @staticmethod
+    def _history_mapping(entry: ApprovalHistory) -> Dict:
+        return {
+            'request_id': entry.request_id,
+            'workflow_id': entry.workflow_id,
+            'stage': entry.stage,
+            'stage_name': entry.stage_name,
+            'action': entry.action,
+            'user': entry.user,
+            'notes': entry.notes,
+            'data': entry.data,
+            'timestamp': entry.timestamp,
+            'tenant_id': entry.tenant_id
         }
-        
-        self.approval_history.append(history_entry)
     
-    def _execute_approved_action(self, workflow: Dict) -> None:
+    def _serialize(self, workflow: ApprovalRequest, include_history: bool = True) -> Dict:
+        data = {
+            'id': workflow.workflow_id,
+            'type': workflow.workflow_type,
+            'name': workflow.name,
+            'description': workflow.description,
+            'reference_id': workflow.reference_id,
+            'reference_type': workflow.reference_type,
+            'amount': float(workflow.amount) if workflow.amount is not None else 0.0,
+            'currency': workflow.currency,
+            'initiator': workflow.initiator,
+            'initiated_date': workflow.initiated_date,
+            'status': workflow.status,
+            'current_stage': workflow.current_stage,
+            'total_stages': workflow.total_stages,
+            'stages': workflow.stages,
+            'metadata': workflow.extra_data or {},
+            'timeout_date': workflow.timeout_date,
+            'escalated': workflow.escalated,
+            'escalated_to': workflow.escalated_to,
+            'escalated_date': workflow.escalated_date
+        }
+        if workflow.completed_date:
+            data['completed_date'] = workflow.completed_date
+        if workflow.rejected_date:
+            data['rejected_date'] = workflow.rejected_date
+            data['rejection_reason'] = workflow.rejection_reason
+        if include_history:
+            data['approval_history'] = [
+                {
+                    'stage': h.stage,
+                    'stage_name': h.stage_name,
+                    'user': h.user,
+                    'action': h.action,
+                    'date': h.timestamp,
+                    'notes': h.notes,
+                    'data': h.data
+                }
+                for h in workflow.history
+            ]
+        return data
+    
+    def _execute_approved_action(self, workflow: ApprovalRequest) -> None:
         """
         Execute the action after workflow approval
         """
-        workflow_type = workflow['type']
-        reference_id = workflow['reference_id']
+        workflow_type = workflow.workflow_type
+        reference_id = workflow.reference_id
         
         if workflow_type == 'purchase_order':
             # Approve purchase order
-            print(f"Approving purchase order: {reference_id}")
+            logger.info(f"Approving purchase order: {reference_id}")
         elif workflow_type == 'stock_adjustment':
             # Approve stock adjustment
-            print(f"Approving stock adjustment: {reference_id}")
+            logger.info(f"Approving stock adjustment: {reference_id}")
         elif workflow_type == 'journal_entry':
             # Approve journal entry
-            print(f"Approving journal entry: {reference_id}")
+            logger.info(f"Approving journal entry: {reference_id}")
         elif workflow_type == 'expense_report':
             # Approve expense report
-            print(f"Approving expense report: {reference_id}")
+            logger.info(f"Approving expense report: {reference_id}")
 
 # Global instance
 approval_workflow = ApprovalWorkflow()
-
-
-
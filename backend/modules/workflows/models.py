@@ -0,0 +1,58 @@
+from app import db
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import JSON
+
+class ApprovalRequest(db.Model):
+    __tablename__ = 'approval_requests'
+    id = db.Column(db.Integer, primary_key=True)
+    workflow_id = db.Column(db.String(64), unique=True, index=True)  # WF-<TYPE>-<YYYYMMDD>-<NNN>
+    workflow_type = db.Column(db.String(50), nullable=False)  # purchase_order, stock_adjustment, journal_entry, expense_report
+    name = db.Column(db.String(100))
+    description = db.Column(db.Text)
+    reference_id = db.Column(db.String(100), nullable=False)
+    reference_type = db.Column(db.String(50))
+    amount = db.Column(db.Numeric(15, 2), nullable=False)
+    currency = db.Column(db.String(3), default='USD')
+    initiator = db.Column(db.String(100), nullable=False)
+    initiated_date = db.Column(db.DateTime, default=datetime.now)
+    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
+    current_stage = db.Column(db.Integer, default=1)
+    total_stages = db.Column(db.Integer, nullable=False)
+    stages = db.Column(JSON)  # Required stages resolved from the template at creation
+    current_role = db.Column(db.String(50))  # Role required for the current stage (inbox key)
+    timeout_date = db.Column(db.DateTime)
+    escalated = db.Column(db.Boolean, default=False)
+    escalated_to = db.Column(db.String(100))  # Escalation target (inbox key)
+    escalated_date = db.Column(db.DateTime)
+    completed_date = db.Column(db.DateTime)
+    rejected_date = db.Column(db.DateTime)
+    rejection_reason = db.Column(db.Text)
+    extra_data = db.Column(JSON)  # Caller-supplied metadata
+    tenant_id = db.Column(db.String(50), nullable=False, index=True)  # Company/tenant identifier - company-wide
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    history = db.relationship('ApprovalHistory', backref='request', lazy='dynamic',
+                              order_by='ApprovalHistory.id')
+
+    __table_args__ = (
+        # Pending inbox lookups: by the role an approver holds, or by escalation target
+        db.Index('idx_approval_inbox_role', 'tenant_id', 'status', 'current_role'),
+        db.Index('idx_approval_inbox_escalated', 'tenant_id', 'status', 'escalated_to'),
+        db.Index('idx_approval_tenant_initiated', 'tenant_id', 'initiated_date'),
+    )
+
+class ApprovalHistory(db.Model):
+    __tablename__ = 'approval_history'
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('approval_requests.id'), nullable=False, index=True)
+    workflow_id = db.Column(db.String(64))
+    stage = db.Column(db.Integer)
+    stage_name = db.Column(db.String(100))
+    action = db.Column(db.String(20), nullable=False)  # initiated, approved, rejected, escalated, completed
+    user = db.Column(db.String(100))
+    notes = db.Column(db.Text)
+    data = db.Column(JSON)
+    timestamp = db.Column(db.DateTime, default=datetime.now)
+    tenant_id = db.Column(db.String(50), nullable=False, index=True)  # Company/tenant identifier - company-wide
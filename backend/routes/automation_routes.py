@@ -1,6 +1,10 @@
 # Business Process Automation API Routes for EdonuOps ERP
 from flask import Blueprint, request, jsonify
-from modules.automation.workflow_engine import WorkflowEngine, create_invoice_approval_workflow, create_purchase_order_workflow
+from app import db
+from modules.automation.workflow_engine import (
+    WorkflowEngine, WorkflowDefinition, WorkflowStatus,
+    create_invoice_approval_workflow, create_purchase_order_workflow
+)
 import logging
 from datetime import datetime
 import uuid
@@ -75,7 +79,16 @@ def create_workflow():
         }
         
         # Register workflow
-        success = workflow_engine.register_workflow(workflow_def)
+        success = workflow_engine.register_workflow(WorkflowDefinition(
+            id=workflow_def['id'],
+            name=workflow_def['name'],
+            description=workflow_def['description'],
+            version=workflow_def['version'],
+            status=WorkflowStatus(workflow_def['status']),
+            steps=workflow_def['steps'],
+            triggers=workflow_def['triggers'],
+            conditions=workflow_def['conditions']
+        ))
         
         if success:
             return jsonify({
@@ -98,6 +111,7 @@ def start_workflow(workflow_id):
         
         # Start workflow
         instance_id = workflow_engine.start_workflow(workflow_id, data)
+        db.session.commit()
         
         if instance_id:
             return jsonify({
@@ -109,6 +123,7 @@ def start_workflow(workflow_id):
             return jsonify({'error': 'Failed to start workflow'}), 500
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Start workflow error: {e}")
         return jsonify({'error': 'Failed to start workflow'}), 500
 
@@ -116,36 +131,11 @@ def start_workflow(workflow_id):
 def get_tasks():
     """Get all tasks"""
     try:
-        # Mock tasks data for now
-        tasks = [
-            {
-                'id': 'task_1',
-                'name': 'Invoice Review',
-                'status': 'pending',
-                'assigned_to': 'finance_manager',
-                'due_date': '2024-01-15T10:00:00Z',
-                'workflow_instance_id': 'instance_1',
-                'task_type': 'approval'
-            },
-            {
-                'id': 'task_2',
-                'name': 'Purchase Order Approval',
-                'status': 'completed',
-                'assigned_to': 'procurement_manager',
-                'due_date': '2024-01-14T15:00:00Z',
-                'workflow_instance_id': 'instance_2',
-                'task_type': 'approval'
-            },
-            {
-                'id': 'task_3',
-                'name': 'Payment Processing',
-                'status': 'pending',
-                'assigned_to': 'system',
-                'due_date': '2024-01-16T09:00:00Z',
-                'workflow_instance_id': 'instance_1',
-                'task_type': 'automated'
-            }
-        ]
+        tasks = workflow_engine.list_tasks(
+            status=request.args.get('status'),
+            assigned_to=request.args.get('assigned_to'),
+            limit=request.args.get('limit', 100, type=int)
+        )
         
         return jsonify({
             'status': 'success',
@@ -171,7 +161,7 @@ def complete_task(task_id):
                 'message': 'Task completed successfully'
             })
         else:
-            return jsonify({'error': 'Failed to complete task'}), 500
+            return jsonify({'error': 'Task not found or already completed'}), 404
             
     except Exception as e:
         logger.error(f"Complete task error: {e}")
@@ -240,6 +230,7 @@ def trigger_workflow():
         
         # Trigger workflows
         instance_ids = workflow_engine.trigger_workflow(trigger_type, trigger_data)
+        db.session.commit()
         
         return jsonify({
             'status': 'success',
@@ -249,6 +240,7 @@ def trigger_workflow():
         })
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Trigger workflow error: {e}")
         return jsonify({'error': 'Failed to trigger workflow'}), 500
 
@@ -256,16 +248,10 @@ def trigger_workflow():
 def get_workflow_instances():
     """Get workflow instances"""
     try:
-        instances = []
-        for instance_id, instance in workflow_engine.instances.items():
-            instances.append({
-                'id': instance.id,
-                'workflow_id': instance.workflow_id,
-                'status': instance.status.value,
-                'current_step': instance.current_step,
-                'started_at': instance.started_at.isoformat(),
-                'completed_at': instance.completed_at.isoformat() if instance.completed_at else None
-            })
+        instances = workflow_engine.list_instances(
+            status=request.args.get('status'),
+            limit=request.args.get('limit', 100, type=int)
+        )
         
         return jsonify({
             'status': 'success',
@@ -0,0 +1,47 @@
+"""
+Shared plumbing of the standalone test scripts (test_*.py)
+
+Each script subclasses ScriptTester, records its checks with check() and
+ends with ``sys.exit(0 if Tester().run() else 1)``; run() returns report().
+"""
+
+from flask import Flask
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import db
+
+class ScriptTester:
+    def __init__(self):
+        self.passed = 0
+        self.failed = 0
+
+    def check(self, name: str, condition: bool, detail=''):
+        if condition:
+            self.passed += 1
+            print(f"✅ {name}")
+        else:
+            self.failed += 1
+            print(f"❌ {name} {detail}")
+
+    def report(self) -> bool:
+        print(f"\n{self.passed} passed, {self.failed} failed")
+        return self.failed == 0
+
+def sqlite_app(**config) -> Flask:
+    """A bare Flask app on a throwaway SQLite database (in memory unless ``config`` names one)"""
+    app = Flask(__name__)
+    app.config.update({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_TRACK_MODIFICATIONS': False, **config})
+    db.init_app(app)
+    return app
+
+def create_tables(*models):
+    """
+    Create just the tables of ``models`` (metadata.create_all would also want
+    every table they reference); call inside the app context
+    """
+    with db.engine.begin() as conn:
+        for model in models:
+            conn.execute(CreateTable(model.__table__))
+            for index in model.__table__.indexes:
+                # accounts declares ix_accounts_tenant_id twice (index=True and db.Index)
+                conn.execute(CreateIndex(index, if_not_exists=True))
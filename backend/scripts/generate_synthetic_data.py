@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Synthetic Tenant Data Generator
+===============================
+
+Fills a scratch database (SQLite or a local PostgreSQL) with deterministic
+synthetic tenants for benchmarking: chart of accounts, posted journal entries
+with millions of lines, products, stock movements, FIFO cost layers, the
+stock levels they add up to, opportunities and audit rows - every table the
+default scenarios of scripts/run_benchmarks.py read.
+
+Rows are written with bulk executemany inserts in chunks and explicit ids, so
+a "large" tenant (1M journal lines) loads in minutes rather than hours. The
+same --seed and scale always produce the same data, which is what makes
+benchmark runs comparable (see scripts/run_benchmarks.py).
+
+Each tenant gets an admin user ``admin_<tenant_id>`` that the benchmark
+suite authenticates as.
+
+Usage:
+    BENCHMARK_DATABASE_URL=sqlite:////tmp/bench.db python scripts/generate_synthetic_data.py --scale small
+    BENCHMARK_DATABASE_URL=postgresql://localhost/edonuops_bench \\
+        python scripts/generate_synthetic_data.py --scale large --tenants 2 --seed 7
+
+Never point this at a database holding real data.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, text
+
+from app import create_app, db
+
+# Rows per tenant for each preset
+SCALES = {
+    'small': {
+        'accounts': 60, 'entries': 2000, 'lines_per_entry': 3, 'products': 500,
+        'layers_per_product': 4, 'movements': 10000, 'opportunities': 1000, 'audit_rows': 5000
+    },
+    'medium': {
+        'accounts': 150, 'entries': 50000, 'lines_per_entry': 4, 'products': 5000,
+        'layers_per_product': 5, 'movements': 100000, 'opportunities': 10000, 'audit_rows': 50000
+    },
+    'large': {
+        'accounts': 300, 'entries': 250000, 'lines_per_entry': 4, 'products': 20000,
+        'layers_per_product': 5, 'movements': 500000, 'opportunities': 50000, 'audit_rows': 250000
+    },
+}
+
+CHUNK_SIZE = 5000
+TENANT_PREFIX = 'bench_t'
+BENCH_PASSWORD = 'bench-password'
+# Fixed anchor so generated dates do not depend on the day the script runs
+ANCHOR_DATE = date(2024, 1, 1)
+ACCOUNT_TYPES = ('asset', 'liability', 'equity', 'revenue', 'expense')
+OPPORTUNITY_STAGES = (
+    ('prospecting', 10), ('qualification', 25), ('proposal', 50),
+    ('negotiation', 75), ('closed_won', 100), ('closed_lost', 0)
+)
+AUDIT_ACTIONS = ('CREATE', 'UPDATE', 'DELETE', 'LOGIN', 'EXPORT')
+AUDIT_MODULES = ('finance', 'inventory', 'crm', 'core')
+
+def bench_tenant_ids(count: int):
+    return [f"{TENANT_PREFIX}{n}" for n in range(1, count + 1)]
+
+def bench_username(tenant_id: str) -> str:
+    return f"admin_{tenant_id}"
+
+def _models():
+    from modules.core.models import User, Role
+    from modules.core.tenant_models import Tenant
+    from modules.core.audit_models import AuditLog
+    from modules.finance.models import Account, JournalEntry, JournalLine
+    from modules.inventory.models import Product, StockMovement, Warehouse
+    from modules.inventory.advanced_models import InventoryProduct, SimpleWarehouse, StockLevel, UnitOfMeasure
+    from modules.inventory.cost_layer_models import InventoryCostLayer
+    from modules.crm.models import Opportunity
+    return [Tenant, Role, User, Account, JournalEntry, JournalLine, Warehouse, Product, StockMovement,
+            UnitOfMeasure, SimpleWarehouse, InventoryProduct, InventoryCostLayer, StockLevel, Opportunity,
+            AuditLog]
+
+def ensure_tables():
+    """Create the generated tables, the permission tables and everything they reference, if missing"""
+    from modules.core.permissions import Permission, RolePermission
+    needed, pending = set(), [model.__table__ for model in _models() + [Permission, RolePermission]]
+    while pending:
+        table = pending.pop()
+        if table.name in needed:
+            continue
+        needed.add(table.name)
+        pending.extend(fk.column.table for fk in table.foreign_keys)
+    failed = []
+    for table in db.metadata.sorted_tables:
+        if table.name in needed:
+            try:
+                table.create(db.engine, checkfirst=True)
+            except Exception as e:
+                failed.append(f"{table.name}: {str(e).splitlines()[0]}")
+    return failed
+
+class IdAllocator:
+    """Hands out explicit primary keys after the current max(id) of each table"""
+
+    def __init__(self):
+        self._next = {}
+
+    def take(self, model, count: int = 1) -> int:
+        name = model.__tablename__
+        if name not in self._next:
+            self._next[name] = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+        first = self._next[name]
+        self._next[name] += count
+        return first
+
+def bulk_insert(model, rows, chunk_size: int = CHUNK_SIZE) -> int:
+    """executemany ``rows`` (any iterable of dicts) in chunks; returns the row count"""
+    table, batch, total = model.__table__, [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            db.session.execute(table.insert(), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+def reset_sequences(models):
+    """PostgreSQL sequences do not advance for explicit ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        if model.__table__.c.id.type.python_type is int:
+            name = model.__tablename__
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {name}), 1))"
+            ))
+
+class TenantGenerator:
+    """Generates one tenant; every random choice comes from a per-tenant seeded RNG"""
+
+    def __init__(self, tenant_id: str, scale: dict, seed: int, ids: IdAllocator, role_id: int, uom_id: int):
+        self.tenant_id = tenant_id
+        self.scale = scale
+        self.rng = random.Random(f"{seed}:{tenant_id}")
+        self.ids = ids
+        self.role_id = role_id
+        self.uom_id = uom_id
+        self.now = datetime.combine(ANCHOR_DATE, datetime.min.time())
+        self.counts = {}
+
+    def run(self):
+        from modules.core.models import User
+        from modules.core.tenant_models import Tenant
+        from werkzeug.security import generate_password_hash
+
+        db.session.add(Tenant(id=self.tenant_id, name=f"Benchmark {self.tenant_id}",
+                              domain=f"{self.tenant_id}.bench.local", subscription_plan='enterprise'))
+        user = User(username=bench_username(self.tenant_id), email=f"admin@{self.tenant_id}.bench.local",
+                    password_hash=generate_password_hash(BENCH_PASSWORD), role_id=self.role_id,
+                    tenant_id=self.tenant_id, is_active=True, email_verified=True)
+        db.session.add(user)
+        db.session.flush()
+        self.user_id = user.id
+
+        for step in (self._accounts, self._journal, self._products, self._movements,
+                     self._cost_layers, self._stock_levels, self._opportunities, self._audit_rows):
+            started = time.perf_counter()
+            name, count = step()
+            db.session.commit()
+            self.counts[name] = count
+            print(f"   {name:<18} {count:>10,} rows  {time.perf_counter() - started:7.1f}s")
+        return self.counts
+
+    def _accounts(self):
+        from modules.finance.models import Account
+        count = self.scale['accounts']
+        first = self.ids.take(Account, count)
+        self.account_ids = list(range(first, first + count))
+        rows = []
+        for n in range(count):
+            account_type = ACCOUNT_TYPES[n % len(ACCOUNT_TYPES)]
+            rows.append({
+                'id': first + n, 'code': f"{ACCOUNT_TYPES.index(account_type) + 1}{n:04d}",
+                'name': f"{account_type.title()} account {n}", 'type': account_type,
+                'balance': 0.0, 'currency': 'USD', 'is_active': True,
+                'tenant_id': self.tenant_id, 'created_by': self.user_id, 'created_at': self.now
+            })
+        return 'accounts', bulk_insert(Account, rows)
+
+    def _journal(self):
+        from modules.finance.models import JournalEntry, JournalLine
+        entries, per_entry = self.scale['entries'], max(2, self.scale['lines_per_entry'])
+        first_entry = self.ids.take(JournalEntry, entries)
+        first_line = self.ids.take(JournalLine, entries * per_entry)
+        rng, line_id, lines_written = self.rng, first_line, 0
+        entry_batch, line_batch = [], []
+
+        def flush():
+            nonlocal lines_written
+            bulk_insert(JournalEntry, entry_batch)
+            lines_written += bulk_insert(JournalLine, line_batch)
+            entry_batch.clear()
+            line_batch.clear()
+
+        for n in range(entries):
+            entry_id = first_entry + n
+            doc_date = ANCHOR_DATE + timedelta(days=rng.randrange(365))
+            amounts = [round(rng.uniform(10, 5000), 2) for _ in range(per_entry - 1)]
+            total = round(sum(amounts), 2)
+            accounts = rng.sample(self.account_ids, min(per_entry, len(self.account_ids)))
+            entry_batch.append({
+                'id': entry_id, 'period': doc_date.strftime('%Y-%m'), 'doc_date': doc_date,
+                'reference': f"{self.tenant_id}-JE{n:08d}", 'description': f"Synthetic entry {n}",
+                'status': 'posted', 'currency': 'USD', 'payment_method': 'bank',
+                'total_debit': total, 'total_credit': total, 'tenant_id': self.tenant_id,
+                'created_by': self.user_id, 'created_at': self.now
+            })
+            for i in range(per_entry):
+                debit = amounts[i] if i < per_entry - 1 else 0.0
+                credit = total if i == per_entry - 1 else 0.0
+                line_batch.append({
+                    'id': line_id, 'journal_entry_id': entry_id, 'account_id': accounts[i % len(accounts)],
+                    'description': f"Line {i}", 'debit_amount': debit, 'credit_amount': credit,
+                    'currency': 'USD', 'exchange_rate': 1.0, 'functional_debit_amount': debit,
+                    'functional_credit_amount': credit, 'created_at': self.now
+                })
+                line_id += 1
+            if len(line_batch) >= CHUNK_SIZE:
+                flush()
+        flush()
+        self.counts['journal_entries'] = entries
+        return 'journal_lines', lines_written
+
+    def _products(self):
+        from modules.inventory.models import Product, Warehouse
+        from modules.inventory.advanced_models import InventoryProduct, SimpleWarehouse
+        count, rng = self.scale['products'], self.rng
+        first_warehouse = self.ids.take(Warehouse, 3)
+        self.warehouse_ids = [first_warehouse + n for n in range(3)]
+        bulk_insert(Warehouse, [{
+            'id': warehouse_id, 'name': f"Warehouse {n + 1}", 'location': f"Site {n + 1}",
+            'capacity': 100000, 'is_active': True, 'tenant_id': self.tenant_id,
+            'created_by': self.user_id, 'created_at': self.now
+        } for n, warehouse_id in enumerate(self.warehouse_ids)])
+        first_simple = self.ids.take(SimpleWarehouse, 3)
+        self.simple_warehouse_ids = [first_simple + n for n in range(3)]
+        bulk_insert(SimpleWarehouse, [{
+            'id': warehouse_id, 'name': f"{self.tenant_id} store {n + 1}", 'is_active': True,
+            'user_id': self.user_id, 'created_at': self.now
+        } for n, warehouse_id in enumerate(self.simple_warehouse_ids)])
+
+        first = self.ids.take(Product, count)
+        first_advanced = self.ids.take(InventoryProduct, count)
+        self.product_ids = list(range(first, first + count))
+        self.advanced_product_ids = list(range(first_advanced, first_advanced + count))
+        self.product_costs = [round(rng.uniform(1, 500), 2) for _ in range(count)]
+        products, advanced = [], []
+        for n in range(count):
+            sku, cost = f"{self.tenant_id}-P{n:07d}", self.product_costs[n]
+            products.append({
+                'id': first + n, 'sku': sku, 'name': f"Product {n}", 'price': round(cost * 1.4, 2),
+                'unit': 'pcs', 'cost_method': 'FIFO', 'standard_cost': cost, 'current_cost': cost,
+                'current_stock': 0.0, 'min_stock': 10.0, 'max_stock': 1000.0, 'is_active': True,
+                'status': 'active', 'tenant_id': self.tenant_id, 'created_by': self.user_id,
+                'created_at': self.now
+            })
+            advanced.append({
+                'id': first_advanced + n, 'sku': sku, 'product_id': sku, 'name': f"Product {n}",
+                'base_uom_id': self.uom_id, 'cost_method': 'FIFO', 'standard_cost': cost,
+                'current_cost': cost, 'base_currency_cost': cost, 'is_active': True,
+                'status': 'active', 'user_id': self.user_id, 'created_at': self.now
+            })
+        bulk_insert(InventoryProduct, advanced)
+        return 'products', bulk_insert(Product, products)
+
+    def _movements(self):
+        from modules.inventory.models import StockMovement
+        count, rng = self.scale['movements'], self.rng
+        first = self.ids.take(StockMovement, count)
+
+        def rows():
+            for n in range(count):
+                index = rng.randrange(len(self.product_ids))
+                movement_type = 'IN' if rng.random() < 0.55 else 'OUT'
+                quantity = float(rng.randint(1, 50))
+                unit_cost = self.product_costs[index]
+                yield {
+                    'id': first + n, 'product_id': self.product_ids[index],
+                    'warehouse_id': rng.choice(self.warehouse_ids), 'movement_type': movement_type,
+                    'quantity': quantity, 'unit_cost': unit_cost, 'total_cost': round(quantity * unit_cost, 2),
+                    'reference_type': 'PO' if movement_type == 'IN' else 'SO', 'reference_id': n,
+                    'tenant_id': self.tenant_id, 'created_by': self.user_id,
+                    'created_at': self.now + timedelta(minutes=n)
+                }
+        return 'stock_movements', bulk_insert(StockMovement, rows())
+
+    def _cost_layers(self):
+        from modules.inventory.cost_layer_models import InventoryCostLayer
+        per_product, rng = self.scale['layers_per_product'], self.rng
+        total = per_product * len(self.advanced_product_ids)
+        first = self.ids.take(InventoryCostLayer, total)
+
+        def rows():
+            layer_id = first
+            for index, product_id in enumerate(self.advanced_product_ids):
+                for sequence in range(1, per_product + 1):
+                    quantity = float(rng.randint(10, 200))
+                    # Older layers are partly or fully consumed, like a FIFO history
+                    remaining = 0.0 if sequence < per_product - 1 else float(rng.randint(0, int(quantity)))
+                    unit_cost = round(self.product_costs[index] * rng.uniform(0.9, 1.1), 4)
+                    yield {
+                        'id': layer_id, 'product_id': product_id,
+                        'simple_warehouse_id': self.simple_warehouse_ids[index % 3],
+                        'layer_sequence': sequence,
+                        'receipt_date': ANCHOR_DATE + timedelta(days=sequence * 30),
+                        'receipt_reference': f"PO-{product_id}-{sequence}",
+                        'unit_cost': unit_cost, 'original_quantity': quantity,
+                        'remaining_quantity': remaining, 'total_cost': round(quantity * unit_cost, 2),
+                        'remaining_cost': round(remaining * unit_cost, 2), 'currency': 'USD',
+                        'exchange_rate': 1.0, 'base_currency_unit_cost': unit_cost,
+                        'base_currency_total_cost': round(quantity * unit_cost, 2),
+                        'is_depleted': remaining == 0, 'source_document_type': 'PO',
+                        'user_id': self.user_id, 'created_at': self.now
+                    }
+                    layer_id += 1
+        return 'cost_layers', bulk_insert(InventoryCostLayer, rows())
+
+    def _stock_levels(self):
+        """One level per product and warehouse, summed from the open cost layers"""
+        from modules.inventory.advanced_models import StockLevel
+        from modules.inventory.cost_layer_models import InventoryCostLayer
+        totals = db.session.query(
+            InventoryCostLayer.product_id, InventoryCostLayer.simple_warehouse_id,
+            func.sum(InventoryCostLayer.remaining_quantity), func.sum(InventoryCostLayer.remaining_cost)
+        ).filter(
+            InventoryCostLayer.product_id.in_(self.advanced_product_ids)
+        ).group_by(InventoryCostLayer.product_id, InventoryCostLayer.simple_warehouse_id).order_by(
+            InventoryCostLayer.product_id).all()
+        first = self.ids.take(StockLevel, len(totals))
+
+        def rows():
+            for n, (product_id, warehouse_id, quantity, value) in enumerate(totals):
+                unit_cost = round(value / quantity, 4) if quantity else 0.0
+                yield {
+                    'id': first + n, 'product_id': product_id, 'simple_warehouse_id': warehouse_id,
+                    'quantity_on_hand': quantity, 'quantity_allocated': 0.0, 'quantity_available': quantity,
+                    'quantity_in_transit': 0.0, 'unit_cost': unit_cost, 'total_value': value,
+                    'cost_currency': 'USD', 'base_currency_unit_cost': unit_cost,
+                    'base_currency_total_value': value, 'user_id': self.user_id, 'last_updated': self.now,
+                    'created_at': self.now, 'version': 1
+                }
+        return 'stock_levels', bulk_insert(StockLevel, rows())
+
+    def _opportunities(self):
+        from modules.crm.models import Opportunity
+        count, rng = self.scale['opportunities'], self.rng
+        first = self.ids.take(Opportunity, count)
+
+        def rows():
+            for n in range(count):
+                stage, probability = rng.choice(OPPORTUNITY_STAGES)
+                yield {
+                    'id': first + n, 'name': f"Opportunity {n}", 'amount': round(rng.uniform(500, 250000), 2),
+                    'stage': stage, 'probability': probability,
+                    'expected_close_date': ANCHOR_DATE + timedelta(days=rng.randrange(-90, 270)),
+                    'region': rng.choice(('NA', 'EMEA', 'APAC', 'LATAM')),
+                    'tenant_id': self.tenant_id, 'created_by': self.user_id, 'created_at': self.now
+                }
+        return 'opportunities', bulk_insert(Opportunity, rows())
+
+    def _audit_rows(self):
+        from modules.core.audit_models import AuditLog
+        count, rng = self.scale['audit_rows'], self.rng
+
+        def rows():
+            for n in range(count):
+                module = rng.choice(AUDIT_MODULES)
+                yield {
+                    'id': str(uuid.UUID(int=rng.getrandbits(128))), 'tenant_id': self.tenant_id,
+                    'user_id': self.user_id, 'action': rng.choice(AUDIT_ACTIONS), 'resource': module,
+                    'resource_id': str(rng.randrange(100000)), 'module': module, 'severity': 'INFO',
+                    'ip_address': f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                    'timestamp': self.now + timedelta(seconds=n * 7)
+                }
+        return 'audit_rows', bulk_insert(AuditLog, rows())
+
+def _bench_role_and_uom():
+    from modules.core.models import Role
+    from modules.inventory.advanced_models import UnitOfMeasure
+    role = Role.query.filter_by(role_name='admin').first()
+    if role is None:
+        role = Role(role_name='admin', description='Administrator')
+        db.session.add(role)
+    uom = UnitOfMeasure.query.filter_by(code='EA').first()
+    if uom is None:
+        uom = UnitOfMeasure(code='EA', name='Each', is_base_unit=True)
+        db.session.add(uom)
+    db.session.flush()
+    return role.id, uom.id
+
+def generate(scale: dict, tenants: int = 1, seed: int = 42):
+    """Generate ``tenants`` synthetic tenants; must run inside an app context"""
+    from modules.core.tenant_models import Tenant
+
+    failed = ensure_tables()
+    if failed:
+        print("⚠️  Could not create some tables:")
+        for error in failed:
+            print(f"   - {error}")
+
+    tenant_ids = bench_tenant_ids(tenants)
+    existing = [t.id for t in Tenant.query.filter(Tenant.id.in_(tenant_ids)).all()]
+    if existing:
+        raise SystemExit(f"Tenant(s) {', '.join(existing)} already exist - use a fresh database")
+
+    role_id, uom_id = _bench_role_and_uom()
+    ids, totals = IdAllocator(), {}
+    for tenant_id in tenant_ids:
+        print(f"🏢 {tenant_id} (user {bench_username(tenant_id)} / {BENCH_PASSWORD})")
+        counts = TenantGenerator(tenant_id, scale, seed, ids, role_id, uom_id).run()
+        for name, count in counts.items():
+            totals[name] = totals.get(name, 0) + count
+    reset_sequences(_models())
+    db.session.commit()
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate deterministic synthetic tenants for benchmarking')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--tenants', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--config', default='benchmark')
+    for name in SCALES['small']:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name,
+                            help=f"override the preset's {name.replace('_', ' ')} per tenant")
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    scale.update({name: getattr(args, name) for name in scale if getattr(args, name) is not None})
+
+    app = create_app(args.config)
+    with app.app_context():
+        print("=" * 60)
+        print(f"SYNTHETIC DATA ({args.scale}, {args.tenants} tenant(s), seed {args.seed})")
+        print(f"Database: {db.engine.url.render_as_string(hide_password=True)}")
+        print("=" * 60)
+        started = time.perf_counter()
+        totals = generate(scale, tenants=args.tenants, seed=args.seed)
+        print("=" * 60)
+        for name, count in totals.items():
+            print(f"{name:<18} {count:>12,}")
+        print(f"✅ Done in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
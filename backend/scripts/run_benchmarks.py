@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Endpoint Benchmark Suite
+========================
+
+Times the hot read paths (general ledger, trial balance, product list,
+dashboards, CRM forecast) against data from scripts/generate_synthetic_data.py
+and compares latency and SQL query counts with a stored baseline.
+
+Each scenario is called through the Flask test client as the benchmark
+tenant's admin (a JWT, plus the X-User-ID header the older inventory routes
+scope by): a few warm-up calls, then ``--rounds`` timed calls. Per
+scenario the suite records min/median/p95/mean latency and the SQL statements
+issued per call. Scenarios whose blueprint is not registered are reported as
+skipped.
+
+A run fails (exit code 1) when a selected scenario was skipped or answered
+with a 4xx/5xx status - such a run is never saved as the baseline - or when
+any scenario's median latency exceeds the baseline by more than ``--tolerance`` (default 25%), or when it issues more
+queries per call than the baseline. Latency baselines are machine-specific:
+record one per machine/CI runner with --save-baseline. Query counts are not,
+and catch N+1 regressions anywhere.
+
+Usage:
+    BENCHMARK_DATABASE_URL=sqlite:////tmp/bench.db python scripts/run_benchmarks.py --save-baseline
+    BENCHMARK_DATABASE_URL=sqlite:////tmp/bench.db python scripts/run_benchmarks.py
+    python scripts/run_benchmarks.py --only trial_balance,product_list --rounds 20 --json results.json
+"""
+
+import argparse
+import io
+import json
+import contextlib
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app, db
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# (name, path, query string)
+SCENARIOS = [
+    ('general_ledger', '/api/finance/double-entry/journal-entries', {}),
+    ('chart_of_accounts', '/api/finance/double-entry/accounts', {}),
+    ('trial_balance', '/api/finance/double-entry/trial-balance', {}),
+    ('product_list', '/api/inventory/core/products', {}),
+    ('inventory_dashboard', '/api/inventory/core/dashboard', {}),
+    ('dashboard_summary', '/api/dashboard/summary', {}),
+    ('crm_forecast', '/api/crm/reports/forecast', {}),
+]
+
+class QueryCounter:
+    """Counts SQL statements issued by the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.active = False
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        if self.active:
+            self.count += 1
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_scenario(client, counter, headers, path, params, rounds: int, warmup: int):
+    """Warm up, then time ``rounds`` calls. Returns a result dict, or None if the route is missing"""
+    for _ in range(warmup):
+        response = client.get(path, headers=headers, query_string=params)
+        if response.status_code == 404 and (response.get_json(silent=True) or {}).get('error') == 'Endpoint not found':
+            return None
+
+    timings, queries, statuses = [], [], set()
+    for _ in range(rounds):
+        counter.count, counter.active = 0, True
+        started = time.perf_counter()
+        response = client.get(path, headers=headers, query_string=params)
+        elapsed = time.perf_counter() - started
+        counter.active = False
+        timings.append(elapsed * 1000)
+        queries.append(counter.count)
+        statuses.add(response.status_code)
+
+    return {
+        'status': sorted(statuses),
+        'min_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(_percentile(timings, 0.95), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries': int(statistics.median(queries)),
+        'response_bytes': len(response.get_data())
+    }
+
+def failed_scenarios(results: dict):
+    """Messages for scenarios that were skipped or did not answer successfully"""
+    failures = []
+    for name, result in results.items():
+        if result is None:
+            failures.append(f"{name}: skipped (route not registered)")
+        elif any(status >= 400 for status in result['status']):
+            failures.append(f"{name}: status {result['status']}")
+    return failures
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """List of regression messages against the baseline's scenarios"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or result is None:
+            continue
+        limit = base['median_ms'] * (1 + tolerance)
+        if result['median_ms'] > limit:
+            regressions.append(
+                f"{name}: median {result['median_ms']}ms > {base['median_ms']}ms baseline (+{tolerance:.0%} allowed)")
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: {result['queries']} queries/call > {base['queries']} in baseline")
+        if result['status'] != base.get('status', result['status']):
+            regressions.append(f"{name}: status {result['status']} (baseline {base['status']})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark key endpoints against a stored baseline')
+    parser.add_argument('--tenant', default='bench_t1', help='synthetic tenant to run as')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', help='comma-separated scenario names')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown (0.25 = 25%%)')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    parser.add_argument('--config', default='benchmark')
+    args = parser.parse_args()
+
+    # Startup banners and per-request prints would drown the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app(args.config)
+
+    from flask_jwt_extended import create_access_token
+    from modules.core.models import User
+    from generate_synthetic_data import bench_username
+
+    with app.app_context():
+        user = User.query.filter_by(username=bench_username(args.tenant)).first()
+        if user is None:
+            raise SystemExit(f"No benchmark user for {args.tenant} - run scripts/generate_synthetic_data.py first")
+        headers = {'Authorization': f"Bearer {create_access_token(identity=str(user.id))}", 'X-User-ID': str(user.id)}
+        database = db.engine.url.render_as_string(hide_password=True)
+        engine = db.engine
+
+    wanted = set(args.only.split(',')) if args.only else None
+    scenarios = [s for s in SCENARIOS if wanted is None or s[0] in wanted]
+    client = app.test_client()
+    results = {}
+
+    print("=" * 78)
+    print(f"BENCHMARKS ({args.tenant}, {args.rounds} rounds) - {database}")
+    print("=" * 78)
+    print(f"{'scenario':<22}{'status':>8}{'median':>10}{'p95':>10}{'min':>10}{'queries':>9}")
+    with QueryCounter(engine) as counter:
+        for name, path, params in scenarios:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_scenario(client, counter, headers, path, params, args.rounds, args.warmup)
+            results[name] = result
+            if result is None:
+                print(f"{name:<22}{'skipped (route not registered)':>47}")
+                continue
+            status = ','.join(str(s) for s in result['status'])
+            print(f"{name:<22}{status:>8}{result['median_ms']:>8.1f}ms{result['p95_ms']:>8.1f}ms"
+                  f"{result['min_ms']:>8.1f}ms{result['queries']:>9}")
+
+    run = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'database': database.split('@')[-1],
+        'tenant': args.tenant,
+        'rounds': args.rounds,
+        'scenarios': {name: result for name, result in results.items() if result is not None}
+    }
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    failures = failed_scenarios(results)
+    if failures:
+        print("\n❌ FAILED SCENARIOS" + (" - baseline not saved" if args.save_baseline else ""))
+        for message in failures:
+            print(f"   - {message}")
+        print("   (use --only to leave out scenarios this deployment does not serve)")
+        sys.exit(1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline} - run with --save-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ REGRESSIONS")
+        for message in regressions:
+            print(f"   - {message}")
+        sys.exit(1)
+    print(f"\n✅ No regressions against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
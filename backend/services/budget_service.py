@@ -1,55 +1,185 @@
-# backend/services/finance/budget_service.py
+# backend/services/budget_service.py
 from __future__ import annotations
 import logging
-from datetime import datetime
 from typing import Dict, List
 
-from sqlalchemy import func, extract, case, and_
+from sqlalchemy import func, case, literal, select, union_all
 
 from app import db
 from modules.finance.models import (
-    ChartOfAccount,
-    JournalHeader,
+    Account,
+    JournalEntry,
     JournalLine,
     Budget
 )
+from modules.finance.cost_center_models import CostCenter
 
 logger = logging.getLogger(__name__)
 
+# Account types whose balance grows with credits; their actuals are reported credit - debit
+CREDIT_NORMAL_TYPES = ('liability', 'equity', 'revenue')
+COMPARISON_WINDOWS = ('period', 'ytd', 'rolling')
+
+def _window_bounds(period: str, window: str, months: int):
+    """First and last YYYY-MM period of a comparison window ending at `period`"""
+    if window not in COMPARISON_WINDOWS:
+        raise ValueError(f"Unknown window '{window}', expected one of {', '.join(COMPARISON_WINDOWS)}")
+    year, month = (int(part) for part in period.split('-'))
+    if window == 'ytd':
+        return f"{year}-01", period
+    if window == 'rolling':
+        index = year * 12 + month - 1 - (max(months, 1) - 1)
+        return f"{index // 12}-{index % 12 + 1:02d}", period
+    return period, period
+
 class BudgetService:
     
     @staticmethod
-    def compare_to_budget(period: str, cost_center: str = None) -> Dict:
-        """Compare actuals vs budget for a period"""
+    def compare_to_budget(
+        period: str,
+        cost_center=None,
+        scenarios: List[str] = None,
+        window: str = 'period',
+        months: int = 12,
+        by_period: bool = False,
+        threshold_pct: float = 10.0,
+        threshold_amount: float = 0.0,
+        tenant_id: str = None,
+        flagged_only: bool = False
+    ) -> Dict:
+        """
+        Compare actuals vs budget per account and cost center in one query.
+
+        Posted journal lines and budget rows are stacked with UNION ALL and summed
+        per (account, cost center[, period]), which behaves as a full outer join:
+        unbudgeted spend and budgets without actuals both show up. Each scenario
+        in `scenarios` gets its own budget column; variances use the first one.
+        `window` is 'period', 'ytd' or 'rolling' (the `months` periods ending at
+        `period`). A cell is flagged when |variance| >= threshold_amount and
+        |variance %| >= threshold_pct.
+        """
         try:
-            actuals = db.session.query(
-                ChartOfAccount.account_type,
-                func.sum(JournalLine.debit_amount - JournalLine.credit_amount).label("amount")
-            ).join(JournalLine).join(JournalHeader).join(Budget).filter(
-                JournalHeader.period == period,
-                JournalHeader.status == "posted",
-                Budget.period == period
-            ).group_by(ChartOfAccount.account_type).all()
-            
-            budgets = db.session.query(
-                Budget.account_type,
-                Budget.amount
-            ).filter_by(period=period).all()
-            
+            scenarios = list(scenarios or ['base'])
+            start_period, end_period = _window_bounds(period, window, months)
+
+            actuals = select(
+                JournalLine.account_id.label('account_id'),
+                JournalLine.cost_center_id.label('cost_center_id'),
+                JournalEntry.period.label('period'),
+                (func.coalesce(JournalLine.debit_amount, 0.0) -
+                 func.coalesce(JournalLine.credit_amount, 0.0)).label('actual'),
+                *[literal(0.0, db.Float).label(f'budget_{i}') for i in range(len(scenarios))]
+            ).join(JournalEntry, JournalEntry.id == JournalLine.journal_entry_id).where(
+                JournalEntry.status == 'posted',
+                JournalEntry.period.between(start_period, end_period)
+            )
+            budgets = select(
+                Budget.account_id.label('account_id'),
+                Budget.cost_center_id.label('cost_center_id'),
+                Budget.period.label('period'),
+                literal(0.0, db.Float).label('actual'),
+                *[case((Budget.scenario == name, Budget.budget_amount), else_=0.0).label(f'budget_{i}')
+                  for i, name in enumerate(scenarios)]
+            ).where(
+                Budget.scenario.in_(scenarios),
+                Budget.period.between(start_period, end_period)
+            )
+
+            if tenant_id:
+                actuals = actuals.where(JournalEntry.tenant_id == tenant_id)
+                budgets = budgets.where(Budget.tenant_id == tenant_id)
+            if cost_center is not None:
+                if isinstance(cost_center, int) or str(cost_center).isdigit():
+                    cost_center_ids = [int(cost_center)]
+                else:
+                    cost_center_ids = select(CostCenter.id).where(CostCenter.code == cost_center)
+                    if tenant_id:
+                        cost_center_ids = cost_center_ids.where(CostCenter.tenant_id == tenant_id)
+                actuals = actuals.where(JournalLine.cost_center_id.in_(cost_center_ids))
+                budgets = budgets.where(Budget.cost_center_id.in_(cost_center_ids))
+
+            stacked = union_all(actuals, budgets).subquery('stacked')
+            keys = [stacked.c.account_id, stacked.c.cost_center_id] + ([stacked.c.period] if by_period else [])
+            cells = select(
+                *keys,
+                func.sum(stacked.c.actual).label('actual'),
+                *[func.sum(stacked.c[f'budget_{i}']).label(f'budget_{i}') for i in range(len(scenarios))]
+            ).group_by(*keys).subquery('cells')
+            query = select(
+                cells,
+                Account.code.label('account_code'), Account.name.label('account_name'),
+                Account.type.label('account_type'), CostCenter.code.label('cost_center_code'),
+                CostCenter.name.label('cost_center_name')
+            ).join(Account, Account.id == cells.c.account_id).outerjoin(
+                CostCenter, CostCenter.id == cells.c.cost_center_id
+            ).order_by(Account.code, CostCenter.code, *([cells.c.period] if by_period else []))
+            if tenant_id:
+                query = query.where(Account.tenant_id == tenant_id)
+
+            comparisons = []
+            totals = {}
+            for row in db.session.execute(query).mappings():
+                account_type = row['account_type']
+                sign = -1 if account_type in CREDIT_NORMAL_TYPES else 1
+                actual = sign * float(row['actual'] or 0)
+                scenario_budgets = {name: float(row[f'budget_{i}'] or 0) for i, name in enumerate(scenarios)}
+                budget = scenario_budgets[scenarios[0]]
+                variance = actual - budget
+                variance_pct = variance / abs(budget) * 100 if budget else None
+
+                flag = None
+                if variance and abs(variance) >= threshold_amount:
+                    if not budget:
+                        flag = 'unbudgeted'
+                    elif abs(variance_pct) >= threshold_pct:
+                        flag = 'over_budget' if variance > 0 else 'under_budget'
+                if flagged_only and not flag:
+                    continue
+
+                comparison = {
+                    "account_id": row['account_id'],
+                    "account_code": row['account_code'],
+                    "account_name": row['account_name'],
+                    "account_type": account_type,
+                    "cost_center_id": row['cost_center_id'],
+                    "cost_center_code": row['cost_center_code'],
+                    "cost_center_name": row['cost_center_name'],
+                    "actual": round(actual, 2),
+                    "budget": round(budget, 2),
+                    "variance": round(variance, 2),
+                    "variance_pct": round(variance_pct, 2) if variance_pct is not None else None,
+                    "favorable": variance >= 0 if account_type == 'revenue' else variance <= 0,
+                    "flag": flag
+                }
+                if by_period:
+                    comparison["period"] = row['period']
+                if len(scenarios) > 1:
+                    comparison["scenarios"] = {
+                        name: {"budget": round(amount, 2), "variance": round(actual - amount, 2)}
+                        for name, amount in scenario_budgets.items()
+                    }
+                comparisons.append(comparison)
+
+                total = totals.setdefault(account_type, {"actual": 0.0, "budget": 0.0, "variance": 0.0})
+                total["actual"] += actual
+                total["budget"] += budget
+                total["variance"] += variance
+
             return {
                 "period": period,
-                "comparisons": [{
-                    "account_type": act.account_type,
-                    "actual": float(act.amount or 0),
-                    "budget": next(
-                        (float(bud.amount) for bud in budgets 
-                        if bud.account_type == act.account_type), 0
-                    ),
-                    "variance": float(act.amount or 0) - next(
-                        (float(bud.amount) for bud in budgets 
-                        if bud.account_type == act.account_type), 0
-                    )
-                } for act in actuals]
+                "window": window,
+                "start_period": start_period,
+                "end_period": end_period,
+                "scenario": scenarios[0],
+                "scenarios": scenarios,
+                "threshold_pct": threshold_pct,
+                "threshold_amount": threshold_amount,
+                "comparisons": comparisons,
+                "totals_by_type": {
+                    account_type: {key: round(value, 2) for key, value in total.items()}
+                    for account_type, total in totals.items()
+                },
+                "flagged": sum(1 for c in comparisons if c["flag"])
             }
         except Exception as e:
             logger.error(f"Budget comparison failed: {str(e)}")
@@ -61,51 +191,28 @@ class BudgetService:
         entity: str = None,
         scenario: str = "base_case"
     ) -> List[Dict]:
-        """Generate cash flow forecast"""
+        """
+        Monthly cash flow forecast for one scenario of the tenant `entity`
+        (default: the current user's). See services/cashflow_forecast.py for
+        the full 13-week / 12-month multi-scenario forecast.
+        """
         try:
-            # Historical cash inflows/outflows
-            history = db.session.query(
-                extract('month', JournalHeader.doc_date).label("month"),
-                extract('year', JournalHeader.doc_date).label("year"),
-                func.sum(
-                    case([(ChartOfAccount.account_type == "asset", JournalLine.debit_amount)],
-                        else_=JournalLine.credit_amount)
-                ).label("inflows"),
-                func.sum(
-                    case([(ChartOfAccount.account_type == "asset", JournalLine.credit_amount)],
-                        else_=JournalLine.debit_amount)
-                ).label("outflows")
-            ).join(JournalLine).join(ChartOfAccount).filter(
-                ChartOfAccount.code.in_(["1000", "2000"]),  # Cash and AR accounts
-                JournalHeader.status == "posted"
-            ).group_by("month", "year").order_by("year", "month").all()
-            
-            # Apply forecasting model (simplified)
-            forecast = []
-            for i in range(1, months + 1):
-                month = (datetime.now().month + i - 1) % 12 + 1
-                year = datetime.now().year + (datetime.now().month + i - 1) // 12
-                
-                # Find historical average (simplified)
-                avg_in = sum(h.inflows for h in history if h.month == month) / max(len([h for h in history if h.month == month]), 1)
-                avg_out = sum(h.outflows for h in history if h.month == month) / max(len([h for h in history if h.month == month]), 1)
-                
-                # Apply scenario adjustments
-                if scenario == "optimistic":
-                    adj_in, adj_out = 1.1, 0.9
-                elif scenario == "pessimistic":
-                    adj_in, adj_out = 0.9, 1.1
-                else:
-                    adj_in, adj_out = 1.0, 1.0
-                    
-                forecast.append({
-                    "month": f"{year}-{month:02d}",
-                    "projected_inflow": avg_in * adj_in,
-                    "projected_outflow": avg_out * adj_out,
-                    "net_cashflow": (avg_in * adj_in) - (avg_out * adj_out)
-                })
-                
-            return forecast
+            from modules.core.tenant_helpers import get_current_user_tenant_id
+            from services.cashflow_forecast import SCENARIOS, cashflow_forecaster
+
+            tenant_id = entity or get_current_user_tenant_id()
+            name = "base" if scenario == "base_case" else scenario
+            if name not in SCENARIOS:
+                raise ValueError(f"Unknown scenario '{scenario}'")
+            forecast = cashflow_forecaster.forecast(tenant_id)
+
+            return [{
+                "month": month["month"],
+                "projected_inflow": month["inflow"],
+                "projected_outflow": month["outflow"],
+                "net_cashflow": month["net"],
+                "closing_balance": month["closing_balance"]
+            } for month in forecast["scenarios"][name]["months"][:months]]
         except Exception as e:
             logger.error(f"Cashflow forecast failed: {str(e)}")
-            raise
\ No newline at end of file
+            raise
@@ -1,220 +1,549 @@
-import redis
+"""
+Unified Cache Service
+One cache API for the whole backend: a bounded per-process LRU (tier 1) in
+front of an optional Redis tier (tier 2).
+
+- Keys are tenant scoped (``tenant:<id>:<key>``) when a tenant is given.
+- Entries can carry tags; ``invalidate_tags('gl_reports', tenant_id=...)``
+  drops every entry written under that tag for the tenant. Tags are versioned
+  counters, so invalidation is O(1) and stale entries are discarded on read.
+- ``get_or_set`` coalesces concurrent misses for the same key into a single
+  loader call (single-flight in-process, a short Redis lock across workers)
+  and refreshes hot entries probabilistically shortly before they expire, so a
+  popular key expiring never sends every request to the database at once.
+
+The local tier holds encoded payloads, bounded by entry count and bytes, and
+keeps entries at most ``CACHE_LOCAL_TTL`` seconds; that bounds how long
+another worker's invalidation can take to reach this process. Without Redis
+(not installed or unreachable) the cache runs local-only.
+"""
+
+import fnmatch
+import hashlib
 import json
-import pickle
-from datetime import timedelta
-from typing import Any, Optional, Union
-from flask import current_app
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
 import logging
 
+try:
+    import redis
+except ImportError:  # Local-only mode
+    redis = None
+
 logger = logging.getLogger(__name__)
 
+REDIS_PREFIX = 'cache:'
+RECONNECT_INTERVAL = 30
+
+class LocalLRU:
+    """Thread-safe LRU of key -> (payload, expires_at), bounded by entries and bytes"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, payload: str, ttl: float):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (payload, time.time() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def expire(self, key: str, ttl: float) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False
+            self._data[key] = (item[0], time.time() + ttl)
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._pop(key)
+
+    def delete_matching(self, pattern: str) -> int:
+        with self._lock:
+            keys = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+            for key in keys:
+                self._pop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key: str) -> bool:
+        item = self._data.pop(key, None)
+        if item is None:
+            return False
+        self._bytes -= len(item[0])
+        return True
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+class _Flight:
+    """One in-progress load that concurrent callers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
 class CacheService:
-    """Redis-based caching service for enterprise performance"""
-    
-    def __init__(self, redis_url: str = None):
+    """Two-tier (local LRU + optional Redis) tenant-aware cache"""
+
+    def __init__(self, redis_url: str = None, max_entries: int = None, max_bytes: int = None,
+                 local_ttl: int = None):
         self.redis_url = redis_url
         self.client = None
+        self._next_connect = 0.0
+        self._connect_lock = threading.Lock()
+        self._settings = {'max_entries': max_entries, 'max_bytes': max_bytes, 'local_ttl': local_ttl}
+        self._local = None
+        self._tag_versions = {}
+        self._flights = {}
+        self._flight_lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'loads': 0,
+                      'coalesced': 0, 'early_refreshes': 0, 'stale_tag_hits': 0}
         # Don't connect immediately - will connect when needed
-    
+
+    def _config(self, name: str, default):
+        try:
+            from flask import current_app
+            return current_app.config.get(name, default)
+        except RuntimeError:
+            return default
+
+    @property
+    def local(self) -> LocalLRU:
+        if self._local is None:
+            self._local = LocalLRU(
+                max_entries=int(self._settings['max_entries'] or self._config('CACHE_LOCAL_MAX_ENTRIES', 10000)),
+                max_bytes=int(self._settings['max_bytes'] or self._config('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024))
+            )
+        return self._local
+
+    @property
+    def local_ttl(self) -> int:
+        if self._settings['local_ttl'] is None:
+            self._settings['local_ttl'] = int(self._config('CACHE_LOCAL_TTL', 30))
+        return self._settings['local_ttl']
+
     def _get_redis_url(self):
         """Get Redis URL from config or use default"""
         if self.redis_url:
             return self.redis_url
-        try:
-            from flask import current_app
-            return current_app.config.get('REDIS_URL', 'redis://localhost:6379/0')
-        except RuntimeError:
-            return 'redis://localhost:6379/0'
-    
+        return self._config('REDIS_URL', 'redis://localhost:6379/0')
+
     def _ensure_connected(self):
-        """Ensure Redis connection is established"""
-        if self.client is None:
-            self._connect()
-    
+        """Connect to Redis lazily; failed attempts are retried at most every RECONNECT_INTERVAL"""
+        if self.client is not None or redis is None or time.time() < self._next_connect:
+            return
+        with self._connect_lock:
+            if self.client is None and time.time() >= self._next_connect:
+                self._connect()
+
     def _connect(self):
         """Establish Redis connection with error handling"""
         try:
-            redis_url = self._get_redis_url()
-            self.client = redis.from_url(
-                redis_url,
+            client = redis.from_url(
+                self._get_redis_url(),
                 decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5,
+                socket_connect_timeout=1,
+                socket_timeout=1,
                 retry_on_timeout=True
             )
             # Test connection
-            self.client.ping()
+            client.ping()
+            self.client = client
             logger.info("Redis connection established successfully")
-        except redis.ConnectionError as e:
-            logger.error(f"Redis connection failed: {e}")
-            self.client = None
         except Exception as e:
-            logger.error(f"Unexpected Redis error: {e}")
+            logger.info(f"Redis not available, cache runs local-only: {e}")
+            self.client = None
+            self._next_connect = time.time() + RECONNECT_INTERVAL
+
+    def _redis(self):
+        self._ensure_connected()
+        return self.client
+
+    def _redis_failed(self, operation: str, error: Exception):
+        logger.error(f"Cache {operation} error: {error}")
+        if redis is not None and isinstance(error, redis.ConnectionError):
             self.client = None
-    
+            self._next_connect = time.time() + RECONNECT_INTERVAL
+
     def _get_key(self, key: str, tenant_id: str = None) -> str:
         """Generate cache key with tenant prefix"""
         if tenant_id:
             return f"tenant:{tenant_id}:{key}"
         return key
-    
-    def set(self, key: str, value: Any, ttl: int = 3600, tenant_id: str = None) -> bool:
-        """Set cache value with TTL"""
-        self._ensure_connected()
-        if not self.client:
-            return False
-        
+
+    # ------------------------------------------------------------------
+    # Tags
+    # ------------------------------------------------------------------
+
+    def _tag_key(self, tag: str, tenant_id: str = None) -> str:
+        return self._get_key(f"tag:{tag}", tenant_id)
+
+    def _current_tag_versions(self, tag_keys: Iterable[str], from_redis: bool) -> Dict[str, int]:
+        tag_keys = list(tag_keys)
+        if from_redis and tag_keys:
+            client = self._redis()
+            if client is not None:
+                try:
+                    values = client.mget([REDIS_PREFIX + k for k in tag_keys])
+                    for tag_key, value in zip(tag_keys, values):
+                        version = int(value or 0)
+                        if version > self._tag_versions.get(tag_key, 0):
+                            self._tag_versions[tag_key] = version
+                except Exception as e:
+                    self._redis_failed('tag read', e)
+        return {k: self._tag_versions.get(k, 0) for k in tag_keys}
+
+    def invalidate_tags(self, *tags: str, tenant_id: str = None) -> bool:
+        """Invalidate every entry written under any of ``tags`` (for the tenant)"""
+        tag_keys = [self._tag_key(tag, tenant_id) for tag in tags]
+        for tag_key in tag_keys:
+            self._tag_versions[tag_key] = self._tag_versions.get(tag_key, 0) + 1
+        client = self._redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for tag_key in tag_keys:
+                    pipe.incr(REDIS_PREFIX + tag_key)
+                for tag_key, version in zip(tag_keys, pipe.execute()):
+                    self._tag_versions[tag_key] = max(self._tag_versions[tag_key], int(version))
+            except Exception as e:
+                self._redis_failed('tag invalidation', e)
+                return False
+        return True
+
+    def tag_version(self, tag: str, tenant_id: str = None) -> int:
+        """Current version of ``tag``; it changes whenever any worker invalidates the tag"""
+        tag_key = self._tag_key(tag, tenant_id)
+        return self._current_tag_versions([tag_key], from_redis=True)[tag_key]
+
+    # ------------------------------------------------------------------
+    # Entries
+    # ------------------------------------------------------------------
+
+    def _encode(self, value: Any, ttl: int, tags: Dict[str, int], delta: float) -> str:
+        return json.dumps({'v': value, 'e': time.time() + ttl, 'd': delta, 't': tags}, default=str)
+
+    def _lookup(self, cache_key: str) -> Optional[Dict]:
+        """Entry from the local tier, then Redis; None if missing or invalidated by a tag"""
+        payload = self.local.get(cache_key)
+        if payload is not None:
+            entry = json.loads(payload)
+            if entry['t'] == self._current_tag_versions(entry['t'], from_redis=False):
+                self.stats['local_hits'] += 1
+                return entry
+            self.local.delete(cache_key)
+            self.stats['stale_tag_hits'] += 1
+
+        client = self._redis()
+        if client is None:
+            return None
         try:
-            cache_key = self._get_key(key, tenant_id)
-            if isinstance(value, (dict, list)):
-                serialized_value = json.dumps(value)
-            else:
-                serialized_value = str(value)
-            
-            return self.client.setex(cache_key, ttl, serialized_value)
+            payload = client.get(REDIS_PREFIX + cache_key)
+        except Exception as e:
+            self._redis_failed('get', e)
+            return None
+        if payload is None:
+            return None
+        entry = json.loads(payload)
+        if entry['t'] != self._current_tag_versions(entry['t'], from_redis=True):
+            self.stats['stale_tag_hits'] += 1
+            return None
+        self.stats['redis_hits'] += 1
+        remaining = entry['e'] - time.time()
+        if remaining > 0:
+            self.local.set(cache_key, payload, min(remaining, self.local_ttl))
+        return entry
+
+    def set(self, key: str, value: Any, ttl: int = 3600, tenant_id: str = None,
+            tags: Iterable[str] = None, _delta: float = 0.0, _tag_versions: Dict[str, int] = None) -> bool:
+        """
+        Set cache value with TTL, optionally under invalidation tags
+        (``_tag_versions``: the versions read before the value was computed)
+        """
+        cache_key = self._get_key(key, tenant_id)
+        tag_versions = _tag_versions
+        if tag_versions is None:
+            tag_versions = self._current_tag_versions((self._tag_key(t, tenant_id) for t in tags or ()),
+                                                      from_redis=True)
+        try:
+            payload = self._encode(value, ttl, tag_versions, _delta)
         except Exception as e:
             logger.error(f"Cache set error: {e}")
             return False
-    
+        self.local.set(cache_key, payload, min(ttl, self.local_ttl))
+
+        client = self._redis()
+        if client is not None:
+            try:
+                client.setex(REDIS_PREFIX + cache_key, ttl, payload)
+            except Exception as e:
+                self._redis_failed('set', e)
+        return True
+
     def get(self, key: str, tenant_id: str = None) -> Optional[Any]:
         """Get cache value"""
-        self._ensure_connected()
-        if not self.client:
-            return None
-        
         try:
-            cache_key = self._get_key(key, tenant_id)
-            value = self.client.get(cache_key)
-            
-            if value is None:
-                return None
-            
-            # Try to deserialize JSON
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
+            entry = self._lookup(self._get_key(key, tenant_id))
         except Exception as e:
             logger.error(f"Cache get error: {e}")
             return None
-    
-    def delete(self, key: str, tenant_id: str = None) -> bool:
-        """Delete cache key"""
-        self._ensure_connected()
-        if not self.client:
-            return False
-        
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        return entry['v']
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: int = 3600, tenant_id: str = None,
+                   tags: Iterable[str] = None, beta: float = 1.0, wait_timeout: float = 10.0) -> Any:
+        """
+        Cached value, or ``loader()`` stored under ``key``. Concurrent misses share
+        one loader call; entries close to expiry are refreshed early by a single
+        caller (probability grows with the loader's cost) while others keep
+        getting the current value. ``beta=0`` disables early refresh.
+        """
+        cache_key = self._get_key(key, tenant_id)
         try:
-            cache_key = self._get_key(key, tenant_id)
-            return bool(self.client.delete(cache_key))
+            entry = self._lookup(cache_key)
         except Exception as e:
-            logger.error(f"Cache delete error: {e}")
-            return False
-    
-    def exists(self, key: str, tenant_id: str = None) -> bool:
-        """Check if key exists"""
-        self._ensure_connected()
-        if not self.client:
-            return False
-        
+            logger.error(f"Cache get error: {e}")
+            entry = None
+
+        if entry is not None:
+            # XFetch: refresh before expiry with probability rising as expiry nears
+            if beta <= 0 or time.time() - entry['d'] * beta * math.log(1.0 - random.random()) < entry['e']:
+                return entry['v']
+            if cache_key in self._flights:
+                return entry['v']
+            self.stats['early_refreshes'] += 1
+        else:
+            self.stats['misses'] += 1
+
+        with self._flight_lock:
+            flight = self._flights.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[cache_key] = _Flight()
+
+        if not leader:
+            if entry is not None:
+                return entry['v']
+            self.stats['coalesced'] += 1
+            if flight.event.wait(wait_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            return loader()
+
         try:
-            cache_key = self._get_key(key, tenant_id)
-            return bool(self.client.exists(cache_key))
+            value = self._load(key, cache_key, loader, ttl, tenant_id, tags, wait_timeout)
+            flight.value = value
+            return value
         except Exception as e:
-            logger.error(f"Cache exists error: {e}")
-            return False
-    
+            flight.error = e
+            raise
+        finally:
+            flight.event.set()
+            with self._flight_lock:
+                self._flights.pop(cache_key, None)
+
+    def _load(self, key, cache_key, loader, ttl, tenant_id, tags, wait_timeout):
+        """Run the loader, holding a short Redis lock so other workers wait for the result"""
+        client = self._redis()
+        lock_key = f"{REDIS_PREFIX}lock:{cache_key}"
+        locked = False
+        if client is not None:
+            try:
+                locked = bool(client.set(lock_key, '1', nx=True, px=int(wait_timeout * 1000)))
+                if not locked:
+                    deadline = time.time() + wait_timeout
+                    while time.time() < deadline:
+                        time.sleep(0.05)
+                        payload = client.get(REDIS_PREFIX + cache_key)
+                        if payload is not None:
+                            self.stats['coalesced'] += 1
+                            entry = json.loads(payload)
+                            self.local.set(cache_key, payload, min(max(entry['e'] - time.time(), 0), self.local_ttl))
+                            return entry['v']
+                        if not client.exists(lock_key):
+                            break
+            except Exception as e:
+                self._redis_failed('lock', e)
+
+        try:
+            # Tag versions as of before the load: an invalidation landing while the
+            # loader runs then makes the stored value stale instead of current
+            tag_versions = self._current_tag_versions((self._tag_key(t, tenant_id) for t in tags or ()),
+                                                      from_redis=True)
+            started = time.perf_counter()
+            value = loader()
+            self.stats['loads'] += 1
+            self.set(key, value, ttl, tenant_id, tags, _delta=time.perf_counter() - started,
+                     _tag_versions=tag_versions)
+            return value
+        finally:
+            if locked:
+                try:
+                    client.delete(lock_key)
+                except Exception as e:
+                    self._redis_failed('unlock', e)
+
+    def delete(self, key: str, tenant_id: str = None) -> bool:
+        """Delete cache key"""
+        cache_key = self._get_key(key, tenant_id)
+        deleted = self.local.delete(cache_key)
+        client = self._redis()
+        if client is not None:
+            try:
+                deleted = bool(client.delete(REDIS_PREFIX + cache_key)) or deleted
+            except Exception as e:
+                self._redis_failed('delete', e)
+        return deleted
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Delete keys matching a glob pattern (e.g. ``tenant:t1:reports:*``) in both tiers"""
+        deleted = self.local.delete_matching(pattern)
+        client = self._redis()
+        if client is not None:
+            try:
+                keys = list(client.scan_iter(match=REDIS_PREFIX + pattern, count=500))
+                if keys:
+                    deleted += client.delete(*keys)
+            except Exception as e:
+                self._redis_failed('delete pattern', e)
+        return deleted
+
+    def exists(self, key: str, tenant_id: str = None) -> bool:
+        """Check if key exists"""
+        return self.get(key, tenant_id) is not None
+
     def expire(self, key: str, ttl: int, tenant_id: str = None) -> bool:
         """Set expiration for key"""
-        self._ensure_connected()
-        if not self.client:
-            return False
-        
-        try:
-            cache_key = self._get_key(key, tenant_id)
-            return bool(self.client.expire(cache_key, ttl))
-        except Exception as e:
-            logger.error(f"Cache expire error: {e}")
-            return False
-    
+        cache_key = self._get_key(key, tenant_id)
+        found = self.local.expire(cache_key, min(ttl, self.local_ttl))
+        client = self._redis()
+        if client is not None:
+            try:
+                found = bool(client.expire(REDIS_PREFIX + cache_key, ttl)) or found
+            except Exception as e:
+                self._redis_failed('expire', e)
+        return found
+
     def clear_tenant_cache(self, tenant_id: str) -> bool:
         """Clear all cache for a specific tenant"""
-        if not self.client:
-            return False
-        
-        try:
-            pattern = f"tenant:{tenant_id}:*"
-            keys = self.client.keys(pattern)
-            if keys:
-                return bool(self.client.delete(*keys))
-            return True
-        except Exception as e:
-            logger.error(f"Clear tenant cache error: {e}")
-            return False
-    
+        self.delete_pattern(f"tenant:{tenant_id}:*")
+        return True
+
     def clear_all(self) -> bool:
-        """Clear all cache (use with caution)"""
-        if not self.client:
-            return False
-        
-        try:
-            return bool(self.client.flushdb())
-        except Exception as e:
-            logger.error(f"Clear all cache error: {e}")
-            return False
-    
+        """Clear all cache entries (only this cache's keys, not the whole Redis database)"""
+        self.local.clear()
+        self._tag_versions.clear()
+        self.delete_pattern('*')
+        return True
+
     def get_stats(self) -> dict:
         """Get cache statistics"""
-        if not self.client:
-            return {"error": "Redis not connected"}
-        
+        stats = dict(self.stats)
+        stats.update({
+            'mode': 'local+redis' if self.client is not None else 'local',
+            'local_entries': len(self.local),
+            'local_bytes': self.local.bytes,
+            'local_evictions': self.local.evictions
+        })
+        if self.client is None:
+            return stats
+
         try:
             info = self.client.info()
-            return {
+            stats.update({
                 "connected_clients": info.get("connected_clients", 0),
                 "used_memory_human": info.get("used_memory_human", "0B"),
                 "total_commands_processed": info.get("total_commands_processed", 0),
                 "keyspace_hits": info.get("keyspace_hits", 0),
                 "keyspace_misses": info.get("keyspace_misses", 0),
                 "uptime_in_seconds": info.get("uptime_in_seconds", 0)
-            }
+            })
         except Exception as e:
             logger.error(f"Get cache stats error: {e}")
-            return {"error": str(e)}
+            stats['error'] = str(e)
+        return stats
 
 # Global cache instance
 cache_service = CacheService()
 
+def _current_tenant() -> Optional[str]:
+    try:
+        from flask import g
+        return getattr(g, 'tenant_id', None)
+    except RuntimeError:
+        return None
+
+def make_key(*parts: Any) -> str:
+    """Stable key for arbitrary arguments (the same in every worker process)"""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
 # Cache decorators for easy use
-def cached(ttl: int = 3600, key_prefix: str = ""):
-    """Decorator to cache function results"""
+def cached(ttl: int = 3600, key_prefix: str = "", tags: Iterable[str] = (), tenant_scoped: bool = True):
+    """Decorator to cache function results (scoped to the request's tenant by default)"""
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             # Generate cache key from function name and arguments
-            cache_key = f"{key_prefix}:{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
-            
-            # Try to get from cache
-            cached_result = cache_service.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache_service.set(cache_key, result, ttl)
-            return result
+            cache_key = f"{key_prefix}:{func.__name__}:{make_key(args, kwargs)}"
+            tenant_id = _current_tenant() if tenant_scoped else None
+            return cache_service.get_or_set(cache_key, lambda: func(*args, **kwargs), ttl,
+                                            tenant_id=tenant_id, tags=tags)
         return wrapper
     return decorator
 
-def invalidate_cache(pattern: str):
-    """Decorator to invalidate cache after function execution"""
+def invalidate_cache(pattern: str = None, tags: Iterable[str] = (), tenant_scoped: bool = True):
+    """Decorator to invalidate cache (keys matching ``pattern`` and/or ``tags``) after function execution"""
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             result = func(*args, **kwargs)
-            # Invalidate cache based on pattern
-            if cache_service.client:
-                keys = cache_service.client.keys(pattern)
-                if keys:
-                    cache_service.client.delete(*keys)
+            if pattern:
+                cache_service.delete_pattern(pattern)
+            if tags:
+                cache_service.invalidate_tags(*tags, tenant_id=_current_tenant() if tenant_scoped else None)
             return result
         return wrapper
     return decorator
@@ -0,0 +1,334 @@
+"""
+Cash-Flow Forecast
+Direct-method cash forecasting for treasury: 13 weeks and 12 months, several
+scenarios at once.
+
+Three inputs are read with two queries:
+
+- daily inflows/outflows of the cash accounts (asset accounts whose code
+  starts with one of ``CASHFLOW_CASH_ACCOUNT_PREFIXES``), summed per
+  ``doc_date`` in SQL over ``CASHFLOW_HISTORY_DAYS``; everything older is
+  folded into the opening balance by the same GROUP BY;
+- open receivables and payables, summed per due date.
+
+The projection is plain NumPy over day-indexed arrays:
+
+- recurring items: a day of the month that moved cash in at least
+  ``RECURRING_MIN_HITS`` of the last ``RECURRING_MONTHS`` complete months
+  recurs with the smallest of those amounts (rent, payroll, subscriptions);
+- seasonal baseline: what is left is averaged per calendar month into a
+  seasonal index, scaled to the level of the trailing year;
+- open AR/AP land on their due dates (overdue ones tomorrow), shifted by each
+  scenario's collection/payment delay. Known items replace expected flows
+  rather than add to them: the cumulative projection is the larger of the
+  cumulative baseline and the cumulative schedule.
+
+All scenarios are computed together as (scenario, day) arrays and then summed
+into weeks and months. Results are cached per tenant in ``cache_service``
+under the ``cashflow_forecast`` tag; ``init_app`` invalidates the tag when a
+commit posts or unposts a journal entry or changes a receivable or payable.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Tuple
+
+import numpy as np
+from sqlalchemy import case, event, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session, attributes
+
+logger = logging.getLogger(__name__)
+
+CACHE_TAG = 'cashflow_forecast'
+
+# Assumptions per scenario: multipliers on the expected (baseline + recurring)
+# flows and extra days before open receivables are collected / payables paid
+SCENARIOS = {
+    'base': {'inflow': 1.0, 'outflow': 1.0, 'collection_delay': 0, 'payment_delay': 0},
+    'optimistic': {'inflow': 1.1, 'outflow': 0.9, 'collection_delay': 0, 'payment_delay': 0},
+    'pessimistic': {'inflow': 0.9, 'outflow': 1.1, 'collection_delay': 15, 'payment_delay': 0},
+}
+
+WEEKS = 13
+MONTHS = 12
+RECURRING_MONTHS = 12
+RECURRING_MIN_HITS = 10
+LEVEL_DAYS = 365
+
+def _month_start(day: date, months_ahead: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + months_ahead
+    return date(index // 12, index % 12 + 1, 1)
+
+def _calendar(first: date, days: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Month number (months since 1970), month of year (0-11) and day of month (0-30) of each day"""
+    dates = np.datetime64(first, 'D') + np.arange(days)
+    months = dates.astype('datetime64[M]')
+    month_index = months.astype(np.int64)
+    return month_index, month_index % 12, (dates - months.astype('datetime64[D]')).astype(np.int64)
+
+def recurring_profile(flows: np.ndarray, month_index: np.ndarray, day_of_month: np.ndarray,
+                      current_month: int) -> np.ndarray:
+    """
+    Amount (31,) that recurs on each day of the month: the smallest flow on that
+    day in the complete months before ``current_month``, if it moved cash in
+    enough of them; 0 otherwise
+    """
+    first_month = current_month - RECURRING_MONTHS
+    window = (month_index >= first_month) & (month_index < current_month)
+    grid = np.zeros((RECURRING_MONTHS, 31))
+    grid[month_index[window] - first_month, day_of_month[window]] = flows[window]
+    present = grid > 0
+    hits = present.sum(axis=0)
+    floor = np.where(present, grid, np.inf).min(axis=0)
+    return np.where(hits >= RECURRING_MIN_HITS, floor, 0.0)
+
+def seasonal_baseline(flows: np.ndarray, month_of_year: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Daily level of the trailing year and a seasonal index (12,) per calendar month"""
+    counts = np.bincount(month_of_year, minlength=12)
+    totals = np.bincount(month_of_year, weights=flows, minlength=12)
+    overall = flows.mean() if len(flows) else 0.0
+    seasonal = np.ones(12)
+    if overall > 0:
+        np.divide(totals, counts * overall, out=seasonal, where=counts > 0)
+    recent = slice(-min(LEVEL_DAYS, len(flows)), None) if len(flows) else slice(0, 0)
+    weight = seasonal[month_of_year[recent]].mean() if len(flows) else 1.0
+    level = flows[recent].mean() / weight if len(flows) and weight > 0 else 0.0
+    return level, seasonal
+
+def _schedule(offsets: np.ndarray, amounts: np.ndarray, delays: np.ndarray, horizon: int) -> np.ndarray:
+    """(scenario, day) array of open items placed on their due day plus each scenario's delay"""
+    schedule = np.zeros((len(delays), horizon))
+    if len(offsets):
+        days = np.maximum(offsets, 1)[None, :] + delays[:, None] - 1
+        rows = np.broadcast_to(np.arange(len(delays))[:, None], days.shape)
+        inside = days < horizon
+        np.add.at(schedule, (rows[inside], days[inside]), np.broadcast_to(amounts, days.shape)[inside])
+    return schedule
+
+def project(as_of: date, history_start: date, inflows: np.ndarray, outflows: np.ndarray,
+            opening_balance: float, receivables: Tuple[np.ndarray, np.ndarray],
+            payables: Tuple[np.ndarray, np.ndarray], scenarios: Dict[str, Dict]) -> Dict:
+    """
+    Forecast from day-indexed history (``inflows[i]`` is day ``history_start + i``
+    up to ``as_of``) and open items given as (days until due, amount) arrays
+    """
+    month_index, month_of_year, day_of_month = _calendar(history_start, len(inflows))
+    current_month = month_index[-1] if len(month_index) else 0
+    recurring_in = recurring_profile(inflows, month_index, day_of_month, current_month)
+    recurring_out = recurring_profile(outflows, month_index, day_of_month, current_month)
+    residual_in = inflows - np.where(inflows >= recurring_in[day_of_month], recurring_in[day_of_month], 0.0)
+    residual_out = outflows - np.where(outflows >= recurring_out[day_of_month], recurring_out[day_of_month], 0.0)
+    level_in, seasonal_in = seasonal_baseline(residual_in, month_of_year)
+    level_out, seasonal_out = seasonal_baseline(residual_out, month_of_year)
+
+    # Horizon: tomorrow through the end of the 12th month after this one
+    tomorrow = as_of + timedelta(days=1)
+    month_starts = [_month_start(as_of, i) for i in range(1, MONTHS + 2)]
+    horizon = (month_starts[-1] - tomorrow).days
+    _, future_moy, future_dom = _calendar(tomorrow, horizon)
+    expected_in = level_in * seasonal_in[future_moy] + recurring_in[future_dom]
+    expected_out = level_out * seasonal_out[future_moy] + recurring_out[future_dom]
+
+    names = list(scenarios)
+    assumptions = [dict(SCENARIOS['base'], **scenarios[name]) for name in names]
+    factor = lambda key: np.array([a[key] for a in assumptions], dtype=float)[:, None]
+    delay = lambda key: np.array([int(a[key]) for a in assumptions], dtype=np.int64)
+
+    known_in = _schedule(*receivables, delay('collection_delay'), horizon)
+    known_out = _schedule(*payables, delay('payment_delay'), horizon)
+    cumulative_in = np.maximum(np.cumsum(expected_in[None, :] * factor('inflow'), axis=1), np.cumsum(known_in, axis=1))
+    cumulative_out = np.maximum(np.cumsum(expected_out[None, :] * factor('outflow'), axis=1), np.cumsum(known_out, axis=1))
+    inflow = np.diff(cumulative_in, axis=1, prepend=0.0)
+    outflow = np.diff(cumulative_out, axis=1, prepend=0.0)
+    balance = opening_balance + cumulative_in - cumulative_out
+
+    week_shape = (len(names), WEEKS, 7)
+    week_in = inflow[:, :WEEKS * 7].reshape(week_shape).sum(axis=2)
+    week_out = outflow[:, :WEEKS * 7].reshape(week_shape).sum(axis=2)
+    week_close = balance[:, 6:WEEKS * 7:7]
+    week_min = balance[:, :WEEKS * 7].reshape(week_shape).min(axis=2)
+
+    # Days between tomorrow and the first of next month only move the opening balance
+    starts = np.array([(m - tomorrow).days for m in month_starts])
+    month_in = np.add.reduceat(inflow, starts[:-1], axis=1)
+    month_out = np.add.reduceat(outflow, starts[:-1], axis=1)
+    month_close = balance[:, starts[1:] - 1]
+    first_open = balance[:, starts[0] - 1] if starts[0] > 0 else np.full(len(names), opening_balance)
+    month_open = np.column_stack([first_open, month_close[:, :-1]])
+    lowest = balance.argmin(axis=1)
+
+    r = lambda values: np.round(values, 2).tolist()
+    result = {}
+    for s, name in enumerate(names):
+        result[name] = {
+            'assumptions': assumptions[s],
+            'weeks': [{
+                'week_start': (tomorrow + timedelta(days=7 * w)).isoformat(),
+                'week_end': (tomorrow + timedelta(days=7 * w + 6)).isoformat(),
+                'inflow': i, 'outflow': o, 'net': round(i - o, 2), 'closing_balance': c, 'min_balance': m
+            } for w, (i, o, c, m) in enumerate(zip(r(week_in[s]), r(week_out[s]), r(week_close[s]), r(week_min[s])))],
+            'months': [{
+                'month': month_starts[k].strftime('%Y-%m'),
+                'inflow': i, 'outflow': o, 'net': round(i - o, 2), 'opening_balance': b, 'closing_balance': c
+            } for k, (i, o, b, c) in enumerate(zip(r(month_in[s]), r(month_out[s]), r(month_open[s]), r(month_close[s])))],
+            'min_balance': round(float(balance[s, lowest[s]]), 2),
+            'min_balance_date': (tomorrow + timedelta(days=int(lowest[s]))).isoformat()
+        }
+
+    return {
+        'as_of': as_of.isoformat(),
+        'history_start': history_start.isoformat(),
+        'opening_balance': round(float(opening_balance), 2),
+        'recurring': {
+            'inflows': [{'day_of_month': int(d) + 1, 'amount': round(float(recurring_in[d]), 2)} for d in np.flatnonzero(recurring_in)],
+            'outflows': [{'day_of_month': int(d) + 1, 'amount': round(float(recurring_out[d]), 2)} for d in np.flatnonzero(recurring_out)]
+        },
+        'open_items': {
+            'receivables': round(float(receivables[1].sum()), 2),
+            'payables': round(float(payables[1].sum()), 2)
+        },
+        'scenarios': result
+    }
+
+class CashFlowForecaster:
+    """Loads cash history and open items for a tenant and caches the projection"""
+
+    def __init__(self):
+        self.cash_prefixes = ('10',)
+        self.history_days = 3 * 365
+        self.cache_ttl = 3600
+        self._listening = False
+
+    def init_app(self, app):
+        prefixes = app.config.get('CASHFLOW_CASH_ACCOUNT_PREFIXES', '10')
+        self.cash_prefixes = tuple(p.strip() for p in prefixes.split(',') if p.strip()) or ('10',)
+        self.history_days = int(app.config.get('CASHFLOW_HISTORY_DAYS', self.history_days))
+        self.cache_ttl = int(app.config.get('CASHFLOW_FORECAST_CACHE_TTL', self.cache_ttl))
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+            self._listening = True
+
+    # ------------------------------------------------------------------
+    # Cache invalidation on posting
+    # ------------------------------------------------------------------
+
+    def _after_flush(self, session, flush_context):
+        from modules.finance.models import JournalEntry
+        from modules.finance.advanced_models import AccountsPayable, AccountsReceivable
+        tenants = None
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, JournalEntry):
+                # Posting, and voiding or reversing a posted entry, both move cash
+                if (obj.status != 'posted' and obj not in session.deleted and
+                        'posted' not in attributes.get_history(obj, 'status').deleted):
+                    continue
+            elif not isinstance(obj, (AccountsReceivable, AccountsPayable)):
+                continue
+            if obj.tenant_id:
+                if tenants is None:
+                    tenants = session.info.setdefault('cashflow_forecast_tenants', set())
+                tenants.add(obj.tenant_id)
+
+    def _after_commit(self, session):
+        if session.in_nested_transaction():
+            return  # a savepoint released; the outer transaction may still roll back
+        tenants = session.info.pop('cashflow_forecast_tenants', None)
+        if tenants:
+            from services.cache_service import cache_service
+            for tenant_id in tenants:
+                cache_service.invalidate_tags(CACHE_TAG, tenant_id=tenant_id)
+
+    def _after_rollback(self, session):
+        if session.in_nested_transaction():
+            return
+        session.info.pop('cashflow_forecast_tenants', None)
+
+    # ------------------------------------------------------------------
+    # Forecast
+    # ------------------------------------------------------------------
+
+    def forecast(self, tenant_id: str, as_of: date = None, scenarios: Dict[str, Dict] = None,
+                 use_cache: bool = True) -> Dict:
+        """13-week and 12-month projections for every scenario; cached until the next posting"""
+        as_of = as_of or date.today()
+        scenarios = scenarios or SCENARIOS
+        if not use_cache:
+            return self.compute(tenant_id, as_of, scenarios)
+        from services.cache_service import cache_service
+        fingerprint = hashlib.md5(json.dumps(scenarios, sort_keys=True).encode()).hexdigest()[:12]
+        return cache_service.get_or_set(f"cashflow_forecast:{as_of.isoformat()}:{fingerprint}",
+                                        lambda: self.compute(tenant_id, as_of, scenarios),
+                                        self.cache_ttl, tenant_id=tenant_id, tags=[CACHE_TAG])
+
+    def compute(self, tenant_id: str, as_of: date, scenarios: Dict[str, Dict]) -> Dict:
+        history_start = as_of - timedelta(days=self.history_days - 1)
+        opening_balance, inflows, outflows = self._cash_history(tenant_id, history_start, as_of)
+        receivables, payables = self._open_items(tenant_id, as_of)
+        result = project(as_of, history_start, inflows, outflows, opening_balance,
+                         receivables, payables, scenarios)
+        result['tenant_id'] = tenant_id
+        result['generated_at'] = datetime.utcnow().isoformat()
+        return result
+
+    def _cash_history(self, tenant_id: str, start: date, as_of: date) -> Tuple[float, np.ndarray, np.ndarray]:
+        """Cash balance at ``as_of`` and daily debits/credits of the cash accounts since ``start``"""
+        from app import db
+        from modules.finance.models import Account, JournalEntry, JournalLine
+        day = case((JournalEntry.doc_date < start, None), else_=JournalEntry.doc_date)
+        rows = db.session.query(
+            day.label('day'),
+            func.sum(func.coalesce(JournalLine.debit_amount, 0.0)),
+            func.sum(func.coalesce(JournalLine.credit_amount, 0.0))
+        ).select_from(JournalLine).join(
+            JournalEntry, JournalEntry.id == JournalLine.journal_entry_id
+        ).join(Account, Account.id == JournalLine.account_id).filter(
+            JournalEntry.tenant_id == tenant_id,
+            JournalEntry.status == 'posted',
+            JournalEntry.doc_date <= as_of,
+            Account.tenant_id == tenant_id,
+            Account.type == 'asset',
+            or_(*[Account.code.like(f'{prefix}%') for prefix in self.cash_prefixes])
+        ).group_by(day).all()
+
+        days = (as_of - start).days + 1
+        inflows, outflows = np.zeros(days), np.zeros(days)
+        balance = 0.0
+        for day_value, debit, credit in rows:
+            balance += float(debit or 0) - float(credit or 0)
+            if day_value is not None:
+                if isinstance(day_value, str):
+                    day_value = date.fromisoformat(day_value[:10])
+                index = (day_value - start).days
+                inflows[index], outflows[index] = float(debit or 0), float(credit or 0)
+        return balance, inflows, outflows
+
+    def _open_items(self, tenant_id: str, as_of: date):
+        """(days until due, amount) arrays of open receivables and of open payables"""
+        from app import db
+        from modules.finance.advanced_models import AccountsPayable, AccountsReceivable
+        from modules.finance.aging_reports import CLOSED_STATUSES
+
+        def open_by_due_date(model, kind):
+            return select(literal(kind).label('kind'), model.due_date,
+                          func.sum(model.outstanding_amount)).where(
+                model.tenant_id == tenant_id,
+                model.status.notin_(CLOSED_STATUSES),
+                model.outstanding_amount > 0
+            ).group_by(model.due_date)
+
+        rows = db.session.execute(union_all(open_by_due_date(AccountsReceivable, 'ar'),
+                                            open_by_due_date(AccountsPayable, 'ap'))).all()
+        items = {'ar': ([], []), 'ap': ([], [])}
+        for kind, due_date, amount in rows:
+            if isinstance(due_date, str):
+                due_date = date.fromisoformat(due_date[:10])
+            items[kind][0].append((due_date - as_of).days)
+            items[kind][1].append(float(amount or 0))
+        return tuple((np.array(offsets, dtype=np.int64), np.array(amounts, dtype=float))
+                     for offsets, amounts in (items['ar'], items['ap']))
+
+cashflow_forecaster = CashFlowForecaster()
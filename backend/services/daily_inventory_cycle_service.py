@@ -2,13 +2,22 @@
 Daily Inventory Cycle Service
 Date: September 18, 2025
 Purpose: Daily opening/closing inventory cycles like finance module
+
+The cycle engine is set-based: opening balances are captured with one
+stock-level read and a bulk insert, and closing balances are computed from a
+single grouped query over the day's transactions (using a sargable
+``transaction_date`` range) followed by a bulk update. Closing work can be
+partitioned by warehouse across a process pool for very large stock sets.
 """
 
 from __future__ import annotations
 import logging
-from datetime import datetime, date, timedelta
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta, time as dt_time
 from typing import Dict, List, Optional, Tuple
-from sqlalchemy import func, and_, or_, text
+from sqlalchemy import func, and_, or_, text, bindparam, create_engine, update
+from sqlalchemy.pool import NullPool
 import json
 import time
 
@@ -23,14 +32,133 @@ from modules.inventory.advanced_models import (
 
 logger = logging.getLogger(__name__)
 
+# Rows per bulk INSERT/UPDATE statement
+BULK_CHUNK_SIZE = 5000
+
+# Sentinel partition meaning "every warehouse" (serial, single-transaction close)
+ALL_WAREHOUSES = object()
+
+MOVEMENT_FIELDS = (
+    'received_qty', 'received_value', 'received_count',
+    'issued_qty', 'issued_value', 'issued_count',
+    'transfer_in_qty', 'transfer_in_value', 'transfer_in_count',
+    'transfer_out_qty', 'transfer_out_value', 'transfer_out_count',
+    'adjusted_qty', 'adjusted_value', 'adjusted_count',
+)
+
+
+def _day_range(cycle_date: date) -> Tuple[datetime, datetime]:
+    """Half-open [start, end) datetime range for a cycle date (index friendly)"""
+    start = datetime.combine(cycle_date, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+def _empty_movements() -> Dict:
+    return dict.fromkeys(MOVEMENT_FIELDS, 0)
+
+
+def _chunks(items: List, size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _apply_closing_movements(conn, cycle_date: date, movements: Dict,
+                             warehouse_id=ALL_WAREHOUSES) -> Dict:
+    """
+    Compute closing balances for one warehouse partition and write them with
+    executemany UPDATEs. ``movements`` maps balance keys to aggregated
+    movements; keys without movements close at their opening balance.
+    """
+    table = DailyInventoryBalance.__table__
+    query = db.select(
+        table.c.id, table.c.product_id, table.c.variant_id,
+        table.c.simple_warehouse_id, table.c.lot_batch_id,
+        table.c.opening_quantity, table.c.opening_total_value
+    ).where(table.c.cycle_date == cycle_date)
+    if warehouse_id is not ALL_WAREHOUSES:
+        if warehouse_id is None:
+            query = query.where(table.c.simple_warehouse_id.is_(None))
+        else:
+            query = query.where(table.c.simple_warehouse_id == warehouse_id)
+
+    updates = []
+    total_quantity = 0.0
+    total_value = 0.0
+    for row in conn.execute(query):
+        key = (row.product_id, row.variant_id, row.simple_warehouse_id, row.lot_batch_id)
+        m = movements.get(key) or _empty_movements()
+
+        net_quantity = (m['received_qty'] + m['transfer_in_qty'] + m['adjusted_qty'] -
+                        m['issued_qty'] - m['transfer_out_qty'])
+        net_value = (m['received_value'] + m['transfer_in_value'] + m['adjusted_value'] -
+                     m['issued_value'] - m['transfer_out_value'])
+
+        closing_quantity = (row.opening_quantity or 0.0) + net_quantity
+        if closing_quantity > 0:
+            closing_value = (row.opening_total_value or 0.0) + net_value
+            closing_unit_cost = closing_value / closing_quantity
+        else:
+            closing_value = 0.0
+            closing_unit_cost = 0.0
+
+        total_quantity += closing_quantity
+        total_value += closing_value
+        updates.append({
+            'b_id': row.id,
+            'quantity_received': m['received_qty'],
+            'quantity_issued': m['issued_qty'],
+            'quantity_transferred_in': m['transfer_in_qty'],
+            'quantity_transferred_out': m['transfer_out_qty'],
+            'quantity_adjusted': m['adjusted_qty'],
+            'value_received': m['received_value'],
+            'value_issued': m['issued_value'],
+            'value_transferred_in': m['transfer_in_value'],
+            'value_transferred_out': m['transfer_out_value'],
+            'value_adjusted': m['adjusted_value'],
+            'net_quantity_change': net_quantity,
+            'net_value_change': net_value,
+            'closing_quantity': closing_quantity,
+            'closing_total_value': closing_value,
+            'closing_unit_cost': closing_unit_cost,
+        })
+
+    if updates:
+        stmt = update(table).where(table.c.id == bindparam('b_id')).values(
+            {name: bindparam(name) for name in updates[0] if name != 'b_id'}
+        )
+        for chunk in _chunks(updates):
+            conn.execute(stmt, chunk)
+
+    return {
+        'records_updated': len(updates),
+        'total_quantity': total_quantity,
+        'total_value': total_value,
+    }
+
+
+def _close_warehouse_partition(database_url: str, cycle_date: date,
+                               warehouse_id, movements: Dict) -> Dict:
+    """Process-pool entry point: close one warehouse on a private connection"""
+    engine = create_engine(database_url, poolclass=NullPool)
+    try:
+        with engine.begin() as conn:
+            return _apply_closing_movements(conn, cycle_date, movements, warehouse_id)
+    finally:
+        engine.dispose()
+
+
 class DailyInventoryCycleService:
     """
     Daily inventory cycle service - handles opening/closing inventory balances
     Similar to DailyCycleService but for inventory management
     """
     
-    def __init__(self, grace_period_hours: int = 2):
+    def __init__(self, grace_period_hours: int = 2, max_workers: int = None):
         self.grace_period_hours = grace_period_hours
+        # Closing runs in-process by default; >1 partitions the work by warehouse
+        if max_workers is None:
+            max_workers = int(os.getenv('INVENTORY_CYCLE_WORKERS', '1'))
+        self.max_workers = max(1, max_workers)
     
     def capture_opening_inventory(self, cycle_date: date, user_id: str,
                                 user_name: str = None, user_role: str = None) -> Dict:
@@ -39,6 +167,7 @@ class DailyInventoryCycleService:
         Similar to capture_opening_balances in finance module
         """
         start_time = time.time()
+        cycle_status = None
         
         try:
             # Check if opening already captured
@@ -76,86 +205,99 @@ class DailyInventoryCycleService:
                 started_at=datetime.utcnow()
             )
             
-            # Get previous day's closing balances (if any)
-            previous_date = cycle_date - timedelta(days=1)
-            previous_balances = {}
-            
-            previous_closing = DailyInventoryBalance.query.filter_by(
-                cycle_date=previous_date
-            ).all()
-            
-            for balance in previous_closing:
-                key = self._get_balance_key(
-                    balance.product_id, balance.variant_id,
-                    balance.simple_warehouse_id, balance.lot_batch_id
-                )
-                previous_balances[key] = {
-                    'quantity': balance.closing_quantity,
-                    'unit_cost': balance.closing_unit_cost,
-                    'total_value': balance.closing_total_value
-                }
+            # A failed earlier attempt may have left partial rows behind
+            DailyInventoryBalance.query.filter_by(cycle_date=cycle_date).delete(
+                synchronize_session=False
+            )
             
-            # Get current stock levels for all products/locations
-            current_stock = db.session.query(StockLevel).filter(
-                StockLevel.quantity_on_hand > 0
-            ).all()
+            # Previous day's closing balances (if any), keyed by balance key
+            previous_date = cycle_date - timedelta(days=1)
+            previous_balances = {
+                self._get_balance_key(row.product_id, row.variant_id,
+                                      row.simple_warehouse_id, row.lot_batch_id):
+                    (row.closing_quantity, row.closing_unit_cost, row.closing_total_value)
+                for row in db.session.query(
+                    DailyInventoryBalance.product_id,
+                    DailyInventoryBalance.variant_id,
+                    DailyInventoryBalance.simple_warehouse_id,
+                    DailyInventoryBalance.lot_batch_id,
+                    DailyInventoryBalance.closing_quantity,
+                    DailyInventoryBalance.closing_unit_cost,
+                    DailyInventoryBalance.closing_total_value
+                ).filter(DailyInventoryBalance.cycle_date == previous_date)
+            }
             
-            records_processed = 0
-            records_created = 0
+            # Current stock levels for all products/locations, read as plain rows
+            current_stock = db.session.query(
+                StockLevel.product_id,
+                StockLevel.variant_id,
+                StockLevel.simple_warehouse_id,
+                StockLevel.lot_batch_id,
+                StockLevel.quantity_on_hand,
+                StockLevel.unit_cost,
+                StockLevel.total_value,
+                StockLevel.cost_currency,
+                InventoryProduct.cost_method
+            ).outerjoin(
+                InventoryProduct, InventoryProduct.id == StockLevel.product_id
+            ).filter(StockLevel.quantity_on_hand > 0)
+            
+            rows = []
+            product_ids = set()
+            warehouse_ids = set()
+            total_value = 0.0
+            total_quantity = 0.0
             
             for stock in current_stock:
-                # Create daily inventory balance record
                 balance_key = self._get_balance_key(
                     stock.product_id, stock.variant_id,
                     stock.simple_warehouse_id, stock.lot_batch_id
                 )
                 
                 # Use previous closing as opening, or current stock if no previous
-                if balance_key in previous_balances:
-                    opening_qty = previous_balances[balance_key]['quantity']
-                    opening_cost = previous_balances[balance_key]['unit_cost']
-                    opening_value = previous_balances[balance_key]['total_value']
+                previous = previous_balances.get(balance_key)
+                if previous is not None:
+                    opening_qty, opening_cost, opening_value = previous
                 else:
                     opening_qty = stock.quantity_on_hand
                     opening_cost = stock.unit_cost
                     opening_value = stock.total_value
                 
-                daily_balance = DailyInventoryBalance(
-                    cycle_date=cycle_date,
-                    product_id=stock.product_id,
-                    variant_id=stock.variant_id,
-                    simple_warehouse_id=stock.simple_warehouse_id,
-                    lot_batch_id=stock.lot_batch_id,
-                    opening_quantity=opening_qty,
-                    opening_unit_cost=opening_cost,
-                    opening_total_value=opening_value,
-                    closing_quantity=opening_qty,  # Initialize closing with opening
-                    closing_unit_cost=opening_cost,
-                    closing_total_value=opening_value,
-                    cost_method=stock.product.cost_method if stock.product else 'FIFO',
-                    currency=stock.cost_currency or 'USD',
-                    created_by=user_id
-                )
+                rows.append({
+                    'cycle_date': cycle_date,
+                    'product_id': stock.product_id,
+                    'variant_id': stock.variant_id,
+                    'simple_warehouse_id': stock.simple_warehouse_id,
+                    'lot_batch_id': stock.lot_batch_id,
+                    'opening_quantity': opening_qty,
+                    'opening_unit_cost': opening_cost,
+                    'opening_total_value': opening_value,
+                    'closing_quantity': opening_qty,  # Initialize closing with opening
+                    'closing_unit_cost': opening_cost,
+                    'closing_total_value': opening_value,
+                    'cost_method': stock.cost_method or 'FIFO',
+                    'currency': stock.cost_currency or 'USD'
+                })
                 
-                db.session.add(daily_balance)
-                records_created += 1
-                records_processed += 1
+                product_ids.add(stock.product_id)
+                if stock.simple_warehouse_id:
+                    warehouse_ids.add(stock.simple_warehouse_id)
+                total_value += opening_value or 0.0
+                total_quantity += opening_qty or 0.0
+            
+            for chunk in _chunks(rows):
+                db.session.bulk_insert_mappings(DailyInventoryBalance, chunk)
+            
+            records_created = len(rows)
+            records_processed = records_created
             
             # Update cycle status
             cycle_status.opening_status = 'completed'
             cycle_status.opening_completed_at = datetime.utcnow()
             cycle_status.opening_records_count = records_created
-            cycle_status.total_products_processed = len(set(s.product_id for s in current_stock))
-            cycle_status.total_locations_processed = len(set(s.simple_warehouse_id for s in current_stock if s.simple_warehouse_id))
-            
-            # Calculate total inventory value
-            total_value = sum(balance.opening_total_value for balance in 
-                            db.session.query(DailyInventoryBalance).filter_by(cycle_date=cycle_date).all())
+            cycle_status.total_products_processed = len(product_ids)
+            cycle_status.total_locations_processed = len(warehouse_ids)
             cycle_status.total_inventory_value = total_value
-            
-            # Calculate total quantity on hand
-            total_quantity = sum(balance.opening_quantity for balance in 
-                               db.session.query(DailyInventoryBalance).filter_by(cycle_date=cycle_date).all())
             cycle_status.total_quantity_on_hand = total_quantity
             
             db.session.commit()
@@ -190,7 +332,7 @@ class DailyInventoryCycleService:
             if cycle_status:
                 cycle_status.opening_status = 'error'
                 cycle_status.error_message = str(e)
-                cycle_status.error_count += 1
+                cycle_status.error_count = (cycle_status.error_count or 0) + 1
             
             if 'audit_log' in locals():
                 audit_log.operation_status = 'error'
@@ -214,6 +356,7 @@ class DailyInventoryCycleService:
         Similar to calculate_closing_balances in finance module
         """
         start_time = time.time()
+        cycle_status = None
         
         try:
             # Check prerequisites
@@ -238,7 +381,7 @@ class DailyInventoryCycleService:
             cycle_status.closing_started_at = datetime.utcnow()
             cycle_status.closing_started_by = user_id
             
-            # Log operation
+            # Log operation (commits the status change as well)
             audit_log = DailyInventoryCycleAuditLog.log_operation(
                 cycle_date=cycle_date,
                 operation='closing_calculation',
@@ -249,73 +392,24 @@ class DailyInventoryCycleService:
                 started_at=datetime.utcnow()
             )
             
-            # Get all opening balances for the day
-            opening_balances = DailyInventoryBalance.query.filter_by(
-                cycle_date=cycle_date
-            ).all()
-            
-            records_processed = 0
-            records_updated = 0
+            # One grouped query for every key's movements
+            movements = self._aggregate_daily_movements(cycle_date)
             
-            # Process each balance record
-            for balance in opening_balances:
-                # Get transactions for this product/location for the day
-                transactions = self._get_daily_transactions(
-                    cycle_date, balance.product_id, balance.variant_id,
-                    balance.simple_warehouse_id, balance.lot_batch_id
-                )
-                
-                # Calculate movements
-                movements = self._calculate_movements(transactions, balance.cost_method)
-                
-                # Update balance record
-                balance.quantity_received = movements['received_qty']
-                balance.quantity_issued = movements['issued_qty']
-                balance.quantity_transferred_in = movements['transfer_in_qty']
-                balance.quantity_transferred_out = movements['transfer_out_qty']
-                balance.quantity_adjusted = movements['adjusted_qty']
-                
-                balance.value_received = movements['received_value']
-                balance.value_issued = movements['issued_value']
-                balance.value_transferred_in = movements['transfer_in_value']
-                balance.value_transferred_out = movements['transfer_out_value']
-                balance.value_adjusted = movements['adjusted_value']
-                
-                # Calculate net changes
-                balance.net_quantity_change = (
-                    movements['received_qty'] + movements['transfer_in_qty'] + movements['adjusted_qty'] -
-                    movements['issued_qty'] - movements['transfer_out_qty']
-                )
-                
-                balance.net_value_change = (
-                    movements['received_value'] + movements['transfer_in_value'] + movements['adjusted_value'] -
-                    movements['issued_value'] - movements['transfer_out_value']
-                )
-                
-                # Calculate closing balances
-                balance.closing_quantity = balance.opening_quantity + balance.net_quantity_change
-                
-                if balance.closing_quantity > 0:
-                    balance.closing_total_value = balance.opening_total_value + balance.net_value_change
-                    balance.closing_unit_cost = balance.closing_total_value / balance.closing_quantity
-                else:
-                    balance.closing_total_value = 0.0
-                    balance.closing_unit_cost = 0.0
-                
-                records_updated += 1
-                records_processed += 1
+            # Closing balances, either in this transaction or per warehouse in a pool
+            result = self._close_balances(cycle_date, movements)
+            records_updated = result['records_updated']
+            records_processed = records_updated
             
-            # Create transaction summaries
-            self._create_transaction_summaries(cycle_date)
+            # Create transaction summaries from the same aggregates
+            self._create_transaction_summaries(cycle_date, movements)
             
             # Update cycle status
             cycle_status.closing_status = 'completed'
             cycle_status.closing_completed_at = datetime.utcnow()
             cycle_status.closing_records_count = records_updated
             
-            # Recalculate totals
-            total_value = sum(balance.closing_total_value for balance in opening_balances)
-            total_quantity = sum(balance.closing_quantity for balance in opening_balances)
+            total_value = result['total_value']
+            total_quantity = result['total_quantity']
             cycle_status.total_inventory_value = total_value
             cycle_status.total_quantity_on_hand = total_quantity
             
@@ -351,7 +445,7 @@ class DailyInventoryCycleService:
             if cycle_status:
                 cycle_status.closing_status = 'error'
                 cycle_status.error_message = str(e)
-                cycle_status.error_count += 1
+                cycle_status.error_count = (cycle_status.error_count or 0) + 1
             
             if 'audit_log' in locals():
                 audit_log.operation_status = 'error'
@@ -444,122 +538,157 @@ class DailyInventoryCycleService:
             }
     
     def _get_balance_key(self, product_id: int, variant_id: int = None,
-                        location_id: int = None, lot_id: int = None) -> str:
+                        location_id: int = None, lot_id: int = None) -> Tuple:
         """Generate unique key for inventory balance"""
-        return f"{product_id}_{variant_id or 0}_{location_id or 0}_{lot_id or 0}"
+        return (product_id, variant_id, location_id, lot_id)
     
-    def _get_daily_transactions(self, cycle_date: date, product_id: int,
-                              variant_id: int = None, location_id: int = None,
-                              lot_id: int = None) -> List:
-        """Get all transactions for a product/location on a specific date"""
-        query = InventoryTransaction.query.filter(
-            func.date(InventoryTransaction.transaction_date) == cycle_date,
-            InventoryTransaction.product_id == product_id
+    def _aggregate_daily_movements(self, cycle_date: date) -> Dict[Tuple, Dict]:
+        """
+        Aggregate the day's transactions for every balance key in one grouped
+        query. Receipts and adjustments land on the destination warehouse
+        (falling back to the source), issues on the source, and transfers
+        count as out of the source and into the destination.
+        """
+        day_start, day_end = _day_range(cycle_date)
+        grouped = db.session.query(
+            InventoryTransaction.transaction_type,
+            InventoryTransaction.product_id,
+            InventoryTransaction.variant_id,
+            InventoryTransaction.lot_batch_id,
+            InventoryTransaction.from_simple_warehouse_id,
+            InventoryTransaction.to_simple_warehouse_id,
+            func.count(InventoryTransaction.id),
+            func.coalesce(func.sum(InventoryTransaction.quantity), 0.0),
+            func.coalesce(func.sum(InventoryTransaction.total_cost), 0.0)
+        ).filter(
+            InventoryTransaction.transaction_date >= day_start,
+            InventoryTransaction.transaction_date < day_end
+        ).group_by(
+            InventoryTransaction.transaction_type,
+            InventoryTransaction.product_id,
+            InventoryTransaction.variant_id,
+            InventoryTransaction.lot_batch_id,
+            InventoryTransaction.from_simple_warehouse_id,
+            InventoryTransaction.to_simple_warehouse_id
         )
         
-        if variant_id:
-            query = query.filter(InventoryTransaction.variant_id == variant_id)
-        if location_id:
-            query = query.filter(
-                or_(
-                    InventoryTransaction.from_simple_warehouse_id == location_id,
-                    InventoryTransaction.to_simple_warehouse_id == location_id
-                )
-            )
-        if lot_id:
-            query = query.filter(InventoryTransaction.lot_batch_id == lot_id)
+        movements = {}
         
-        return query.all()
-    
-    def _calculate_movements(self, transactions: List, cost_method: str = 'FIFO') -> Dict:
-        """Calculate quantity and value movements from transactions"""
-        movements = {
-            'received_qty': 0.0, 'received_value': 0.0,
-            'issued_qty': 0.0, 'issued_value': 0.0,
-            'transfer_in_qty': 0.0, 'transfer_in_value': 0.0,
-            'transfer_out_qty': 0.0, 'transfer_out_value': 0.0,
-            'adjusted_qty': 0.0, 'adjusted_value': 0.0
-        }
+        def add(location_id, prefix, count, qty, value):
+            key = self._get_balance_key(product_id, variant_id, location_id, lot_id)
+            m = movements.get(key)
+            if m is None:
+                m = movements[key] = _empty_movements()
+            m[f'{prefix}_count'] += count
+            m[f'{prefix}_qty'] += qty
+            m[f'{prefix}_value'] += value
         
-        for txn in transactions:
-            if txn.transaction_type == 'receive':
-                movements['received_qty'] += txn.quantity
-                movements['received_value'] += txn.total_cost
-            elif txn.transaction_type == 'issue':
-                movements['issued_qty'] += txn.quantity
-                movements['issued_value'] += txn.total_cost
-            elif txn.transaction_type == 'transfer':
-                # Handle as transfer in or out based on location
-                movements['transfer_in_qty'] += txn.quantity
-                movements['transfer_in_value'] += txn.total_cost
-            elif txn.transaction_type == 'adjustment':
-                movements['adjusted_qty'] += txn.quantity  # Can be negative
-                movements['adjusted_value'] += txn.total_cost
+        for (txn_type, product_id, variant_id, lot_id,
+             from_wh, to_wh, count, qty, value) in grouped:
+            if txn_type == 'receive':
+                add(to_wh if to_wh is not None else from_wh, 'received', count, qty, value)
+            elif txn_type == 'issue':
+                add(from_wh if from_wh is not None else to_wh, 'issued', count, qty, value)
+            elif txn_type == 'adjustment':
+                # Can be negative
+                add(to_wh if to_wh is not None else from_wh, 'adjusted', count, qty, value)
+            elif txn_type == 'transfer':
+                if from_wh is not None:
+                    add(from_wh, 'transfer_out', count, qty, value)
+                if to_wh is not None:
+                    add(to_wh, 'transfer_in', count, qty, value)
         
         return movements
     
-    def _create_transaction_summaries(self, cycle_date: date):
-        """Create daily transaction summaries"""
-        # Get all transactions for the day
-        transactions = InventoryTransaction.query.filter(
-            func.date(InventoryTransaction.transaction_date) == cycle_date
-        ).all()
+    def _close_balances(self, cycle_date: date, movements: Dict[Tuple, Dict]) -> Dict:
+        """
+        Write closing balances for the day. Runs inside the current session
+        transaction unless a process pool is configured and the database
+        supports concurrent writers, in which case each warehouse partition is
+        closed by a worker on its own connection. Closing is a pure function of
+        opening balances and movements, so a partially failed run is safely
+        recomputed on retry.
+        """
+        warehouse_ids = [
+            row[0] for row in db.session.query(
+                DailyInventoryBalance.simple_warehouse_id
+            ).filter(DailyInventoryBalance.cycle_date == cycle_date).distinct()
+        ]
+        
+        if (self.max_workers <= 1 or len(warehouse_ids) <= 1
+                or db.engine.dialect.name == 'sqlite'):
+            return _apply_closing_movements(db.session.connection(), cycle_date, movements)
+        
+        # Release locks held by this session before workers write
+        db.session.commit()
+        
+        by_warehouse = {warehouse_id: {} for warehouse_id in warehouse_ids}
+        for key, m in movements.items():
+            if key[2] in by_warehouse:
+                by_warehouse[key[2]][key] = m
         
-        # Group by product and location
+        database_url = db.engine.url.render_as_string(hide_password=False)
+        totals = {'records_updated': 0, 'total_quantity': 0.0, 'total_value': 0.0}
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(warehouse_ids))) as pool:
+            futures = [
+                pool.submit(_close_warehouse_partition, database_url, cycle_date,
+                            warehouse_id, by_warehouse[warehouse_id])
+                for warehouse_id in warehouse_ids
+            ]
+            for future in futures:
+                partial = future.result()
+                for name in totals:
+                    totals[name] += partial[name]
+        return totals
+    
+    def _create_transaction_summaries(self, cycle_date: date, movements: Dict[Tuple, Dict]):
+        """Create daily transaction summaries from the aggregated movements"""
+        # Summaries are per product/variant/warehouse, so fold lots together
         summaries = {}
+        for (product_id, variant_id, warehouse_id, _lot_id), m in movements.items():
+            key = (product_id, variant_id, warehouse_id)
+            summary = summaries.get(key)
+            if summary is None:
+                summary = summaries[key] = _empty_movements()
+            for name in MOVEMENT_FIELDS:
+                summary[name] += m[name]
         
-        for txn in transactions:
-            key = f"{txn.product_id}_{txn.variant_id or 0}_{txn.from_simple_warehouse_id or 0}"
-            
-            if key not in summaries:
-                summaries[key] = {
-                    'product_id': txn.product_id,
-                    'variant_id': txn.variant_id,
-                    'warehouse_id': txn.from_simple_warehouse_id,
-                    'receipts_count': 0, 'receipts_qty': 0.0, 'receipts_value': 0.0,
-                    'issues_count': 0, 'issues_qty': 0.0, 'issues_value': 0.0,
-                    'transfers_in_count': 0, 'transfers_in_qty': 0.0, 'transfers_in_value': 0.0,
-                    'transfers_out_count': 0, 'transfers_out_qty': 0.0, 'transfers_out_value': 0.0,
-                    'adjustments_count': 0, 'adjustments_qty': 0.0, 'adjustments_value': 0.0,
-                    'total_transactions': 0
-                }
-            
-            summary = summaries[key]
-            summary['total_transactions'] += 1
-            
-            if txn.transaction_type == 'receive':
-                summary['receipts_count'] += 1
-                summary['receipts_qty'] += txn.quantity
-                summary['receipts_value'] += txn.total_cost
-            elif txn.transaction_type == 'issue':
-                summary['issues_count'] += 1
-                summary['issues_qty'] += txn.quantity
-                summary['issues_value'] += txn.total_cost
-            elif txn.transaction_type == 'adjustment':
-                summary['adjustments_count'] += 1
-                summary['adjustments_qty'] += txn.quantity
-                summary['adjustments_value'] += txn.total_cost
+        DailyInventoryTransactionSummary.query.filter_by(summary_date=cycle_date).delete(
+            synchronize_session=False
+        )
         
-        # Create summary records
-        for key, data in summaries.items():
-            summary_record = DailyInventoryTransactionSummary(
-                summary_date=cycle_date,
-                product_id=data['product_id'],
-                variant_id=data['variant_id'],
-                simple_warehouse_id=data['warehouse_id'],
-                receipts_count=data['receipts_count'],
-                receipts_quantity=data['receipts_qty'],
-                receipts_value=data['receipts_value'],
-                issues_count=data['issues_count'],
-                issues_quantity=data['issues_qty'],
-                issues_value=data['issues_value'],
-                adjustments_count=data['adjustments_count'],
-                adjustments_quantity=data['adjustments_qty'],
-                adjustments_value=data['adjustments_value'],
-                total_transactions=data['total_transactions'],
-                net_quantity_change=(data['receipts_qty'] - data['issues_qty'] + data['adjustments_qty']),
-                net_value_change=(data['receipts_value'] - data['issues_value'] + data['adjustments_value'])
-            )
-            
-            db.session.add(summary_record)
-
+        rows = []
+        for (product_id, variant_id, warehouse_id), data in summaries.items():
+            rows.append({
+                'summary_date': cycle_date,
+                'product_id': product_id,
+                'variant_id': variant_id,
+                'simple_warehouse_id': warehouse_id,
+                'receipts_count': data['received_count'],
+                'receipts_quantity': data['received_qty'],
+                'receipts_value': data['received_value'],
+                'issues_count': data['issued_count'],
+                'issues_quantity': data['issued_qty'],
+                'issues_value': data['issued_value'],
+                'transfers_in_count': data['transfer_in_count'],
+                'transfers_in_quantity': data['transfer_in_qty'],
+                'transfers_in_value': data['transfer_in_value'],
+                'transfers_out_count': data['transfer_out_count'],
+                'transfers_out_quantity': data['transfer_out_qty'],
+                'transfers_out_value': data['transfer_out_value'],
+                'adjustments_count': data['adjusted_count'],
+                'adjustments_quantity': data['adjusted_qty'],
+                'adjustments_value': data['adjusted_value'],
+                'total_transactions': (data['received_count'] + data['issued_count'] +
+                                       data['transfer_in_count'] + data['transfer_out_count'] +
+                                       data['adjusted_count']),
+                'net_quantity_change': (data['received_qty'] - data['issued_qty'] +
+                                        data['transfer_in_qty'] - data['transfer_out_qty'] +
+                                        data['adjusted_qty']),
+                'net_value_change': (data['received_value'] - data['issued_value'] +
+                                     data['transfer_in_value'] - data['transfer_out_value'] +
+                                     data['adjusted_value'])
+            })
+        
+        for chunk in _chunks(rows):
+            db.session.bulk_insert_mappings(DailyInventoryTransactionSummary, chunk)
@@ -0,0 +1,548 @@
+"""
+Email Outbox
+Queued, batched email delivery for EmailService and bulk sends.
+
+``queue`` adds one ``email_outbox`` row to the caller's session and
+``queue_many`` bulk-inserts many, so a request never waits on SMTP and a
+message exists exactly when the transaction that produced it commits.
+
+After the commit a sender thread is woken. It claims due messages in batches
+(lowest ``priority`` first, so a password reset is not stuck behind a CRM
+campaign) and spreads each batch over ``EMAIL_SMTP_CONNECTIONS`` worker
+threads. Every worker keeps its own SMTP session open between messages and
+batches (STARTTLS and login happen once), and reconnects after
+``EMAIL_SMTP_MAX_MESSAGES`` messages, when the server drops the session, or
+when a NOOP fails after ``EMAIL_SMTP_IDLE_SECONDS`` of idleness. A shared
+pacer keeps the total below ``EMAIL_RATE_PER_SECOND`` (the SES sending rate).
+The outcome of a batch is written back in one commit.
+
+Connection errors and 4xx replies are retried with exponential backoff up to
+``EMAIL_MAX_ATTEMPTS``; 5xx replies to the recipient or the message (unknown
+mailbox, rejected content) fail the message at once. Claims are leased, so a
+crashed process's messages are picked up again.
+
+Settings are read once, in ``init_app``. ``EMAIL_BACKEND = 'maildir'`` writes
+every message to ``EMAIL_MAILDIR_PATH`` instead of sending it (tests, local
+development); ``EMAIL_SEND_SYNC`` (on under TESTING) sends inline through the
+backend without the outbox.
+"""
+
+import atexit
+import logging
+import mailbox
+import os
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, event, func, or_, text
+from sqlalchemy.orm import Session
+
+from modules.core.metrics import CounterMetric
+
+logger = logging.getLogger(__name__)
+
+# Columns a claimed message carries to the workers
+JOB_COLUMNS = ('id', 'to_email', 'from_email', 'subject', 'html_body', 'text_body', 'category', 'attempts')
+
+class EmailNotConfigured(Exception):
+    """The SMTP backend has no credentials; messages stay queued until it has"""
+
+class SMTPConnection:
+    """One reusable, authenticated SMTP session; used by a single worker thread"""
+
+    def __init__(self, backend: 'SMTPBackend'):
+        self.backend = backend
+        self._smtp = None
+        self._sent = 0
+        self._last_used = 0.0
+
+    def _open(self):
+        backend = self.backend
+        smtp = smtplib.SMTP(backend.host, backend.port, timeout=backend.timeout)
+        try:
+            smtp.ehlo()
+            if backend.use_tls:
+                smtp.starttls()
+                smtp.ehlo()
+            if backend.username:
+                smtp.login(backend.username, backend.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp, self._sent = smtp, 0
+
+    def _usable(self) -> bool:
+        if self._smtp is None or self._sent >= self.backend.max_messages:
+            return False
+        if time.monotonic() - self._last_used > self.backend.idle_seconds:
+            try:
+                return self._smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                return False
+        return True
+
+    def send(self, message: EmailMessage):
+        if not self._usable():
+            self.close()
+            self._open()
+        self._smtp.send_message(message)
+        self._sent += 1
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+class SMTPBackend:
+    name = 'smtp'
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 use_tls: bool = True, timeout: float = 30, max_messages: int = 500, idle_seconds: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+
+    def open(self) -> SMTPConnection:
+        if not self.username or not self.password:
+            raise EmailNotConfigured("SES_SMTP_USER and SES_SMTP_PASS environment variables are required")
+        return SMTPConnection(self)
+
+class MaildirBackend:
+    """Stores messages in a local maildir instead of sending them"""
+    name = 'maildir'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mailbox = None
+        self._lock = threading.Lock()
+
+    def open(self) -> 'MaildirBackend':
+        with self._lock:
+            if self._mailbox is None:
+                # Maildir(create=True) leaves an existing empty directory without its subfolders
+                for folder in ('tmp', 'new', 'cur'):
+                    os.makedirs(os.path.join(self.path, folder), exist_ok=True)
+                self._mailbox = mailbox.Maildir(self.path, create=True)
+        return self
+
+    def send(self, message: EmailMessage):
+        self._mailbox.add(message)
+
+    def messages(self) -> List:
+        maildir = self.open()._mailbox
+        return [maildir.get_message(key) for key in maildir.keys()]
+
+    def close(self):
+        pass
+
+class _Pacer:
+    """Spaces sends evenly so all workers together stay under ``rate`` per second"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+def _classify(error: Exception) -> Tuple[bool, bool]:
+    """(permanent, connection_lost) for an exception raised while sending"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values()), False
+    if isinstance(error, smtplib.SMTPDataError):
+        return error.smtp_code >= 500, False
+    if isinstance(error, EmailNotConfigured):
+        return False, False
+    if isinstance(error, (ValueError, TypeError)):
+        # Malformed address or header: no retry will fix it
+        return True, False
+    # Disconnects, timeouts, authentication failures, 4xx replies: may succeed on a new connection
+    return False, True
+
+class EmailOutbox:
+    """Outbox writer (``queue``/``queue_many``) plus the background sender"""
+
+    def __init__(self):
+        self._app = None
+        self._backend = None
+        self._pacer = _Pacer(0)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._inline = None
+        self._inline_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._executor = None
+        self._last_error_log = 0.0
+        self._last_purge = 0.0
+        self.synchronous = False
+        self.from_address = 'info@edonuerp.com'
+        self.from_name = 'EdonuOps ERP'
+
+        # Tunables (overridden from config in init_app)
+        self.connections = 4
+        self.batch_size = 100
+        self.max_attempts = 5
+        self.poll_interval = 2.0
+        self.backoff_base = 30.0
+        self.backoff_max = 3600.0
+        self.lease_seconds = 300
+        self.retention_days = 30
+
+        self.emails_total = CounterMetric('emails_total', 'Emails by category and outcome', ('category', 'result'))
+
+    def init_app(self, app, start: bool = True):
+        self._app = app
+        self.configure(app.config)
+        app.extensions['email_outbox'] = self
+        if start and not self.synchronous:
+            self.start()
+
+    def configure(self, config):
+        """Load settings and build the backend; ``config`` is a Flask config or any mapping"""
+        self.synchronous = bool(config.get('EMAIL_SEND_SYNC') or config.get('TESTING'))
+        self.from_address = config.get('EMAIL_FROM_ADDRESS') or self.from_address
+        self.from_name = config.get('EMAIL_FROM_NAME') or self.from_name
+        self.connections = max(1, int(config.get('EMAIL_SMTP_CONNECTIONS', self.connections)))
+        self.batch_size = int(config.get('EMAIL_BATCH_SIZE', self.batch_size))
+        self.max_attempts = int(config.get('EMAIL_MAX_ATTEMPTS', self.max_attempts))
+        self.poll_interval = float(config.get('EMAIL_POLL_INTERVAL', self.poll_interval))
+        self.backoff_base = float(config.get('EMAIL_BACKOFF_SECONDS', self.backoff_base))
+        self.retention_days = int(config.get('EMAIL_RETENTION_DAYS', self.retention_days))
+        self._pacer = _Pacer(float(config.get('EMAIL_RATE_PER_SECOND', 0)))
+        if config.get('EMAIL_BACKEND', 'smtp') == 'maildir':
+            self._backend = MaildirBackend(config.get('EMAIL_MAILDIR_PATH') or 'instance/maildir')
+        else:
+            self._backend = SMTPBackend(
+                config.get('EMAIL_SMTP_HOST'), int(config.get('EMAIL_SMTP_PORT', 587)),
+                config.get('EMAIL_SMTP_USER'), config.get('EMAIL_SMTP_PASSWORD'),
+                use_tls=bool(config.get('EMAIL_SMTP_USE_TLS', True)),
+                timeout=float(config.get('EMAIL_SMTP_TIMEOUT', 30)),
+                max_messages=int(config.get('EMAIL_SMTP_MAX_MESSAGES', 500)),
+                idle_seconds=float(config.get('EMAIL_SMTP_IDLE_SECONDS', 30))
+            )
+        self._close_connections()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            # Used outside an app (scripts): fall back to the static settings
+            from config.settings import Config
+            self.configure({key: getattr(Config, key) for key in dir(Config) if key.isupper()})
+        return self._backend
+
+    def build_message(self, to_email: str, subject: str, html_body: Optional[str] = None,
+                      text_body: Optional[str] = None, from_email: Optional[str] = None) -> EmailMessage:
+        sender = from_email or self.from_address
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = formataddr((self.from_name, sender))
+        message['To'] = to_email
+        message['Date'] = formatdate(localtime=False, usegmt=True)
+        message['Message-ID'] = make_msgid(domain=sender.rsplit('@', 1)[-1])
+        if text_body:
+            message.set_content(text_body)
+            if html_body:
+                message.add_alternative(html_body, subtype='html')
+        else:
+            message.set_content(html_body or '', subtype='html')
+        return message
+
+    # ------------------------------------------------------------------
+    # Outbox
+    # ------------------------------------------------------------------
+
+    def queue(self, to_email: str, subject: str, html_body: Optional[str] = None, text_body: Optional[str] = None,
+              category: str = 'transactional', priority: int = 0, tenant_id: Optional[str] = None,
+              from_email: Optional[str] = None, session=None) -> bool:
+        """
+        Queue one email in the caller's transaction (``db.session`` by default);
+        it is sent after that transaction commits. In synchronous mode it is
+        sent right away and the result of the send is returned.
+        """
+        if self.synchronous:
+            return self.send_now(to_email, subject, html_body, text_body, from_email, category)
+        from app import db
+        from modules.core.email_models import OutboundEmail
+        session = session or db.session
+        now = datetime.utcnow()
+        session.add(OutboundEmail(
+            tenant_id=tenant_id, category=category, priority=priority, to_email=to_email, from_email=from_email,
+            subject=subject, html_body=html_body, text_body=text_body, status='pending', attempts=0,
+            next_attempt_at=now, created_at=now
+        ))
+        session.info['emails_pending'] = True
+        self.emails_total.inc((category, 'queued'))
+        return True
+
+    def queue_many(self, messages: List[Dict], category: str = 'bulk', priority: int = 5,
+                   tenant_id: Optional[str] = None, session=None) -> int:
+        """
+        Queue many emails with one bulk insert. Each message is a dict with
+        ``to_email``, ``subject`` and ``html_body`` and/or ``text_body``
+        (optionally ``from_email``). Returns the number queued.
+        """
+        if self.synchronous:
+            return sum(bool(self.send_now(m['to_email'], m['subject'], m.get('html_body'), m.get('text_body'),
+                                          m.get('from_email'), category)) for m in messages)
+        from app import db
+        from modules.core.email_models import OutboundEmail
+        session = session or db.session
+        now = datetime.utcnow()
+        rows = [{
+            'tenant_id': tenant_id, 'category': category, 'priority': priority, 'to_email': m['to_email'],
+            'from_email': m.get('from_email'), 'subject': m['subject'], 'html_body': m.get('html_body'),
+            'text_body': m.get('text_body'), 'status': 'pending', 'attempts': 0, 'next_attempt_at': now,
+            'created_at': now
+        } for m in messages]
+        if rows:
+            session.bulk_insert_mappings(OutboundEmail, rows)
+            session.info['emails_pending'] = True
+            self.emails_total.inc((category, 'queued'), len(rows))
+        return len(rows)
+
+    def send_now(self, to_email: str, subject: str, html_body: Optional[str] = None, text_body: Optional[str] = None,
+                 from_email: Optional[str] = None, category: str = 'transactional') -> bool:
+        """Send one email inline, over a connection shared by all callers (no outbox)"""
+        with self._inline_lock:
+            try:
+                message = self.build_message(to_email, subject, html_body, text_body, from_email)
+                if self._inline is None:
+                    self._inline = self.backend.open()
+                self._pacer.wait()
+                self._inline.send(message)
+                self.emails_total.inc((category, 'sent'))
+                return True
+            except Exception as e:
+                if _classify(e)[1] and self._inline is not None:
+                    self._inline.close()
+                    self._inline = None
+                self.emails_total.inc((category, 'failed'))
+                logger.error(f"❌ Failed to send email to {to_email}: {e}")
+                return False
+
+    def _after_commit(self, session):
+        if session.info.pop('emails_pending', False):
+            self._wakeup.set()
+
+    def _after_rollback(self, session):
+        session.info.pop('emails_pending', None)
+
+    def status_counts(self) -> Dict[str, int]:
+        from app import db
+        from modules.core.email_models import OutboundEmail
+        return dict(db.session.query(OutboundEmail.status, func.count(OutboundEmail.id))
+                    .group_by(OutboundEmail.status).all())
+
+    def retry_failed(self, email_id: int) -> bool:
+        """Re-queue a failed email for immediate sending"""
+        from app import db
+        from modules.core.email_models import OutboundEmail
+        updated = OutboundEmail.query.filter_by(id=email_id, status='failed').update(
+            {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow(), 'last_error': None},
+            synchronize_session=False)
+        db.session.commit()
+        self._wakeup.set()
+        return bool(updated)
+
+    def metric_lines(self) -> List[str]:
+        return self.emails_total.render()
+
+    # ------------------------------------------------------------------
+    # Connections (one per sender worker thread)
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.backend.open()
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            with self._connections_lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _close_connections(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        with self._inline_lock:
+            if self._inline is not None:
+                connections.append(self._inline)
+                self._inline = None
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    # ------------------------------------------------------------------
+    # Sender loop
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+            self._thread = threading.Thread(target=self._run, name='email-sender', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._close_connections()
+
+    def drain(self) -> int:
+        """Send due messages until none are left; needs an app context. Returns the number handled"""
+        handled = 0
+        while not self._stopping:
+            jobs = self._claim()
+            if jobs:
+                self._send_batch(jobs)
+                handled += len(jobs)
+            if len(jobs) < self.batch_size:
+                return handled
+        return handled
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.drain()
+                    if time.time() - self._last_purge > 3600:
+                        self._purge()
+            except Exception as e:
+                # e.g. the table does not exist yet; keep polling, log at most once a minute
+                if time.time() - self._last_error_log > 60:
+                    self._last_error_log = time.time()
+                    logger.error(f"Email sender error: {e}")
+
+    def _claim(self) -> List[Dict]:
+        """Lease the next batch of due messages, most urgent first"""
+        from app import db
+        from modules.core.email_models import OutboundEmail
+
+        now = datetime.utcnow()
+        query = db.session.query(*[getattr(OutboundEmail, column) for column in JOB_COLUMNS]).filter(or_(
+            and_(OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now),
+            and_(OutboundEmail.status == 'sending', OutboundEmail.locked_until < now)
+        )).order_by(OutboundEmail.priority, OutboundEmail.next_attempt_at, OutboundEmail.id).limit(self.batch_size)
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # No row locks: take the write lock first so two processes cannot claim the same rows
+            db.session.execute(text("UPDATE email_outbox SET id = id WHERE 1 = 0"))
+        else:
+            query = query.with_for_update(skip_locked=True)
+
+        jobs = [dict(zip(JOB_COLUMNS, row)) for row in query.all()]
+        try:
+            if jobs:
+                OutboundEmail.query.filter(OutboundEmail.id.in_([job['id'] for job in jobs])).update(
+                    {'status': 'sending', 'locked_until': now + timedelta(seconds=self.lease_seconds)},
+                    synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return jobs
+
+    def _send_batch(self, jobs: List[Dict]):
+        from app import db
+        from modules.core.email_models import OutboundEmail
+
+        if self._executor is None:
+            with self._start_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix='email')
+        chunks = [jobs[i::self.connections] for i in range(self.connections) if jobs[i::self.connections]]
+        updates = [values for result in self._executor.map(self._send_chunk, chunks) for values in result]
+        db.session.bulk_update_mappings(OutboundEmail, updates)
+        db.session.commit()
+
+    def _send_chunk(self, jobs: List[Dict]) -> List[Dict]:
+        """Send messages over this worker's connection; returns the row updates"""
+        updates = []
+        for job in jobs:
+            values = {'id': job['id'], 'attempts': (job['attempts'] or 0) + 1, 'locked_until': None}
+            try:
+                message = self.build_message(job['to_email'], job['subject'], job['html_body'],
+                                             job['text_body'], job['from_email'])
+                self._pacer.wait()
+                self._connection().send(message)
+                values.update(status='sent', sent_at=datetime.utcnow(), message_id=message['Message-ID'],
+                              last_error=None)
+                self.emails_total.inc((job['category'], 'sent'))
+            except Exception as e:
+                permanent, connection_lost = _classify(e)
+                if connection_lost:
+                    self._drop_connection()
+                values['last_error'] = f"{type(e).__name__}: {e}"[:2000]
+                if permanent or values['attempts'] >= self.max_attempts:
+                    values['status'] = 'failed'
+                    self.emails_total.inc((job['category'], 'failed'))
+                    logger.warning(f"Email {job['id']} to {job['to_email']} failed: {values['last_error']}")
+                else:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (values['attempts'] - 1))
+                    values.update(status='pending',
+                                  next_attempt_at=datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2)))
+                    self.emails_total.inc((job['category'], 'retried'))
+            updates.append(values)
+        return updates
+
+    def _purge(self):
+        """Delete sent messages older than the retention period"""
+        from app import db
+        from modules.core.email_models import OutboundEmail
+        self._last_purge = time.time()
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        OutboundEmail.query.filter(
+            OutboundEmail.status == 'sent', OutboundEmail.sent_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+email_outbox = EmailOutbox()
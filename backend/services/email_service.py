@@ -1,13 +1,12 @@
 import os
-import smtplib
 import secrets
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from flask import current_app
+from typing import Dict, List
+from flask import has_app_context
 from sqlalchemy import text
 import logging
 from dotenv import load_dotenv
+from services.email_outbox import email_outbox
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,75 +19,80 @@ class EmailService:
         # Load environment variables from .env (not config.env which has placeholders)
         load_dotenv('.env')
         
-        # AWS SES SMTP Configuration - All from environment variables
-        self.SMTP_HOST = "email-smtp.eu-north-1.amazonaws.com"
-        self.SMTP_PORT = 587
-        self.SMTP_USER = os.getenv("SES_SMTP_USER")
-        self.SMTP_PASS = os.getenv("SES_SMTP_PASS")
-        self.FROM_EMAIL = os.getenv("SES_FROM_EMAIL", "info@edonuerp.com")
-        self.FROM_NAME = os.getenv("SES_FROM_NAME", "EdonuOps ERP")
+        # SMTP host, credentials and sender are read once by the email outbox (EMAIL_* settings)
         self.FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
-        
-        # Validate required environment variables
-        if not self.SMTP_USER or not self.SMTP_PASS:
-            raise ValueError("SES_SMTP_USER and SES_SMTP_PASS environment variables are required")
     
-    def send_email(self, to_email: str, subject: str, html_body: str, text_body: str = None):
+    def send_email(self, to_email: str, subject: str, html_body: str, text_body: str = None,
+                   category: str = 'transactional', tenant_id: str = None, db_session=None):
         """
-        Send email via AWS SES SMTP
+        Queue an email in the outbox; services/email_outbox.py sends it in the
+        background, so the calling request does not wait on SMTP
         
         Args:
             to_email (str): Recipient email address
             subject (str): Email subject
             html_body (str): HTML email content
             text_body (str): Plain text email content (optional)
+            category (str): verification, password_reset, notification, ... (for metrics and triage)
+            tenant_id (str): Tenant the email belongs to (optional)
+            db_session: Database session (optional, will use current app context if not provided)
         
         Returns:
-            bool: True if email sent successfully, False otherwise
+            bool: True if the email was queued (sent, in synchronous mode), False otherwise
         """
         try:
-            # Load environment variables directly from .env file
-            import os
-            from dotenv import dotenv_values
-            
-            # Load .env file directly
-            env_vars = dotenv_values('.env')
-            smtp_user = env_vars.get("SES_SMTP_USER")
-            smtp_pass = env_vars.get("SES_SMTP_PASS")
-            from_email = env_vars.get("SES_FROM_EMAIL", "info@edonuerp.com")
-            from_name = env_vars.get("SES_FROM_NAME", "EdonuOps ERP")
-            
-            if not smtp_user or not smtp_pass:
-                logger.error("❌ SES_SMTP_USER and SES_SMTP_PASS environment variables are required")
-                return False
+            if not has_app_context():
+                # Scripts without an application (no outbox table): send right away
+                return email_outbox.send_now(to_email, subject, html_body, text_body, category=category)
             
-            # Create message
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = f"{from_name} <{from_email}>"
-            msg["To"] = to_email
+            if db_session is None:
+                from app import db
+                db_session = db.session
             
-            # Add HTML content
-            html_part = MIMEText(html_body, "html")
-            msg.attach(html_part)
+            queued = email_outbox.queue(to_email, subject, html_body, text_body, category=category,
+                                        tenant_id=tenant_id, session=db_session)
+            db_session.commit()
             
-            # Add text content if provided
-            if text_body:
-                text_part = MIMEText(text_body, "plain")
-                msg.attach(text_part)
+            logger.info(f"✅ Email to {to_email} queued")
+            return queued
             
-            # Send email via SMTP
-            with smtplib.SMTP(self.SMTP_HOST, self.SMTP_PORT) as server:
-                server.starttls()
-                server.login(smtp_user, smtp_pass)
-                server.sendmail(from_email, to_email, msg.as_string())
+        except Exception as e:
+            logger.error(f"❌ Failed to queue email to {to_email}: {str(e)}")
+            if db_session is not None:
+                db_session.rollback()
+            return False
+    
+    def send_bulk_email(self, messages: List[Dict], category: str = 'bulk', tenant_id: str = None,
+                        db_session=None) -> int:
+        """
+        Queue many emails (CRM campaigns, notifications) with one insert.
+        They are sent after transactional email of the same moment.
+        
+        Args:
+            messages (list): Dicts with to_email, subject, html_body and/or text_body
+            category (str): Category recorded on every message
+            tenant_id (str): Tenant the emails belong to (optional)
+            db_session: Database session (optional)
+        
+        Returns:
+            int: Number of emails queued
+        """
+        try:
+            if db_session is None:
+                from app import db
+                db_session = db.session
             
-            logger.info(f"✅ Email sent successfully to {to_email}")
-            return True
+            queued = email_outbox.queue_many(messages, category=category, tenant_id=tenant_id, session=db_session)
+            db_session.commit()
+            
+            logger.info(f"✅ {queued} {category} emails queued")
+            return queued
             
         except Exception as e:
-            logger.error(f"❌ Failed to send email to {to_email}: {str(e)}")
-            return False
+            logger.error(f"❌ Failed to queue {category} emails: {str(e)}")
+            if db_session is not None:
+                db_session.rollback()
+            return 0
     
     def generate_verification_token(self, user_id: int, email: str, db_session=None):
         """
@@ -275,7 +279,8 @@ class EmailService:
             """
             
             # Send email
-            return self.send_email(user_email, subject, html_body, text_body)
+            return self.send_email(user_email, subject, html_body, text_body,
+                                   category='verification', db_session=db_session)
             
         except Exception as e:
             logger.error(f"❌ Failed to send verification email: {str(e)}")
@@ -375,7 +380,8 @@ class EmailService:
             """
             
             # Send email
-            return self.send_email(user_email, subject, html_body, text_body)
+            return self.send_email(user_email, subject, html_body, text_body,
+                                   category='password_reset', db_session=db_session)
             
         except Exception as e:
             logger.error(f"❌ Failed to send password reset email: {str(e)}")
@@ -61,7 +61,7 @@ class InventoryCostingService:
                 simple_warehouse_id=warehouse_id,
                 lot_batch_id=receipt_data.get('lot_batch_id'),
                 layer_sequence=max_sequence + 1,
-                receipt_date=receipt_data.get('receipt_date', date.today()),
+                receipt_date=receipt_data.get('receipt_date') or date.today(),
                 receipt_reference=receipt_data.get('reference', ''),
                 unit_cost=unit_cost,
                 original_quantity=quantity,
@@ -130,7 +130,7 @@ class InventoryCostingService:
                     cost_depleted=layer_depletion['cost_depleted'],
                     unit_cost_used=layer_depletion['unit_cost'],
                     journal_entry_id=issue_data.get('journal_entry_id'),
-                    created_by=issue_data.get('user_id', 'system')
+                    user_id=issue_data.get('user_id')
                 )
                 db.session.add(depletion_txn)
             
@@ -150,109 +150,44 @@ class InventoryCostingService:
                            warehouse_id: int, issue_data: Dict) -> Dict:
         """Process issue using FIFO (First In, First Out) method"""
         
-        # Get oldest layers first
-        available_layers = InventoryCostLayer.get_available_layers(
-            product_id=product_id,
-            warehouse_id=warehouse_id,
-            cost_method='FIFO',
-            limit_quantity=quantity
-        )
-        
-        if not available_layers:
-            return {
-                'success': False,
-                'error': 'No cost layers available for FIFO issue',
-                'available_quantity': 0
-            }
-        
-        layer_depletions = []
-        total_cost = 0
-        remaining_to_issue = quantity
-        
-        for layer in available_layers:
-            if remaining_to_issue <= 0:
-                break
-            
-            # Deplete from this layer
-            depletion_result = layer.deplete_layer(remaining_to_issue)
-            
-            layer_depletions.append({
-                'layer_id': layer.id,
-                'layer_sequence': layer.layer_sequence,
-                'receipt_date': layer.receipt_date.isoformat(),
-                'quantity_depleted': depletion_result['depleted_quantity'],
-                'cost_depleted': depletion_result['depleted_cost'],
-                'unit_cost': depletion_result['unit_cost'],
-                'remaining_in_layer': depletion_result['remaining_in_layer']
-            })
-            
-            total_cost += depletion_result['depleted_cost']
-            remaining_to_issue -= depletion_result['depleted_quantity']
-        
-        # Calculate weighted average cost
-        actual_quantity_issued = quantity - remaining_to_issue
-        weighted_average_cost = total_cost / actual_quantity_issued if actual_quantity_issued > 0 else 0
-        
-        return {
-            'success': True,
-            'cost_method': 'FIFO',
-            'quantity_issued': actual_quantity_issued,
-            'total_cost': total_cost,
-            'weighted_average_cost': weighted_average_cost,
-            'layer_depletions': layer_depletions,
-            'remaining_shortage': remaining_to_issue
-        }
+        # Oldest layers first
+        return self._process_layered_issue('FIFO', product_id, quantity, warehouse_id)
     
     def _process_lifo_issue(self, product_id: int, quantity: float, 
                            warehouse_id: int, issue_data: Dict) -> Dict:
         """Process issue using LIFO (Last In, First Out) method"""
         
-        # Get newest layers first
-        available_layers = InventoryCostLayer.get_available_layers(
+        # Newest layers first
+        return self._process_layered_issue('LIFO', product_id, quantity, warehouse_id)
+    
+    def _process_layered_issue(self, cost_method: str, product_id: int, quantity: float,
+                               warehouse_id: int) -> Dict:
+        """Deplete locked layers in cost-method order at each layer's own cost"""
+        depletions = InventoryCostLayer.consume_layers(
             product_id=product_id,
+            quantity=quantity,
             warehouse_id=warehouse_id,
-            cost_method='LIFO',
-            limit_quantity=quantity
+            cost_method=cost_method
         )
         
-        if not available_layers:
+        if not depletions:
             return {
                 'success': False,
-                'error': 'No cost layers available for LIFO issue',
+                'error': f'No cost layers available for {cost_method} issue',
                 'available_quantity': 0
             }
         
-        layer_depletions = []
-        total_cost = 0
-        remaining_to_issue = quantity
-        
-        for layer in available_layers:
-            if remaining_to_issue <= 0:
-                break
-            
-            # Deplete from this layer
-            depletion_result = layer.deplete_layer(remaining_to_issue)
-            
-            layer_depletions.append({
-                'layer_id': layer.id,
-                'layer_sequence': layer.layer_sequence,
-                'receipt_date': layer.receipt_date.isoformat(),
-                'quantity_depleted': depletion_result['depleted_quantity'],
-                'cost_depleted': depletion_result['depleted_cost'],
-                'unit_cost': depletion_result['unit_cost'],
-                'remaining_in_layer': depletion_result['remaining_in_layer']
-            })
-            
-            total_cost += depletion_result['depleted_cost']
-            remaining_to_issue -= depletion_result['depleted_quantity']
+        layer_depletions = [self._layer_depletion_entry(d) for d in depletions]
+        total_cost = sum(d['depleted_cost'] for d in depletions)
+        actual_quantity_issued = sum(d['depleted_quantity'] for d in depletions)
+        remaining_to_issue = quantity - actual_quantity_issued
         
         # Calculate weighted average cost
-        actual_quantity_issued = quantity - remaining_to_issue
         weighted_average_cost = total_cost / actual_quantity_issued if actual_quantity_issued > 0 else 0
         
         return {
             'success': True,
-            'cost_method': 'LIFO',
+            'cost_method': cost_method,
             'quantity_issued': actual_quantity_issued,
             'total_cost': total_cost,
             'weighted_average_cost': weighted_average_cost,
@@ -260,68 +195,54 @@ class InventoryCostingService:
             'remaining_shortage': remaining_to_issue
         }
     
+    @staticmethod
+    def _layer_depletion_entry(depletion: Dict) -> Dict:
+        return {
+            'layer_id': depletion['layer_id'],
+            'layer_sequence': depletion['layer_sequence'],
+            'receipt_date': depletion['receipt_date'].isoformat() if depletion['receipt_date'] else None,
+            'quantity_depleted': depletion['depleted_quantity'],
+            'cost_depleted': depletion['depleted_cost'],
+            'unit_cost': depletion['unit_cost'],
+            'remaining_in_layer': depletion['remaining_in_layer']
+        }
+    
     def _process_average_issue(self, product_id: int, quantity: float, 
                               warehouse_id: int, issue_data: Dict) -> Dict:
         """Process issue using Moving Average method"""
         
-        # Get all available layers to calculate average
-        available_layers = InventoryCostLayer.get_available_layers(
-            product_id=product_id,
-            warehouse_id=warehouse_id,
-            cost_method='AVERAGE'
-        )
-        
-        if not available_layers:
-            return {
-                'success': False,
-                'error': 'No cost layers available for Average issue',
-                'available_quantity': 0
-            }
-        
-        # Calculate weighted average cost
-        total_quantity_available = sum(layer.remaining_quantity for layer in available_layers)
-        total_cost_available = sum(layer.remaining_cost for layer in available_layers)
+        # Average over all open layers, aggregated in SQL rather than loaded
+        total_quantity_available, total_cost_available = InventoryCostLayer.open_totals(product_id, warehouse_id)
         
         if total_quantity_available <= 0:
             return {
                 'success': False,
-                'error': 'No quantity available for Average issue',
+                'error': 'No cost layers available for Average issue',
                 'available_quantity': 0
             }
         
         average_unit_cost = total_cost_available / total_quantity_available
         
-        # Issue quantity at average cost, depleting layers proportionally
+        # Issue quantity at average cost; layer quantities are relieved oldest first
         actual_quantity_issued = min(quantity, total_quantity_available)
+        depletions = InventoryCostLayer.consume_layers(
+            product_id=product_id,
+            quantity=actual_quantity_issued,
+            warehouse_id=warehouse_id,
+            cost_method='AVERAGE'
+        )
+        actual_quantity_issued = sum(d['depleted_quantity'] for d in depletions)
         total_cost = actual_quantity_issued * average_unit_cost
         
         layer_depletions = []
-        remaining_to_issue = actual_quantity_issued
-        
-        for layer in available_layers:
-            if remaining_to_issue <= 0:
-                break
-            
-            # Calculate proportional depletion
-            layer_proportion = layer.remaining_quantity / total_quantity_available
-            layer_depletion_qty = min(remaining_to_issue, layer.remaining_quantity, 
-                                    actual_quantity_issued * layer_proportion)
-            
-            if layer_depletion_qty > 0:
-                depletion_result = layer.deplete_layer(layer_depletion_qty)
-                
-                layer_depletions.append({
-                    'layer_id': layer.id,
-                    'layer_sequence': layer.layer_sequence,
-                    'receipt_date': layer.receipt_date.isoformat(),
-                    'quantity_depleted': depletion_result['depleted_quantity'],
-                    'cost_depleted': depletion_result['depleted_quantity'] * average_unit_cost,  # Use average cost
-                    'unit_cost': average_unit_cost,
-                    'original_layer_cost': depletion_result['unit_cost'],
-                    'remaining_in_layer': depletion_result['remaining_in_layer']
-                })
-                
-                remaining_to_issue -= depletion_result['depleted_quantity']
+        for depletion in depletions:
+            entry = self._layer_depletion_entry(depletion)
+            entry.update({
+                'cost_depleted': depletion['depleted_quantity'] * average_unit_cost,  # Use average cost
+                'unit_cost': average_unit_cost,
+                'original_layer_cost': depletion['unit_cost']
+            })
+            layer_depletions.append(entry)
         
         return {
             'success': True,
@@ -350,35 +271,25 @@ class InventoryCostingService:
             total_cost = quantity * standard_cost
             
             # For standard costing, we still need to deplete layers but use standard cost
-            available_layers = InventoryCostLayer.get_available_layers(
+            depletions = InventoryCostLayer.consume_layers(
                 product_id=product_id,
+                quantity=quantity,
                 warehouse_id=warehouse_id,
-                cost_method='FIFO',  # Use FIFO for layer depletion
-                limit_quantity=quantity
+                cost_method='FIFO'  # Use FIFO for layer depletion
             )
             
             layer_depletions = []
-            remaining_to_issue = quantity
-            
-            for layer in available_layers:
-                if remaining_to_issue <= 0:
-                    break
-                
-                depletion_result = layer.deplete_layer(remaining_to_issue)
-                
-                layer_depletions.append({
-                    'layer_id': layer.id,
-                    'layer_sequence': layer.layer_sequence,
-                    'receipt_date': layer.receipt_date.isoformat(),
-                    'quantity_depleted': depletion_result['depleted_quantity'],
-                    'cost_depleted': depletion_result['depleted_quantity'] * standard_cost,  # Use standard cost
+            for depletion in depletions:
+                entry = self._layer_depletion_entry(depletion)
+                entry.update({
+                    'cost_depleted': depletion['depleted_quantity'] * standard_cost,  # Use standard cost
                     'unit_cost': standard_cost,
-                    'actual_layer_cost': depletion_result['unit_cost'],
-                    'cost_variance': (standard_cost - depletion_result['unit_cost']) * depletion_result['depleted_quantity'],
-                    'remaining_in_layer': depletion_result['remaining_in_layer']
+                    'actual_layer_cost': depletion['unit_cost'],
+                    'cost_variance': (standard_cost - depletion['unit_cost']) * depletion['depleted_quantity']
                 })
-                
-                remaining_to_issue -= depletion_result['depleted_quantity']
+                layer_depletions.append(entry)
+            
+            remaining_to_issue = quantity - sum(d['depleted_quantity'] for d in depletions)
             
             return {
                 'success': True,
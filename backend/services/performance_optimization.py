@@ -9,6 +9,7 @@ import functools
 from datetime import datetime, timedelta
 from sqlalchemy import func, text
 from app import db
+from services.cache_service import cache_service
 import logging
 import json
 
@@ -19,7 +20,8 @@ class PerformanceOptimizationService:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.cache = {}
+        # Backed by the shared bounded cache instead of a private unbounded dict
+        self.cache = cache_service
         self.query_stats = {}
         self.performance_metrics = {}
     
@@ -30,12 +32,7 @@ class PerformanceOptimizationService:
     def cache_result(self, key, data, ttl_seconds=300):
         """Cache data with TTL"""
         try:
-            self.cache[key] = {
-                'data': data,
-                'expires_at': datetime.utcnow() + timedelta(seconds=ttl_seconds),
-                'created_at': datetime.utcnow()
-            }
-            return True
+            return self.cache.set(key, data, ttl_seconds, tags=('performance',))
         except Exception as e:
             self.logger.error(f"Error caching data: {str(e)}")
             return False
@@ -43,14 +40,7 @@ class PerformanceOptimizationService:
     def get_cached_result(self, key):
         """Get cached data if not expired"""
         try:
-            if key in self.cache:
-                cached_item = self.cache[key]
-                if datetime.utcnow() < cached_item['expires_at']:
-                    return cached_item['data']
-                else:
-                    # Remove expired cache
-                    del self.cache[key]
-            return None
+            return self.cache.get(key)
         except Exception as e:
             self.logger.error(f"Error getting cached data: {str(e)}")
             return None
@@ -59,10 +49,9 @@ class PerformanceOptimizationService:
         """Clear cache by key or all cache"""
         try:
             if key:
-                if key in self.cache:
-                    del self.cache[key]
+                self.cache.delete(key)
             else:
-                self.cache.clear()
+                self.cache.invalidate_tags('performance')
             return True
         except Exception as e:
             self.logger.error(f"Error clearing cache: {str(e)}")
@@ -163,7 +152,7 @@ class PerformanceOptimizationService:
         try:
             metrics = {
                 'cache_stats': {
-                    'total_cached_items': len(self.cache),
+                    'total_cached_items': len(self.cache.local),
                     'cache_hit_rate': self._calculate_cache_hit_rate(),
                     'memory_usage': self._estimate_cache_memory_usage()
                 },
@@ -179,11 +168,10 @@ class PerformanceOptimizationService:
     def _calculate_cache_hit_rate(self):
         """Calculate cache hit rate"""
         try:
-            # This is a simplified calculation
-            # In a real system, you'd track actual hits vs misses
-            total_requests = sum(stats.get('count', 0) for stats in self.query_stats.values())
-            cache_hits = len(self.cache)  # Simplified
-            return (cache_hits / total_requests * 100) if total_requests > 0 else 0
+            stats = self.cache.stats
+            hits = stats['local_hits'] + stats['redis_hits']
+            total_requests = hits + stats['misses']
+            return (hits / total_requests * 100) if total_requests > 0 else 0
         except Exception as e:
             self.logger.error(f"Error calculating cache hit rate: {str(e)}")
             return 0
@@ -191,8 +179,7 @@ class PerformanceOptimizationService:
     def _estimate_cache_memory_usage(self):
         """Estimate cache memory usage"""
         try:
-            cache_size = len(json.dumps(self.cache))
-            return f"{cache_size} bytes"
+            return f"{self.cache.local.bytes} bytes"
         except Exception as e:
             self.logger.error(f"Error estimating cache memory usage: {str(e)}")
             return "Unknown"
@@ -7,6 +7,7 @@ Simple caching and monitoring
 import time
 from datetime import datetime, timedelta
 from app import db
+from services.cache_service import cache_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,17 +16,14 @@ class PerformanceService:
     """Simple performance optimization service"""
     
     def __init__(self):
-        self.cache = {}
+        # Backed by the shared bounded cache instead of a private unbounded dict
+        self.cache = cache_service
         self.query_stats = {}
     
     def cache_result(self, key, data, ttl_seconds=300):
         """Cache data with TTL"""
         try:
-            self.cache[key] = {
-                'data': data,
-                'expires_at': datetime.utcnow() + timedelta(seconds=ttl_seconds)
-            }
-            return True
+            return self.cache.set(f"performance:{key}", data, ttl_seconds)
         except Exception as e:
             logger.error(f"Error caching data: {str(e)}")
             return False
@@ -33,13 +31,7 @@ class PerformanceService:
     def get_cached_result(self, key):
         """Get cached data if not expired"""
         try:
-            if key in self.cache:
-                cached_item = self.cache[key]
-                if datetime.utcnow() < cached_item['expires_at']:
-                    return cached_item['data']
-                else:
-                    del self.cache[key]
-            return None
+            return self.cache.get(f"performance:{key}")
         except Exception as e:
             logger.error(f"Error getting cached data: {str(e)}")
             return None
@@ -79,9 +71,7 @@ class PerformanceService:
         """Get performance metrics"""
         try:
             return {
-                'cache_stats': {
-                    'total_cached_items': len(self.cache)
-                },
+                'cache_stats': self.cache.get_stats(),
                 'query_stats': self.query_stats
             }
         except Exception as e:
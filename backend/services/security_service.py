@@ -13,6 +13,7 @@ from modules.core.security_models import (
     TwoFactorAuth, SecurityEvent
 )
 from modules.core.models import User
+from modules.core.identity_cache import identity_cache
 from services.audit_logger_service import audit_logger
 
 class SecurityService:
@@ -55,19 +56,26 @@ class SecurityService:
         'require_email_verification': True
     }
     
+    @classmethod
+    def _get_policy(cls, policy_name: str, policy_type: str, defaults: Dict) -> Dict:
+        """Policy merged over its defaults, cached until a policy edit invalidates it"""
+        cached = identity_cache.get_policy(policy_name)
+        if cached is not None:
+            return {**defaults, **cached}
+        
+        policy = SecurityPolicy.query.filter_by(
+            policy_name=policy_name,
+            policy_type=policy_type
+        ).first()
+        configuration = (policy.configuration or {}) if policy else {}
+        identity_cache.set_policy(policy_name, configuration)
+        return {**defaults, **configuration}
+    
     @classmethod
     def get_password_policy(cls) -> Dict:
         """Get current password policy"""
         try:
-            policy = SecurityPolicy.query.filter_by(
-                policy_name='password_policy',
-                policy_type='PASSWORD'
-            ).first()
-            
-            if policy:
-                return {**cls.DEFAULT_PASSWORD_POLICY, **policy.configuration}
-            
-            return cls.DEFAULT_PASSWORD_POLICY
+            return cls._get_policy('password_policy', 'PASSWORD', cls.DEFAULT_PASSWORD_POLICY)
         except Exception as e:
             print(f"Error getting password policy: {e}")
             return cls.DEFAULT_PASSWORD_POLICY
@@ -175,6 +183,7 @@ class SecurityService:
                 
                 if oldest_session:
                     oldest_session.is_active = False
+                    identity_cache.invalidate_session(oldest_session.session_id)
             
             # Create new session
             expires_at = datetime.utcnow() + timedelta(minutes=session_policy['session_timeout_minutes'])
@@ -205,6 +214,7 @@ class SecurityService:
             if session:
                 session.last_activity = datetime.utcnow()
                 db.session.commit()
+                identity_cache.invalidate_session(session_id)
                 return True
             return False
         except Exception as e:
@@ -213,24 +223,36 @@ class SecurityService:
     
     @classmethod
     def is_session_valid(cls, session_id: str) -> bool:
-        """Check if session is valid and not expired"""
+        """
+        Check if session is valid and not expired.
+        Active sessions are cached with their expiry and last activity, so the
+        timeouts are still evaluated on every call; invalidation drops the entry.
+        """
         try:
-            session = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
-            if not session:
-                return False
+            now = datetime.utcnow()
+            state = identity_cache.get_session(session_id)
+            if state is None:
+                session = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
+                if not session:
+                    return False
+                state = {
+                    'expires_at': session.expires_at.timestamp() if session.expires_at else None,
+                    'last_activity': session.last_activity.timestamp() if session.last_activity else now.timestamp()
+                }
+                identity_cache.set_session(session_id, state)
             
             # Check if session is expired
-            if session.expires_at and datetime.utcnow() > session.expires_at:
-                session.is_active = False
-                db.session.commit()
-                return False
+            expired = state['expires_at'] is not None and now.timestamp() > state['expires_at']
             
             # Check inactive timeout
             session_policy = cls.get_session_policy()
             inactive_timeout = timedelta(minutes=session_policy['inactive_timeout_minutes'])
-            if datetime.utcnow() - session.last_activity > inactive_timeout:
-                session.is_active = False
+            inactive = now.timestamp() - state['last_activity'] > inactive_timeout.total_seconds()
+            
+            if expired or inactive:
+                UserSession.query.filter_by(session_id=session_id).update({'is_active': False})
                 db.session.commit()
+                identity_cache.invalidate_session(session_id)
                 return False
             
             return True
@@ -247,6 +269,7 @@ class SecurityService:
             if session:
                 session.is_active = False
                 db.session.commit()
+                identity_cache.invalidate_session(session_id)
                 return True
             return False
         except Exception as e:
@@ -261,6 +284,9 @@ class SecurityService:
             for session in sessions:
                 session.is_active = False
             db.session.commit()
+            identity_cache.invalidate_session(*[session.session_id for session in sessions])
+            # Tokens issued before now stop working as well
+            identity_cache.revoke_user_tokens(user_id)
             return True
         except Exception as e:
             print(f"Error invalidating user sessions: {e}")
@@ -270,15 +296,7 @@ class SecurityService:
     def get_session_policy(cls) -> Dict:
         """Get current session policy"""
         try:
-            policy = SecurityPolicy.query.filter_by(
-                policy_name='session_policy',
-                policy_type='SESSION'
-            ).first()
-            
-            if policy:
-                return {**cls.DEFAULT_SESSION_POLICY, **policy.configuration}
-            
-            return cls.DEFAULT_SESSION_POLICY
+            return cls._get_policy('session_policy', 'SESSION', cls.DEFAULT_SESSION_POLICY)
         except Exception as e:
             print(f"Error getting session policy: {e}")
             return cls.DEFAULT_SESSION_POLICY
@@ -287,15 +305,7 @@ class SecurityService:
     def get_login_policy(cls) -> Dict:
         """Get current login policy"""
         try:
-            policy = SecurityPolicy.query.filter_by(
-                policy_name='login_policy',
-                policy_type='LOGIN'
-            ).first()
-            
-            if policy:
-                return {**cls.DEFAULT_LOGIN_POLICY, **policy.configuration}
-            
-            return cls.DEFAULT_LOGIN_POLICY
+            return cls._get_policy('login_policy', 'LOGIN', cls.DEFAULT_LOGIN_POLICY)
         except Exception as e:
             print(f"Error getting login policy: {e}")
             return cls.DEFAULT_LOGIN_POLICY
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Aging reports test
+==================
+
+Generates open, paid and void receivables and payables on a throwaway SQLite
+database and checks the SQL bucketing of modules/finance/aging_reports.py
+against a naive per-item classification:
+- AR and AP bucket totals and counts, including items due exactly on each
+  bucket boundary;
+- the customer breakdown (totals, bucket amounts, counts, oldest invoice);
+- items without a due date age from their invoice date instead of landing
+  in over_120_days;
+- nightly snapshots (buckets, open items, DSO/DPO) per tenant.
+
+Usage:
+    python test_aging_reports.py
+"""
+
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+AS_OF = date(2026, 6, 30)
+BUCKETS = ('current', '30_days', '60_days', '90_days', '120_days', 'over_120_days')
+LIMITS = (0, 30, 60, 90, 120)
+WINDOW_DAYS = 90
+
+def reference_bucket(item):
+    """Bucket by days past due, one item at a time"""
+    days = (AS_OF - (item['due_date'] or item['invoice_date'])).days
+    for name, limit in zip(BUCKETS, LIMITS):
+        if days <= limit:
+            return name
+    return 'over_120_days'
+
+def is_open(item):
+    return item['status'] not in ('paid', 'void') and item['outstanding_amount'] > 0
+
+def reference_aging(items, tenant_id, party):
+    totals = {name: [0.0, 0] for name in BUCKETS}
+    parties = {}
+    for item in items:
+        if item['tenant_id'] != tenant_id or not is_open(item):
+            continue
+        name, amount = reference_bucket(item), item['outstanding_amount']
+        totals[name][0] += amount
+        totals[name][1] += 1
+        entry = parties.setdefault(item[party], {'total': 0.0, 'count': 0, 'oldest': item['invoice_date'],
+                                                 'buckets': {b: 0.0 for b in BUCKETS}})
+        entry['total'] += amount
+        entry['count'] += 1
+        entry['buckets'][name] += amount
+        entry['oldest'] = min(entry['oldest'], item['invoice_date'])
+    return totals, parties
+
+def reference_snapshot(items, tenant_id):
+    window_start = AS_OF - timedelta(days=WINDOW_DAYS)
+    kept = [i for i in items if i['tenant_id'] == tenant_id and i['status'] != 'void']
+    buckets = {name: 0.0 for name in BUCKETS}
+    for item in kept:
+        if is_open(item):
+            buckets[reference_bucket(item)] += item['outstanding_amount']
+    total = sum(buckets.values())
+    invoiced = sum(i['total_amount'] for i in kept if i['invoice_date'] > window_start)
+    return {'open_items': sum(1 for i in kept if is_open(i)), 'total': total, 'buckets': buckets,
+            'days_outstanding': round(total / invoiced * WINDOW_DAYS, 1) if invoiced else None}
+
+class AgingReportsTester(ScriptTester):
+    def generate(self, party, name_field, rng):
+        items = []
+        for i in range(3000):
+            invoice_date = AS_OF - timedelta(days=rng.randint(0, 400))
+            if i < 12:
+                # Due exactly on, or one day past, each bucket boundary
+                due_date = AS_OF - timedelta(days=LIMITS[i % 5] + (i // 5) % 2 if i < 10 else 121)
+            elif rng.random() < 0.03:
+                due_date = None
+            else:
+                due_date = invoice_date + timedelta(days=rng.choice([0, 15, 30, 45, 60]))
+            total = round(rng.uniform(10, 5000), 2)
+            status = rng.choice(['pending', 'pending', 'overdue', 'paid', 'void'])
+            outstanding = 0.0 if status == 'paid' or rng.random() < 0.05 else round(total * rng.random(), 2)
+            number = rng.randint(1, 40)
+            items.append({'tenant_id': rng.choice(['t1', 't2']), party: number, name_field: f'Party {number}',
+                          'invoice_number': f'{party}-{i}', 'invoice_date': invoice_date, 'due_date': due_date,
+                          'total_amount': total, 'outstanding_amount': outstanding, 'status': status})
+        return items
+
+    def compare(self, name, result, items, party, breakdown_key):
+        report = result.get('report') or {}
+        totals, parties = reference_aging(items, 't1', party)
+        got = report.get('aging_buckets', {})
+        wrong = [(b, got.get(b), totals[b]) for b in BUCKETS
+                 if got.get(b, {}).get('count') != totals[b][1] or abs(got[b]['amount'] - totals[b][0]) > 0.02]
+        self.check(f'{name}: bucket totals and counts match the per-item classification',
+                   result['success'] and not wrong, wrong or result.get('error'))
+
+        breakdown = {row[f'{breakdown_key}_id']: row for row in report.get(f'{breakdown_key}_breakdown', [])}
+        wrong = [key for key, expected in parties.items()
+                 if key not in breakdown or breakdown[key]['invoice_count'] != expected['count']
+                 or abs(breakdown[key]['total_outstanding'] - expected['total']) > 0.02
+                 or breakdown[key]['oldest_invoice_date'] != expected['oldest']
+                 or any(abs(breakdown[key]['aging_buckets'][b] - expected['buckets'][b]) > 0.02 for b in BUCKETS)]
+        self.check(f'{name}: {breakdown_key} breakdown matches', not wrong and len(breakdown) == len(parties),
+                   (wrong[:3], len(breakdown), len(parties)))
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the ledgers
+            import modules.finance.payment_models  # noqa: F401 - payment_methods, bank_accounts
+            from modules.finance.advanced_models import AccountsPayable, AccountsReceivable, AgingSnapshot
+            from modules.finance.aging_reports import AgingReports
+
+            # Databases created before due_date was enforced may still hold NULLs
+            for model in (AccountsReceivable, AccountsPayable):
+                model.__table__.c.due_date.nullable = True
+            create_tables(AccountsReceivable, AccountsPayable, AgingSnapshot)
+            for model in (AccountsReceivable, AccountsPayable):
+                model.__table__.c.due_date.nullable = False
+
+            rng = random.Random(45)
+            receivables = self.generate('customer_id', 'customer_name', rng)
+            payables = self.generate('vendor_id', 'vendor_name', rng)
+            db.session.execute(AccountsReceivable.__table__.insert(), receivables)
+            db.session.execute(AccountsPayable.__table__.insert(), payables)
+            db.session.commit()
+
+            reports = AgingReports()
+            as_of = datetime.combine(AS_OF, datetime.min.time())
+            ar = reports.generate_ar_aging_report(as_of, tenant_id='t1')
+            self.compare('AR', ar, receivables, 'customer_id', 'customer')
+            ap = reports.generate_ap_aging_report(as_of, tenant_id='t1')
+            self.compare('AP', ap, payables, 'vendor_id', 'supplier')
+
+            undated = [i for i in receivables if i['due_date'] is None and i['tenant_id'] == 't1' and is_open(i)]
+            recent = [i for i in undated if (AS_OF - i['invoice_date']).days <= 120]
+            self.check('items without a due date age from their invoice date',
+                       recent and ar['report']['aging_buckets']['over_120_days']['count'] ==
+                       sum(1 for i in receivables if i['tenant_id'] == 't1' and is_open(i)
+                           and reference_bucket(i) == 'over_120_days'), (len(undated), len(recent)))
+
+            result = reports.take_snapshots(AS_OF, window_days=WINDOW_DAYS)
+            reports.take_snapshots(AS_OF, window_days=WINDOW_DAYS)  # re-running replaces the day's rows
+            wrong = []
+            for ledger, items in (('ar', receivables), ('ap', payables)):
+                for tenant_id in ('t1', 't2'):
+                    snapshot = AgingSnapshot.query.filter_by(tenant_id=tenant_id, ledger=ledger).one()
+                    expected = reference_snapshot(items, tenant_id)
+                    got = [snapshot.open_items, snapshot.total_outstanding, snapshot.days_outstanding,
+                           snapshot.current_amount, snapshot.days_30_amount, snapshot.days_60_amount,
+                           snapshot.days_90_amount, snapshot.days_120_amount, snapshot.over_120_amount]
+                    want = [expected['open_items'], expected['total'], expected['days_outstanding'],
+                            *[expected['buckets'][b] for b in BUCKETS]]
+                    if got[0] != want[0] or got[2] != want[2] or any(abs(g - w) > 0.05 for g, w in zip(got[3:], want[3:])) \
+                            or abs(got[1] - want[1]) > 0.05:
+                        wrong.append((ledger, tenant_id, got, want))
+            self.check('snapshots match the per-item classification', result['success'] and not wrong,
+                       wrong[:2] or result)
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if AgingReportsTester().run() else 1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Bulk approval test
+==================
+
+Drives modules/workflows/approval_engine.py through a random mix of single and
+bulk approvals, rejections and escalations on a throwaway SQLite database and
+checks it against a naive reference that walks every workflow in memory:
+- each bulk item succeeds or fails exactly as the one-at-a-time reference;
+- status, stage and history length of every workflow agree after each batch;
+- every user's pending inbox equals a full scan of the stage roles and
+  escalation targets;
+- an all-or-nothing batch with one bad item changes nothing;
+- escalating an overdue workflow gives the target a new deadline to approve;
+- another tenant's workflows are neither listed nor touched.
+
+Usage:
+    python test_approval_bulk.py
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import g
+
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+USERS = ['manager', 'finance_manager', 'director', 'controller', 'supervisor', 'inventory_manager',
+         'accountant', 'finance', 'alice', 'bob']
+TYPES = ['purchase_order', 'stock_adjustment', 'journal_entry', 'expense_report']
+
+class ReferenceInbox:
+    """The approval rules applied to plain dicts, one workflow at a time"""
+
+    def __init__(self, templates, roles):
+        self.templates = templates
+        self.roles = roles
+        self.workflows = {}
+
+    def create(self, workflow_id, workflow_type, amount):
+        template = self.templates[workflow_type]
+        thresholds = template['amount_thresholds']
+        count = 1 if amount <= thresholds['low'] else 2 if amount <= thresholds['medium'] else len(template['stages'])
+        self.workflows[workflow_id] = {'stages': template['stages'][:count], 'stage': 1, 'status': 'pending',
+                                       'escalated_to': None, 'history': 1}
+
+    def may_act(self, workflow, user):
+        role = workflow['stages'][workflow['stage'] - 1]['role']
+        return role in self.roles.get(user, ()) or workflow['escalated_to'] == user
+
+    def act(self, workflow_id, user, action):
+        workflow = self.workflows.get(workflow_id)
+        if workflow is None or workflow['status'] != 'pending' or not self.may_act(workflow, user):
+            return False
+        if action == 'reject':
+            workflow['status'] = 'rejected'
+            workflow['history'] += 1
+        elif workflow['stage'] == len(workflow['stages']):
+            workflow['status'] = 'approved'
+            workflow['history'] += 2
+        else:
+            workflow['stage'] += 1
+            workflow['escalated_to'] = None
+            workflow['history'] += 1
+        return True
+
+    def escalate(self, workflow_id, target):
+        workflow = self.workflows[workflow_id]
+        if workflow['status'] != 'pending' or not workflow['stages'][workflow['stage'] - 1].get('can_escalate'):
+            return False
+        workflow['escalated_to'] = target
+        workflow['history'] += 1
+        return True
+
+    def inbox(self, user):
+        return {workflow_id for workflow_id, workflow in self.workflows.items()
+                if workflow['status'] == 'pending' and self.may_act(workflow, user)}
+
+class ApprovalBulkTester(ScriptTester):
+    def compare(self, name, engine, reference, ApprovalRequest):
+        rows = {w.workflow_id: w for w in ApprovalRequest.query.filter_by(tenant_id='t1')}
+        wrong = [(workflow_id, rows[workflow_id].status, rows[workflow_id].current_stage,
+                  rows[workflow_id].history.count(), expected)
+                 for workflow_id, expected in reference.workflows.items()
+                 if (rows[workflow_id].status, rows[workflow_id].current_stage, rows[workflow_id].history.count())
+                 != (expected['status'], expected['stage'], expected['history'])]
+        self.check(f'{name}: workflows match the reference', not wrong, wrong[:3])
+
+        inboxes = {user: {w['id'] for w in engine.get_pending_approvals(user)} for user in USERS}
+        wrong = [(user, len(inboxes[user]), len(reference.inbox(user))) for user in USERS
+                 if inboxes[user] != reference.inbox(user)]
+        self.check(f'{name}: inboxes match a full scan', not wrong, wrong)
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            from modules.workflows.approval_engine import USER_APPROVAL_ROLES, ApprovalWorkflow
+            from modules.workflows.models import ApprovalHistory, ApprovalRequest
+
+            create_tables(ApprovalRequest, ApprovalHistory)
+            engine = ApprovalWorkflow()
+            reference = ReferenceInbox(engine.workflow_templates, USER_APPROVAL_ROLES)
+            rng = random.Random(29)
+
+            with app.test_request_context():
+                g.tenant_id = 't2'
+                other = engine.create_workflow({'type': 'purchase_order', 'reference_id': 1, 'amount': 100,
+                                                'initiator': 'bob'})['workflow_id']
+
+            with app.test_request_context():
+                g.tenant_id = 't1'
+                for i in range(400):
+                    workflow_type = rng.choice(TYPES)
+                    amount = rng.choice([100, 800, 1500, 4000, 9000, 30000, 60000])
+                    created = engine.create_workflow({'type': workflow_type, 'reference_id': i, 'amount': amount,
+                                                      'initiator': 'bob'})
+                    reference.create(created['workflow_id'], workflow_type, amount)
+                self.compare('created', engine, reference, ApprovalRequest)
+
+                ids = list(reference.workflows)
+                mismatched = []
+                for batch in range(30):
+                    user = rng.choice(USERS)
+                    action = 'reject' if rng.random() < 0.2 else 'approve'
+                    chosen = rng.sample(ids, rng.randint(1, 120)) + (['WF-MISSING'] if batch % 5 == 0 else [])
+                    if batch % 3 == 0:
+                        for workflow_id in rng.sample(ids, 10):
+                            target = rng.choice(USERS)
+                            escalated = engine.escalate_workflow(workflow_id, 'bob', target, 'busy')['success']
+                            if escalated != reference.escalate(workflow_id, target):
+                                mismatched.append(('escalate', workflow_id))
+
+                    result = engine.bulk_action(chosen, user, action, 'batch')
+                    done = {r['workflow_id'] for r in result['results']}
+                    expected = {workflow_id for workflow_id in chosen if reference.act(workflow_id, user, action)}
+                    if done != expected or result['failed'] != len(chosen) - len(expected):
+                        mismatched.append((batch, user, action, len(done), len(expected)))
+                self.check('bulk items succeed exactly where the reference does', not mismatched, mismatched[:3])
+                self.compare('after 30 batches', engine, reference, ApprovalRequest)
+
+                pending = [w for w, state in reference.workflows.items() if state['status'] == 'pending']
+                before = ApprovalHistory.query.count()
+                result = engine.bulk_action(pending[:20] + ['WF-MISSING'], 'controller', 'reject',
+                                            all_or_nothing=True)
+                self.check('all-or-nothing batch with a bad item changes nothing',
+                           not result['success'] and ApprovalHistory.query.count() == before, result.get('error'))
+                self.compare('after the refused batch', engine, reference, ApprovalRequest)
+
+                overdue = engine.create_workflow({'type': 'purchase_order', 'reference_id': 999, 'amount': 100,
+                                                  'initiator': 'bob'})['workflow_id']
+                ApprovalRequest.query.filter_by(workflow_id=overdue).one().timeout_date = datetime.now() - timedelta(hours=1)
+                escalated = engine.escalate_workflow(overdue, 'bob', 'alice', 'overdue')
+                approved = engine.approve_workflow(overdue, 'alice', 'ok')
+                self.check('escalating an overdue workflow resets its deadline',
+                           escalated['success'] and approved['success'], approved.get('error'))
+
+                result = engine.bulk_action([other], 'manager', 'approve')
+                self.check("another tenant's workflow is not found", result['processed'] == 0 and result['failed'] == 1,
+                           result)
+
+            with app.test_request_context():
+                g.tenant_id = 't2'
+                self.check("another tenant's inbox is untouched",
+                           [w['id'] for w in engine.get_pending_approvals('manager')] == [other])
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if ApprovalBulkTester().run() else 1)
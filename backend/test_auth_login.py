@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Login test
+==========
+
+Logs in through /api/auth (modules/core/auth_enhanced.py) on a throwaway
+SQLite database and checks:
+- an active, verified user gets a token that /verify-token accepts;
+- a wrong password, an inactive account and an unverified email are
+  refused with their own answers;
+- a password reset for an inactive account answers like any unknown email;
+- a revoke-all (password reset) refuses earlier tokens but not one issued
+  in the same second right after it;
+- a user deactivated after login has the token refused;
+- repeated failures are throttled and every attempt is logged.
+
+Usage:
+    python test_auth_login.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_jwt_extended import JWTManager
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+PASSWORD = 'Correct-Horse-9'
+
+class AuthLoginTester(ScriptTester):
+    def login(self, client, email, password=PASSWORD):
+        response = client.post('/api/auth/login', json={'email': email, 'password': password})
+        return response.status_code, response.get_json()
+
+    def run(self):
+        app = sqlite_app(JWT_SECRET_KEY='test-secret', TESTING=True)
+        jwt = JWTManager(app)
+
+        with app.app_context():
+            import modules.core.tenant_models  # noqa: F401 - tenants, referenced by permissions
+            from modules.core.auth_enhanced import auth_enhanced_bp
+            from modules.core.identity_cache import MemoryStore, identity_cache
+            from modules.core.login_throttle import MemorySlidingWindow, login_throttle
+            from modules.core.models import Role, User
+            from modules.core.permissions import Permission, RolePermission
+
+            @jwt.additional_claims_loader
+            def add_token_claims(identity):
+                return identity_cache.token_claims()
+
+            @jwt.token_in_blocklist_loader
+            def check_token_revoked(jwt_header, jwt_data):
+                return identity_cache.is_token_revoked(jwt_data)
+
+            app.register_blueprint(auth_enhanced_bp, url_prefix='/api/auth')
+            identity_cache._store = MemoryStore()
+            login_throttle._window = MemorySlidingWindow()
+
+            create_tables(Role, User, Permission, RolePermission)
+            db.session.execute(text(
+                "CREATE TABLE login_attempts (id INTEGER PRIMARY KEY, user_id INTEGER, email VARCHAR(255), "
+                "ip_address VARCHAR(45), success BOOLEAN, user_agent TEXT, failure_reason VARCHAR(100), "
+                "tenant_id VARCHAR(50))"))
+            db.session.add(Role(id=1, role_name='admin'))
+            for user_id, name, active, verified in ((1, 'ada', True, True), (2, 'ben', False, True),
+                                                    (3, 'cy', True, False)):
+                db.session.add(User(id=user_id, username=name, email=f'{name}@example.com', role_id=1,
+                                    password_hash=generate_password_hash(PASSWORD), is_active=active,
+                                    email_verified=verified, tenant_id='t1'))
+            db.session.commit()
+
+            client = app.test_client()
+            status, body = self.login(client, 'ADA@example.com ')
+            self.check('an active, verified user logs in',
+                       status == 200 and body['user']['id'] == 1 and body['user']['is_active'] and body['access_token'],
+                       (status, body))
+            headers = {'Authorization': f"Bearer {body.get('access_token')}"}
+            verified = client.get('/api/auth/verify-token', headers=headers)
+            self.check('the token is accepted by /verify-token',
+                       verified.status_code == 200 and verified.get_json()['user']['id'] == 1,
+                       (verified.status_code, verified.get_json()))
+
+            identity_cache.revoke_user_tokens(1)  # a password reset
+            status, body = self.login(client, 'ada@example.com')
+            fresh = {'Authorization': f"Bearer {body.get('access_token')}"}
+            earlier = client.get('/api/auth/verify-token', headers=headers)
+            later = client.get('/api/auth/verify-token', headers=fresh)
+            self.check('a revoke-all refuses earlier tokens but not the next login',
+                       earlier.status_code == 401 and later.status_code == 200,
+                       (earlier.status_code, later.status_code))
+            headers = fresh
+
+            status, body = self.login(client, 'ada@example.com', 'wrong')
+            self.check('a wrong password is refused', status == 401 and body['message'] == 'Invalid credentials',
+                       (status, body))
+            status, body = self.login(client, 'ben@example.com')
+            self.check('an inactive account is refused', status == 401 and 'inactive' in body['message'],
+                       (status, body))
+            status, body = self.login(client, 'cy@example.com')
+            self.check('an unverified email is refused',
+                       status == 401 and body.get('email_verification_required'), (status, body))
+
+            reset = client.post('/api/auth/request-password-reset', json={'email': 'ben@example.com'})
+            self.check('a reset for an inactive account answers like an unknown email',
+                       reset.status_code == 200 and 'If the email exists' in reset.get_json()['message'],
+                       (reset.status_code, reset.get_json()))
+
+            db.session.get(User, 1).is_active = False
+            db.session.commit()
+            identity_cache.invalidate_user(1)
+            revoked = client.get('/api/auth/verify-token', headers=headers)
+            self.check('a user deactivated after login has the token refused', revoked.status_code == 401,
+                       (revoked.status_code, revoked.get_json()))
+
+            for _ in range(4):
+                self.login(client, 'dora@example.com', 'wrong')
+            status, body = self.login(client, 'dora@example.com', 'wrong')
+            self.check('repeated failures are throttled', status == 429 and body['retry_after'] == 900,
+                       (status, body))
+
+            # The writer thread may hold the first batch while the rest is flushed here
+            login_throttle.writer.flush()
+            deadline = time.time() + 5
+            while login_throttle.writer.written < 9 and time.time() < deadline:
+                time.sleep(0.05)
+            logged = db.session.execute(text(
+                "SELECT count(*), sum(CASE WHEN success THEN 1 ELSE 0 END) FROM login_attempts")).one()
+            self.check('every attempt is logged', tuple(logged) == (9, 1), tuple(logged))
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if AuthLoginTester().run() else 1)
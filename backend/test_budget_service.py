@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Budget vs actual test
+=====================
+
+Runs BudgetService.compare_to_budget from services/budget_service.py on a
+generated ledger in a throwaway SQLite database and checks that:
+- actuals and budgets meet per account and cost center, including cells that
+  have only one side (unbudgeted spend, budgets with no postings);
+- draft entries and other tenants are ignored;
+- YTD and rolling windows, per-period rows and side-by-side scenarios add up;
+- threshold flags and favourable/unfavourable signs follow the account type.
+
+Usage:
+    python test_budget_service.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+class BudgetServiceTester(ScriptTester):
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the finance models
+            import modules.finance.accounting_periods  # noqa: F401 - accounting_periods, referenced by journal_entries
+            from modules.finance.cost_center_models import CostCenter
+            from modules.finance.models import Account, Budget, JournalEntry, JournalLine
+            from services.budget_service import BudgetService
+            create_tables(Account, CostCenter, JournalEntry, JournalLine, Budget)
+
+            engine = db.engine
+            accounts = [{'id': 1, 'code': '4000', 'name': 'Sales', 'type': 'revenue', 'tenant_id': 't1'}]
+            accounts += [{'id': i, 'code': f'{6000 + i}', 'name': f'Expense {i}', 'type': 'expense', 'tenant_id': 't1'}
+                         for i in range(2, 202)]
+            db.session.execute(Account.__table__.insert(), accounts)
+            db.session.execute(CostCenter.__table__.insert(), [
+                {'id': c, 'code': f'CC{c}', 'name': f'Center {c}', 'tenant_id': 't1', 'user_id': 1}
+                for c in range(1, 11)])
+
+            rng = random.Random(7)
+            entries, lines, expected = [], [], {}
+            for entry_id in range(1, 20001):
+                month = rng.randint(1, 6)
+                status = 'draft' if entry_id % 50 == 0 else 'posted'
+                tenant = 't2' if entry_id % 97 == 0 else 't1'
+                entries.append({'id': entry_id, 'period': f'2024-{month:02d}', 'doc_date': date(2024, month, 1),
+                                'reference': f'JE-{entry_id}', 'description': 'generated', 'status': status,
+                                'tenant_id': tenant})
+                account_id, cost_center_id = rng.randint(2, 201), rng.randint(1, 10)
+                amount = rng.randint(1, 500)
+                lines.append({'journal_entry_id': entry_id, 'account_id': account_id,
+                              'cost_center_id': cost_center_id, 'debit_amount': amount, 'credit_amount': 0})
+                lines.append({'journal_entry_id': entry_id, 'account_id': 1,
+                              'cost_center_id': cost_center_id, 'debit_amount': 0, 'credit_amount': amount})
+                if status == 'posted' and tenant == 't1':
+                    for key in ((account_id, cost_center_id, month), (1, cost_center_id, month)):
+                        expected[key] = expected.get(key, 0) + amount
+            db.session.execute(JournalEntry.__table__.insert(), entries)
+            db.session.execute(JournalLine.__table__.insert(), lines)
+
+            budgets = []
+            for account_id in range(1, 202):
+                for cost_center_id in range(1, 11):
+                    for month in range(1, 7):
+                        if account_id == 2 and cost_center_id == 1:
+                            continue  # unbudgeted cell
+                        for scenario, factor in (('base', 1.0), ('optimistic', 0.8)):
+                            budgets.append({'period': f'2024-{month:02d}', 'account_id': account_id,
+                                            'cost_center_id': cost_center_id, 'scenario': scenario,
+                                            'budget_amount': 100.0 * factor, 'tenant_id': 't1', 'user_id': 1})
+            budgets.append({'period': '2024-03', 'account_id': 201, 'cost_center_id': None, 'scenario': 'base',
+                            'budget_amount': 999.0, 'tenant_id': 't1', 'user_id': 1})  # budget without actuals
+            db.session.execute(Budget.__table__.insert(), budgets)
+            db.session.commit()
+
+            statements = []
+            from sqlalchemy import event
+            listener = lambda *args: statements.append(args[2])
+            event.listen(engine, 'before_cursor_execute', listener)
+            started = time.perf_counter()
+            result = BudgetService.compare_to_budget('2024-03', tenant_id='t1')
+            elapsed = time.perf_counter() - started
+            event.remove(engine, 'before_cursor_execute', listener)
+            cells = {(c['account_id'], c['cost_center_id']): c for c in result['comparisons']}
+            self.check('one round trip', len(statements) == 1, len(statements))
+            print(f"   {len(cells)} cells in {elapsed * 1000:.0f} ms")
+
+            mismatched = [key for key, c in cells.items() if key[1] is not None and
+                          c['actual'] != expected.get((key[0], key[1], 3), 0)]
+            self.check('actuals match posted t1 lines', not mismatched, mismatched[:5])
+            self.check('unbudgeted spend is reported',
+                       cells[(2, 1)]['budget'] == 0 and cells[(2, 1)]['flag'] == 'unbudgeted', cells.get((2, 1)))
+            self.check('budget without actuals is reported',
+                       cells[(201, None)]['actual'] == 0 and cells[(201, None)]['budget'] == 999.0)
+            revenue = cells[(1, 1)]
+            self.check('revenue is reported credit-positive',
+                       revenue['actual'] == expected[(1, 1, 3)] and revenue['favorable'] == (revenue['variance'] >= 0))
+            expense = cells[(3, 1)]
+            self.check('expense over budget is unfavourable and flagged',
+                       (expense['variance'] > 0) == (not expense['favorable']) and
+                       (expense['flag'] is not None) == (abs(expense['variance_pct']) >= 10), expense)
+
+            ytd = BudgetService.compare_to_budget('2024-06', window='ytd', tenant_id='t1', cost_center='CC4')
+            ytd_cell = next(c for c in ytd['comparisons'] if c['account_id'] == 5)
+            self.check('ytd sums six periods for one cost center',
+                       ytd['start_period'] == '2024-01' and {c['cost_center_id'] for c in ytd['comparisons']} == {4}
+                       and ytd_cell['budget'] == 600.0 and
+                       ytd_cell['actual'] == sum(expected.get((5, 4, m), 0) for m in range(1, 7)), ytd_cell)
+
+            rolling = BudgetService.compare_to_budget('2024-05', window='rolling', months=3, by_period=True,
+                                                      scenarios=['base', 'optimistic'], tenant_id='t1',
+                                                      cost_center=2)
+            periods = {c['period'] for c in rolling['comparisons']}
+            sample = rolling['comparisons'][0]
+            self.check('rolling window returns one row per period', periods == {'2024-03', '2024-04', '2024-05'},
+                       periods)
+            self.check('scenarios are compared side by side',
+                       sample['scenarios']['optimistic']['budget'] == 80.0 and sample['budget'] == 100.0, sample)
+
+            flagged = BudgetService.compare_to_budget('2024-03', tenant_id='t1', threshold_pct=50,
+                                                      threshold_amount=100, flagged_only=True)
+            self.check('flagged_only keeps cells past both thresholds',
+                       flagged['comparisons'] and all(abs(c['variance']) >= 100 and
+                                                      (c['variance_pct'] is None or abs(c['variance_pct']) >= 50)
+                                                      for c in flagged['comparisons']))
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if BudgetServiceTester().run() else 1)
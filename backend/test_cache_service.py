@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Cache service test
+==================
+
+Runs services/cache_service.py in local-only mode (no Redis reachable) and
+checks that:
+- values are scoped to their tenant;
+- invalidating a tag drops the tenant's entries under it and nothing else;
+- an invalidation that lands while the loader runs leaves the loaded value
+  stale, so the next get misses;
+- concurrent misses for one key share a single loader call.
+
+Usage:
+    python test_cache_service.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from script_testing import ScriptTester
+from services.cache_service import CacheService
+
+class CacheServiceTester(ScriptTester):
+    def run(self):
+        cache = CacheService(redis_url='redis://127.0.0.1:1/0', local_ttl=60)
+
+        cache.set('report', {'total': 1}, tenant_id='t1', tags=['gl'])
+        cache.set('report', {'total': 2}, tenant_id='t2', tags=['gl'])
+        self.check('values are scoped to their tenant',
+                   cache.get('report', tenant_id='t1') == {'total': 1} and
+                   cache.get('report', tenant_id='t2') == {'total': 2} and cache.get('report') is None)
+
+        cache.set('untagged', 'kept', tenant_id='t1')
+        cache.invalidate_tags('gl', tenant_id='t1')
+        self.check('a tag invalidation drops only the tenant\'s entries under it',
+                   cache.get('report', tenant_id='t1') is None and
+                   cache.get('report', tenant_id='t2') == {'total': 2} and
+                   cache.get('untagged', tenant_id='t1') == 'kept')
+
+        def loader_racing_an_invalidation():
+            value = {'total': 'before posting'}
+            cache.invalidate_tags('gl', tenant_id='t1')  # a posting commits while the report is computed
+            return value
+
+        loaded = cache.get_or_set('forecast', loader_racing_an_invalidation, ttl=3600, tenant_id='t1', tags=['gl'])
+        self.check('an invalidation during the load leaves the value stale',
+                   loaded == {'total': 'before posting'} and cache.get('forecast', tenant_id='t1') is None)
+        fresh = cache.get_or_set('forecast', lambda: {'total': 'after posting'}, ttl=3600, tenant_id='t1', tags=['gl'])
+        self.check('the next load is cached again',
+                   fresh == {'total': 'after posting'} and cache.get('forecast', tenant_id='t1') == fresh)
+
+        calls = []
+        def slow_loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'shared'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_set('slow', slow_loader)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.check('concurrent misses share one loader call', len(calls) == 1 and results == ['shared'] * 8,
+                   (len(calls), results))
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if CacheServiceTester().run() else 1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Cash-flow forecast test
+=======================
+
+Generates three years of cash postings (seasonal sales, monthly rent and
+payroll) plus open receivables and payables on a throwaway SQLite database,
+forecasts them with services/cashflow_forecast.py and checks that:
+- the opening balance is the posted cash balance of the tenant;
+- rent and payroll are found as recurring items on their day of the month;
+- the seasonal peak shows up in the 12-month projection;
+- open AR lands on its due date, later in the pessimistic scenario;
+- weekly and monthly figures add up to the same running balance;
+- the result is cached per tenant and dropped when a journal entry is posted
+  or a posted one is voided.
+
+Usage:
+    python test_cashflow_forecast.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+AS_OF = date(2026, 6, 30)
+
+class CashFlowForecastTester(ScriptTester):
+    def generate(self, models):
+        Account, JournalEntry, JournalLine, AccountsReceivable, AccountsPayable = models
+        db.session.execute(Account.__table__.insert(), [
+            {'id': 1, 'code': '1020', 'name': 'Business Checking', 'type': 'asset', 'tenant_id': 't1'},
+            {'id': 2, 'code': '4000', 'name': 'Sales', 'type': 'revenue', 'tenant_id': 't1'},
+            {'id': 3, 'code': '6000', 'name': 'Rent', 'type': 'expense', 'tenant_id': 't1'},
+            {'id': 4, 'code': '6100', 'name': 'Payroll', 'type': 'expense', 'tenant_id': 't1'},
+            {'id': 5, 'code': '1020', 'name': 'Business Checking', 'type': 'asset', 'tenant_id': 't2'},
+        ])
+
+        rng = random.Random(11)
+        entries, lines = [], []
+        balance = 0.0
+
+        def post(day, cash_account, other_account, amount, tenant='t1', status='posted'):
+            nonlocal balance
+            entry_id = len(entries) + 1
+            entries.append({'id': entry_id, 'period': day.strftime('%Y-%m'), 'doc_date': day,
+                            'reference': f'JE-{entry_id}', 'description': 'generated', 'status': status,
+                            'tenant_id': tenant})
+            lines.append({'journal_entry_id': entry_id, 'account_id': cash_account,
+                          'debit_amount': max(amount, 0), 'credit_amount': max(-amount, 0)})
+            lines.append({'journal_entry_id': entry_id, 'account_id': other_account,
+                          'debit_amount': max(-amount, 0), 'credit_amount': max(amount, 0)})
+            if tenant == 't1' and status == 'posted':
+                balance += amount
+
+        day = date(2022, 1, 1)
+        while day <= AS_OF:
+            season = 2.0 if day.month == 12 else 1.0
+            post(day, 1, 2, round(rng.uniform(800, 1200) * season, 2))
+            if day.day == 1:
+                post(day, 1, 3, -5000.0)
+            if day.day == 25:
+                post(day, 1, 4, -20000.0)
+            if day.day == 10:
+                post(day, 1, 2, 99999.0, status='draft')
+                post(day, 5, 2, 77777.0, tenant='t2')
+            day += timedelta(days=1)
+        db.session.execute(JournalEntry.__table__.insert(), entries)
+        db.session.execute(JournalLine.__table__.insert(), lines)
+
+        party = {'customer_id': 1, 'invoice_date': AS_OF - timedelta(days=20), 'total_amount': 0, 'tenant_id': 't1'}
+        db.session.execute(AccountsReceivable.__table__.insert(), [
+            dict(party, invoice_number='AR-1', due_date=AS_OF + timedelta(days=10), outstanding_amount=25000.0,
+                 status='pending'),
+            dict(party, invoice_number='AR-2', due_date=AS_OF - timedelta(days=5), outstanding_amount=1000.0,
+                 status='overdue'),
+            dict(party, invoice_number='AR-3', due_date=AS_OF + timedelta(days=3), outstanding_amount=5000.0,
+                 status='paid'),
+        ])
+        db.session.execute(AccountsPayable.__table__.insert(), [
+            {'invoice_number': 'AP-1', 'vendor_id': 1, 'invoice_date': AS_OF, 'due_date': AS_OF + timedelta(days=20),
+             'total_amount': 0, 'outstanding_amount': 40000.0, 'status': 'approved', 'tenant_id': 't1'},
+        ])
+        db.session.commit()
+        return balance, len(entries)
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the finance models
+            import modules.finance.accounting_periods  # noqa: F401
+            import modules.finance.cost_center_models  # noqa: F401
+            import modules.finance.payment_models  # noqa: F401 - payment_methods, bank_accounts
+            from modules.finance.advanced_models import AccountsPayable, AccountsReceivable
+            from modules.finance.models import Account, JournalEntry, JournalLine
+            from services.budget_service import BudgetService
+            from services.cashflow_forecast import CashFlowForecaster, cashflow_forecaster
+
+            models = (Account, JournalEntry, JournalLine, AccountsReceivable, AccountsPayable)
+            create_tables(*models)
+            balance, entry_count = self.generate(models)
+
+            forecaster = CashFlowForecaster()
+            forecaster.init_app(app)
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+            started = time.perf_counter()
+            result = forecaster.forecast('t1', as_of=AS_OF)
+            elapsed = time.perf_counter() - started
+            print(f"   {entry_count:,} entries over 3.5 years forecast in {elapsed * 1000:.0f} ms "
+                  f"({len(statements)} queries)")
+            self.check('two queries', len(statements) == 2, len(statements))
+            self.check('opening balance is the posted cash balance', abs(result['opening_balance'] - balance) < 0.01,
+                       (result['opening_balance'], balance))
+
+            outflows = {item['day_of_month']: item['amount'] for item in result['recurring']['outflows']}
+            self.check('rent and payroll are recurring', outflows == {1: 5000.0, 25: 20000.0}, outflows)
+
+            base, pessimistic = result['scenarios']['base'], result['scenarios']['pessimistic']
+            months = {m['month']: m for m in base['months']}
+            self.check('seasonal peak in December', months['2026-12']['inflow'] > 1.6 * months['2027-03']['inflow'],
+                       (months['2026-12']['inflow'], months['2027-03']['inflow']))
+            self.check('recurring outflows are projected monthly', 24000 < months['2027-03']['outflow'] < 26000,
+                       months['2027-03']['outflow'])
+
+            # Sales run at ~1,000 a day, so the 25,000 invoice due on day 10 is ahead of the baseline
+            self.check('open AR lands in its due week',
+                       base['weeks'][1]['inflow'] > 15000 > base['weeks'][0]['inflow'],
+                       [w['inflow'] for w in base['weeks'][:3]])
+            self.check('pessimistic scenario collects it later',
+                       pessimistic['weeks'][0]['inflow'] + pessimistic['weeks'][1]['inflow'] < 15000 and
+                       pessimistic['weeks'][3]['inflow'] > 5000,
+                       [w['inflow'] for w in pessimistic['weeks'][:4]])
+            self.check('open items skip paid invoices', result['open_items'] == {'receivables': 26000.0,
+                                                                              'payables': 40000.0},
+                       result['open_items'])
+
+            week_close = result['opening_balance'] + sum(w['net'] for w in base['weeks'])
+            chained = all(a['closing_balance'] == b['opening_balance'] for a, b in zip(base['months'], base['months'][1:]))
+            self.check('weeks and months share one running balance',
+                       abs(week_close - base['weeks'][-1]['closing_balance']) < 0.05 and chained and
+                       abs(base['months'][0]['opening_balance'] + sum(m['net'] for m in base['months'])
+                           - base['months'][-1]['closing_balance']) < 0.05)
+
+            statements.clear()
+            started = time.perf_counter()
+            cached = forecaster.forecast('t1', as_of=AS_OF)
+            self.check('second call is served from the cache', not statements and cached == result,
+                       len(statements))
+            print(f"   cached in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+            db.session.add(JournalEntry(period='2026-06', doc_date=AS_OF, reference='JE-NEW', description='late sale',
+                                        status='posted', tenant_id='t1'))
+            db.session.commit()
+            statements.clear()
+            refreshed = forecaster.forecast('t1', as_of=AS_OF)
+            self.check('posting drops the cached forecast', len(statements) == 2 and
+                       refreshed['generated_at'] != result['generated_at'], len(statements))
+
+            JournalEntry.query.filter_by(reference='JE-NEW').one().status = 'void'
+            db.session.commit()
+            statements.clear()
+            voided = forecaster.forecast('t1', as_of=AS_OF)
+            self.check('voiding a posted entry drops the cached forecast', len(statements) == 2 and
+                       voided['generated_at'] != refreshed['generated_at'], len(statements))
+
+            monthly = BudgetService.forecast_cashflow(months=6, entity='t1', scenario='base_case')
+            today = cashflow_forecaster.forecast('t1')['scenarios']['base']['months']
+            self.check('BudgetService.forecast_cashflow returns the monthly view',
+                       len(monthly) == 6 and monthly[0]['month'] == today[0]['month']
+                       and monthly[0]['net_cashflow'] == today[0]['net'], monthly[:1])
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if CashFlowForecastTester().run() else 1)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Cost layer and optimistic locking concurrency test
+==================================================
+
+Exercises modules/inventory/cost_layer_models.py and
+modules/core/concurrency.py on a throwaway SQLite file database:
+- batched keyset iteration returns every open layer exactly once, in FIFO and
+  LIFO order, including legacy layers without a receipt date;
+- a FIFO issue through services/inventory_costing_service.py takes an undated
+  layer first and reports it without a receipt date;
+- two threads issuing from the same layers never consume a layer twice and
+  together deplete exactly what they issued;
+- a stale StockLevel or JournalHeader update (version_id_col) is answered
+  with 409 CONCURRENCY_CONFLICT by the app error handlers;
+- ConcurrencyManager.update_with_optimistic_lock only writes the table's
+  updatable fields and rejects the whole update otherwise.
+
+Usage:
+    python test_cost_layer_concurrency.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+PRODUCT = 1
+WAREHOUSE = 1
+
+class CostLayerConcurrencyTester(ScriptTester):
+    def generate(self, InventoryCostLayer):
+        rng = random.Random(31)
+        rows = []
+        for sequence in range(1, 121):
+            quantity = float(rng.randint(1, 10))
+            depleted = rng.random() < 0.2
+            receipt = None if sequence % 17 == 0 else date(2026, 1, 1) + timedelta(days=rng.randint(0, 20))
+            rows.append({'product_id': PRODUCT, 'simple_warehouse_id': WAREHOUSE, 'layer_sequence': sequence,
+                         'receipt_date': receipt, 'unit_cost': float(sequence), 'original_quantity': quantity,
+                         'remaining_quantity': 0.0 if depleted else quantity, 'total_cost': quantity * sequence,
+                         'remaining_cost': 0.0 if depleted else quantity * sequence, 'base_currency_unit_cost': 1.0,
+                         'base_currency_total_cost': quantity, 'is_depleted': depleted})
+        db.session.execute(InventoryCostLayer.__table__.insert(), rows)
+        db.session.commit()
+
+    def check_iteration(self, InventoryCostLayer, UNDATED_RECEIPT):
+        layers = InventoryCostLayer.query.filter_by(is_depleted=False).all()
+        fifo = sorted(layers, key=lambda l: (l.receipt_date or UNDATED_RECEIPT, l.layer_sequence, l.id))
+        for method, expected in (('FIFO', fifo), ('LIFO', fifo[::-1])):
+            got = [l.id for l in InventoryCostLayer.iter_available_layers(PRODUCT, WAREHOUSE, method, batch_size=7)]
+            self.check(f'{method} keyset pages cover every open layer once, in order',
+                       got == [l.id for l in expected], (len(got), len(expected)))
+        db.session.rollback()
+
+    def check_undated_issue(self, InventoryCostLayer, CostLayerTransaction):
+        from services.inventory_costing_service import InventoryCostingService
+
+        product = PRODUCT + 1
+        db.session.execute(InventoryCostLayer.__table__.insert(), [
+            {'product_id': product, 'simple_warehouse_id': WAREHOUSE, 'layer_sequence': sequence,
+             'receipt_date': receipt, 'unit_cost': cost, 'original_quantity': 5.0, 'remaining_quantity': 5.0,
+             'total_cost': 5 * cost, 'remaining_cost': 5 * cost, 'base_currency_unit_cost': cost,
+             'base_currency_total_cost': 5 * cost, 'is_depleted': False}
+            for sequence, receipt, cost in ((1, date(2026, 1, 1), 2.0), (2, None, 3.0))])
+        db.session.commit()
+        result = InventoryCostingService().process_inventory_issue(
+            {'product_id': product, 'quantity': 7.0, 'warehouse_id': WAREHOUSE, 'cost_method': 'FIFO'})
+        taken = [(d['layer_sequence'], d['receipt_date'], d['quantity_depleted'])
+                 for d in result.get('layer_depletions', [])]
+        self.check('a FIFO issue takes the undated layer first and reports no receipt date',
+                   result.get('success') and taken == [(2, None, 5.0), (1, '2026-01-01', 2.0)] and
+                   result['total_cost'] == 19.0 and CostLayerTransaction.query.count() == 2, result)
+
+    def check_threads(self, app, InventoryCostLayer):
+        before = {l.id: l.remaining_quantity for l in InventoryCostLayer.query.all()}
+        open_quantity = sum(before.values())
+        issue = open_quantity * 0.4
+        results, errors = {}, []
+
+        def issuer(name):
+            try:
+                with app.app_context():
+                    depletions = InventoryCostLayer.consume_layers(PRODUCT, issue, WAREHOUSE, batch_size=5)
+                    db.session.commit()
+                    results[name] = depletions
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=issuer, args=(name,)) for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db.session.expire_all()
+        after = {l.id: l.remaining_quantity for l in InventoryCostLayer.query.all()}
+        consumed = {}
+        for depletions in results.values():
+            for d in depletions:
+                consumed[d['layer_id']] = consumed.get(d['layer_id'], 0.0) + d['depleted_quantity']
+        over = [layer_id for layer_id, quantity in consumed.items() if quantity > before[layer_id] + 1e-9]
+        drift = [layer_id for layer_id in before if abs(before[layer_id] - consumed.get(layer_id, 0.0)
+                                                         - after[layer_id]) > 1e-9]
+        self.check('both issuers finish', not errors and len(results) == 2, errors)
+        self.check('no layer is consumed twice', not over and not drift, (over[:3], drift[:3]))
+        self.check('the issues deplete exactly what they took',
+                   abs(sum(consumed.values()) - 2 * issue) < 1e-6 and
+                   abs(sum(after.values()) - (open_quantity - 2 * issue)) < 1e-6)
+
+    def check_stale(self, app, name, model, row, change):
+        """Read ``row`` in a request, commit a concurrent update from another session, then save"""
+        from modules.core.concurrency import commit_versioned
+
+        db.session.execute(model.__table__.insert(), [row])
+        db.session.commit()
+
+        def stale_update(commit):
+            record = db.session.get(model, row['id'])
+            with app.app_context():
+                concurrent = db.session.get(model, row['id'])
+                change(concurrent)
+                db.session.commit()
+            change(record)
+            commit()
+            return jsonify({'success': True})
+
+        for label, commit in (('commit_versioned', commit_versioned), ('plain commit', db.session.commit)):
+            self.scenario = lambda: stale_update(commit)
+            response = app.test_client().get('/stale')
+            self.check(f'stale {name} update ({label}) is a 409',
+                       response.status_code == 409 and response.get_json()['error'] == 'CONCURRENCY_CONFLICT',
+                       (response.status_code, response.get_json()))
+
+    def check_updatable_fields(self, StockLevel):
+        from modules.inventory.concurrency_management import ConcurrencyManager
+
+        manager = ConcurrencyManager()
+        version = manager.get_optimistic_lock_version('inventory_stock_levels', 1)
+        rejected = manager.update_with_optimistic_lock('inventory_stock_levels', 1,
+                                                       {'quantity_on_hand': 0.0, 'product_id': 99}, version)
+        db.session.expire_all()
+        untouched = db.session.get(StockLevel, 1)
+        updated = manager.update_with_optimistic_lock('inventory_stock_levels', 1, {'quantity_on_hand': 5.0}, version)
+        self.check('only updatable fields are written',
+                   rejected['error'] == 'INVALID_FIELDS' and untouched.product_id == PRODUCT and
+                   untouched.quantity_on_hand != 0.0 and updated['success'] and updated['new_version'] == version + 1 and
+                   db.session.get(StockLevel, 1).quantity_on_hand == 5.0, (rejected, updated))
+
+    def run(self):
+        directory = tempfile.mkdtemp()
+        app = sqlite_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'layers.db')}")
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the inventory models
+            from app import setup_error_handlers
+            from modules.finance.advanced_models import JournalHeader
+            from modules.inventory.advanced_models import StockLevel
+            from modules.inventory.cost_layer_models import UNDATED_RECEIPT, CostLayerTransaction, InventoryCostLayer
+
+            # Databases created before receipt_date was enforced may still hold NULLs
+            InventoryCostLayer.__table__.c.receipt_date.nullable = True
+            create_tables(InventoryCostLayer, CostLayerTransaction, StockLevel, JournalHeader)
+            InventoryCostLayer.__table__.c.receipt_date.nullable = False
+            setup_error_handlers(app)
+            app.add_url_rule('/stale', 'stale', lambda: self.scenario())
+
+            self.generate(InventoryCostLayer)
+            self.check_iteration(InventoryCostLayer, UNDATED_RECEIPT)
+            self.check_threads(app, InventoryCostLayer)
+            self.check_undated_issue(InventoryCostLayer, CostLayerTransaction)
+
+            self.check_stale(app, 'StockLevel', StockLevel,
+                             {'id': 1, 'product_id': PRODUCT, 'simple_warehouse_id': WAREHOUSE,
+                              'quantity_on_hand': 10.0, 'version': 1},
+                             lambda stock: setattr(stock, 'quantity_on_hand', stock.quantity_on_hand + 1))
+            self.check_updatable_fields(StockLevel)
+            self.check_stale(app, 'JournalHeader', JournalHeader,
+                             {'id': 1, 'journal_number': 'JE-1', 'source_module': 'Finance',
+                              'posting_date': date(2026, 1, 1), 'document_date': date(2026, 1, 1),
+                              'fiscal_period': '2026-01', 'tenant_id': 't1', 'version': 1},
+                             lambda header: setattr(header, 'description', f'edited {random.random()}'))
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if CostLayerConcurrencyTester().run() else 1)
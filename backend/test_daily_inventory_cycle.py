@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Daily inventory cycle test
+==========================
+
+Runs the set-based opening capture and closing of
+services/daily_inventory_cycle_service.py over generated stock levels and
+transactions on a throwaway SQLite database, and checks every closing balance
+and transaction summary against a naive per-transaction replay:
+- receipts, issues, adjustments and both legs of transfers land on the right
+  warehouse;
+- transactions just before midnight and at the next midnight belong to the
+  neighbouring days;
+- the next day opens at the previous day's closing balances;
+- a repeated close is a no-op.
+
+Usage:
+    python test_daily_inventory_cycle.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+DAY = date(2026, 3, 10)
+PRODUCTS = 300
+WAREHOUSES = 4
+
+def reference_close(stock, transactions, cycle_date, opening=None):
+    """Closing quantity/value and summaries, one transaction at a time"""
+    balances = {}
+    for key, (quantity, value) in stock.items():
+        if quantity > 0:
+            balances[key] = list(opening[key]) if opening and key in opening else [quantity, value]
+    summaries = {}
+
+    def move(product, warehouse, lot, sign, quantity, value, field):
+        key = (product, None, warehouse, lot)
+        if key in balances:
+            balances[key][0] += sign * quantity
+            balances[key][1] += sign * value
+        summary = summaries.setdefault((product, None, warehouse), {})
+        summary[field] = summary.get(field, 0) + quantity
+
+    for txn in transactions:
+        if txn['transaction_date'].date() != cycle_date:
+            continue
+        kind, source, target = txn['transaction_type'], txn['from_simple_warehouse_id'], txn['to_simple_warehouse_id']
+        args = (txn['quantity'], txn['total_cost'])
+        if kind == 'receive':
+            move(txn['product_id'], target if target is not None else source, txn['lot_batch_id'], 1, *args,
+                 'receipts_quantity')
+        elif kind == 'issue':
+            move(txn['product_id'], source if source is not None else target, txn['lot_batch_id'], -1, *args,
+                 'issues_quantity')
+        elif kind == 'adjustment':
+            move(txn['product_id'], target if target is not None else source, txn['lot_batch_id'], 1, *args,
+                 'adjustments_quantity')
+        elif kind == 'transfer':
+            move(txn['product_id'], source, txn['lot_batch_id'], -1, *args, 'transfers_out_quantity')
+            move(txn['product_id'], target, txn['lot_batch_id'], 1, *args, 'transfers_in_quantity')
+
+    closing = {key: (q, v if q > 0 else 0.0) for key, (q, v) in balances.items()}
+    summaries = {key: {f: q for f, q in fields.items() if q} for key, fields in summaries.items()}
+    return closing, {key: fields for key, fields in summaries.items() if fields}
+
+class DailyInventoryCycleTester(ScriptTester):
+    def generate(self, models):
+        InventoryProduct, StockLevel, InventoryTransaction = models
+        db.session.execute(InventoryProduct.__table__.insert(), [
+            {'id': p, 'name': f'Product {p}', 'base_uom_id': 1, 'cost_method': 'FIFO'}
+            for p in range(1, PRODUCTS + 1)])
+
+        rng = random.Random(3)
+        stock = {}
+        for product in range(1, PRODUCTS + 1):
+            for warehouse in range(1, WAREHOUSES + 1):
+                if rng.random() < 0.7:
+                    quantity = float(rng.randint(0, 200))  # some zero rows are not captured
+                    stock[(product, None, warehouse, None)] = (quantity, quantity * 5.0)
+        stock[(1, None, 1, None)] = (10.0, 50.0)  # receives the midnight neighbours
+        db.session.execute(StockLevel.__table__.insert(), [
+            {'product_id': k[0], 'simple_warehouse_id': k[2], 'quantity_on_hand': q, 'unit_cost': 5.0,
+             'total_value': v, 'version': 1} for k, (q, v) in stock.items()])
+
+        transactions = []
+        for _ in range(20000):
+            kind = rng.choice(['receive', 'issue', 'adjustment', 'transfer', 'count'])
+            source, target = rng.sample(range(1, WAREHOUSES + 1), 2)
+            if kind == 'receive':
+                source = None if rng.random() < 0.8 else source
+                target = None if source is not None else target
+            elif kind in ('issue', 'adjustment'):
+                target = None if rng.random() < 0.8 else target
+                source = None if target is not None else source
+            moment = datetime.combine(DAY, datetime.min.time()) + timedelta(
+                seconds=rng.randint(-3600, 2 * 86400))
+            quantity = float(rng.randint(1, 20)) * (-1 if kind == 'adjustment' and rng.random() < 0.5 else 1)
+            transactions.append({'transaction_type': kind, 'transaction_date': moment,
+                                 'product_id': rng.randint(1, PRODUCTS), 'variant_id': None, 'lot_batch_id': None,
+                                 'from_simple_warehouse_id': source, 'to_simple_warehouse_id': target,
+                                 'quantity': quantity, 'unit_cost': 5.0, 'total_cost': quantity * 5.0})
+        midnight = datetime.combine(DAY, datetime.min.time())
+        for moment in (midnight - timedelta(microseconds=1), midnight + timedelta(days=1)):
+            transactions.append({'transaction_type': 'receive', 'transaction_date': moment, 'product_id': 1,
+                                 'variant_id': None, 'lot_batch_id': None, 'from_simple_warehouse_id': None,
+                                 'to_simple_warehouse_id': 1, 'quantity': 1000.0, 'unit_cost': 5.0,
+                                 'total_cost': 5000.0})
+        db.session.execute(InventoryTransaction.__table__.insert(), transactions)
+        db.session.commit()
+        return stock, transactions
+
+    def compare(self, name, balances, summaries, closing, expected_summaries):
+        got = {(b.product_id, b.variant_id, b.simple_warehouse_id, b.lot_batch_id):
+               (b.closing_quantity, b.closing_total_value) for b in balances}
+        wrong = [(k, got.get(k), v) for k, v in closing.items()
+                 if got.get(k) is None or abs(got[k][0] - v[0]) > 1e-6 or abs(got[k][1] - v[1]) > 1e-6]
+        self.check(f'{name}: closing balances match the replay', not wrong and len(got) == len(closing),
+                   (wrong[:3], len(got), len(closing)))
+
+        fields = ('receipts_quantity', 'issues_quantity', 'adjustments_quantity', 'transfers_in_quantity',
+                  'transfers_out_quantity')
+        got = {(s.product_id, s.variant_id, s.simple_warehouse_id): {f: getattr(s, f) for f in fields if getattr(s, f)}
+               for s in summaries}
+        self.check(f'{name}: transaction summaries match the replay', got == expected_summaries,
+                   [(k, got.get(k), v) for k, v in expected_summaries.items() if got.get(k) != v][:3])
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the inventory models
+            from modules.inventory.advanced_models import InventoryProduct, InventoryTransaction, StockLevel
+            from modules.inventory.daily_cycle_models import (
+                DailyInventoryBalance, DailyInventoryCycleAuditLog, DailyInventoryCycleStatus,
+                DailyInventoryTransactionSummary
+            )
+            from services.daily_inventory_cycle_service import DailyInventoryCycleService
+
+            models = (InventoryProduct, StockLevel, InventoryTransaction)
+            create_tables(*models, DailyInventoryBalance, DailyInventoryCycleStatus, DailyInventoryTransactionSummary,
+                          DailyInventoryCycleAuditLog)
+            stock, transactions = self.generate(models)
+            service = DailyInventoryCycleService()
+
+            started = time.perf_counter()
+            result = service.execute_full_inventory_cycle(DAY, 'tester')
+            elapsed = time.perf_counter() - started
+            self.check('cycle completes', result['status'] == 'success', result)
+            print(f"   {len(stock)} stock rows, {len(transactions):,} transactions closed in {elapsed * 1000:.0f} ms")
+
+            closing, summaries = reference_close(stock, transactions, DAY)
+            self.compare('day 1', DailyInventoryBalance.query.filter_by(cycle_date=DAY).all(),
+                         DailyInventoryTransactionSummary.query.filter_by(summary_date=DAY).all(),
+                         closing, summaries)
+            first = DailyInventoryBalance.query.filter_by(cycle_date=DAY, product_id=1, simple_warehouse_id=1).first()
+            self.check('midnight neighbours stay out of the day', first.quantity_received < 1000,
+                       first.quantity_received)
+
+            again = service.calculate_closing_inventory(DAY, 'tester')
+            self.check('repeated close is a no-op', again['status'] == 'success' and 'already' in again['message'],
+                       again)
+
+            next_day = DAY + timedelta(days=1)
+            service.execute_full_inventory_cycle(next_day, 'tester')
+            closing2, summaries2 = reference_close(stock, transactions, next_day, opening=closing)
+            self.compare('day 2 (opens at day 1 closing)',
+                         DailyInventoryBalance.query.filter_by(cycle_date=next_day).all(),
+                         DailyInventoryTransactionSummary.query.filter_by(summary_date=next_day).all(),
+                         closing2, summaries2)
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if DailyInventoryCycleTester().run() else 1)
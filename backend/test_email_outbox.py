@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Email outbox test
+=================
+
+Queues email through services/email_outbox.py on a throwaway SQLite database,
+delivers it to a temporary maildir and checks that:
+- queueing only writes rows, and rolled-back rows are never sent;
+- transactional email is claimed before an earlier bulk send;
+- a batch reuses one connection per worker instead of one per message;
+- dropped connections are retried later, 5xx recipient refusals fail at once.
+
+Usage:
+    python test_email_outbox.py
+"""
+
+import os
+import shutil
+import smtplib
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+from services.email_outbox import EmailOutbox, MaildirBackend
+
+class FlakyConnection:
+    """Maildir connection that refuses or drops chosen recipients"""
+
+    def __init__(self, backend: 'FlakyBackend'):
+        self.backend = backend
+        self.target = backend.maildir.open()
+
+    def send(self, message):
+        to = message['To']
+        if to in self.backend.refuse:
+            raise smtplib.SMTPRecipientsRefused({to: (550, b'Mailbox unavailable')})
+        if self.backend.drop.get(to, 0) > 0:
+            self.backend.drop[to] -= 1
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.target.send(message)
+
+    def close(self):
+        pass
+
+class FlakyBackend:
+    def __init__(self, path: str):
+        self.maildir = MaildirBackend(path)
+        self.refuse = set()
+        self.drop = {}
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def open(self) -> FlakyConnection:
+        with self._lock:
+            self.opened += 1
+        return FlakyConnection(self)
+
+class EmailOutboxTester(ScriptTester):
+    def run(self):
+        app = sqlite_app()
+        maildir_path = tempfile.mkdtemp(prefix='edonuops-maildir-')
+
+        try:
+            with app.app_context():
+                from modules.core.email_models import OutboundEmail
+                create_tables(OutboundEmail)
+
+                outbox = EmailOutbox()
+                outbox.configure({'EMAIL_BACKEND': 'maildir', 'EMAIL_MAILDIR_PATH': maildir_path,
+                                  'EMAIL_SMTP_CONNECTIONS': 4, 'EMAIL_BATCH_SIZE': 100})
+                backend = outbox._backend = FlakyBackend(maildir_path)
+
+                outbox.queue('lost@example.com', 'Rolled back', '<p>never</p>')
+                db.session.rollback()
+                self.check('rolled-back email is not queued', OutboundEmail.query.count() == 0)
+
+                outbox.queue_many([{'to_email': f'customer{i}@example.com', 'subject': f'Newsletter {i}',
+                                    'html_body': '<p>News</p>', 'text_body': 'News'} for i in range(1000)],
+                                  category='crm')
+                outbox.queue('user@example.com', 'Reset your password', '<p>reset</p>', 'reset',
+                             category='password_reset')
+                db.session.commit()
+                self.check('queueing writes rows without sending',
+                           OutboundEmail.query.count() == 1001 and not backend.maildir.open().messages())
+
+                first = outbox._claim()
+                self.check('transactional email is claimed first', first[0]['to_email'] == 'user@example.com',
+                           first[0]['to_email'])
+                outbox._send_batch(first)
+
+                started = time.perf_counter()
+                handled = outbox.drain()
+                elapsed = time.perf_counter() - started
+                counts = outbox.status_counts()
+                self.check('every queued email is sent', counts == {'sent': 1001} and handled == 901, (counts, handled))
+                self.check('delivered to the maildir', len(backend.maildir.messages()) == 1001)
+                self.check('one connection per worker, not per message', backend.opened <= 4, backend.opened)
+                self.check('message ids are recorded',
+                           OutboundEmail.query.filter(OutboundEmail.message_id.is_(None)).count() == 0)
+                print(f"   1001 emails in {elapsed:.2f}s")
+
+                backend.drop['flaky@example.com'] = 1
+                backend.refuse.add('nobody@example.com')
+                outbox.queue('flaky@example.com', 'Invoice', '<p>invoice</p>')
+                outbox.queue('nobody@example.com', 'Invoice', '<p>invoice</p>')
+                db.session.commit()
+                outbox.drain()
+                flaky = OutboundEmail.query.filter_by(to_email='flaky@example.com').one()
+                nobody = OutboundEmail.query.filter_by(to_email='nobody@example.com').one()
+                self.check('dropped connection is retried later',
+                           flaky.status == 'pending' and flaky.attempts == 1 and flaky.next_attempt_at > datetime.utcnow(),
+                           (flaky.status, flaky.attempts))
+                self.check('5xx refusal fails without retry', nobody.status == 'failed' and nobody.attempts == 1,
+                           (nobody.status, nobody.attempts))
+
+                flaky.next_attempt_at = datetime.utcnow()
+                db.session.commit()
+                outbox.drain()
+                db.session.refresh(flaky)
+                self.check('retry delivers the email', flaky.status == 'sent' and flaky.attempts == 2,
+                           (flaky.status, flaky.attempts))
+
+                outbox.synchronous = True
+                sent = outbox.queue('sync@example.com', 'Inline', '<p>inline</p>')
+                self.check('synchronous mode sends inline', sent and OutboundEmail.query.filter_by(
+                    to_email='sync@example.com').count() == 0 and len(backend.maildir.messages()) == 1003)
+                outbox.stop()
+        finally:
+            shutil.rmtree(maildir_path, ignore_errors=True)
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if EmailOutboxTester().run() else 1)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Finance event bus test
+======================
+
+Runs modules/finance/events/event_bus.py with its dispatcher thread on a
+throwaway SQLite file database and checks that:
+- a committed event is dispatched as soon as the transaction commits, also
+  when it was published inside a savepoint;
+- a rolled-back event is neither stored nor dispatched;
+- events of one tenant are handled one at a time, in publish order;
+- a failing handler is retried alone, and the tenant's later events wait
+  for the retry;
+- synchronous mode runs the handlers inline, without an outbox row.
+
+Usage:
+    python test_finance_event_bus.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+class Recorder:
+    """Handler calls as (handler, tenant, seq), and the peak of concurrent calls per tenant"""
+
+    def __init__(self):
+        self.calls = []
+        self.active = {}
+        self.peak = {}
+        self.failures_left = 0
+        self.lock = threading.Lock()
+
+    def handler(self, label, delay=0.0, flaky=False):
+        def handle(data):
+            tenant = data['tenant_id']
+            with self.lock:
+                self.calls.append((label, tenant, data['seq']))
+                self.active[tenant] = self.active.get(tenant, 0) + 1
+                self.peak[tenant] = max(self.peak.get(tenant, 0), self.active[tenant])
+                fail = flaky and self.failures_left > 0
+                if fail:
+                    self.failures_left -= 1
+            time.sleep(delay)
+            with self.lock:
+                self.active[tenant] -= 1
+            if fail:
+                raise RuntimeError('ledger unavailable')
+        return handle
+
+    def seqs(self, label, tenant=None):
+        with self.lock:
+            return [seq for name, t, seq in self.calls if name == label and (tenant is None or t == tenant)]
+
+class FinanceEventBusTester(ScriptTester):
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.02)
+        return condition()
+
+    def run(self):
+        directory = tempfile.mkdtemp()
+        # A long poll interval: anything handled promptly was woken by the commit
+        app = sqlite_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'events.db')}",
+                         FINANCE_EVENT_WORKERS=4, FINANCE_EVENT_POLL_INTERVAL=30,
+                         FINANCE_EVENT_BACKOFF_SECONDS=0.05)
+
+        with app.app_context():
+            from modules.finance.event_models import FinanceEventOutbox
+            from modules.finance.events.event_bus import FinanceEventBus
+
+            create_tables(FinanceEventOutbox)
+            recorder = Recorder()
+            bus = FinanceEventBus()
+            bus.register('test.posted', recorder.handler('posted', delay=0.01), name='posted')
+            bus.register('test.flaky', recorder.handler('audit'), name='audit')
+            bus.register('test.flaky', recorder.handler('ledger', flaky=True), name='ledger')
+            bus.init_app(app)
+
+            def handled(label, seqs):
+                return lambda: sorted(recorder.seqs(label)) == sorted(seqs)
+
+            bus.publish('test.posted', {'seq': 1}, tenant_id='t1')
+            published_before_commit = self.wait_for(lambda: recorder.seqs('posted'), timeout=0.3)
+            db.session.commit()
+            self.check('a committed event is dispatched on commit',
+                       not published_before_commit and self.wait_for(handled('posted', [1])), recorder.calls)
+
+            with db.session.begin_nested():
+                bus.publish('test.posted', {'seq': 2}, tenant_id='t1')
+            db.session.commit()
+            self.check('an event published in a savepoint is dispatched on the outer commit',
+                       self.wait_for(handled('posted', [1, 2])), recorder.calls)
+
+            bus.publish('test.posted', {'seq': 3}, tenant_id='t1')
+            db.session.rollback()
+            bus.publish('test.posted', {'seq': 4}, tenant_id='t1')
+            db.session.commit()
+            self.wait_for(handled('posted', [1, 2, 4]))
+            self.check('a rolled-back event is neither stored nor dispatched',
+                       3 not in recorder.seqs('posted') and
+                       FinanceEventOutbox.query.filter(FinanceEventOutbox.payload['seq'].as_integer() == 3).count() == 0,
+                       recorder.calls)
+
+            for seq in range(10, 30):
+                bus.publish('test.posted', {'seq': seq}, tenant_id=('t1', 't2')[seq % 2])
+            db.session.commit()
+            self.wait_for(handled('posted', [1, 2, 4] + list(range(10, 30))))
+            in_order = [recorder.seqs('posted', tenant) == sorted(recorder.seqs('posted', tenant))
+                        for tenant in ('t1', 't2')]
+            self.check('events of a tenant are handled one at a time, in publish order',
+                       all(in_order) and recorder.peak == {'t1': 1, 't2': 1}, (in_order, recorder.peak))
+
+            bus.poll_interval = 0.05  # retries are due after the backoff, not on a commit
+            recorder.failures_left = 1
+            bus.publish('test.flaky', {'seq': 100}, tenant_id='t3')
+            bus.publish('test.flaky', {'seq': 101}, tenant_id='t3')
+            db.session.commit()
+            self.wait_for(lambda: recorder.seqs('ledger') == [100, 100, 101])
+            db.session.expire_all()
+            first = FinanceEventOutbox.query.filter_by(tenant_id='t3').order_by(FinanceEventOutbox.id).first()
+            self.check('a failing handler is retried alone, ahead of the tenant\'s later events',
+                       recorder.seqs('audit') == [100, 101] and recorder.seqs('ledger') == [100, 100, 101] and
+                       first.status == 'done' and first.attempts == 1 and
+                       sorted(first.handlers_done) == ['audit', 'ledger'],
+                       (recorder.calls[-5:], first.status, first.attempts))
+            bus.stop()
+
+            stored = FinanceEventOutbox.query.count()
+            inline = FinanceEventBus()
+            inline.register('test.posted', recorder.handler('inline'), name='inline')
+            inline.synchronous = True
+            inline.publish('test.posted', {'seq': 200}, tenant_id='t1')
+            self.check('synchronous mode runs the handlers inline without an outbox row',
+                       recorder.seqs('inline') == [200] and FinanceEventOutbox.query.count() == stored,
+                       recorder.seqs('inline'))
+            db.session.rollback()
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if FinanceEventBusTester().run() else 1)
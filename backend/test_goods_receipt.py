@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Goods receipt test
+==================
+
+Receives purchase-order lines through modules/procurement/goods_receipt.py on
+a throwaway SQLite database and checks:
+- a receipt writes inventory, cost layers and its GR/IR journal in one commit;
+- a retry with the same idempotency key replays without writing again, also
+  when it only collides on the unique constraint;
+- receiving more than is still open on a PO line is a 400 and writes nothing;
+- other constraint violations are a 400, not an idempotency 409;
+- journal numbers do not collide across engines (restarts, other workers);
+- a journal that cannot be written rolls back the whole receipt.
+
+Usage:
+    python test_goods_receipt.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import g
+from sqlalchemy import text
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+def purchase_order():
+    return {'id': 7, 'po_number': 'PO-7', 'status': 'approved', 'currency': 'USD', 'fx_rate': 1.0, 'items': [
+        {'id': 1, 'product_id': 1, 'quantity': 10, 'received_quantity': 0, 'unit_price_foreign': 4.0},
+        {'id': 2, 'product_id': 2, 'quantity': 5, 'received_quantity': 3, 'unit_price_foreign': 10.0}]}
+
+class GoodsReceiptTester(ScriptTester):
+    def counts(self, models):
+        return tuple(model.query.count() for model in models)
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context(), app.test_request_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the models below
+            import modules.finance.payment_models  # noqa: F401 - payment_methods, bank_accounts
+            from modules.finance.advanced_models import ChartOfAccounts, GeneralLedgerEntry, JournalHeader
+            from modules.integration.auto_journal import AutoJournalEngine
+            from modules.inventory.advanced_models import InventoryProduct, UnitOfMeasure
+            from modules.inventory.cost_layer_models import InventoryCostLayer
+            from modules.inventory.models import BasicInventoryTransaction, Product, Warehouse
+            from modules.procurement.goods_receipt import GoodsReceiptService
+            from modules.procurement.models import GoodsReceipt
+
+            create_tables(UnitOfMeasure, Warehouse, Product, InventoryProduct, BasicInventoryTransaction,
+                          InventoryCostLayer, GoodsReceipt, ChartOfAccounts, JournalHeader, GeneralLedgerEntry)
+            # The warehouses foreign key as PostgreSQL enforces it (SQLite would need every referenced table)
+            db.session.execute(text(
+                "CREATE TRIGGER fk_transaction_warehouse BEFORE INSERT ON basic_inventory_transactions "
+                "WHEN NEW.warehouse_id NOT IN (SELECT id FROM warehouses) "
+                "BEGIN SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed'); END"))
+            db.session.execute(UnitOfMeasure.__table__.insert(), [{'id': 1, 'code': 'EA', 'name': 'Each'}])
+            db.session.execute(Warehouse.__table__.insert(), [{'id': 1, 'name': 'Main', 'tenant_id': 't1'}])
+            db.session.execute(Product.__table__.insert(), [
+                {'id': p, 'sku': f'SKU-{p}', 'name': f'Product {p}', 'tenant_id': 't1'} for p in (1, 2)])
+            db.session.execute(InventoryProduct.__table__.insert(), [
+                {'id': p, 'name': f'Product {p}', 'base_uom_id': 1} for p in (1, 2)])
+            db.session.commit()
+            g.tenant_id = 't1'
+
+            written = (GoodsReceipt, BasicInventoryTransaction, InventoryCostLayer, JournalHeader, GeneralLedgerEntry)
+            service = GoodsReceiptService(journal_engine=AutoJournalEngine())
+            po = purchase_order()
+            result = service.receive(po, [{'item_id': 1, 'quantity': 4}, {'item_id': 2, 'quantity': 2}],
+                                     warehouse_id=1, idempotency_key='scan-1')
+            db.session.rollback()  # anything not committed by the receipt is dropped here
+            receipt = GoodsReceipt.query.one()
+            header = JournalHeader.query.one()
+            self.check('receipt, inventory, layers and journal commit together',
+                       result['success'] and self.counts(written) == (1, 2, 2, 1, 2), (result, self.counts(written)))
+            self.check('journal is linked to the receipt',
+                       receipt.journal_entry_id == header.journal_number == result['response']['journal_entry_id']
+                       == f'GR-{receipt.id}' and header.tenant_id == 't1', result['response'])
+
+            before = self.counts(written)
+            replay = service.receive(po, [{'item_id': 1, 'quantity': 4}], warehouse_id=1, idempotency_key='scan-1')
+            self.check('retry with the same key replays', replay['replayed'] and self.counts(written) == before,
+                       replay)
+
+            racing = GoodsReceiptService(journal_engine=AutoJournalEngine())
+            lookups = []
+            def replay_after_first_lookup(tenant_id, key, po_id, original=racing._replay):
+                lookups.append(key)
+                return None if len(lookups) == 1 else original(tenant_id, key, po_id)
+            racing._replay = replay_after_first_lookup
+            raced = racing.receive(po, [{'item_id': 1, 'quantity': 1}], warehouse_id=1, idempotency_key='scan-1')
+            self.check('a key taken concurrently replays instead of posting',
+                       raced['success'] and raced['replayed'] and self.counts(written) == before, raced)
+
+            over = service.receive(po, [{'item_id': 1, 'quantity': 5}, {'item_id': 1, 'quantity': 2},
+                                        {'item_id': 2, 'quantity': 0.5}], warehouse_id=1, idempotency_key='scan-2')
+            types = [(e['type'], e['item_id']) for e in over.get('errors', [])]
+            self.check('over-receipt against the open PO quantity is a 400',
+                       over['status_code'] == 400 and types == [('over_receipt', 1), ('over_receipt', 2)] and
+                       [e['remaining'] for e in over['errors']] == [6, 0] and self.counts(written) == before, over)
+
+            missing_warehouse = service.receive(po, [{'item_id': 1, 'quantity': 1}], warehouse_id=99,
+                                                idempotency_key='scan-3')
+            self.check('a foreign key violation is a 400, not a replay conflict',
+                       missing_warehouse['status_code'] == 400 and self.counts(written) == before, missing_warehouse)
+
+            # A fresh engine (a restart, another worker) starts from an empty counter
+            restarted = GoodsReceiptService(journal_engine=AutoJournalEngine())
+            second = restarted.receive(po, [{'item_id': 1, 'quantity': 1}], warehouse_id=1, idempotency_key='scan-4')
+            db.session.rollback()
+            after = self.counts(written)
+            numbers = [h.journal_number for h in JournalHeader.query.order_by(JournalHeader.id)]
+            self.check('journal numbers do not collide across engines',
+                       second['success'] and after == tuple(n + 1 for n in before[:4]) + (before[4] + 2,) and
+                       len(set(numbers)) == 2 and second['response']['journal_entry_id'] == numbers[-1],
+                       (second, after, numbers))
+
+            class FailingEngine:
+                def on_inventory_receipt(self, receipt_data, commit=True):
+                    return {'success': True, 'persisted_to_db': False}
+
+            before = self.counts(written)
+            broken = GoodsReceiptService(journal_engine=FailingEngine()).receive(
+                po, [{'item_id': 1, 'quantity': 1}], warehouse_id=1, idempotency_key='scan-5')
+            db.session.rollback()
+            self.check('a journal that cannot be written rolls back the whole receipt',
+                       not broken['success'] and broken['status_code'] == 500 and self.counts(written) == before and
+                       po['items'][0]['received_quantity'] == 5, (broken, self.counts(written)))
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if GoodsReceiptTester().run() else 1)
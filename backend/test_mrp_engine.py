@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+MRP engine test
+===============
+
+Runs modules/manufacturing/mrp_engine.py over a generated multi-level bill of
+materials on a throwaway SQLite database and checks every cell of the planning
+grid against a naive item-by-item, period-by-period MRP:
+- gross requirements, scheduled receipts, projected on hand, net requirements,
+  planned receipts and releases agree for lot-for-lot and fixed lots;
+- only the newest active BOM of a product is exploded, inactive products and
+  other tenants are ignored;
+- a cyclic bill of materials raises BOMCycleError;
+- the manufacturing routes keep work centers in the database and answer 400
+  for a bad component, work center, BOM or product id and for a bad date.
+
+Usage:
+    python test_mrp_engine.py
+"""
+
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+TENANT = 't1'
+START = date(2026, 4, 6)
+PERIOD_DAYS = 7
+HORIZON = 10
+PRODUCTS = 60
+
+def reference_mrp(items, boms, demand, purchases, production, lot_sizes, default_lead, lead_overrides):
+    """
+    Plain-Python MRP: items are planned one at a time, parents before
+    components, and each period is netted with scalar arithmetic
+    """
+    def bucket(day):
+        offset = (day - START).days
+        if offset < 0:
+            return 0
+        return offset // PERIOD_DAYS if offset // PERIOD_DAYS < HORIZON else None
+
+    gross = {p: [0.0] * HORIZON for p in items}
+    scheduled = {p: [0.0] * HORIZON for p in items}
+    firm = {p: [0.0] * HORIZON for p in items}
+    for product, quantity, due in demand:
+        if product in items and bucket(due) is not None:
+            gross[product][bucket(due)] += quantity
+    for product, quantity, due in purchases:
+        if product in items and bucket(due) is not None:
+            scheduled[product][bucket(due)] += quantity
+    for product, status, remaining, start, end in production:
+        if product not in items or remaining <= 0:
+            continue
+        if bucket(end) is not None:
+            scheduled[product][bucket(end)] += remaining
+        if status == 'planned' and bucket(start) is not None:
+            firm[product][bucket(start)] += remaining
+
+    lines = {p: [(c, q, s, lt) for c, q, s, lt in boms.get(p, []) if c in items] for p in items}
+    lead = {p: default_lead for p in items}
+    component_leads = {}
+    for parent in items:
+        for child, _, _, lead_time in lines[parent]:
+            component_leads.setdefault(child, []).append(lead_time)
+    for child, leads in component_leads.items():
+        lead[child] = max(max(leads), 0)
+    lead.update({p: d for p, d in lead_overrides.items() if p in items})
+
+    depth = {}
+    def level(product, seen=()):
+        if product in seen:
+            raise ValueError('cycle')
+        parents = [p for p in items if any(c == product for c, _, _, _ in lines[p])]
+        return max((level(p, seen + (product,)) + 1 for p in parents), default=0)
+    for product in items:
+        depth[product] = level(product)
+
+    grid = {}
+    for product in sorted(items, key=lambda p: (depth[p], p)):
+        on_hand, safety = items[product]
+        lot = lot_sizes.get(product, 0.0)
+        projected, net, receipts, releases = [], [], [], [0.0] * HORIZON
+        for t in range(HORIZON):
+            available = on_hand + scheduled[product][t] - gross[product][t]
+            shortfall = max(safety - available, 0.0)
+            planned = math.ceil(shortfall / lot) * lot if lot > 0 else shortfall
+            on_hand = available + planned
+            projected.append(on_hand)
+            net.append(shortfall)
+            receipts.append(planned)
+            releases[max(t - math.ceil(lead[product] / PERIOD_DAYS), 0)] += planned
+        for child, quantity, scrap, _ in lines[product]:
+            for t in range(HORIZON):
+                gross[child][t] += (releases[t] + firm[product][t]) * quantity * (1 + scrap / 100.0)
+        grid[product] = {'gross': gross[product], 'scheduled': scheduled[product], 'projected': projected,
+                         'net': net, 'receipts': receipts, 'releases': releases}
+    return grid
+
+class MRPEngineTester(ScriptTester):
+    def generate(self, models):
+        Product, BillOfMaterials, BOMItem, ProductionOrder, PurchaseOrder, PurchaseOrderItem = models
+        rng = random.Random(27)
+
+        items = {}
+        products = []
+        for p in range(1, PRODUCTS + 1):
+            on_hand, safety = float(rng.randint(0, 40)), float(rng.choice([0, 0, 5, 10]))
+            active = p != PRODUCTS  # the last product is retired
+            products.append({'id': p, 'sku': f'SKU-{p}', 'name': f'Product {p}', 'current_stock': on_hand,
+                             'min_stock': safety, 'is_active': active, 'tenant_id': TENANT})
+            if active:
+                items[p] = (on_hand, safety)
+        products.append({'id': PRODUCTS + 1, 'sku': 'OTHER-1', 'name': 'Other tenant', 'current_stock': 0.0,
+                         'min_stock': 0.0, 'is_active': True, 'tenant_id': 't2'})
+        db.session.execute(Product.__table__.insert(), products)
+
+        # Components always have higher ids than their parents, so the graph is acyclic
+        boms, bom_rows, bom_items = {}, [], []
+        for parent in range(1, PRODUCTS - 5):
+            if rng.random() < 0.4:
+                continue
+            for stale in (True, False):
+                bom_id = len(bom_rows) + 1
+                bom_rows.append({'id': bom_id, 'name': f'BOM {bom_id}', 'product_id': parent, 'is_active': True,
+                                 'tenant_id': TENANT})
+                lines = []
+                for child in rng.sample(range(parent + 1, PRODUCTS + 1), rng.randint(1, 3)):
+                    lines.append((child, float(rng.randint(1, 4)), float(rng.choice([0, 0, 10, 25])),
+                                  rng.choice([0, 3, 7, 10, 20])))
+                bom_items.extend({'bom_id': bom_id, 'component_id': c, 'quantity': q, 'scrap_factor': s,
+                                  'lead_time': lt, 'tenant_id': TENANT} for c, q, s, lt in lines)
+                if not stale:
+                    boms[parent] = lines  # the newer BOM wins
+        db.session.execute(BillOfMaterials.__table__.insert(), bom_rows)
+        db.session.execute(BOMItem.__table__.insert(), bom_items)
+
+        purchases, po_rows, po_items = [], [], []
+        for po_id in range(1, 41):
+            status = rng.choice(['pending', 'approved', 'sent', 'partially_received', 'received', 'closed'])
+            due = START + timedelta(days=rng.randint(-10, HORIZON * PERIOD_DAYS + 10))
+            po_rows.append({'id': po_id, 'po_number': f'PO-{po_id}', 'vendor_id': 1, 'order_date': START,
+                            'expected_delivery': due, 'status': status, 'tenant_id': TENANT})
+            for product in rng.sample(range(1, PRODUCTS + 1), 2):
+                quantity, received = float(rng.randint(5, 50)), float(rng.randint(0, 10))
+                po_items.append({'po_id': po_id, 'product_id': product, 'description': 'line', 'quantity': quantity,
+                                 'unit_price': 1.0, 'total_amount': quantity, 'received_quantity': received})
+                if status in ('pending', 'approved', 'sent', 'partially_received') and quantity > received:
+                    purchases.append((product, quantity - received, due))
+        db.session.execute(PurchaseOrder.__table__.insert(), po_rows)
+        db.session.execute(PurchaseOrderItem.__table__.insert(), po_items)
+
+        production, orders = [], []
+        for order_id, parent in enumerate(sorted(boms)[:15], start=1):
+            status = rng.choice(['planned', 'in_progress', 'completed'])
+            quantity, completed = float(rng.randint(5, 30)), float(rng.randint(0, 5))
+            start = START + timedelta(days=rng.randint(-5, 40))
+            end = start + timedelta(days=rng.randint(0, 14))
+            orders.append({'order_number': f'MO-{order_id}', 'bom_id': 1, 'product_id': parent, 'quantity': quantity,
+                           'completed_quantity': completed, 'status': status, 'planned_start_date': start,
+                           'planned_end_date': end, 'tenant_id': TENANT})
+            if status in ('planned', 'in_progress'):
+                production.append((parent, status, quantity - completed, start, end))
+        db.session.execute(ProductionOrder.__table__.insert(), orders)
+        db.session.commit()
+
+        demand = [(p, float(rng.randint(1, 30)), START + timedelta(days=rng.randint(-3, HORIZON * PERIOD_DAYS)))
+                  for p in range(1, 15) for _ in range(3)]
+        return items, boms, demand, purchases, production
+
+    def compare(self, name, engine, expected):
+        grid = engine.grid
+        wrong = []
+        for i, product in enumerate(grid['product_ids']):
+            for field, rows in expected[product].items():
+                if any(abs(grid[field][i, t] - rows[t]) > 1e-6 for t in range(HORIZON)):
+                    wrong.append((product, field, grid[field][i].tolist(), rows))
+        self.check(f'{name}: grid matches the naive MRP',
+                   not wrong and sorted(grid['product_ids']) == sorted(expected), wrong[:2])
+
+    def check_routes(self, app, models):
+        import modules.core.tenant_helpers as tenant_helpers
+        from modules.manufacturing.routes import bp
+
+        tenant_helpers.require_tenant_context = lambda: (1, TENANT)
+        app.register_blueprint(bp)
+        client = app.test_client()
+
+        created = client.post('/api/manufacturing/work-centers', json={'name': 'Assembly', 'capacity': 8.0})
+        listed = client.get('/api/manufacturing/work-centers').get_json()
+        self.check('work centers are stored per tenant',
+                   created.status_code == 201 and [wc['name'] for wc in listed] == ['Assembly'],
+                   (created.status_code, listed))
+
+        bad_component = client.post('/api/manufacturing/boms/1/items', json={'component_id': 'abc', 'quantity': 1})
+        missing_component = client.post('/api/manufacturing/boms/1/items', json={'quantity': 1})
+        self.check('bad component_id is a 400',
+                   bad_component.status_code == 400 and missing_component.status_code == 400,
+                   (bad_component.status_code, missing_component.status_code))
+
+        order = {'bom_id': 1, 'product_id': 1, 'quantity': 5}
+        unknown = client.post('/api/manufacturing/production-orders', json=dict(order, work_center_id=999))
+        known = client.post('/api/manufacturing/production-orders',
+                            json=dict(order, work_center_id=created.get_json()['id']))
+        self.check('production orders need a work center of the tenant',
+                   unknown.status_code == 400 and known.status_code == 201, (unknown.status_code, known.status_code))
+
+        refused = [client.post('/api/manufacturing/production-orders', json=dict(order, **bad)).status_code
+                   for bad in ({'bom_id': 999}, {'bom_id': 'abc'}, {'product_id': PRODUCTS + 1})]
+        self.check('production orders need a BOM and product of the tenant', refused == [400] * 3, refused)
+
+        order_id = known.get_json()['id']
+        bad_create = client.post('/api/manufacturing/production-orders',
+                                 json=dict(order, planned_start_date='next tuesday'))
+        bad_update = client.put(f'/api/manufacturing/production-orders/{order_id}',
+                                json={'planned_end_date': '2026-13-45', 'notes': 'dropped'})
+        self.check('bad dates are a 400 and change nothing',
+                   bad_create.status_code == 400 and bad_update.status_code == 400 and
+                   db.session.get(models[3], order_id).notes is None,
+                   (bad_create.status_code, bad_update.status_code))
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the manufacturing models
+            from modules.inventory.models import Product
+            from modules.manufacturing.models import (
+                BillOfMaterials, BOMItem, MaterialRequirementsPlan, ProductionOrder, WorkCenter
+            )
+            from modules.manufacturing.mrp_engine import FIXED_ORDER_QUANTITY, BOMCycleError, MRPEngine
+            from modules.procurement.models import PurchaseOrder, PurchaseOrderItem
+
+            models = (Product, BillOfMaterials, BOMItem, ProductionOrder, PurchaseOrder, PurchaseOrderItem)
+            create_tables(Product, BillOfMaterials, BOMItem, WorkCenter, ProductionOrder, MaterialRequirementsPlan,
+                          PurchaseOrder, PurchaseOrderItem)
+            items, boms, demand, purchases, production = self.generate(models)
+            demand_rows = [{'product_id': p, 'quantity': q, 'due_date': d.isoformat()} for p, q, d in demand]
+
+            engine = MRPEngine(TENANT, start_date=START, period_days=PERIOD_DAYS, horizon_periods=HORIZON,
+                               default_lead_time_days=5, lead_times={1: 14})
+            result = engine.run(demand_rows)
+            expected = reference_mrp(items, boms, demand, purchases, production, {}, 5, {1: 14})
+            self.compare('lot for lot', engine, expected)
+            self.check('multi-level plan', result['max_low_level_code'] >= 3 and result['planned_orders'] > 0, result)
+            self.check('grid is persisted',
+                       MaterialRequirementsPlan.query.filter_by(tenant_id=TENANT).count() == result['records_persisted']
+                       > 0, result)
+
+            lot_sizes = {p: float(random.Random(p).choice([10, 25, 50])) for p in items}
+            engine = MRPEngine(TENANT, start_date=START, period_days=PERIOD_DAYS, horizon_periods=HORIZON,
+                               lot_sizing=FIXED_ORDER_QUANTITY, lot_sizes=lot_sizes)
+            engine.run(demand_rows, persist=False)
+            self.compare('fixed lots', engine, reference_mrp(items, boms, demand, purchases, production,
+                                                             lot_sizes, 0, {}))
+
+            db.session.execute(BillOfMaterials.__table__.insert(), [
+                {'id': 900 + p, 'name': 'Cycle', 'product_id': p, 'is_active': True, 'tenant_id': TENANT}
+                for p in (1, 2)])
+            db.session.execute(BOMItem.__table__.insert(), [
+                {'bom_id': 901, 'component_id': 2, 'quantity': 1.0, 'tenant_id': TENANT},
+                {'bom_id': 902, 'component_id': 1, 'quantity': 1.0, 'tenant_id': TENANT}])
+            try:
+                MRPEngine(TENANT, start_date=START).run(persist=False)
+                raised = False
+            except BOMCycleError:
+                raised = True
+            self.check('cyclic BOM raises BOMCycleError', raised)
+            db.session.rollback()
+
+            self.check_routes(app, models)
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if MRPEngineTester().run() else 1)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Batch payroll test
+==================
+
+Generates 50,000 employees with earnings, pre- and post-tax deductions and a
+progressive tax table on a throwaway SQLite database, runs the period with
+modules/hr/payroll_engine.py and checks that:
+- every payslip matches a plain per-employee calculation of the same rules;
+- progressive tax, component caps and proration behave as specified, and net
+  pay never goes negative;
+- the run posts one balanced journal entry and one payslip per employee;
+- re-running unchanged inputs is a no-op, changed inputs replace the previous
+  payslips and post a reversal of the previous journal entry linked to its
+  replacement, and a locked period is refused.
+
+Usage:
+    python test_payroll_engine.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+PERIOD = '2026-06'
+EMPLOYEES = 50000
+
+# (lower bound, rate %) of the tax table in force; an older table must be ignored
+BRACKETS = [(0.0, 0.0), (1000.0, 10.0), (4000.0, 20.0), (8000.0, 40.0)]
+OLD_BRACKETS = [(0.0, 50.0)]
+REDUCED_BRACKETS = [(0.0, 0.0), (2000.0, 5.0)]
+
+# id, code, kind, calculation, pre_tax, default_amount, cap, account_code
+COMPONENTS = [
+    (1, 'BONUS', 'earning', 'fixed', False, 0.0, 1000.0, None),
+    (2, 'ALLOW', 'earning', 'percent_of_base', False, 10.0, 300.0, '6210'),
+    (3, 'PENSION', 'deduction', 'percent_of_gross', True, 5.0, None, '2200'),
+    (4, 'UNION', 'deduction', 'fixed', False, 50.0, None, None),
+    (5, 'LOAN', 'deduction', 'fixed', False, 0.0, None, '2200'),
+]
+
+def cents(value):
+    return int(Decimal(str(value)).scaleb(2).quantize(Decimal(1), ROUND_HALF_UP))
+
+def reference_payslip(employee, assignments):
+    """The payroll rules, one employee at a time, in Decimal"""
+    salary, hire, termination, tax_code = employee
+    first = max(hire or date(2026, 6, 1), date(2026, 6, 1))
+    last = min(termination or date(2026, 6, 30), date(2026, 6, 30))
+    worked = max((last - first).days + 1, 0)
+    base = int((Decimal(cents(salary)) * worked / 30).quantize(Decimal(1), ROUND_HALF_UP))
+
+    def value(component, amount, basis):
+        _, _, _, calculation, _, _, cap, _ = COMPONENTS[component - 1]
+        raw = cents(amount) if calculation == 'fixed' else cents(Decimal(basis) * Decimal(str(amount)) / 10000)
+        return min(raw, cents(cap)) if cap is not None else raw
+
+    earnings = sum(value(c, a, base) for c, a in assignments if COMPONENTS[c - 1][2] == 'earning')
+    gross = base + earnings
+    pre = 0
+    for c, a in assignments:
+        if COMPONENTS[c - 1][2] == 'deduction' and COMPONENTS[c - 1][4]:
+            pre += min(value(c, a, gross if COMPONENTS[c - 1][3] == 'percent_of_gross' else base), gross - pre)
+    taxable = gross - pre
+    table = REDUCED_BRACKETS if tax_code == 'reduced' else BRACKETS
+    bounds = [Decimal(str(lower)) for lower, _ in table[1:]] + [None]
+    tax = Decimal(0)
+    for (lower, rate), upper in zip(table, bounds):
+        amount = Decimal(taxable) / 100 if upper is None else min(Decimal(taxable) / 100, upper)
+        tax += max(amount - Decimal(str(lower)), 0) * Decimal(str(rate)) / 100
+    tax = min(cents(tax), taxable)
+    post = 0
+    for c, a in assignments:
+        if COMPONENTS[c - 1][2] == 'deduction' and not COMPONENTS[c - 1][4]:
+            post += min(value(c, a, base), taxable - tax - post)
+    return {'gross_pay': gross, 'pre_tax_deductions': pre, 'income_tax': tax, 'post_tax_deductions': post,
+            'net_pay': taxable - tax - post, 'worked_days': worked}
+
+class PayrollEngineTester(ScriptTester):
+    def generate(self, models):
+        Account, Employee, EmployeePayComponent, PayComponent, PayrollTaxBracket = models
+        db.session.execute(Account.__table__.insert(), [
+            {'code': code, 'name': name, 'type': kind, 'tenant_id': 't1'} for code, name, kind in (
+                ('6200', 'Salaries and Wages', 'expense'), ('6210', 'Allowances', 'expense'),
+                ('2100', 'Accrued Expenses', 'liability'), ('2200', 'Pension Payable', 'liability'))])
+        db.session.execute(PayComponent.__table__.insert(), [
+            {'id': c[0], 'tenant_id': 't1', 'code': c[1], 'name': c[1].title(), 'kind': c[2], 'calculation': c[3],
+             'pre_tax': c[4], 'default_amount': c[5], 'cap': c[6], 'account_code': c[7], 'is_active': True}
+            for c in COMPONENTS] + [
+            {'id': 6, 'tenant_id': 't1', 'code': 'OLD', 'name': 'Retired', 'kind': 'earning', 'calculation': 'fixed',
+             'pre_tax': False, 'default_amount': 999.0, 'cap': None, 'account_code': None, 'is_active': False}])
+        brackets = [(date(2020, 1, 1), 'standard', OLD_BRACKETS), (date(2026, 1, 1), 'standard', BRACKETS),
+                    (date(2026, 1, 1), 'reduced', REDUCED_BRACKETS), (date(2026, 7, 1), 'standard', OLD_BRACKETS)]
+        db.session.execute(PayrollTaxBracket.__table__.insert(), [
+            {'tenant_id': 't1', 'tax_code': code, 'effective_from': start, 'lower_bound': lower, 'rate': rate}
+            for start, code, table in brackets for lower, rate in table])
+
+        rng = random.Random(5)
+        employees, assignments, expected = [], [], {}
+        for employee_id in range(1, EMPLOYEES + 1):
+            salary = round(rng.uniform(800, 15000), 2)
+            hire = date(2026, 6, rng.randint(2, 28)) if employee_id % 40 == 0 else date(2020, 1, 1)
+            termination = None
+            status = 'active'
+            if employee_id % 55 == 0:
+                termination = date(2026, 6, rng.randint(1, 29))
+            elif employee_id % 101 == 0:
+                termination, status = date(2026, 5, 31), 'terminated'
+            tax_code = 'reduced' if employee_id % 7 == 0 else 'standard'
+            employees.append({'id': employee_id, 'tenant_id': 't1', 'employee_number': f'E{employee_id:06d}',
+                              'first_name': 'Employee', 'last_name': str(employee_id), 'base_salary': salary,
+                              'cost_center_id': employee_id % 20 or None, 'tax_code': tax_code, 'status': status,
+                              'hire_date': hire, 'termination_date': termination})
+
+            mine = []
+            if rng.random() < 0.3:
+                mine.append((1, round(rng.uniform(100, 2000), 2)))
+            if rng.random() < 0.5:
+                mine.append((2, None))
+            mine.append((3, None))
+            if rng.random() < 0.4:
+                mine.append((4, None))
+            if rng.random() < 0.05:
+                mine.append((5, 20000.0))  # more than anyone's net pay
+            for component_id, amount in mine:
+                assignments.append({'employee_id': employee_id, 'component_id': component_id, 'amount': amount,
+                                    'end_period': None})
+            assignments.append({'employee_id': employee_id, 'component_id': 6, 'amount': None,
+                                'end_period': None})  # inactive
+            if employee_id % 9 == 0:
+                assignments.append({'employee_id': employee_id, 'component_id': 1, 'amount': 5000.0,
+                                    'end_period': '2026-05'})  # expired
+            if status != 'terminated':
+                resolved = [(c, a if a is not None else COMPONENTS[c - 1][5]) for c, a in mine]
+                expected[employee_id] = ((salary, hire, termination, tax_code), resolved)
+
+        employees.append({'id': EMPLOYEES + 1, 'tenant_id': 't2', 'employee_number': 'E000001', 'first_name': 'Other',
+                          'last_name': 'Tenant', 'base_salary': 5000.0, 'cost_center_id': None, 'tax_code': 'standard',
+                          'status': 'active', 'hire_date': None, 'termination_date': None})
+        db.session.execute(Employee.__table__.insert(), employees)
+        db.session.execute(EmployeePayComponent.__table__.insert(), assignments)
+        db.session.commit()
+        return expected
+
+    def run(self):
+        app = sqlite_app()
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the finance models
+            import modules.finance.cost_center_models  # noqa: F401 - departments, cost_centers
+            from modules.finance.accounting_periods import AccountingPeriod, FiscalYear
+            from modules.finance.models import Account, JournalEntry, JournalLine
+            from modules.hr.models import (Employee, EmployeePayComponent, PayComponent, PayrollRun,
+                                           PayrollTaxBracket, Payslip)
+            from modules.hr.payroll_engine import payroll_engine, progressive_tax
+
+            import numpy as np
+            taxes = progressive_tax(np.array([50000, 250000, 500000, 1000000, 400005]), *zip(*BRACKETS))
+            self.check('progressive tax taxes each band at its rate, in cents rounded half up',
+                       taxes.tolist() == [0, 15000, 50000, 190000, 30001], taxes)
+
+            models = (Account, Employee, EmployeePayComponent, PayComponent, PayrollTaxBracket)
+            create_tables(*models, JournalEntry, JournalLine, FiscalYear, AccountingPeriod, PayrollRun, Payslip)
+            expected = self.generate(models)
+
+            started = time.perf_counter()
+            result = payroll_engine.run_payroll('t1', PERIOD, user_id=1)
+            elapsed = time.perf_counter() - started
+            print(f"   {result['employee_count']:,} employees paid and posted in {elapsed:.2f}s")
+            self.check('every employee employed in the period is paid', result['employee_count'] == len(expected),
+                       (result['employee_count'], len(expected)))
+
+            payslips = {p.employee_id: p for p in Payslip.query.all()}
+            self.check('one payslip per employee', len(payslips) == len(expected), len(payslips))
+            mismatched = []
+            for employee_id, (employee, assignments) in expected.items():
+                want = reference_payslip(employee, assignments)
+                slip = payslips.get(employee_id)
+                got = slip and {name: cents(getattr(slip, name)) if name != 'worked_days' else slip.worked_days
+                                for name in want}
+                if got != want:
+                    mismatched.append((employee_id, want, got))
+            self.check('payslips match the per-employee calculation', not mismatched, mismatched[:3])
+
+            allowances = [p.components.get('ALLOW', 0) for p in payslips.values()]
+            bonuses = [p.components.get('BONUS', 0) for p in payslips.values()]
+            self.check('components are capped', max(allowances) == 300.0 and max(bonuses) <= 1000.0,
+                       (max(allowances), max(bonuses)))
+            loans = [p for p in payslips.values() if 'LOAN' in p.components]
+            self.check('net pay never goes negative',
+                       min(p.net_pay for p in payslips.values()) >= 0 and loans and
+                       all(p.net_pay == 0 for p in loans), len(loans))
+            new_hire = payslips[40]
+            self.check('mid-month hires are prorated',
+                       new_hire.worked_days < 30 and abs(
+                           new_hire.base_pay - expected[40][0][0] * new_hire.worked_days / 30) <= 0.01,
+                       new_hire.to_dict())
+
+            entries = JournalEntry.query.filter_by(tenant_id='t1').all()
+            debit, credit = db.session.query(func.sum(JournalLine.debit_amount),
+                                             func.sum(JournalLine.credit_amount)).one()
+            run = PayrollRun.query.filter_by(tenant_id='t1', period=PERIOD).one()
+            self.check('one balanced journal entry',
+                       len(entries) == 1 and entries[0].id == run.journal_entry_id and
+                       round(debit, 2) == round(credit, 2) == round(run.gross_pay, 2) and
+                       entries[0].total_debit == entries[0].total_credit, (len(entries), debit, credit))
+            by_center = {cc: amount for cc, amount in db.session.query(
+                JournalLine.cost_center_id, func.sum(JournalLine.debit_amount)).filter(
+                JournalLine.debit_amount > 0).group_by(JournalLine.cost_center_id)}
+            self.check('salary expense is split by cost center', len(by_center) == 20 and None in by_center,
+                       sorted(by_center, key=str))
+
+            started = time.perf_counter()
+            again = payroll_engine.run_payroll('t1', PERIOD, user_id=1)
+            print(f"   unchanged re-run in {time.perf_counter() - started:.2f}s")
+            self.check('unchanged re-run is a no-op', again['unchanged'] and again['run_count'] == 1 and
+                       JournalEntry.query.count() == 1, again)
+
+            db.session.query(Employee).filter(Employee.id == 1).update({'base_salary': 20000.0})
+            db.session.commit()
+            original = run.journal_entry_id
+            rerun = payroll_engine.run_payroll('t1', PERIOD, user_id=1)
+            slip = Payslip.query.filter_by(employee_id=1).all()
+            self.check('changed inputs replace the previous payslips',
+                       not rerun['unchanged'] and rerun['run_count'] == 2 and Payslip.query.count() == len(expected)
+                       and len(slip) == 1 and slip[0].base_pay == 20000.0, rerun)
+
+            entries = {entry.id: entry for entry in JournalEntry.query.all()}
+            replacement = entries.get(rerun['journal_entry_id'])
+            reversal = next((entry for entry in entries.values() if entry.reversal_of_id == original), None)
+            net = {account: round(amount, 2) for account, amount in db.session.query(
+                JournalLine.account_id, func.sum(JournalLine.debit_amount - JournalLine.credit_amount)).filter(
+                JournalLine.journal_entry_id != rerun['journal_entry_id']).group_by(JournalLine.account_id)}
+            self.check('changed inputs reverse the posted entry and link its replacement',
+                       len(entries) == 3 and original in entries and entries[original].status == 'posted' and
+                       entries[original].replaced_by_id == rerun['journal_entry_id'] and reversal is not None and
+                       reversal.status == 'posted' and reversal.total_debit == entries[original].total_credit and
+                       set(net.values()) == {0.0} and replacement is not None and
+                       replacement.total_debit == replacement.total_credit == rerun['gross_pay'],
+                       (sorted(entries), net))
+
+            db.session.execute(FiscalYear.__table__.insert(), [{
+                'id': 1, 'year': 2026, 'name': 'FY 2026', 'start_date': date(2026, 1, 1),
+                'end_date': date(2026, 12, 31), 'tenant_id': 't1'}])
+            db.session.execute(AccountingPeriod.__table__.insert(), [{
+                'fiscal_year_id': 1, 'period_number': 6, 'name': 'June 2026', 'short_name': 'Jun-26',
+                'start_date': date(2026, 6, 1), 'end_date': date(2026, 6, 30), 'is_locked': True,
+                'tenant_id': 't1'}])
+            db.session.query(Employee).filter(Employee.id == 1).update({'base_salary': 1000.0})
+            db.session.commit()
+            try:
+                payroll_engine.run_payroll('t1', PERIOD, user_id=1)
+                refused = False
+            except ValueError as e:
+                refused = 'locked' in str(e)
+            self.check('a locked period is refused',
+                       refused and Payslip.query.filter_by(employee_id=1).one().base_pay == 20000.0)
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if PayrollEngineTester().run() else 1)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Request metrics test
+====================
+
+Sends a random mix of requests through the hooks of modules/core/metrics.py
+on a throwaway SQLite database, parses the Prometheus text output with a
+small independent parser and checks it against a naive per-request tally:
+- every sample belongs to a family declared by a # TYPE line, and label
+  values with quotes, backslashes and newlines round-trip;
+- request counts per endpoint, method and status (including unmatched
+  routes and unhandled exceptions) match the tally;
+- SQL statement and row counts per endpoint and tenant match the tally,
+  with label sets beyond METRICS_MAX_SERIES folded into "other";
+- histogram buckets are cumulative and agree with counting the observed
+  values per bound.
+
+Usage:
+    python test_request_metrics.py
+"""
+
+import os
+import random
+import re
+import sys
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import g, request
+from sqlalchemy import text
+
+from app import db
+from script_testing import ScriptTester, sqlite_app
+
+MAX_SERIES = 12
+TENANTS = ['t1', 't2', 't3', 'acme "north"\\eu\nx', None]
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(,|$)')
+
+def parse_prometheus(output):
+    """(declared types, [(name, labels, value)]) - raises ValueError on a malformed line"""
+    types, samples = {}, []
+    for line in output.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ', 3)
+            types[name] = kind
+            continue
+        if not line or line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        if match is None:
+            raise ValueError(line)
+        name, raw, value = match.groups()
+        labels, position = {}, 0
+        for label in LABEL.finditer(raw or ''):
+            if label.start() != position:
+                raise ValueError(line)
+            labels[label.group(1)] = re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1),
+                                            label.group(2))
+            position = label.end()
+        if position != len(raw or ''):
+            raise ValueError(line)
+        samples.append((name, labels, float(value)))
+    return types, samples
+
+def family(name, types):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and types.get(name[:-len(suffix)]) == 'histogram':
+            return name[:-len(suffix)]
+    return name
+
+class CappedTally:
+    """Counter that folds label sets past ``cap`` into ("other", ...), like the registry"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.values = Counter()
+
+    def add(self, key, amount):
+        if key not in self.values and len(self.values) >= self.cap:
+            key = tuple('other' for _ in key)
+        self.values[key] += amount
+
+class RequestMetricsTester(ScriptTester):
+    def build_app(self):
+        from modules.core.metrics import init_metrics
+
+        app = sqlite_app(METRICS_MAX_SERIES=MAX_SERIES)
+        app.logger.disabled = True  # the tracebacks of /fail are expected
+
+        @app.before_request
+        def set_tenant():
+            tenant = request.headers.get('X-Tenant')
+            if tenant is not None:
+                g.tenant_id = tenant.replace('\\n', '\n')
+
+        @app.route('/read/<int:n>')
+        def read(n):
+            for i in range(n):
+                db.session.execute(text('SELECT id FROM items WHERE id = :i'), {'i': i + 1}).all()
+            return 'ok'
+
+        @app.route('/touch/<int:n>', methods=['POST'])
+        def touch(n):
+            db.session.execute(text('UPDATE items SET hits = hits + 1 WHERE id <= :n'), {'n': n})
+            db.session.commit()
+            return 'ok'
+
+        @app.route('/fail')
+        def fail():
+            db.session.execute(text('SELECT 1')).all()
+            raise RuntimeError('boom')
+
+        with app.app_context():
+            db.session.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, hits INTEGER DEFAULT 0)'))
+            db.session.execute(text('INSERT INTO items (id) VALUES ' + ','.join(f'({i})' for i in range(1, 51))))
+            db.session.commit()
+        return app, init_metrics(app, db)
+
+    def check_histogram(self):
+        from modules.core.metrics import HistogramMetric
+
+        rng = random.Random(39)
+        histogram = HistogramMetric('latency_seconds', 'test', ('route',), buckets=(0.01, 0.1, 1.0))
+        observed = {}
+        for _ in range(2000):
+            route, value = rng.choice('abc'), rng.choice([0.01, 0.1, 1.0, 5.0, rng.random() * 2])
+            histogram.observe((route,), value)
+            observed.setdefault(route, []).append(value)
+        types, samples = parse_prometheus('\n'.join(histogram.render()))
+        got = {(name, labels['route'], labels.get('le')): value for name, labels, value in samples}
+        wrong = []
+        for route, values in observed.items():
+            for bound in ('0.01', '0.1', '1.0', '+Inf'):
+                expected = sum(1 for v in values if bound == '+Inf' or v <= float(bound))
+                if got.get(('latency_seconds_bucket', route, bound)) != expected:
+                    wrong.append((route, bound, got.get(('latency_seconds_bucket', route, bound)), expected))
+            if got.get(('latency_seconds_count', route, None)) != len(values) or \
+                    abs(got.get(('latency_seconds_sum', route, None), -1) - sum(values)) > 1e-6:
+                wrong.append((route, 'count/sum'))
+        self.check('histogram buckets count the values at or below each bound',
+                   not wrong and types == {'latency_seconds': 'histogram'}, wrong[:3])
+
+    def run(self):
+        app, metrics = self.build_app()
+        client = app.test_client()
+        rng = random.Random(39)
+        latency = CappedTally(MAX_SERIES)
+        queries, rows = CappedTally(MAX_SERIES), CappedTally(MAX_SERIES)
+
+        for _ in range(400):
+            tenant = rng.choice(TENANTS)
+            headers = {} if tenant is None else {'X-Tenant': tenant.replace('\n', '\\n')}
+            kind = rng.choice(['read', 'touch', 'fail', 'missing'])
+            n = rng.randint(0, 6)
+            if kind == 'read':
+                response = client.get(f'/read/{n}', headers=headers)
+                rule, method, statements, touched = '/read/<int:n>', 'GET', n, 0
+            elif kind == 'touch':
+                response = client.post(f'/touch/{n}', headers=headers)
+                rule, method, statements, touched = '/touch/<int:n>', 'POST', 1, n
+            elif kind == 'fail':
+                response = client.get('/fail', headers=headers)
+                rule, method, statements, touched = '/fail', 'GET', 1, 0
+            else:
+                response = client.get(f'/missing/{n}', headers=headers)
+                rule, method, statements, touched = 'unmatched', 'GET', 0, 0
+            latency.add((rule, method, str(response.status_code)), 1)
+            if statements:
+                queries.add((rule, tenant or 'none'), statements)
+            if touched:
+                rows.add((rule, tenant or 'none'), touched)
+
+        try:
+            types, samples = parse_prometheus(metrics.render_prometheus())
+        except ValueError as e:
+            self.check('output parses as Prometheus text', False, e)
+            return self.report()
+        untyped = sorted({name for name, _, _ in samples if family(name, types) not in types})
+        self.check('every sample belongs to a declared family', not untyped, untyped[:5])
+        self.check('status codes include 200, 404 and 500',
+                   {k[2] for k in latency.values} == {'200', '404', '500'}, set(latency.values))
+
+        got = Counter()
+        for name, labels, value in samples:
+            if name == 'http_request_duration_seconds_count':
+                got[(labels['endpoint'], labels['method'], labels['status'])] += value
+        self.check('request counts per endpoint, method and status match the tally',
+                   got == latency.values, set(got.items()) ^ set(latency.values.items()))
+
+        for name, tally in (('db_queries_total', queries), ('db_rows_returned_total', rows)):
+            got = Counter({(labels['endpoint'], labels['tenant']): value for metric, labels, value in samples
+                           if metric == name and labels['endpoint'] != 'background'})
+            self.check(f'{name} per endpoint and tenant matches the tally', got == tally.values,
+                       set(got.items()) ^ set(tally.values.items()))
+        self.check('label sets past the cap are folded into "other"',
+                   ('other', 'other') in queries.values and len(queries.values) == MAX_SERIES + 1,
+                   len(queries.values))
+        self.check('a tenant with quotes, backslashes and newlines round-trips',
+                   any(labels.get('tenant') == TENANTS[3] for _, labels, _ in samples))
+
+        self.check_histogram()
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if RequestMetricsTester().run() else 1)
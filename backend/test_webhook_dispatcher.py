@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Webhook dispatcher test
+=======================
+
+Runs modules/api/webhook_dispatcher.py against a local http.server receiver
+on a throwaway SQLite file database and checks:
+- every request carries an HMAC signature over "<timestamp>.<body>" that the
+  receiver can verify, and the body is the emitted event;
+- only subscribed webhooks of the event's tenant (or of all tenants) are
+  called;
+- a 5xx is retried until it succeeds, and dead-lettered once retry_count is
+  used up;
+- a 4xx is dead-lettered after one attempt;
+- no endpoint sees more than WEBHOOK_PER_ENDPOINT_CONCURRENCY requests at once;
+- a dead-lettered delivery can be redelivered, with the same delivery id;
+- a webhook change invalidated by one dispatcher is seen at once by another
+  (as in another worker process) through the shared index version.
+
+Usage:
+    python test_webhook_dispatcher.py
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+SECRET = 's3cret'
+PER_ENDPOINT = 2
+
+class Receiver:
+    """Scripted endpoints; records every request and the peak concurrency per path"""
+
+    def __init__(self):
+        self.requests = []
+        self.failures_left = {'/flaky': 2}
+        self.accepting_bad = False
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+    def status(self, path):
+        with self.lock:
+            if path == '/flaky' and self.failures_left['/flaky'] > 0:
+                self.failures_left['/flaky'] -= 1
+                return 503
+        if path == '/down':
+            return 503
+        if path == '/bad':
+            return 200 if self.accepting_bad else 400
+        return 200
+
+    def handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with receiver.lock:
+                    receiver.requests.append((self.path, dict(self.headers), body))
+                    receiver.active[self.path] = receiver.active.get(self.path, 0) + 1
+                    receiver.peak[self.path] = max(receiver.peak.get(self.path, 0), receiver.active[self.path])
+                if self.path == '/slow':
+                    time.sleep(0.2)
+                status = receiver.status(self.path)
+                with receiver.lock:
+                    receiver.active[self.path] -= 1
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def calls(self, path):
+        return [(headers, body) for p, headers, body in self.requests if p == path]
+
+class WebhookDispatcherTester(ScriptTester):
+    def wait(self, dispatcher, timeout=20):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            db.session.expire_all()
+            counts = dispatcher.status_counts()
+            if not counts.get('pending') and not counts.get('in_flight'):
+                return counts
+            time.sleep(0.05)
+        return dispatcher.status_counts()
+
+    def run(self):
+        receiver = Receiver()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), receiver.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+
+        directory = tempfile.mkdtemp()
+        app = sqlite_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'webhooks.db')}",
+                         WEBHOOK_WORKERS=8, WEBHOOK_PER_ENDPOINT_CONCURRENCY=PER_ENDPOINT,
+                         WEBHOOK_POLL_INTERVAL=0.05, WEBHOOK_BACKOFF_SECONDS=0.05,
+                         WEBHOOK_BACKOFF_MAX_SECONDS=0.2)
+
+        with app.app_context():
+            import modules.core.models  # noqa: F401 - users, referenced by webhooks
+            from modules.api.models import Webhook, WebhookDelivery
+            from modules.api.webhook_dispatcher import WebhookDispatcher
+
+            create_tables(Webhook, WebhookDelivery)
+            hooks = [
+                ('signed', '/ok', 't1', ['finance.*'], 3, SECRET),
+                ('flaky', '/flaky', None, ['finance.journal_posted'], 3, None),
+                ('down', '/down', None, ['finance.journal_posted'], 2, None),
+                ('bad', '/bad', 't1', ['finance.journal_posted'], 3, None),
+                ('slow', '/slow', 't1', ['inventory.*'], 0, None),
+                ('other tenant', '/ok', 't2', ['*'], 3, None),
+            ]
+            db.session.add_all([Webhook(name=name, url=base + path, tenant_id=tenant, events=events, user_id=1,
+                                        retry_count=retries, secret_key=secret, timeout=5, is_active=True)
+                                for name, path, tenant, events, retries, secret in hooks])
+            db.session.commit()
+
+            dispatcher = WebhookDispatcher()
+            dispatcher.init_app(app)
+            queued = dispatcher.emit('finance.journal_posted', {'journal': 'JE-1', 'amount': 12.5}, tenant_id='t1')
+            queued += sum(dispatcher.emit('inventory.moved', {'move': i}, tenant_id='t1') for i in range(10))
+            db.session.commit()
+            counts = self.wait(dispatcher)
+            self.check('only subscribed webhooks of the tenant are queued', queued == 14, queued)
+            self.check('every delivery reaches a final state', set(counts) <= {'delivered', 'dead'}, counts)
+
+            signed = receiver.calls('/ok')
+            valid = [json.loads(body)['data'] == {'journal': 'JE-1', 'amount': 12.5} and hmac.compare_digest(
+                headers['X-EdonuOps-Signature'],
+                'sha256=' + hmac.new(SECRET.encode(), headers['X-EdonuOps-Timestamp'].encode() + b'.' + body,
+                                     hashlib.sha256).hexdigest()) for headers, body in signed]
+            self.check('requests are signed over "<timestamp>.<body>"', valid == [True], valid)
+
+            def delivery(name):
+                webhook = Webhook.query.filter_by(name=name).one()
+                return WebhookDelivery.query.filter_by(webhook_id=webhook.id).order_by(WebhookDelivery.id).all()
+
+            flaky = delivery('flaky')[0]
+            self.check('a 5xx is retried until it succeeds',
+                       len(receiver.calls('/flaky')) == 3 and flaky.status == 'delivered' and flaky.retry_count == 2,
+                       (len(receiver.calls('/flaky')), flaky.status, flaky.retry_count))
+            down = delivery('down')[0]
+            self.check('a 5xx is dead-lettered once retry_count is used up',
+                       len(receiver.calls('/down')) == 3 and down.status == 'dead' and down.error_message == 'HTTP 503',
+                       (len(receiver.calls('/down')), down.status, down.error_message))
+            bad = delivery('bad')[0]
+            self.check('a 4xx is dead-lettered after one attempt',
+                       len(receiver.calls('/bad')) == 1 and bad.status == 'dead' and bad.response_status == 400,
+                       (len(receiver.calls('/bad')), bad.status, bad.response_status))
+
+            slow = delivery('slow')
+            self.check('concurrent requests per endpoint stay within the cap',
+                       receiver.peak.get('/slow') == PER_ENDPOINT and len(receiver.calls('/slow')) == 10 and
+                       all(d.status == 'delivered' for d in slow), (receiver.peak, len(receiver.calls('/slow'))))
+
+            receiver.accepting_bad = True
+            redelivered = dispatcher.redeliver(bad.id)
+            self.wait(dispatcher)
+            db.session.expire_all()
+            attempts = receiver.calls('/bad')
+            self.check('a dead-lettered delivery is redelivered with the same delivery id',
+                       redelivered and db.session.get(WebhookDelivery, bad.id).status == 'delivered' and
+                       len(attempts) == 2 and
+                       attempts[0][0]['X-EdonuOps-Delivery'] == attempts[1][0]['X-EdonuOps-Delivery'] == str(bad.id),
+                       (redelivered, len(attempts)))
+
+            # Two workers: one changes a webhook, the other must not keep emitting from its old index
+            other = WebhookDispatcher()
+            other.init_app(app, start=False)
+            before = other.subscriptions('payroll.run', tenant_id='t1')
+            db.session.add(Webhook(name='payroll', url=base + '/ok', tenant_id='t1', events=['payroll.*'], user_id=1,
+                                   retry_count=0, secret_key=None, timeout=5, is_active=True))
+            db.session.commit()
+            dispatcher.invalidate_index()
+            after = other.subscriptions('payroll.run', tenant_id='t1')
+            self.check('another worker sees a webhook change at once', before == [] and len(after) == 1,
+                       (before, after))
+
+            dispatcher.stop()
+        server.shutdown()
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if WebhookDispatcherTester().run() else 1)
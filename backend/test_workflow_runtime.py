@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Workflow runtime test
+=====================
+
+Starts workflows through modules/workflow/workflow_engine.py and
+modules/automation/workflow_engine.py on a throwaway SQLite file database,
+next to the caller's own uncommitted work, and checks that:
+- starting a workflow joins the caller's transaction: a rollback drops both,
+  a commit keeps both, and the rule id is only cached once committed;
+- synchronous tasks run inline up to the first approval, without committing;
+- a workflow that cannot start leaves the caller's work alone;
+- pooled task handlers only run after the caller commits;
+- instances and tasks survive a new engine (a restart or another worker)
+  and can be completed from it.
+
+Usage:
+    python test_workflow_runtime.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import g
+from sqlalchemy import text
+
+from app import db
+from script_testing import ScriptTester, create_tables, sqlite_app
+
+class WorkflowRuntimeTester(ScriptTester):
+    def documents(self):
+        return db.session.execute(text('SELECT count(*) FROM documents')).scalar()
+
+    def add_document(self, name):
+        db.session.execute(text('INSERT INTO documents (name) VALUES (:name)'), {'name': name})
+
+    def run(self):
+        directory = tempfile.mkdtemp()
+        app = sqlite_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'workflow.db')}")
+
+        with app.app_context(), app.test_request_context():
+            import modules.core.models  # noqa: F401 - users, referenced by the workflow tables
+            from modules.automation import workflow_engine as automation
+            from modules.workflow import workflow_engine as workflow
+            from modules.workflow.models import WorkflowAction, WorkflowExecution, WorkflowRule
+            from modules.workflow.runtime import TaskExecutor, WorkflowStore
+
+            create_tables(WorkflowRule, WorkflowExecution, WorkflowAction)
+            db.session.execute(text('CREATE TABLE documents (id INTEGER PRIMARY KEY, name VARCHAR(50))'))
+            db.session.commit()
+            g.tenant_id = 't1'
+
+            engine = workflow.WorkflowEngine(executor=TaskExecutor(max_workers=0))
+            engine.register_workflow(workflow.create_invoice_approval_workflow())
+            rule_key = ('t1', 'workflow.invoice_approval')
+
+            self.add_document('rolled back')
+            started = engine.start_workflow('invoice_approval', {'amount': 10}, created_by='1')
+            db.session.rollback()
+            self.check('a rollback drops the caller\'s work and the workflow together',
+                       started and self.documents() == 0 and WorkflowExecution.query.count() == 0 and
+                       WorkflowRule.query.count() == 0 and rule_key not in WorkflowStore._rule_ids, started)
+
+            self.add_document('committed')
+            started = engine.start_workflow('invoice_approval', {'amount': 10}, created_by='1')
+            cached_before_commit = rule_key in WorkflowStore._rule_ids
+            db.session.commit()
+            db.session.expire_all()
+            instance = db.session.get(WorkflowExecution, int(started))
+            instance_id = instance.id
+            tasks = {t.step_id: t for t in instance.actions}
+            self.check('a commit keeps the caller\'s work and the workflow together',
+                       self.documents() == 1 and WorkflowRule.query.count() == 1 and not cached_before_commit and
+                       WorkflowStore._rule_ids.get(rule_key) == instance.rule_id,
+                       (self.documents(), WorkflowRule.query.count(), cached_before_commit, WorkflowStore._rule_ids))
+            self.check('synchronous tasks run inline up to the first approval',
+                       tasks['validate_invoice'].status == 'completed' and
+                       tasks['manager_approval'].status == 'pending' and
+                       tasks['manager_approval'].result['approvers'] == ['finance_manager'] and
+                       set(tasks) == {'validate_invoice', 'manager_approval'},
+                       {k: t.status for k, t in tasks.items()})
+
+            pooled = automation.WorkflowEngine(executor=TaskExecutor(max_workers=2))
+            pooled.register_workflow(automation.WorkflowDefinition(
+                id='broken', name='Broken', description='', version='1', status=automation.WorkflowStatus.ACTIVE,
+                steps=[{'id': 'x', 'type': 'not-a-task-type'}], triggers=[], conditions=[]))
+            self.add_document('kept')
+            broken = pooled.start_workflow('broken', {})
+            db.session.commit()
+            self.check('a workflow that cannot start leaves the caller\'s work alone',
+                       broken is None and self.documents() == 2 and
+                       WorkflowExecution.query.filter_by(workflow_key='automation.broken').count() == 0, broken)
+
+            handled = threading.Event()
+            seen = []
+            def approval_handler(task, data):
+                seen.append(task.id)
+                handled.set()
+            pooled.register_task_handler('approval', approval_handler)
+            pooled.register_workflow(automation.create_invoice_approval_workflow())
+            self.add_document('pooled')
+            started = pooled.start_workflow('invoice_approval', {'amount': 10})
+            ran_before_commit = handled.wait(0.3)
+            db.session.commit()
+            self.check('pooled handlers only run after the caller commits',
+                       started and not ran_before_commit and handled.wait(5) and len(seen) == 1,
+                       (ran_before_commit, seen))
+
+            # A new engine over the same database, as after a restart
+            restarted = workflow.WorkflowEngine(executor=TaskExecutor(max_workers=0))
+            restarted.register_workflow(workflow.create_invoice_approval_workflow())
+            db.session.remove()
+            g.tenant_id = 't1'
+            approved = restarted.complete_task(str(instance_id), 'manager_approval', {'approved': True})
+            db.session.expire_all()
+            final = restarted.get_instance(str(instance_id))
+            self.check('a new engine picks the instance up and completes it',
+                       approved and final['status'] == 'completed' and
+                       [t['status'] for t in final['tasks']] == ['completed'] * 4, final)
+            pooled.executor.shutdown()
+
+        return self.report()
+
+if __name__ == '__main__':
+    sys.exit(0 if WorkflowRuntimeTester().run() else 1)